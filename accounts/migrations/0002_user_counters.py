@@ -0,0 +1,54 @@
+# Generated by Django 5.0.1 on 2026-10-19 01:58
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    CodeSubmission = apps.get_model('users', 'CodeSubmission')
+    ComparisonRequest = apps.get_model('users', 'ComparisonRequest')
+    SimilarityResult = apps.get_model('users', 'SimilarityResult')
+
+    def count(queryset, user_field):
+        counts = queryset.filter(**{user_field: OuterRef('pk')}).order_by().values(user_field).annotate(
+            n=Count('pk')
+        ).values('n')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+    CustomUser.objects.update(
+        total_submissions=count(CodeSubmission.objects.all(), 'user'),
+        total_comparisons=count(ComparisonRequest.objects.all(), 'user'),
+        completed_comparisons=count(ComparisonRequest.objects.filter(status='completed'), 'user'),
+        high_similarity_count=count(
+            SimilarityResult.objects.filter(overall_similarity_score__gte=75), 'comparison__user'
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='completed_comparisons',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='high_similarity_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='total_comparisons',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -17,16 +17,35 @@ class CustomUser(AbstractUser):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     last_login_ip = models.GenericIPAddressField(blank=True, null=True)
+    # Counter caches, maintained by users.signals (see reconcile_user_counters)
     total_submissions = models.IntegerField(default=0)
+    total_comparisons = models.IntegerField(default=0)
+    completed_comparisons = models.IntegerField(default=0)
+    high_similarity_count = models.IntegerField(default=0)
+    
+    COUNTER_FIELDS = ('total_submissions', 'total_comparisons', 'completed_comparisons', 'high_similarity_count')
     
     class Meta:
         db_table = 'custom_users'
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            models.Index(fields=['date_joined', 'id'], name='custom_user_joined_idx'),
+        ]
     
     def __str__(self):
         return f"{self.username} ({self.get_user_type_display()})"
     
+    def save(self, *args, **kwargs):
+        # A full save of an existing user must not write back stale counters
+        # over concurrent F() increments; counters are only written explicitly.
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+    
     def is_admin_user(self):
         return self.user_type in ['admin', 'super_admin']
 
@@ -69,6 +88,10 @@ class UserActivity(models.Model):
         db_table = 'user_activities'
         ordering = ['-timestamp']
         verbose_name_plural = 'User Activities'
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='user_activity_user_ts_idx'),
+            models.Index(fields=['timestamp'], name='user_activity_ts_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.activity_type} at {self.timestamp}"
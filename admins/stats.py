@@ -0,0 +1,134 @@
+"""
+Cached statistics snapshot for the admin dashboard and statistics pages.
+
+Every count the admin pages show is computed with a few conditional
+aggregation queries (one per table) and kept in the cache. Requests always
+read the cached snapshot; once it is older than ADMIN_STATS_TTL seconds a
+single background thread recomputes it while the stale copy keeps being
+served, so page loads never wait on the aggregation queries.
+
+The snapshot lives in the default cache. No CACHES are configured, so
+that is Django's LocMemCache, which is per process: each worker computes
+its own snapshot in its first request and refreshes it on its own, and
+workers can show counts up to ADMIN_STATS_TTL seconds apart. Configuring
+a shared cache (memcached, redis) makes every worker share one snapshot
+and one refresh, with no code change.
+"""
+
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Avg, Count, F, Q
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from users.counters import HIGH_SIMILARITY_SCORE
+from users.models import CodeSubmission, ComparisonRequest, SimilarityResult
+
+SNAPSHOT_CACHE_KEY = 'admins:stats:snapshot'
+REFRESH_LOCK_KEY = 'admins:stats:refreshing'
+REFRESH_LOCK_TIMEOUT = 300
+
+
+def _period_counts(field, today, week_ago, month_ago):
+    """Count() expressions for rows created today / in the last week / in the last month"""
+    return {
+        'today': Count('id', filter=Q(**{f'{field}__gte': today})),
+        'week': Count('id', filter=Q(**{f'{field}__gte': week_ago})),
+        'month': Count('id', filter=Q(**{f'{field}__gte': month_ago})),
+    }
+
+
+def compute_stats():
+    """Recompute every admin statistic (a fixed handful of queries)"""
+    now = timezone.now()
+    today = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    week_ago = today - timedelta(days=7)
+    month_ago = today - timedelta(days=30)
+
+    users = CustomUser.objects.aggregate(
+        total=Count('id'),
+        active_week=Count('id', filter=Q(last_login__gte=now - timedelta(days=7))),
+        **_period_counts('date_joined', today, week_ago, month_ago),
+    )
+    submissions = CodeSubmission.objects.aggregate(
+        total=Count('id'),
+        **_period_counts('created_at', today, week_ago, month_ago),
+    )
+    comparisons = ComparisonRequest.objects.aggregate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(status='completed')),
+        **_period_counts('created_at', today, week_ago, month_ago),
+    )
+    results = SimilarityResult.objects.aggregate(
+        high=Count('id', filter=Q(overall_similarity_score__gte=HIGH_SIMILARITY_SCORE)),
+        medium=Count(
+            'id', filter=Q(overall_similarity_score__gte=50, overall_similarity_score__lt=HIGH_SIMILARITY_SCORE)
+        ),
+        low=Count('id', filter=Q(overall_similarity_score__lt=50)),
+        avg_score=Avg('overall_similarity_score'),
+    )
+    language_stats = list(
+        CodeSubmission.objects.values('language').annotate(count=Count('id')).order_by('-count')
+    )
+    top_users = list(
+        CustomUser.objects.order_by('-total_submissions').values(
+            'username', 'email', submission_count=F('total_submissions')
+        )[:10]
+    )
+
+    return {
+        'computed_at': time.time(),
+        'total_users': users['total'],
+        'active_users': users['active_week'],
+        'total_submissions': submissions['total'],
+        'total_comparisons': comparisons['total'],
+        'completed_comparisons': comparisons['completed'],
+        'high_similarity': results['high'],
+        'medium_similarity': results['medium'],
+        'low_similarity': results['low'],
+        'avg_similarity': results['avg_score'] or 0,
+        'language_stats': language_stats,
+        'top_users': top_users,
+        'periods': {
+            period: {
+                'submissions': submissions[period],
+                'comparisons': comparisons[period],
+                'users': users[period],
+            }
+            for period in ('today', 'week', 'month')
+        },
+    }
+
+
+def refresh_snapshot():
+    """Recompute the snapshot and store it in the cache"""
+    snapshot = compute_stats()
+    # Kept well past its TTL so a stale copy is always there to serve during a refresh
+    cache.set(SNAPSHOT_CACHE_KEY, snapshot, timeout=max(settings.ADMIN_STATS_TTL * 20, 600))
+    return snapshot
+
+
+def _refresh_in_background():
+    try:
+        refresh_snapshot()
+    finally:
+        cache.delete(REFRESH_LOCK_KEY)
+        connections.close_all()
+
+
+def get_stats():
+    """Current snapshot; a stale one triggers a single background refresh"""
+    snapshot = cache.get(SNAPSHOT_CACHE_KEY)
+    if snapshot is None:
+        return refresh_snapshot()
+
+    if time.time() - snapshot['computed_at'] > settings.ADMIN_STATS_TTL:
+        # cache.add is atomic, so only one request starts the refresh
+        if cache.add(REFRESH_LOCK_KEY, True, timeout=REFRESH_LOCK_TIMEOUT):
+            threading.Thread(target=_refresh_in_background, name='admin-stats-refresh', daemon=True).start()
+    return snapshot
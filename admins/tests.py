@@ -1,3 +1,104 @@
-from django.test import TestCase
+import logging
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from accounts.models import CustomUser
+from code_similarity_system import metrics
+from users.tests import QueryBudgetMixin
+from .stats import REFRESH_LOCK_KEY, SNAPSHOT_CACHE_KEY, _refresh_in_background, get_stats
+
+
+class AdminsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    from admins import urls as urlconf
+
+    as_superuser = True
+    budgets = {
+        'dashboard': 13,
+        'users': 6,
+        'delete_user': 5,
+        'submissions': 6,
+        'delete_submission': 5,
+        'comparisons': 9,
+        'delete_comparison': 5,
+        'statistics': 11,
+        'export_results': 7,
+        'metrics': 5,
+    }
+
+    def url_kwargs(self, name, kwarg_names):
+        values = {
+            'user_id': self.other_user.pk,
+            'submission_id': self.submission.pk,
+            'comparison_id': self.comparison.pk,
+            'export_format': 'csv',
+        }
+        return {kwarg: values[kwarg] for kwarg in kwarg_names}
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser('root', 'root@example.com', 'pw-root-123')
+        self.client.force_login(self.admin)
+        metrics.reset()
+
+    def test_requests_are_recorded_in_metrics(self):
+        self.client.get(reverse('admins:dashboard'))
+        self.client.get(reverse('admins:dashboard'))
+        stats = self.client.get(reverse('admins:metrics')).json()['views']['admins:dashboard']
+        self.assertEqual(stats['requests'], 2)
+        self.assertGreater(stats['queries'], 0)
+        self.assertEqual(stats['over_budget'], 0)
+
+    def test_views_over_budget_are_logged(self):
+        with override_settings(QUERY_BUDGETS={'admins:dashboard': 1}):
+            with self.assertLogs('code_similarity_system.query_budget', level=logging.WARNING) as logs:
+                self.client.get(reverse('admins:dashboard'))
+        self.assertIn('admins:dashboard', logs.output[0])
+        self.assertEqual(metrics.snapshot()['views']['admins:dashboard']['over_budget'], 1)
+
+
+@override_settings(ADMIN_STATS_TTL=30)
+class StatsSnapshotTests(TestCase):
+
+    def setUp(self):
+        cache.delete_many([SNAPSHOT_CACHE_KEY, REFRESH_LOCK_KEY])
+        self.addCleanup(cache.delete_many, [SNAPSHOT_CACHE_KEY, REFRESH_LOCK_KEY])
+        CustomUser.objects.create_user('vic', 'vic@example.com', 'pw-vic-123')
+        thread_patch = mock.patch('admins.stats.threading.Thread')
+        self.Thread = thread_patch.start()
+        self.addCleanup(thread_patch.stop)
+
+    def age(self, seconds):
+        snapshot = cache.get(SNAPSHOT_CACHE_KEY)
+        snapshot['computed_at'] = time.time() - seconds
+        cache.set(SNAPSHOT_CACHE_KEY, snapshot)
+
+    def test_first_request_computes_and_later_ones_read_the_cache(self):
+        self.assertEqual(get_stats()['total_users'], 1)
+        CustomUser.objects.create_user('wes', 'wes@example.com', 'pw-wes-123')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_stats()['total_users'], 1)
+        self.Thread.assert_not_called()
+
+    def test_stale_snapshot_is_served_while_one_refresh_runs(self):
+        get_stats()
+        CustomUser.objects.create_user('wes', 'wes@example.com', 'pw-wes-123')
+        self.age(31)
+        with self.assertNumQueries(0):
+            # Stale, but served right away; only the first request starts a refresh
+            self.assertEqual(get_stats()['total_users'], 1)
+            self.assertEqual(get_stats()['total_users'], 1)
+        self.Thread.assert_called_once()
+        self.assertTrue(cache.get(REFRESH_LOCK_KEY))
+
+        # Run the refresh here (the test's connection must stay open)
+        with mock.patch('admins.stats.connections'):
+            _refresh_in_background()
+        self.assertIsNone(cache.get(REFRESH_LOCK_KEY))
+        self.assertEqual(get_stats()['total_users'], 2)
+        self.Thread.assert_called_once()
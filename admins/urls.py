@@ -12,4 +12,6 @@ urlpatterns = [
     path('comparisons/', views.admin_comparisons, name='comparisons'),
     path('comparisons/<int:comparison_id>/delete/', views.delete_comparison, name='delete_comparison'),
     path('statistics/', views.admin_statistics, name='statistics'),
+    path('export/results/<str:export_format>/', views.export_results, name='export_results'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
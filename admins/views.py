@@ -1,13 +1,27 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Count, Q, Avg
+from django.http import FileResponse, Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.db.models import Prefetch
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.dateparse import parse_date
+from datetime import datetime, timezone as dt_timezone
+import tempfile
 
 # Import models
 from accounts.models import CustomUser
-from users.models import CodeSubmission, ComparisonRequest, SimilarityResult
+from users.models import CodeSubmission, ComparisonRequest, PlagiarismCluster, PlagiarismClusterMember, SimilarityResult
+from users.pagination import KeysetPaginator
+from .stats import get_stats
+from code_similarity_system import metrics
+from reports.exporters import EXPORT_FORMATS, iter_result_rows, stream_csv, stream_jsonl, write_xlsx
+from reports.rollups import day_bounds
+
+
+ADMIN_PAGE_SIZE = 50
+# Plagiarism clusters listed on the comparisons page, and members shown per cluster
+ADMIN_CLUSTERS = 10
+ADMIN_CLUSTER_MEMBERS = 8
 
 
 def is_superuser(user):
@@ -24,58 +38,27 @@ def admin_dashboard(request):
         messages.error(request, 'Models not properly configured.')
         return redirect('users:dashboard')
     
-    # Get statistics
-    total_users = CustomUser.objects.count()
-    total_submissions = CodeSubmission.objects.count()
-    total_comparisons = ComparisonRequest.objects.count()
-    
-    completed_comparisons = ComparisonRequest.objects.filter(status='completed').count()
+    stats = get_stats()
     
     # Recent activity
     recent_users = CustomUser.objects.order_by('-date_joined')[:5]
-    recent_submissions = CodeSubmission.objects.order_by('-created_at')[:10]
-    
-    recent_comparisons = ComparisonRequest.objects.order_by('-created_at')[:10]
-    
-    # Language distribution
-    language_stats = CodeSubmission.objects.values('language').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    # Similarity distribution
-    high_similarity = 0
-    medium_similarity = 0
-    low_similarity = 0
-    
-    if SimilarityResult:
-        high_similarity = SimilarityResult.objects.filter(
-            overall_similarity_score__gte=75
-        ).count()
-        medium_similarity = SimilarityResult.objects.filter(
-            overall_similarity_score__gte=50,
-            overall_similarity_score__lt=75
-        ).count()
-        low_similarity = SimilarityResult.objects.filter(
-            overall_similarity_score__lt=50
-        ).count()
-    
-    # User activity in last 7 days
-    week_ago = timezone.now() - timedelta(days=7)
-    active_users = CustomUser.objects.filter(last_login__gte=week_ago).count()
+    recent_submissions = CodeSubmission.objects.select_related('user').order_by('-created_at')[:10]
+    
+    recent_comparisons = ComparisonRequest.objects.select_related('user').order_by('-created_at')[:10]
     
     context = {
-        'total_users': total_users,
-        'total_submissions': total_submissions,
-        'total_comparisons': total_comparisons,
-        'completed_comparisons': completed_comparisons,
+        'total_users': stats['total_users'],
+        'total_submissions': stats['total_submissions'],
+        'total_comparisons': stats['total_comparisons'],
+        'completed_comparisons': stats['completed_comparisons'],
         'recent_users': recent_users,
         'recent_submissions': recent_submissions,
         'recent_comparisons': recent_comparisons,
-        'language_stats': language_stats,
-        'high_similarity': high_similarity,
-        'medium_similarity': medium_similarity,
-        'low_similarity': low_similarity,
-        'active_users': active_users,
+        'language_stats': stats['language_stats'],
+        'high_similarity': stats['high_similarity'],
+        'medium_similarity': stats['medium_similarity'],
+        'low_similarity': stats['low_similarity'],
+        'active_users': stats['active_users'],
     }
     
     return render(request, 'admins/dashboard.html', context)
@@ -85,9 +68,9 @@ def admin_dashboard(request):
 @user_passes_test(is_superuser, login_url='/users/dashboard/')
 def admin_users(request):
     """Manage users"""
-    users = CustomUser.objects.annotate(
-        submission_count=Count('submissions')
-    ).order_by('-date_joined')
+    users = KeysetPaginator(
+        CustomUser.objects.all(), ordering=('-date_joined', '-id'), per_page=ADMIN_PAGE_SIZE
+    ).get_page(request)
     
     context = {
         'users': users,
@@ -104,7 +87,9 @@ def admin_submissions(request):
         messages.error(request, 'Models not properly configured.')
         return redirect('users:dashboard')
     
-    submissions = CodeSubmission.objects.select_related('user').order_by('-created_at')
+    submissions = KeysetPaginator(
+        CodeSubmission.objects.select_related('user'), per_page=ADMIN_PAGE_SIZE
+    ).get_page(request)
     
     context = {
         'submissions': submissions,
@@ -117,10 +102,32 @@ def admin_submissions(request):
 @user_passes_test(is_superuser, login_url='/users/dashboard/')
 def admin_comparisons(request):
     """View all comparisons"""
-    comparisons = ComparisonRequest.objects.select_related('user').order_by('-created_at')
+    comparisons = KeysetPaginator(
+        ComparisonRequest.objects.select_related('user').with_submissions(),
+        per_page=ADMIN_PAGE_SIZE,
+    ).get_page(request)
+    
+    # Plagiarism clusters (similarity_engine.plagiarism) of the submissions on this page
+    submission_ids = {c.source_submission_id for c in comparisons} | {c.target_submission_id for c in comparisons}
+    clusters_of = {}
+    for membership in PlagiarismClusterMember.objects.filter(submission_id__in=submission_ids).select_related('cluster'):
+        clusters_of.setdefault(membership.submission_id, []).append(membership.cluster)
+    for c in comparisons:
+        c.source_clusters = clusters_of.get(c.source_submission_id, [])
+        c.target_clusters = clusters_of.get(c.target_submission_id, [])
+        c.shares_cluster = bool({cluster.pk for cluster in c.source_clusters} & {cluster.pk for cluster in c.target_clusters})
+    
+    clusters = PlagiarismCluster.objects.prefetch_related(Prefetch(
+        'members',
+        queryset=PlagiarismClusterMember.objects.select_related('submission__user').only(
+            'cluster_id', 'degree', 'max_score', 'submission__title', 'submission__user__username'
+        )[:ADMIN_CLUSTER_MEMBERS],
+        to_attr='top_members',
+    ))[:ADMIN_CLUSTERS]
     
     context = {
         'comparisons': comparisons,
+        'clusters': clusters,
     }
     
     return render(request, 'admins/comparisons.html', context)
@@ -135,44 +142,13 @@ def admin_statistics(request):
         messages.error(request, 'Models not properly configured.')
         return redirect('users:dashboard')
     
-    # Time-based statistics
-    today = timezone.now().date()
-    week_ago = today - timedelta(days=7)
-    month_ago = today - timedelta(days=30)
-    
-    stats = {
-        'today': {
-            'submissions': CodeSubmission.objects.filter(created_at__date=today).count(),
-            'comparisons': ComparisonRequest.objects.filter(created_at__date=today).count(),
-            'users': CustomUser.objects.filter(date_joined__date=today).count(),
-        },
-        'week': {
-            'submissions': CodeSubmission.objects.filter(created_at__date__gte=week_ago).count(),
-            'comparisons': ComparisonRequest.objects.filter(created_at__date__gte=week_ago).count(),
-            'users': CustomUser.objects.filter(date_joined__date__gte=week_ago).count(),
-        },
-        'month': {
-            'submissions': CodeSubmission.objects.filter(created_at__date__gte=month_ago).count(),
-            'comparisons': ComparisonRequest.objects.filter(created_at__date__gte=month_ago).count(),
-            'users': CustomUser.objects.filter(date_joined__date__gte=month_ago).count(),
-        },
-    }
-    
-    # Average similarity scores
-    avg_similarity = 0
-    if SimilarityResult:
-        result = SimilarityResult.objects.aggregate(avg_score=Avg('overall_similarity_score'))
-        avg_similarity = result['avg_score'] or 0
-    
-    # Most active users
-    active_users = CustomUser.objects.annotate(
-        total_submissions=Count('submissions')
-    ).order_by('-total_submissions')[:10]
+    snapshot = get_stats()
     
     context = {
-        'stats': stats,
-        'avg_similarity': avg_similarity,
-        'active_users': active_users,
+        'stats': snapshot['periods'],
+        'avg_similarity': snapshot['avg_similarity'],
+        'active_users': snapshot['top_users'],
+        'stats_computed_at': datetime.fromtimestamp(snapshot['computed_at'], tz=dt_timezone.utc),
     }
     
     return render(request, 'admins/statistics.html', context)
@@ -217,3 +193,64 @@ def delete_comparison(request, comparison_id):
         messages.success(request, 'Comparison deleted successfully.')
     
     return redirect('admins:comparisons')
+
+
+def _date_param(request, name):
+    """A YYYY-MM-DD query parameter as a date (None if absent); ValueError if it isn't one"""
+    value = request.GET.get(name)
+    if not value:
+        return None
+    # parse_date returns None for a malformed string and raises ValueError for e.g. 2024-02-30
+    date = parse_date(value)
+    if date is None:
+        raise ValueError(f'{name} is not a date')
+    return date
+
+
+@login_required
+@user_passes_test(is_superuser, login_url='/users/dashboard/')
+def export_results(request, export_format):
+    """Stream every similarity result as CSV, JSONL or XLSX"""
+    if export_format not in EXPORT_FORMATS:
+        raise Http404('Unknown export format')
+    
+    try:
+        date_from = _date_param(request, 'date_from')
+        date_to = _date_param(request, 'date_to')
+        min_score = float(request.GET['min_score']) if request.GET.get('min_score') else None
+    except ValueError:
+        return HttpResponseBadRequest('date_from and date_to must be YYYY-MM-DD dates, and min_score a number')
+    
+    # Local days as datetime ranges: __date converts time zones in MySQL, which needs its tz tables
+    results = SimilarityResult.objects.all()
+    if date_from:
+        results = results.filter(created_at__gte=day_bounds(date_from, date_from)[0])
+    if date_to:
+        results = results.filter(created_at__lt=day_bounds(date_to, date_to)[1])
+    if min_score is not None:
+        results = results.filter(overall_similarity_score__gte=min_score)
+    
+    content_type, extension = EXPORT_FORMATS[export_format]
+    filename = f'similarity_results_{timezone.now():%Y%m%d_%H%M%S}.{extension}'
+    rows = iter_result_rows(results)
+    
+    if export_format == 'xlsx':
+        # xlsx is a zip archive, so it is spooled to disk and then streamed
+        spool = tempfile.TemporaryFile()
+        write_xlsx(rows, spool)
+        spool.seek(0)
+        return FileResponse(spool, as_attachment=True, filename=filename, content_type=content_type)
+    
+    stream = stream_csv(rows) if export_format == 'csv' else stream_jsonl(rows)
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+@user_passes_test(is_superuser, login_url='/users/dashboard/')
+def metrics_view(request):
+    """Per-view request metrics (queries, database time, budget overruns) for this process"""
+    data = metrics.snapshot()
+    data['views'] = dict(sorted(data['views'].items(), key=lambda item: -item[1]['max_queries']))
+    return JsonResponse(data)
@@ -0,0 +1,63 @@
+"""
+In-process request metrics.
+
+Per-view counters (requests, database queries, database time and budget
+overruns) collected by QueryBudgetMiddleware. Numbers are per worker
+process and reset on restart; the admin metrics endpoint reports the
+process that serves it.
+"""
+
+import threading
+import time
+
+_lock = threading.Lock()
+_views = {}
+_started_at = time.time()
+
+
+def record_request(view_name, queries, db_time_ms, budget, duration_ms):
+    """Add one request's numbers to the view's counters"""
+    with _lock:
+        stats = _views.get(view_name)
+        if stats is None:
+            stats = _views[view_name] = {
+                'requests': 0,
+                'queries': 0,
+                'max_queries': 0,
+                'db_time_ms': 0.0,
+                'max_db_time_ms': 0.0,
+                'duration_ms': 0.0,
+                'over_budget': 0,
+                'budget': budget,
+            }
+        stats['requests'] += 1
+        stats['queries'] += queries
+        stats['max_queries'] = max(stats['max_queries'], queries)
+        stats['db_time_ms'] += db_time_ms
+        stats['max_db_time_ms'] = max(stats['max_db_time_ms'], db_time_ms)
+        stats['duration_ms'] += duration_ms
+        stats['budget'] = budget
+        if queries > budget:
+            stats['over_budget'] += 1
+
+
+def snapshot():
+    """Copy of all counters with per-request averages filled in"""
+    with _lock:
+        views = {}
+        for name, stats in _views.items():
+            n = stats['requests']
+            views[name] = {
+                **stats,
+                'avg_queries': round(stats['queries'] / n, 2),
+                'avg_db_time_ms': round(stats['db_time_ms'] / n, 2),
+                'avg_duration_ms': round(stats['duration_ms'] / n, 2),
+            }
+    return {'since': _started_at, 'views': views}
+
+
+def reset():
+    global _started_at
+    with _lock:
+        _views.clear()
+        _started_at = time.time()
@@ -0,0 +1,102 @@
+"""
+Per-request database query accounting.
+"""
+
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger('code_similarity_system.query_budget')
+
+
+class QueryCounter:
+    """execute_wrapper that counts queries and the time spent in them"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+def query_budget(view_name):
+    """Query budget for a view (QUERY_BUDGETS overrides QUERY_BUDGET_DEFAULT)"""
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the queries and database time of every request, records them in
+    code_similarity_system.metrics and logs views that exceed their budget.
+    (Streaming responses are counted up to the point the view returns.)
+
+    It runs in async mode under ASGI, so async views aren't pushed onto a
+    thread; their ORM calls run on the request's thread-sensitive thread,
+    whose connections the counter is installed on.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        return self._record(request, response, counter, start)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        stack = ExitStack()
+
+        def install():
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+
+        await sync_to_async(install)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self._record(request, response, counter, start)
+
+    def _record(self, request, response, counter, start):
+        duration_ms = (time.perf_counter() - start) * 1000
+        db_time_ms = counter.db_time * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+        budget = query_budget(view_name)
+        metrics.record_request(view_name, counter.queries, db_time_ms, budget, duration_ms)
+
+        if counter.queries > budget:
+            logger.warning(
+                '%s %s (%s) ran %d queries (budget %d, %.1f ms in database)',
+                request.method, request.path, view_name, counter.queries, budget, db_time_ms,
+            )
+        if settings.DEBUG:
+            response['X-DB-Queries'] = str(counter.queries)
+            response['X-DB-Time-Ms'] = f'{db_time_ms:.1f}'
+        return response
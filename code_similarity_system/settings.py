@@ -32,6 +32,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'code_similarity_system.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'code_similarity_system.urls'
@@ -104,7 +105,75 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 ML_MODEL_PATH = BASE_DIR / 'ml_models'
 DATASET_PATH = BASE_DIR / 'datasets'
+FEATURE_STORE_PATH = config('FEATURE_STORE_PATH', default=str(BASE_DIR / 'feature_store'))
+# Reference dataset indexes (similarity_engine.references): location, hits shown, minimum share of
+# the submission matched, and fingerprints too common to look up
+REFERENCE_INDEX_PATH = config('REFERENCE_INDEX_PATH', default=str(BASE_DIR / 'reference_index'))
+REFERENCE_SEARCH_LIMIT = 20
+REFERENCE_MIN_CONTAINMENT = 0.05
+REFERENCE_MAX_POSTINGS = 100_000
 
 SUPPORTED_LANGUAGES = ['python', 'java', 'javascript', 'cpp', 'c']
 MAX_UPLOAD_SIZE = 10485760  # 10MB
+# Archive uploads (users.archives): compressed size, expanded size and file count
+MAX_ARCHIVE_UPLOAD_SIZE = config('MAX_ARCHIVE_UPLOAD_SIZE', default=50 * 1024 * 1024, cast=int)
+MAX_ARCHIVE_UNCOMPRESSED_SIZE = config('MAX_ARCHIVE_UNCOMPRESSED_SIZE', default=200 * 1024 * 1024, cast=int)
+MAX_ARCHIVE_FILES = config('MAX_ARCHIVE_FILES', default=2000, cast=int)
+INGEST_WORKERS = config('INGEST_WORKERS', default=4, cast=int)
+# Size limit first, so oversized files are dropped while still being received
+FILE_UPLOAD_HANDLERS = [
+    'users.uploads.UploadSizeLimitHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
 SIMILARITY_THRESHOLD = 0.75
+# multiple_vs_multiple jobs (similarity_engine.jobs)
+SET_COMPARISON_TOP_K = config('SET_COMPARISON_TOP_K', default=5, cast=int)
+MAX_SET_COMPARISON_FILES = config('MAX_SET_COMPARISON_FILES', default=5000, cast=int)
+COMPARISON_WORKERS = config('COMPARISON_WORKERS', default=2, cast=int)
+SET_COMPARISON_DISPLAY_MATCHES = 200
+# Admission control (users.throttling, similarity_engine.jobs): comparisons a user may have queued or
+# running, jobs of one user run at once, and the longest a batch job pauses per block for interactive ones
+MAX_ACTIVE_COMPARISONS_PER_USER = config('MAX_ACTIVE_COMPARISONS_PER_USER', default=5, cast=int)
+MAX_RUNNING_JOBS_PER_USER = config('MAX_RUNNING_JOBS_PER_USER', default=1, cast=int)
+INTERACTIVE_PAUSE_SECONDS = config('INTERACTIVE_PAUSE_SECONDS', default=5.0, cast=float)
+# Seconds between heartbeats of queued and running jobs, and without one after which an unfinished
+# comparison counts as lost with its process (no longer active, and failed when the server starts)
+COMPARISON_HEARTBEAT_INTERVAL = config('COMPARISON_HEARTBEAT_INTERVAL', default=60.0, cast=float)
+COMPARISON_ORPHAN_AFTER = config('COMPARISON_ORPHAN_AFTER', default=300, cast=int)
+# Per-user token buckets: requests per minute, and how many may come at once
+COMPARE_RATE_PER_MINUTE = config('COMPARE_RATE_PER_MINUTE', default=12, cast=float)
+COMPARE_BURST = config('COMPARE_BURST', default=6, cast=int)
+UPLOAD_RATE_PER_MINUTE = config('UPLOAD_RATE_PER_MINUTE', default=30, cast=float)
+UPLOAD_BURST = config('UPLOAD_BURST', default=10, cast=int)
+# Comparison status streams (similarity_engine.progress): seconds between status polls, between
+# keep-alive comments, and before a stream ends and the client reconnects
+COMPARISON_STATUS_POLL_INTERVAL = config('COMPARISON_STATUS_POLL_INTERVAL', default=1.0, cast=float)
+COMPARISON_EVENTS_HEARTBEAT = config('COMPARISON_EVENTS_HEARTBEAT', default=15.0, cast=float)
+COMPARISON_EVENTS_TIMEOUT = config('COMPARISON_EVENTS_TIMEOUT', default=300.0, cast=float)
+# Corpus plagiarism clusters (similarity_engine.plagiarism): edge score, the edge density under which a
+# component is split, and fingerprints too common (starter code) to pair submissions on
+PLAGIARISM_CLUSTER_THRESHOLD = config('PLAGIARISM_CLUSTER_THRESHOLD', default=0.75, cast=float)
+PLAGIARISM_CLUSTER_MIN_DENSITY = config('PLAGIARISM_CLUSTER_MIN_DENSITY', default=0.5, cast=float)
+PLAGIARISM_CLUSTER_MAX_POSTINGS = config('PLAGIARISM_CLUSTER_MAX_POSTINGS', default=200, cast=int)
+# Corpus clone detection (similarity_engine.clones): shortest fragment, in tokens, and fewest submissions
+CLONE_MIN_TOKENS = config('CLONE_MIN_TOKENS', default=50, cast=int)
+CLONE_MIN_FILES = config('CLONE_MIN_FILES', default=2, cast=int)
+# Token streams of every submission for the corpus-wide jobs (similarity_engine.corpus)
+CORPUS_STORE_PATH = config('CORPUS_STORE_PATH', default=str(BASE_DIR / 'corpus_store'))
+# Load models and indexes when the WSGI/ASGI module is imported (in a pre-forking master; see similarity_engine.warmup)
+PREFORK_WARMUP = config('PREFORK_WARMUP', default=True, cast=bool)
+REPORT_CACHE_MAX_BYTES = config('REPORT_CACHE_MAX_BYTES', default=512 * 1024 * 1024, cast=int)
+REPORT_WORKERS = config('REPORT_WORKERS', default=2, cast=int)
+# Comparisons one batch report may cover (merging its PDF parts holds the whole document in memory)
+MAX_BATCH_REPORT_COMPARISONS = config('MAX_BATCH_REPORT_COMPARISONS', default=1000, cast=int)
+# Seconds after which a report still pending or processing counts as lost (the render queue lives in memory)
+REPORT_RENDER_TIMEOUT = config('REPORT_RENDER_TIMEOUT', default=900, cast=int)
+ADMIN_STATS_TTL = config('ADMIN_STATS_TTL', default=30, cast=int)
+
+# Queries a request may run before it is logged as over budget (per view name)
+QUERY_BUDGET_DEFAULT = config('QUERY_BUDGET_DEFAULT', default=15, cast=int)
+QUERY_BUDGETS = {
+    # Bulk inserts of blobs and submissions, one statement per 500 rows
+    'users:upload_archive': 25,
+}
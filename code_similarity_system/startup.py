@@ -0,0 +1,36 @@
+"""
+What the server does once, when its WSGI/ASGI module is loaded (in a
+pre-forking server's master, before the workers fork).
+"""
+
+import logging
+
+from django.db import connections
+
+logger = logging.getLogger('code_similarity_system.startup')
+
+
+def recover_interrupted_work():
+    """Fail the background work a previous run lost with its in-memory queues"""
+    from reports.tasks import recover_interrupted_reports
+    from similarity_engine.jobs import fail_orphaned_comparisons
+
+    for name, recover in (('comparisons', fail_orphaned_comparisons), ('reports', recover_interrupted_reports)):
+        try:
+            count = recover()
+        except Exception:
+            # e.g. the database isn't reachable yet; the server still starts
+            logger.exception('Could not recover interrupted %s', name)
+            continue
+        if count:
+            logger.warning('Failed %d interrupted %s', count, name)
+
+
+def on_load():
+    """Recover interrupted work, then warm up (see similarity_engine.warmup)"""
+    from similarity_engine.warmup import warm_up_on_load
+
+    recover_interrupted_work()
+    warm_up_on_load()
+    # Workers forked from a preloading master must not share its database connections
+    connections.close_all()
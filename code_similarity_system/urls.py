@@ -10,6 +10,7 @@ urlpatterns = [
     path('users/', include('users.urls', namespace='users')),
     path('accounts/', include('users.urls', namespace='accounts')),  # Same URLs, different namespace
     path('admins/', include('admins.urls', namespace='admins')),
+    path('reports/', include('reports.urls', namespace='reports')),
 ]
 
 if settings.DEBUG:
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'code_similarity_system.settings')
 
 application = get_wsgi_application()
+
+# Fail the background work a previous run lost, and load the read-only state workers share
+# before a pre-forking server forks them
+from code_similarity_system.startup import on_load  # noqa: E402
+
+on_load()
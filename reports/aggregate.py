@@ -0,0 +1,284 @@
+"""
+AggregateReport generation from the daily rollup tables.
+
+Summaries are assembled from DailySimilarityRollup, DailyActivityRollup
+and DailyUsageRollup rows only (a few rows per day), so any date range
+builds in milliseconds regardless of how many results it covers. The
+plagiarism incidents report also lists the stored plagiarism clusters
+(similarity_engine.plagiarism) with a member submitted in the range.
+"""
+
+import json
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db.models import Count
+from django.utils import timezone
+
+from admins.models import MLModel
+from users.models import PlagiarismCluster, PlagiarismClusterMember
+from .models import AggregateReport, DailyActivityRollup, DailySimilarityRollup, DailyUsageRollup
+from .rollups import ALL_ACTIVITY, HISTOGRAM_BUCKETS, backfill_rollups, day_bounds, refresh_rollups
+
+# Largest plagiarism clusters listed, with their members, in plagiarism incident reports
+REPORT_CLUSTERS = 20
+
+
+def _avg(total, count):
+    return round(total / count, 2) if count else 0.0
+
+
+def _histogram_labels():
+    width = 100 // HISTOGRAM_BUCKETS
+    return [f'{i * width}-{(i + 1) * width}%' for i in range(HISTOGRAM_BUCKETS)]
+
+
+def _similarity_rollups(date_from, date_to):
+    return DailySimilarityRollup.objects.filter(day__gte=date_from, day__lte=date_to).values(
+        'day', 'language', 'comparison_type', 'result_count', 'high_similarity_count',
+        'score_sum', 'token_sum', 'structural_sum', 'ast_sum', 'ml_sum', 'ml_count',
+        'min_score', 'max_score', 'score_histogram',
+    )
+
+
+def similarity_trends(date_from, date_to):
+    daily = defaultdict(lambda: {'results': 0, 'high_similarity': 0, 'score_sum': 0.0})
+    languages = defaultdict(lambda: {'results': 0, 'high_similarity': 0, 'score_sum': 0.0})
+    types = defaultdict(int)
+    histogram = [0] * HISTOGRAM_BUCKETS
+    totals = {'results': 0, 'high_similarity': 0, 'score_sum': 0.0, 'token_sum': 0.0,
+              'structural_sum': 0.0, 'ast_sum': 0.0}
+    min_score = max_score = None
+
+    for row in _similarity_rollups(date_from, date_to):
+        for bucket in (daily[row['day'].isoformat()], languages[row['language']]):
+            bucket['results'] += row['result_count']
+            bucket['high_similarity'] += row['high_similarity_count']
+            bucket['score_sum'] += row['score_sum']
+        types[row['comparison_type']] += row['result_count']
+        totals['results'] += row['result_count']
+        totals['high_similarity'] += row['high_similarity_count']
+        for field in ('score_sum', 'token_sum', 'structural_sum', 'ast_sum'):
+            totals[field] += row[field]
+        for i, n in enumerate(row['score_histogram'][:HISTOGRAM_BUCKETS]):
+            histogram[i] += n
+        if row['min_score'] is not None:
+            min_score = row['min_score'] if min_score is None else min(min_score, row['min_score'])
+            max_score = row['max_score'] if max_score is None else max(max_score, row['max_score'])
+
+    def finish(bucket):
+        return {
+            'results': bucket['results'],
+            'high_similarity': bucket['high_similarity'],
+            'average_similarity': _avg(bucket['score_sum'], bucket['results']),
+        }
+
+    count = totals['results']
+    return {
+        'total_results': count,
+        'high_similarity_results': totals['high_similarity'],
+        'average_similarity': _avg(totals['score_sum'], count),
+        'average_token_similarity': _avg(totals['token_sum'], count),
+        'average_structural_similarity': _avg(totals['structural_sum'], count),
+        'average_ast_similarity': _avg(totals['ast_sum'], count),
+        'min_similarity': min_score,
+        'max_similarity': max_score,
+        'score_histogram': dict(zip(_histogram_labels(), histogram)),
+        'by_language': {language: finish(bucket) for language, bucket in sorted(languages.items())},
+        'by_comparison_type': dict(sorted(types.items())),
+        'daily': {day: finish(bucket) for day, bucket in sorted(daily.items())},
+    }
+
+
+def plagiarism_clusters(date_from, date_to):
+    start, end = day_bounds(date_from, date_to)
+    clusters = list(PlagiarismCluster.objects.filter(
+        members__submission__created_at__gte=start, members__submission__created_at__lt=end
+    ).annotate(members_in_range=Count('members')).values(
+        'pk', 'cluster_id', 'language', 'size', 'members_in_range', 'edge_count', 'density', 'average_score', 'max_score',
+    ).order_by('-size', '-max_score', 'pk'))
+
+    languages = defaultdict(lambda: {'clusters': 0, 'submissions': 0})
+    for cluster in clusters:
+        languages[cluster['language']]['clusters'] += 1
+        languages[cluster['language']]['submissions'] += cluster['size']
+
+    top = clusters[:REPORT_CLUSTERS]
+    members = defaultdict(list)
+    for member in PlagiarismClusterMember.objects.filter(cluster_id__in=[c['pk'] for c in top]).values(
+        'cluster_id', 'submission__submission_id', 'submission__title', 'submission__user__username', 'degree', 'max_score',
+    ):
+        members[member['cluster_id']].append({
+            'submission_id': str(member['submission__submission_id']),
+            'title': member['submission__title'],
+            'user': member['submission__user__username'],
+            'degree': member['degree'],
+            'max_score': round(member['max_score'], 2),
+        })
+
+    return {
+        'clusters': len(clusters),
+        'clustered_submissions': sum(cluster['size'] for cluster in clusters),
+        'largest_cluster': max((cluster['size'] for cluster in clusters), default=0),
+        'by_language': dict(sorted(languages.items())),
+        'top': [
+            {
+                'cluster_id': str(cluster['cluster_id']),
+                'language': cluster['language'],
+                'size': cluster['size'],
+                'members_in_range': cluster['members_in_range'],
+                'edges': cluster['edge_count'],
+                'density': cluster['density'],
+                'average_score': round(cluster['average_score'], 2),
+                'max_score': round(cluster['max_score'], 2),
+                'members': members[cluster['pk']],
+            }
+            for cluster in top
+        ],
+    }
+
+
+def plagiarism_incidents(date_from, date_to):
+    daily = defaultdict(int)
+    languages = defaultdict(int)
+    total = incidents = 0
+    for row in _similarity_rollups(date_from, date_to):
+        daily[row['day'].isoformat()] += row['high_similarity_count']
+        languages[row['language']] += row['high_similarity_count']
+        total += row['result_count']
+        incidents += row['high_similarity_count']
+    return {
+        'total_results': total,
+        'incidents': incidents,
+        'incident_rate': _avg(incidents * 100, total),
+        'by_language': dict(sorted(languages.items())),
+        'daily': dict(sorted(daily.items())),
+        'clusters': plagiarism_clusters(date_from, date_to),
+    }
+
+
+def user_activity(date_from, date_to):
+    by_type = defaultdict(int)
+    daily = {}
+    for row in DailyActivityRollup.objects.filter(day__gte=date_from, day__lte=date_to).values(
+        'day', 'activity_type', 'event_count', 'active_users'
+    ):
+        if row['activity_type'] == ALL_ACTIVITY:
+            daily[row['day'].isoformat()] = {'events': row['event_count'], 'active_users': row['active_users']}
+        else:
+            by_type[row['activity_type']] += row['event_count']
+
+    days = (date_to - date_from).days + 1
+    active = [values['active_users'] for values in daily.values()]
+    return {
+        'total_events': sum(values['events'] for values in daily.values()),
+        'by_activity_type': dict(sorted(by_type.items())),
+        'peak_daily_active_users': max(active, default=0),
+        'average_daily_active_users': _avg(sum(active), days),
+        'daily': dict(sorted(daily.items())),
+    }
+
+
+def system_usage(date_from, date_to):
+    languages = defaultdict(lambda: defaultdict(int))
+    daily = defaultdict(lambda: defaultdict(int))
+    fields = ('submissions', 'submission_bytes', 'submission_lines', 'comparisons', 'failed_comparisons')
+    for row in DailyUsageRollup.objects.filter(day__gte=date_from, day__lte=date_to).values('day', 'language', *fields):
+        for field in fields:
+            languages[row['language']][field] += row[field]
+            daily[row['day'].isoformat()][field] += row[field]
+
+    totals = {field: sum(values[field] for values in languages.values()) for field in fields}
+    return {
+        **totals,
+        'by_language': {language: dict(values) for language, values in sorted(languages.items())},
+        'daily': {day: dict(values) for day, values in sorted(daily.items())},
+    }
+
+
+def model_performance(date_from, date_to):
+    ml_sum = ml_count = 0
+    daily = defaultdict(lambda: [0.0, 0])
+    for row in _similarity_rollups(date_from, date_to):
+        ml_sum += row['ml_sum']
+        ml_count += row['ml_count']
+        daily[row['day'].isoformat()][0] += row['ml_sum']
+        daily[row['day'].isoformat()][1] += row['ml_count']
+
+    models = [
+        {
+            'name': model['name'],
+            'version': model['version'],
+            'model_type': model['model_type'],
+            'status': model['status'],
+            'is_default': model['is_default'],
+            'accuracy': model['accuracy'],
+            'precision': model['precision'],
+            'recall': model['recall'],
+            'f1_score': model['f1_score'],
+            'usage_count': model['usage_count'],
+        }
+        for model in MLModel.objects.values(
+            'name', 'version', 'model_type', 'status', 'is_default',
+            'accuracy', 'precision', 'recall', 'f1_score', 'usage_count',
+        )
+    ]
+    return {
+        'ml_scored_results': ml_count,
+        'average_ml_similarity': _avg(ml_sum, ml_count),
+        'models': models,
+        'daily': {day: {'ml_scored_results': n, 'average_ml_similarity': _avg(s, n)}
+                  for day, (s, n) in sorted(daily.items())},
+    }
+
+
+SUMMARY_BUILDERS = {
+    'similarity_trends': similarity_trends,
+    'plagiarism_incidents': plagiarism_incidents,
+    'user_activity': user_activity,
+    'system_usage': system_usage,
+    'model_performance': model_performance,
+}
+
+
+def build_summary(report_type, date_from, date_to):
+    """data_summary for one report type and inclusive date range"""
+    if report_type not in SUMMARY_BUILDERS:
+        raise ValueError(f'Unknown aggregate report type: {report_type}')
+    summary = SUMMARY_BUILDERS[report_type](date_from, date_to)
+    summary['date_from'] = date_from.isoformat()
+    summary['date_to'] = date_to.isoformat()
+    return summary
+
+
+def generate_aggregate_report(report_type, date_from, date_to, generated_by=None, title=None, refresh=True):
+    """Build an AggregateReport (data_summary plus a JSON file) for a date range"""
+    if date_from > date_to:
+        raise ValueError('date_from must not be after date_to')
+
+    if refresh:
+        # Days the periodic job never covered (e.g. before it was scheduled) have no rollups yet
+        backfill_rollups(date_from, date_to)
+        # Only the most recent days can still be changing; older rollups are final
+        today = timezone.localdate()
+        recent_from = max(date_from, today - timedelta(days=1))
+        if recent_from <= date_to:
+            refresh_rollups(recent_from, min(date_to, today))
+
+    summary = build_summary(report_type, date_from, date_to)
+    label = dict(AggregateReport.REPORT_TYPES)[report_type]
+
+    report = AggregateReport(
+        report_type=report_type,
+        title=title or f'{label} ({date_from} to {date_to})',
+        description=f'{label} for {date_from} to {date_to}, built from daily rollups.',
+        date_from=date_from,
+        date_to=date_to,
+        data_summary=summary,
+        generated_by=generated_by,
+    )
+    content = json.dumps(summary, indent=2).encode('utf-8')
+    report.file_path.save(f'{report_type}_{date_from:%Y%m%d}_{date_to:%Y%m%d}.json', ContentFile(content), save=False)
+    report.save()
+    return report
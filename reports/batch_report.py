@@ -0,0 +1,181 @@
+"""
+Batch (multi-comparison) PDF reports.
+
+A batch report starts with a summary table of every comparison sorted by
+overall similarity, followed by one section per comparison. Sections are
+rendered in groups by the report process pool and merged in order with
+PyPDF2. Only a bounded number of groups is in flight at a time, so
+rendering memory stays flat however many comparisons the batch covers.
+
+The merge does not: PdfMerger keeps every part open and its writer
+resolves every page object before writing, so the merge step holds the
+whole merged document in memory. MAX_BATCH_REPORT_COMPARISONS caps the
+comparisons in a batch to bound it.
+"""
+
+import os
+import shutil
+import tempfile
+from collections import deque
+
+from django.conf import settings
+from django.utils import timezone
+from PyPDF2 import PdfMerger
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .models import BatchReport
+from .report_generator import ReportGenerator, build_report_data
+
+SECTION_SIZE = 20
+SUMMARY_ROWS_PER_PART = 500
+
+
+def render_summary_part(title, rows, first_rank, filepath):
+    """Render one part of the summary table (rows are small tuples)"""
+    styles = getSampleStyleSheet()
+    story = []
+    if first_rank == 1:
+        story.append(Paragraph(title, styles['Title']))
+        story.append(Paragraph('Comparisons sorted by overall similarity', styles['Heading2']))
+        story.append(Spacer(1, 0.2*inch))
+
+    table_data = [['#', 'Request ID', 'User', 'Source', 'Target', 'Overall']]
+    for rank, (request_id, username, source, target, score) in enumerate(rows, first_rank):
+        table_data.append([str(rank), request_id[:8], username, source[:40], (target or 'N/A')[:40], f'{score:.2f}%'])
+
+    table = Table(table_data, repeatRows=1, colWidths=[0.5*inch, 1*inch, 1.4*inch, 2.8*inch, 2.8*inch, 1*inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#ecf0f1')]),
+    ]))
+    story.append(table)
+    SimpleDocTemplate(filepath, pagesize=landscape(A4)).build(story)
+    return filepath
+
+
+def render_section(section_data, include_code, include_metrics, filepath):
+    """Render the per-comparison pages for one group of comparisons"""
+    generator = ReportGenerator()
+    story = []
+    for index, data in enumerate(section_data):
+        if index:
+            story.append(PageBreak())
+        story.extend(generator.pdf_story(data, False, include_code, include_metrics))
+    SimpleDocTemplate(filepath, pagesize=A4).build(story)
+    return filepath
+
+
+class BatchReportBuilder:
+
+    def __init__(self, batch_report, executor=None, section_size=SECTION_SIZE, max_in_flight=None):
+        self.batch_report = batch_report
+        self.executor = executor
+        self.section_size = section_size
+        self.max_in_flight = max_in_flight or max(2, settings.REPORT_WORKERS * 2)
+
+    def _comparisons(self):
+        return self.batch_report.comparisons.filter(result__isnull=False).order_by(
+            '-result__overall_similarity_score', 'id'
+        )
+
+    def _submit(self, fn, *args):
+        if self.executor is None:
+            fn(*args)
+            return None
+        return self.executor.submit(fn, *args)
+
+    def _update(self, **fields):
+        BatchReport.objects.filter(pk=self.batch_report.pk).update(**fields)
+
+    def build(self):
+        """Render every part, merge them and store the result on the batch report"""
+        report = self.batch_report
+        comparisons = self._comparisons()
+        total = comparisons.count()
+        self._update(status='processing', progress=1, comparison_count=total)
+
+        work_dir = tempfile.mkdtemp(prefix='batch_report_')
+        parts = []
+        in_flight = deque()
+
+        def enqueue(fn, *args):
+            parts.append(args[-1])
+            future = self._submit(fn, *args)
+            if future is not None:
+                in_flight.append(future)
+            # Bound memory: wait for the oldest part before queueing more
+            while len(in_flight) >= self.max_in_flight:
+                in_flight.popleft().result()
+
+        try:
+            # Summary table, split so no single part holds every row
+            summary = comparisons.values_list(
+                'request_id', 'user__username', 'source_submission__title',
+                'target_submission__title', 'result__overall_similarity_score',
+            )
+            rows = []
+            first_rank = 1
+            for request_id, username, source, target, score in summary.iterator(chunk_size=SUMMARY_ROWS_PER_PART):
+                rows.append((str(request_id), username, source, target, score))
+                if len(rows) == SUMMARY_ROWS_PER_PART:
+                    enqueue(render_summary_part, report.title, rows, first_rank,
+                            os.path.join(work_dir, f'summary_{len(parts):05d}.pdf'))
+                    first_rank += len(rows)
+                    rows = []
+            if rows or first_rank == 1:
+                enqueue(render_summary_part, report.title, rows, first_rank,
+                        os.path.join(work_dir, f'summary_{len(parts):05d}.pdf'))
+
+            # Per-comparison sections
+            section = []
+            done = 0
+            details = comparisons.select_related('user', 'result').with_submissions()
+            for comparison in details.iterator(chunk_size=self.section_size):
+                section.append(build_report_data(comparison, comparison.result))
+                if len(section) == self.section_size:
+                    enqueue(render_section, section, report.include_code_segments, report.include_metrics,
+                            os.path.join(work_dir, f'section_{len(parts):05d}.pdf'))
+                    done += len(section)
+                    section = []
+                    self._update(progress=min(90, 5 + int(85 * done / max(total, 1))))
+            if section:
+                enqueue(render_section, section, report.include_code_segments, report.include_metrics,
+                        os.path.join(work_dir, f'section_{len(parts):05d}.pdf'))
+
+            while in_flight:
+                in_flight.popleft().result()
+            self._update(progress=95)
+
+            file_name = f'batch_reports/{report.report_id.hex}.pdf'
+            file_path = os.path.join(settings.MEDIA_ROOT, file_name)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            merged_path = os.path.join(work_dir, 'merged.pdf')
+
+            merger = PdfMerger()
+            try:
+                for part in parts:
+                    merger.append(part)
+                merger.write(merged_path)
+            finally:
+                merger.close()
+            shutil.move(merged_path, file_path)
+
+            self._update(
+                status='completed', progress=100, file_path=file_name,
+                file_size=os.path.getsize(file_path), completed_at=timezone.now(),
+                error_message=None,
+            )
+        except Exception as e:
+            for future in in_flight:
+                future.cancel()
+            self._update(status='failed', error_message=str(e))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
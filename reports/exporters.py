@@ -0,0 +1,119 @@
+"""
+Streaming bulk export of similarity results.
+
+Rows are read in primary-key ordered batches and written out one at a
+time, so memory use does not grow with the size of the export. (On MySQL
+QuerySet.iterator() still buffers the whole result set client-side, so
+batches are fetched with keyset pagination on the primary key instead.)
+"""
+
+import csv
+import json
+
+from openpyxl import Workbook
+
+from users.models import SimilarityResult
+
+EXPORT_COLUMNS = (
+    ('result_id', 'result_id'),
+    ('request_id', 'comparison__request_id'),
+    ('user', 'comparison__user__username'),
+    ('comparison_type', 'comparison__comparison_type'),
+    ('source_title', 'comparison__source_submission__title'),
+    ('source_language', 'comparison__source_submission__language'),
+    ('target_title', 'comparison__target_submission__title'),
+    ('overall_similarity', 'overall_similarity_score'),
+    ('token_similarity', 'token_similarity'),
+    ('structural_similarity', 'structural_similarity'),
+    ('ast_similarity', 'ast_similarity'),
+    ('ml_similarity', 'ml_similarity'),
+    ('created_at', 'created_at'),
+)
+
+# An xlsx sheet holds at most 1,048,576 rows, one of them the header
+XLSX_MAX_DATA_ROWS = 1048575
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+def export_headers():
+    return [name for name, _ in EXPORT_COLUMNS]
+
+
+def iter_result_rows(queryset=None, chunk_size=2000):
+    """Yield one tuple per SimilarityResult, fetching chunk_size rows per query"""
+    if queryset is None:
+        queryset = SimilarityResult.objects.all()
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    queryset = queryset.order_by('pk')
+
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).values_list('pk', *lookups)[:chunk_size])
+        if not batch:
+            return
+        for row in batch:
+            yield row[1:]
+        # A short batch was the last one
+        if len(batch) < chunk_size:
+            return
+        last_pk = batch[-1][0]
+
+
+def _plain(value):
+    """Export-friendly scalar (UUIDs and datetimes become strings)"""
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class _Echo:
+    """File-like object whose write() hands the written line back"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """Yield CSV lines (header first) for a row iterator"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(export_headers())
+    for row in rows:
+        yield writer.writerow([_plain(value) for value in row])
+
+
+def stream_jsonl(rows):
+    """Yield one JSON object per line for a row iterator"""
+    headers = export_headers()
+    for row in rows:
+        yield json.dumps(dict(zip(headers, (_plain(value) for value in row)))) + '\n'
+
+
+def write_xlsx(rows, destination):
+    """
+    Write rows to an xlsx file using openpyxl's write-only (streaming) mode,
+    starting a new sheet (header repeated) whenever one is full
+    """
+    workbook = Workbook(write_only=True)
+    sheet = None
+    for count, row in enumerate(rows):
+        if count % XLSX_MAX_DATA_ROWS == 0:
+            sheet = _new_sheet(workbook, count // XLSX_MAX_DATA_ROWS + 1)
+        sheet.append([_plain(value) for value in row])
+    if sheet is None:
+        _new_sheet(workbook, 1)
+    workbook.save(destination)
+    return destination
+
+
+def _new_sheet(workbook, number):
+    title = 'Similarity Results' if number == 1 else f'Similarity Results ({number})'
+    sheet = workbook.create_sheet(title)
+    sheet.append(export_headers())
+    return sheet
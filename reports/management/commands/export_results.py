@@ -0,0 +1,37 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from users.models import SimilarityResult
+from reports.exporters import EXPORT_FORMATS, iter_result_rows, stream_csv, stream_jsonl, write_xlsx
+
+class Command(BaseCommand):
+    help = 'Export all similarity results as CSV, JSONL or XLSX with constant memory'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', help='Output file (default: stdout; required for xlsx)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per query')
+        parser.add_argument('--min-score', type=float, help='Only export results at or above this overall score')
+    
+    def handle(self, *args, **options):
+        export_format = options['format']
+        results = SimilarityResult.objects.all()
+        if options['min_score'] is not None:
+            results = results.filter(overall_similarity_score__gte=options['min_score'])
+        rows = iter_result_rows(results, chunk_size=options['chunk_size'])
+        
+        if export_format == 'xlsx':
+            if not options['output']:
+                raise CommandError('--output is required for xlsx exports')
+            write_xlsx(rows, options['output'])
+        else:
+            stream = stream_csv(rows) if export_format == 'csv' else stream_jsonl(rows)
+            out = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+            try:
+                for chunk in stream:
+                    out.write(chunk)
+            finally:
+                if options['output']:
+                    out.close()
+        
+        if options['output']:
+            self.stderr.write(self.style.SUCCESS(f"Exported results to {options['output']}"))
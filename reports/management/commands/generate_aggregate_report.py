@@ -0,0 +1,36 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from accounts.models import CustomUser
+from reports.aggregate import SUMMARY_BUILDERS, generate_aggregate_report
+
+class Command(BaseCommand):
+    help = 'Generate an aggregate report for a date range from the daily rollups'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--type', required=True, choices=sorted(SUMMARY_BUILDERS))
+        parser.add_argument('--from', dest='date_from', help='First day (YYYY-MM-DD, default: 30 days ago)')
+        parser.add_argument('--to', dest='date_to', help='Last day (YYYY-MM-DD, default: today)')
+        parser.add_argument('--user', help='Username recorded as the generator')
+        parser.add_argument('--title')
+    
+    def handle(self, *args, **options):
+        try:
+            date_to = date.fromisoformat(options['date_to']) if options['date_to'] else timezone.localdate()
+            date_from = date.fromisoformat(options['date_from']) if options['date_from'] else date_to - timedelta(days=29)
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+        
+        user = None
+        if options['user']:
+            try:
+                user = CustomUser.objects.get(username=options['user'])
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist")
+        
+        try:
+            report = generate_aggregate_report(options['type'], date_from, date_to, generated_by=user, title=options['title'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        self.stdout.write(self.style.SUCCESS(f"{report.title} written to {report.file_path.path}"))
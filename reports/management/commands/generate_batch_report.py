@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import CustomUser
+from users.models import ComparisonRequest
+from reports.models import BatchReport
+from reports.tasks import render_batch_report
+
+class Command(BaseCommand):
+    help = 'Render one merged PDF report for a set of completed comparisons'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', required=True, help='Username the batch report belongs to')
+        parser.add_argument('--title', default='Batch Similarity Report')
+        parser.add_argument('--user', help='Only include comparisons made by this username')
+        parser.add_argument('--request-ids', nargs='*', default=[], help='Comparison request IDs (default: all completed)')
+        parser.add_argument('--include-code', action='store_true', help='Include identical code segments')
+        parser.add_argument('--no-processes', action='store_true', help='Render in this process instead of the worker pool')
+    
+    def handle(self, *args, **options):
+        try:
+            owner = CustomUser.objects.get(username=options['owner'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"User {options['owner']} does not exist")
+        
+        comparisons = ComparisonRequest.objects.filter(status='completed', result__isnull=False)
+        if options['user']:
+            comparisons = comparisons.filter(user__username=options['user'])
+        if options['request_ids']:
+            try:
+                comparisons = comparisons.filter(request_id__in=options['request_ids'])
+            except ValidationError as e:
+                raise CommandError(f"Invalid request ID: {e.messages[0]}")
+        count = comparisons.count()
+        if count > settings.MAX_BATCH_REPORT_COMPARISONS:
+            raise CommandError(
+                f"{count} comparisons selected; a batch report covers at most "
+                f"{settings.MAX_BATCH_REPORT_COMPARISONS}"
+            )
+        
+        batch_report = BatchReport.objects.create(
+            user=owner,
+            title=options['title'],
+            include_code_segments=options['include_code'],
+        )
+        batch_report.comparisons.set(comparisons)
+        
+        self.stdout.write(f"Rendering {count} comparisons...")
+        render_batch_report(batch_report.pk, use_processes=not options['no_processes'])
+        batch_report.refresh_from_db()
+        
+        if batch_report.status != 'completed':
+            raise CommandError(f"Batch report failed: {batch_report.error_message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Batch report written to {batch_report.file_path.path} ({batch_report.file_size} bytes)"
+        ))
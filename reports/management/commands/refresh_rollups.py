@@ -0,0 +1,33 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from reports.rollups import earliest_activity_date, refresh_recent, refresh_rollups
+
+class Command(BaseCommand):
+    help = 'Recompute the daily similarity, activity and usage rollups (run periodically, e.g. hourly)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2, help='Refresh today and the previous N-1 days (default: 2)')
+        parser.add_argument('--from', dest='date_from', help='First day to refresh (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Last day to refresh (YYYY-MM-DD, default: today)')
+        parser.add_argument('--all', action='store_true', help='Backfill every day since the first recorded activity')
+    
+    def handle(self, *args, **options):
+        try:
+            date_from = date.fromisoformat(options['date_from']) if options['date_from'] else None
+            date_to = date.fromisoformat(options['date_to']) if options['date_to'] else timezone.localdate()
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+        
+        if options['all']:
+            date_from = earliest_activity_date()
+            if date_from is None:
+                self.stdout.write('Nothing to roll up')
+                return
+        
+        if date_from is not None:
+            written = refresh_rollups(date_from, date_to)
+            self.stdout.write(self.style.SUCCESS(f"Refreshed rollups for {date_from} to {date_to} ({written} rows)"))
+        else:
+            written = refresh_recent(options['days'])
+            self.stdout.write(self.style.SUCCESS(f"Refreshed rollups for the last {options['days']} days ({written} rows)"))
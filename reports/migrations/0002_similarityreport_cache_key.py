@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-19 01:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='similarityreport',
+            name='cache_key',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='similarityreport',
+            name='last_accessed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.1 on 2026-10-19 01:47
+
+from django.db import migrations, models
+
+
+def mark_existing_completed(apps, schema_editor):
+    # Reports created before background rendering were rendered synchronously
+    SimilarityReport = apps.get_model('reports', 'SimilarityReport')
+    SimilarityReport.objects.update(status='completed', progress=100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0002_similarityreport_cache_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='similarityreport',
+            name='error_message',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='similarityreport',
+            name='progress',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='similarityreport',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='similarityreport',
+            name='file_path',
+            field=models.FileField(blank=True, upload_to='reports/%Y/%m/%d/'),
+        ),
+        migrations.RunPython(mark_existing_completed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.1 on 2026-10-19 01:50
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0003_similarityreport_status'),
+        ('users', '0002_alter_savedcomparison_result'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('title', models.CharField(max_length=200)),
+                ('comparison_count', models.IntegerField(default=0)),
+                ('file_path', models.FileField(blank=True, upload_to='batch_reports/%Y/%m/')),
+                ('file_size', models.IntegerField(default=0)),
+                ('include_code_segments', models.BooleanField(default=False)),
+                ('include_metrics', models.BooleanField(default=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('progress', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('generated_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('comparisons', models.ManyToManyField(related_name='batch_reports', to='users.comparisonrequest')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batch_reports', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'batch_reports',
+                'ordering': ['-generated_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.0.1 on 2026-10-19 01:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0004_batchreport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('activity_type', models.CharField(max_length=30)),
+                ('event_count', models.IntegerField(default=0)),
+                ('active_users', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'daily_activity_rollups',
+                'ordering': ['day'],
+                'unique_together': {('day', 'activity_type')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySimilarityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('language', models.CharField(max_length=20)),
+                ('comparison_type', models.CharField(max_length=30)),
+                ('result_count', models.IntegerField(default=0)),
+                ('high_similarity_count', models.IntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0.0)),
+                ('token_sum', models.FloatField(default=0.0)),
+                ('structural_sum', models.FloatField(default=0.0)),
+                ('ast_sum', models.FloatField(default=0.0)),
+                ('ml_sum', models.FloatField(default=0.0)),
+                ('ml_count', models.IntegerField(default=0)),
+                ('min_score', models.FloatField(blank=True, null=True)),
+                ('max_score', models.FloatField(blank=True, null=True)),
+                ('score_histogram', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'daily_similarity_rollups',
+                'ordering': ['day'],
+                'unique_together': {('day', 'language', 'comparison_type')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('language', models.CharField(max_length=20)),
+                ('submissions', models.IntegerField(default=0)),
+                ('submission_bytes', models.BigIntegerField(default=0)),
+                ('submission_lines', models.BigIntegerField(default=0)),
+                ('comparisons', models.IntegerField(default=0)),
+                ('failed_comparisons', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'daily_usage_rollups',
+                'ordering': ['day'],
+                'unique_together': {('day', 'language')},
+            },
+        ),
+    ]
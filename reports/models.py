@@ -11,19 +11,31 @@ class SimilarityReport(models.Model):
         ('html', 'HTML'),
     )
     
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+    
     report_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reports')
     comparison = models.ForeignKey(ComparisonRequest, on_delete=models.CASCADE)
     result = models.ForeignKey(SimilarityResult, on_delete=models.CASCADE)
     report_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
-    file_path = models.FileField(upload_to='reports/%Y/%m/%d/')
+    file_path = models.FileField(upload_to='reports/%Y/%m/%d/', blank=True)
     file_size = models.IntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    progress = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True, null=True)
     include_visualizations = models.BooleanField(default=True)
     include_code_segments = models.BooleanField(default=True)
     include_metrics = models.BooleanField(default=True)
     generated_at = models.DateTimeField(auto_now_add=True)
     download_count = models.IntegerField(default=0)
     last_downloaded = models.DateTimeField(blank=True, null=True)
+    cache_key = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    last_accessed = models.DateTimeField(blank=True, null=True)
     
     class Meta:
         db_table = 'similarity_reports'
@@ -31,6 +43,40 @@ class SimilarityReport(models.Model):
     
     def __str__(self):
         return f"Report {self.report_id} - {self.report_format.upper()}"
+    
+    @property
+    def is_ready(self):
+        return self.status == 'completed'
+
+
+class BatchReport(models.Model):
+    """Single PDF covering many comparisons (e.g. a whole assignment)"""
+    
+    report_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='batch_reports')
+    title = models.CharField(max_length=200)
+    comparisons = models.ManyToManyField(ComparisonRequest, related_name='batch_reports')
+    comparison_count = models.IntegerField(default=0)
+    file_path = models.FileField(upload_to='batch_reports/%Y/%m/', blank=True)
+    file_size = models.IntegerField(default=0)
+    include_code_segments = models.BooleanField(default=False)
+    include_metrics = models.BooleanField(default=True)
+    status = models.CharField(max_length=20, choices=SimilarityReport.STATUS_CHOICES, default='pending')
+    progress = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True, null=True)
+    generated_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'batch_reports'
+        ordering = ['-generated_at']
+    
+    def __str__(self):
+        return f"Batch report {self.title} ({self.comparison_count} comparisons)"
+    
+    @property
+    def is_ready(self):
+        return self.status == 'completed'
 
 
 class AggregateReport(models.Model):
@@ -59,3 +105,70 @@ class AggregateReport(models.Model):
     
     def __str__(self):
         return f"{self.get_report_type_display()} - {self.date_from} to {self.date_to}"
+
+
+class DailySimilarityRollup(models.Model):
+    """Per-day similarity result totals for one source language and comparison type"""
+    
+    day = models.DateField()
+    language = models.CharField(max_length=20)
+    comparison_type = models.CharField(max_length=30)
+    result_count = models.IntegerField(default=0)
+    high_similarity_count = models.IntegerField(default=0)
+    score_sum = models.FloatField(default=0.0)
+    token_sum = models.FloatField(default=0.0)
+    structural_sum = models.FloatField(default=0.0)
+    ast_sum = models.FloatField(default=0.0)
+    ml_sum = models.FloatField(default=0.0)
+    ml_count = models.IntegerField(default=0)
+    min_score = models.FloatField(blank=True, null=True)
+    max_score = models.FloatField(blank=True, null=True)
+    score_histogram = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'daily_similarity_rollups'
+        ordering = ['day']
+        unique_together = ['day', 'language', 'comparison_type']
+    
+    def __str__(self):
+        return f"{self.day} {self.language}/{self.comparison_type}: {self.result_count} results"
+
+
+class DailyActivityRollup(models.Model):
+    """Per-day user activity counts; activity_type 'all' holds the day's overall totals"""
+    
+    day = models.DateField()
+    activity_type = models.CharField(max_length=30)
+    event_count = models.IntegerField(default=0)
+    active_users = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'daily_activity_rollups'
+        ordering = ['day']
+        unique_together = ['day', 'activity_type']
+    
+    def __str__(self):
+        return f"{self.day} {self.activity_type}: {self.event_count} events"
+
+
+class DailyUsageRollup(models.Model):
+    """Per-day submission and comparison volume for one language"""
+    
+    day = models.DateField()
+    language = models.CharField(max_length=20)
+    submissions = models.IntegerField(default=0)
+    submission_bytes = models.BigIntegerField(default=0)
+    submission_lines = models.BigIntegerField(default=0)
+    comparisons = models.IntegerField(default=0)
+    failed_comparisons = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'daily_usage_rollups'
+        ordering = ['day']
+        unique_together = ['day', 'language']
+    
+    def __str__(self):
+        return f"{self.day} {self.language}: {self.submissions} submissions"
@@ -0,0 +1,162 @@
+"""
+Content-addressed cache of generated similarity reports.
+
+A report is identified by (result_id, format, include_* flags, template
+version). Its file is written to a path derived from that key, so repeated
+requests reuse the existing SimilarityReport (even while it is still
+rendering) instead of re-rendering, and concurrent requests never collide
+on a timestamped filename. A failed report, one lost with the render
+queue (see tasks.is_lost) or one whose file was evicted is a miss: the next
+request renders the same row again.
+
+Eviction only removes files. The rows are the users' own report history,
+so an evicted report keeps its row with the file cleared.
+"""
+
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import SimilarityReport
+from .report_generator import REPORT_TEMPLATE_VERSION
+from .tasks import is_lost, render_report, submit_report
+
+
+def report_cache_key(result, report_format, include_viz, include_code, include_metrics):
+    """Stable key for one rendering of a result"""
+    parts = [
+        str(result.result_id),
+        report_format,
+        str(int(bool(include_viz))),
+        str(int(bool(include_code))),
+        str(int(bool(include_metrics))),
+        str(REPORT_TEMPLATE_VERSION),
+    ]
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def file_missing(report):
+    """Whether a completed report's file was evicted (or removed behind our back)"""
+    return report.is_ready and (not report.file_path or not os.path.exists(report.file_path.path))
+
+
+def needs_rendering(report):
+    """Failed, lost with the render queue or evicted, so it must be rendered again"""
+    return report.status == 'failed' or is_lost(report) or file_missing(report)
+
+
+class ReportCache:
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes if max_bytes is not None else settings.REPORT_CACHE_MAX_BYTES
+        self.lock_dir = os.path.join(settings.MEDIA_ROOT, 'reports', '.locks')
+
+    @contextmanager
+    def _lock(self, cache_key):
+        """Exclusive per-key lock shared by every thread and process on this host"""
+        os.makedirs(self.lock_dir, exist_ok=True)
+        with open(os.path.join(self.lock_dir, f'{cache_key}.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def lookup(self, cache_key):
+        """Cached report for a key (possibly still rendering), or None on a miss"""
+        report = SimilarityReport.objects.filter(cache_key=cache_key).first()
+        if report is None or needs_rendering(report):
+            return None
+        SimilarityReport.objects.filter(pk=report.pk).update(last_accessed=timezone.now())
+        return report
+
+    def get_or_create(self, user, comparison, result, report_format,
+                      include_viz, include_code, include_metrics, background=True):
+        """Return (report, created); a miss renders the report once, reusing a stale row for the key"""
+        cache_key = report_cache_key(result, report_format, include_viz, include_code, include_metrics)
+
+        report = self.lookup(cache_key)
+        if report is not None:
+            return report, False
+
+        with self._lock(cache_key):
+            # Another request may have created or re-queued it while we waited for the lock
+            report = self.lookup(cache_key)
+            if report is not None:
+                return report, False
+
+            report = SimilarityReport.objects.filter(cache_key=cache_key).first()
+            if report is not None:
+                self._reset(report)
+            else:
+                report = SimilarityReport.objects.create(
+                    user=user,
+                    comparison=comparison,
+                    result=result,
+                    report_format=report_format,
+                    status='pending',
+                    include_visualizations=include_viz,
+                    include_code_segments=include_code,
+                    include_metrics=include_metrics,
+                    cache_key=cache_key,
+                    last_accessed=timezone.now(),
+                )
+
+        self._render(report, background)
+        return report, True
+
+    def rerender(self, report, background=True):
+        """Render a cached report again if it needs it (e.g. it was evicted); returns it refreshed"""
+        with self._lock(report.cache_key):
+            report.refresh_from_db()
+            if not needs_rendering(report):
+                return report
+            self._reset(report)
+        self._render(report, background)
+        return report
+
+    def _reset(self, report):
+        """Put a stale report back to pending, as if just requested"""
+        now = timezone.now()
+        SimilarityReport.objects.filter(pk=report.pk).update(
+            status='pending', progress=0, error_message=None, file_path='', file_size=0,
+            generated_at=now, last_accessed=now,
+        )
+        report.refresh_from_db()
+
+    def _render(self, report, background):
+        if background:
+            submit_report(report.pk)
+        else:
+            render_report(report.pk, use_processes=False)
+            report.refresh_from_db()
+
+    def evict(self, keep=None):
+        """Remove the files of least recently used reports until the cache fits its disk budget"""
+        cached = SimilarityReport.objects.exclude(cache_key='').exclude(file_path='').filter(status='completed')
+        total = cached.aggregate(total=Sum('file_size'))['total'] or 0
+        if total <= self.max_bytes:
+            return 0
+
+        evicted = 0
+        candidates = cached.order_by(F('last_accessed').asc(nulls_first=True), 'generated_at')
+        if keep is not None:
+            candidates = candidates.exclude(pk=keep.pk)
+        for report in candidates.iterator():
+            if total <= self.max_bytes:
+                break
+            try:
+                if os.path.exists(report.file_path.path):
+                    os.remove(report.file_path.path)
+            except OSError:
+                pass
+            total -= report.file_size
+            # The row stays; without its file the next lookup renders it again
+            SimilarityReport.objects.filter(pk=report.pk).update(file_path='', file_size=0)
+            evicted += 1
+        return evicted
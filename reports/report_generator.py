@@ -3,37 +3,124 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
 from reportlab.lib import colors
+from reportlab.graphics.shapes import Drawing
+from reportlab.graphics.charts.barcharts import VerticalBarChart
 from django.conf import settings
 import os
 import json
 import csv
 from datetime import datetime
 
+# Bump whenever the rendered layout of any format changes; it is part of the
+# report cache key so stale cached reports are never served.
+REPORT_TEMPLATE_VERSION = 1
+
+
+# Formats whose rendering is CPU-heavy enough to be kept off web workers
+HEAVY_FORMATS = ('pdf',)
+
+
+def build_report_data(comparison, result):
+    """Plain (picklable) snapshot of everything a report renders"""
+    return {
+        'comparison_info': {
+            'request_id': str(comparison.request_id),
+            'user': comparison.user.username,
+            'date': comparison.created_at.isoformat(),
+            'type': comparison.get_comparison_type_display(),
+            'source_file': comparison.source_submission.title,
+            'target_file': comparison.target_submission.title if comparison.target_submission else None,
+        },
+        'similarity_scores': {
+            'overall': result.overall_similarity_score,
+            'token': result.token_similarity,
+            'structural': result.structural_similarity,
+            'ast': result.ast_similarity,
+            'ml_prediction': result.ml_similarity,
+        },
+        'segments': {
+            'identical': result.identical_segments,
+            'near_identical': result.near_identical_segments,
+        },
+        'code_metrics': result.code_metrics,
+    }
+
+
+def render_report_file(data, format_type, include_viz, include_code, include_metrics, filepath):
+    """Render a report snapshot to filepath; safe to run in a worker process"""
+    return ReportGenerator().render(data, format_type, include_viz, include_code, include_metrics, filepath)
+
+
 class ReportGenerator:
     
-    def generate_report(self, comparison, result, format_type, include_viz, include_code, include_metrics):
-        """Generate report in specified format"""
+    def generate_report(self, comparison, result, format_type, include_viz, include_code, include_metrics, filepath=None):
+        """Generate report in specified format, optionally at a caller-chosen path"""
+        
+        if format_type not in ('pdf', 'csv', 'json', 'html'):
+            return None
+        
+        filepath = filepath or self._default_path(comparison, format_type)
+        return self.render(build_report_data(comparison, result), format_type,
+                           include_viz, include_code, include_metrics, filepath)
+    
+    def render(self, data, format_type, include_viz, include_code, include_metrics, filepath):
+        """Render a report snapshot built by build_report_data"""
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
         
         if format_type == 'pdf':
-            return self._generate_pdf(comparison, result, include_viz, include_code, include_metrics)
+            return self._generate_pdf(data, include_viz, include_code, include_metrics, filepath)
         elif format_type == 'csv':
-            return self._generate_csv(comparison, result)
+            return self._generate_csv(data, filepath)
         elif format_type == 'json':
-            return self._generate_json(comparison, result)
+            return self._generate_json(data, filepath)
         elif format_type == 'html':
-            return self._generate_html(comparison, result, include_viz, include_code, include_metrics)
+            return self._generate_html(data, include_viz, include_code, include_metrics, filepath)
         
         return None
     
-    def _generate_pdf(self, comparison, result, include_viz, include_code, include_metrics):
-        """Generate PDF report"""
+    def _default_path(self, comparison, extension):
+        """Timestamped path under MEDIA_ROOT/reports"""
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'similarity_report_{comparison.request_id}_{timestamp}.pdf'
-        filepath = os.path.join(settings.MEDIA_ROOT, 'reports', filename)
-        
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        filename = f'similarity_report_{comparison.request_id}_{timestamp}.{extension}'
+        return os.path.join(settings.MEDIA_ROOT, 'reports', filename)
+    
+    def _display_date(self, data):
+        return datetime.fromisoformat(data['comparison_info']['date']).strftime('%Y-%m-%d %H:%M:%S')
+    
+    def _score_chart(self, scores):
+        """Bar chart of the similarity scores"""
+        labels = ['Overall', 'Token', 'Structural', 'AST']
+        values = [scores['overall'], scores['token'], scores['structural'], scores['ast']]
+        if scores['ml_prediction']:
+            labels.append('ML')
+            values.append(scores['ml_prediction'])
         
+        drawing = Drawing(6*inch, 2.5*inch)
+        chart = VerticalBarChart()
+        chart.x = 0.5*inch
+        chart.y = 0.4*inch
+        chart.width = 5*inch
+        chart.height = 1.9*inch
+        chart.data = [[v or 0 for v in values]]
+        chart.categoryAxis.categoryNames = labels
+        chart.valueAxis.valueMin = 0
+        chart.valueAxis.valueMax = max(100, max(chart.data[0]))
+        chart.bars[0].fillColor = colors.HexColor('#3498db')
+        drawing.add(chart)
+        return drawing
+    
+    def _generate_pdf(self, data, include_viz, include_code, include_metrics, filepath):
+        """Generate PDF report"""
         doc = SimpleDocTemplate(filepath, pagesize=A4)
+        doc.build(self.pdf_story(data, include_viz, include_code, include_metrics))
+        return filepath
+    
+    def pdf_story(self, data, include_viz, include_code, include_metrics):
+        """Platypus flowables for one comparison's PDF report"""
+        info = data['comparison_info']
+        scores = data['similarity_scores']
+        segments = data['segments']
+        
         story = []
         styles = getSampleStyleSheet()
         
@@ -52,12 +139,12 @@ class ReportGenerator:
         # Comparison Information
         story.append(Paragraph('Comparison Details', styles['Heading2']))
         comparison_data = [
-            ['Request ID:', str(comparison.request_id)],
-            ['User:', comparison.user.username],
-            ['Date:', comparison.created_at.strftime('%Y-%m-%d %H:%M:%S')],
-            ['Type:', comparison.get_comparison_type_display()],
-            ['Source File:', comparison.source_submission.title],
-            ['Target File:', comparison.target_submission.title if comparison.target_submission else 'N/A'],
+            ['Request ID:', info['request_id']],
+            ['User:', info['user']],
+            ['Date:', self._display_date(data)],
+            ['Type:', info['type']],
+            ['Source File:', info['source_file']],
+            ['Target File:', info['target_file'] or 'N/A'],
         ]
         
         comparison_table = Table(comparison_data, colWidths=[2*inch, 4*inch])
@@ -77,14 +164,14 @@ class ReportGenerator:
         story.append(Paragraph('Similarity Scores', styles['Heading2']))
         score_data = [
             ['Metric', 'Score', 'Percentage'],
-            ['Overall Similarity', f'{result.overall_similarity_score:.4f}', f'{result.overall_similarity_score*100:.2f}%'],
-            ['Token Similarity', f'{result.token_similarity:.4f}', f'{result.token_similarity*100:.2f}%'],
-            ['Structural Similarity', f'{result.structural_similarity:.4f}', f'{result.structural_similarity*100:.2f}%'],
-            ['AST Similarity', f'{result.ast_similarity:.4f}', f'{result.ast_similarity*100:.2f}%'],
+            ['Overall Similarity', f'{scores["overall"]:.4f}', f'{scores["overall"]*100:.2f}%'],
+            ['Token Similarity', f'{scores["token"]:.4f}', f'{scores["token"]*100:.2f}%'],
+            ['Structural Similarity', f'{scores["structural"]:.4f}', f'{scores["structural"]*100:.2f}%'],
+            ['AST Similarity', f'{scores["ast"]:.4f}', f'{scores["ast"]*100:.2f}%'],
         ]
         
-        if result.ml_similarity:
-            score_data.append(['ML Prediction', f'{result.ml_similarity:.4f}', f'{result.ml_similarity*100:.2f}%'])
+        if scores['ml_prediction']:
+            score_data.append(['ML Prediction', f'{scores["ml_prediction"]:.4f}', f'{scores["ml_prediction"]*100:.2f}%'])
         
         score_table = Table(score_data, colWidths=[2.5*inch, 1.5*inch, 1.5*inch])
         score_table.setStyle(TableStyle([
@@ -100,21 +187,27 @@ class ReportGenerator:
         story.append(score_table)
         story.append(Spacer(1, 0.3*inch))
         
+        # Score Chart
+        if include_viz:
+            story.append(Paragraph('Score Chart', styles['Heading2']))
+            story.append(self._score_chart(scores))
+            story.append(Spacer(1, 0.3*inch))
+        
         # Identical Segments
-        if include_code and result.identical_segments:
-            story.append(Paragraph(f'Identical Code Segments ({len(result.identical_segments)} found)', styles['Heading2']))
+        if include_code and segments['identical']:
+            story.append(Paragraph(f'Identical Code Segments ({len(segments["identical"])} found)', styles['Heading2']))
             
-            for idx, segment in enumerate(result.identical_segments[:5], 1):
+            for idx, segment in enumerate(segments['identical'][:5], 1):
                 segment_info = f"Segment {idx}: Lines {segment['source_start']}-{segment['source_end']} (Source) matches Lines {segment['target_start']}-{segment['target_end']} (Target)"
                 story.append(Paragraph(segment_info, styles['Normal']))
                 story.append(Spacer(1, 0.1*inch))
         
         # Code Metrics
-        if include_metrics and result.code_metrics:
+        if include_metrics and data['code_metrics']:
             story.append(PageBreak())
             story.append(Paragraph('Code Metrics Comparison', styles['Heading2']))
             
-            metrics = result.code_metrics
+            metrics = data['code_metrics']
             if 'source_metrics' in metrics and 'target_metrics' in metrics:
                 metrics_data = [
                     ['Metric', 'Source Code', 'Target Code', 'Difference'],
@@ -140,17 +233,13 @@ class ReportGenerator:
                 ]))
                 story.append(metrics_table)
         
-        # Build PDF
-        doc.build(story)
-        return filepath
+        return story
     
-    def _generate_csv(self, comparison, result):
+    def _generate_csv(self, data, filepath):
         """Generate CSV report"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'similarity_report_{comparison.request_id}_{timestamp}.csv'
-        filepath = os.path.join(settings.MEDIA_ROOT, 'reports', filename)
-        
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        info = data['comparison_info']
+        scores = data['similarity_scores']
+        segments = data['segments']
         
         with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.writer(csvfile)
@@ -161,74 +250,52 @@ class ReportGenerator:
             
             # Comparison Info
             writer.writerow(['Comparison Information'])
-            writer.writerow(['Request ID', str(comparison.request_id)])
-            writer.writerow(['User', comparison.user.username])
-            writer.writerow(['Date', comparison.created_at.strftime('%Y-%m-%d %H:%M:%S')])
-            writer.writerow(['Type', comparison.get_comparison_type_display()])
+            writer.writerow(['Request ID', info['request_id']])
+            writer.writerow(['User', info['user']])
+            writer.writerow(['Date', self._display_date(data)])
+            writer.writerow(['Type', info['type']])
             writer.writerow([])
             
             # Similarity Scores
             writer.writerow(['Similarity Scores'])
             writer.writerow(['Metric', 'Score', 'Percentage'])
-            writer.writerow(['Overall Similarity', f'{result.overall_similarity_score:.4f}', f'{result.overall_similarity_score*100:.2f}%'])
-            writer.writerow(['Token Similarity', f'{result.token_similarity:.4f}', f'{result.token_similarity*100:.2f}%'])
-            writer.writerow(['Structural Similarity', f'{result.structural_similarity:.4f}', f'{result.structural_similarity*100:.2f}%'])
-            writer.writerow(['AST Similarity', f'{result.ast_similarity:.4f}', f'{result.ast_similarity*100:.2f}%'])
+            writer.writerow(['Overall Similarity', f'{scores["overall"]:.4f}', f'{scores["overall"]*100:.2f}%'])
+            writer.writerow(['Token Similarity', f'{scores["token"]:.4f}', f'{scores["token"]*100:.2f}%'])
+            writer.writerow(['Structural Similarity', f'{scores["structural"]:.4f}', f'{scores["structural"]*100:.2f}%'])
+            writer.writerow(['AST Similarity', f'{scores["ast"]:.4f}', f'{scores["ast"]*100:.2f}%'])
             
-            if result.ml_similarity:
-                writer.writerow(['ML Prediction', f'{result.ml_similarity:.4f}', f'{result.ml_similarity*100:.2f}%'])
+            if scores['ml_prediction']:
+                writer.writerow(['ML Prediction', f'{scores["ml_prediction"]:.4f}', f'{scores["ml_prediction"]*100:.2f}%'])
             
             writer.writerow([])
             
             # Identical Segments
-            writer.writerow(['Identical Segments', len(result.identical_segments)])
-            writer.writerow(['Near-Identical Segments', len(result.near_identical_segments)])
+            writer.writerow(['Identical Segments', len(segments['identical'])])
+            writer.writerow(['Near-Identical Segments', len(segments['near_identical'])])
         
         return filepath
     
-    def _generate_json(self, comparison, result):
+    def _generate_json(self, data, filepath):
         """Generate JSON report"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'similarity_report_{comparison.request_id}_{timestamp}.json'
-        filepath = os.path.join(settings.MEDIA_ROOT, 'reports', filename)
-        
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        
-        report_data = {
-            'comparison_info': {
-                'request_id': str(comparison.request_id),
-                'user': comparison.user.username,
-                'date': comparison.created_at.isoformat(),
-                'type': comparison.get_comparison_type_display(),
-                'source_file': comparison.source_submission.title,
-                'target_file': comparison.target_submission.title if comparison.target_submission else None,
-            },
-            'similarity_scores': {
-                'overall': result.overall_similarity_score,
-                'token': result.token_similarity,
-                'structural': result.structural_similarity,
-                'ast': result.ast_similarity,
-                'ml_prediction': result.ml_similarity,
-            },
-            'segments': {
-                'identical': result.identical_segments,
-                'near_identical': result.near_identical_segments,
-            },
-            'code_metrics': result.code_metrics,
-        }
-        
         with open(filepath, 'w', encoding='utf-8') as jsonfile:
-            json.dump(report_data, jsonfile, indent=2, default=str)
+            json.dump(data, jsonfile, indent=2, default=str)
         
         return filepath
     
-    def _generate_html(self, comparison, result, include_viz, include_code, include_metrics):
+    def _generate_html(self, data, include_viz, include_code, include_metrics, filepath):
         """Generate HTML report"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'similarity_report_{comparison.request_id}_{timestamp}.html'
-        filepath = os.path.join(settings.MEDIA_ROOT, 'reports', filename)
+        info = data['comparison_info']
+        scores = data['similarity_scores']
+        segments = data['segments']
         
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        viz_html = ''
+        if include_viz:
+            bars = ''.join(
+                f'<div class="bar-row"><span>{label}</span><div class="bar" style="width: {min(value or 0, 100):.1f}%"></div><span>{value or 0:.2f}</span></div>'
+                for label, value in (('Overall', scores['overall']), ('Token', scores['token']),
+                                     ('Structural', scores['structural']), ('AST', scores['ast']))
+            )
+            viz_html = f'<h2>Score Chart</h2>{bars}'
         
         html_content = f"""
         <!DOCTYPE html>
@@ -246,6 +313,9 @@ class ReportGenerator:
                 .score-high {{ color: #e74c3c; font-weight: bold; }}
                 .score-medium {{ color: #f39c12; font-weight: bold; }}
                 .score-low {{ color: #2ecc71; font-weight: bold; }}
+                .bar-row {{ display: flex; align-items: center; gap: 10px; margin: 6px 0; }}
+                .bar-row span:first-child {{ width: 90px; }}
+                .bar {{ height: 18px; background-color: #3498db; border-radius: 3px; }}
             </style>
         </head>
         <body>
@@ -254,10 +324,10 @@ class ReportGenerator:
                 
                 <h2>Comparison Information</h2>
                 <table>
-                    <tr><th>Request ID</th><td>{comparison.request_id}</td></tr>
-                    <tr><th>User</th><td>{comparison.user.username}</td></tr>
-                    <tr><th>Date</th><td>{comparison.created_at.strftime('%Y-%m-%d %H:%M:%S')}</td></tr>
-                    <tr><th>Type</th><td>{comparison.get_comparison_type_display()}</td></tr>
+                    <tr><th>Request ID</th><td>{info['request_id']}</td></tr>
+                    <tr><th>User</th><td>{info['user']}</td></tr>
+                    <tr><th>Date</th><td>{self._display_date(data)}</td></tr>
+                    <tr><th>Type</th><td>{info['type']}</td></tr>
                 </table>
                 
                 <h2>Similarity Scores</h2>
@@ -265,17 +335,19 @@ class ReportGenerator:
                     <tr><th>Metric</th><th>Score</th><th>Percentage</th></tr>
                     <tr>
                         <td>Overall Similarity</td>
-                        <td class="{'score-high' if result.overall_similarity_score >= 0.8 else 'score-medium' if result.overall_similarity_score >= 0.5 else 'score-low'}">{result.overall_similarity_score:.4f}</td>
-                        <td>{result.overall_similarity_score*100:.2f}%</td>
+                        <td class="{'score-high' if scores['overall'] >= 0.8 else 'score-medium' if scores['overall'] >= 0.5 else 'score-low'}">{scores['overall']:.4f}</td>
+                        <td>{scores['overall']*100:.2f}%</td>
                     </tr>
-                    <tr><td>Token Similarity</td><td>{result.token_similarity:.4f}</td><td>{result.token_similarity*100:.2f}%</td></tr>
-                    <tr><td>Structural Similarity</td><td>{result.structural_similarity:.4f}</td><td>{result.structural_similarity*100:.2f}%</td></tr>
-                    <tr><td>AST Similarity</td><td>{result.ast_similarity:.4f}</td><td>{result.ast_similarity*100:.2f}%</td></tr>
+                    <tr><td>Token Similarity</td><td>{scores['token']:.4f}</td><td>{scores['token']*100:.2f}%</td></tr>
+                    <tr><td>Structural Similarity</td><td>{scores['structural']:.4f}</td><td>{scores['structural']*100:.2f}%</td></tr>
+                    <tr><td>AST Similarity</td><td>{scores['ast']:.4f}</td><td>{scores['ast']*100:.2f}%</td></tr>
                 </table>
                 
+                {viz_html}
+                
                 <h2>Analysis Summary</h2>
-                <p><strong>Identical Segments Found:</strong> {len(result.identical_segments)}</p>
-                <p><strong>Near-Identical Segments Found:</strong> {len(result.near_identical_segments)}</p>
+                <p><strong>Identical Segments Found:</strong> {len(segments['identical'])}</p>
+                <p><strong>Near-Identical Segments Found:</strong> {len(segments['near_identical'])}</p>
             </div>
         </body>
         </html>
@@ -0,0 +1,215 @@
+"""
+Daily rollups of similarity results, user activity and system usage.
+
+Each refresh recomputes whole days with a handful of grouped queries over
+the raw tables and replaces those days' rollup rows, so it is idempotent
+and can run as often as needed. A periodic job (see the refresh_rollups
+management command) keeps the last couple of days current; aggregate
+reports backfill any day in their range it never covered, then read only
+the rollup tables.
+
+Days are local (TIME_ZONE) days. Their bounds are computed here and each
+row is bucketed with a CASE over them, rather than with TruncDate, which
+on MySQL converts time zones in the server and yields NULL unless its
+time zone tables are loaded. A high-similarity result scores at least
+HIGH_SIMILARITY_SCORE, as on the dashboards and admin statistics.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, DateField, F, FloatField, IntegerField, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Floor, Least
+from django.utils import timezone
+
+from accounts.models import UserActivity
+from users.counters import HIGH_SIMILARITY_SCORE
+from users.models import CodeSubmission, ComparisonRequest, SimilarityResult
+from .models import DailyActivityRollup, DailySimilarityRollup, DailyUsageRollup
+
+HISTOGRAM_BUCKETS = 10
+ALL_ACTIVITY = 'all'
+MAX_DAYS_PER_PASS = 31
+
+
+def day_bounds(date_from, date_to):
+    """Aware [start, end) datetimes covering date_from..date_to in the current time zone"""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(date_from, time.min), tz)
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def local_day(field, date_from, date_to):
+    """Expression for the local day (date_from..date_to) a datetime field falls on"""
+    whens = []
+    day = date_from
+    while day <= date_to:
+        start, end = day_bounds(day, day)
+        whens.append(When(**{f'{field}__gte': start, f'{field}__lt': end}, then=Value(day)))
+        day += timedelta(days=1)
+    return Case(*whens, output_field=DateField())
+
+
+def _similarity_rows(date_from, date_to, start, end):
+    results = SimilarityResult.objects.filter(created_at__gte=start, created_at__lt=end).annotate(
+        day=local_day('created_at', date_from, date_to),
+        language=F('comparison__source_submission__language'),
+        comparison_type=F('comparison__comparison_type'),
+    )
+    keys = ('day', 'language', 'comparison_type')
+
+    rows = {}
+    totals = results.values(*keys).annotate(
+        result_count=Count('id'),
+        high_similarity_count=Count('id', filter=Q(overall_similarity_score__gte=HIGH_SIMILARITY_SCORE)),
+        score_sum=Sum('overall_similarity_score'),
+        token_sum=Sum('token_similarity'),
+        structural_sum=Sum('structural_similarity'),
+        ast_sum=Sum('ast_similarity'),
+        ml_sum=Coalesce(Sum('ml_similarity', filter=Q(ml_similarity__gt=0)), Value(0.0), output_field=FloatField()),
+        ml_count=Count('id', filter=Q(ml_similarity__gt=0)),
+        min_score=Min('overall_similarity_score'),
+        max_score=Max('overall_similarity_score'),
+    ).order_by()
+    for row in totals:
+        key = tuple(row[k] for k in keys)
+        rows[key] = DailySimilarityRollup(score_histogram=[0] * HISTOGRAM_BUCKETS, **row)
+
+    # Scores are percentages; bucket i covers [10*i, 10*i + 10), with 100 in the last bucket
+    buckets = results.annotate(
+        bucket=Least(
+            Cast(Floor(F('overall_similarity_score') / (100 / HISTOGRAM_BUCKETS)), IntegerField()),
+            Value(HISTOGRAM_BUCKETS - 1),
+        )
+    ).values(*keys, 'bucket').annotate(n=Count('id')).order_by()
+    for row in buckets:
+        key = tuple(row[k] for k in keys)
+        bucket = min(max(int(row['bucket'] or 0), 0), HISTOGRAM_BUCKETS - 1)
+        rows[key].score_histogram[bucket] += row['n']
+
+    return list(rows.values())
+
+
+def _activity_rows(date_from, date_to, start, end):
+    activities = UserActivity.objects.filter(timestamp__gte=start, timestamp__lt=end).annotate(
+        day=local_day('timestamp', date_from, date_to)
+    )
+    rows = [
+        DailyActivityRollup(**row)
+        for row in activities.values('day', 'activity_type').annotate(
+            event_count=Count('id'), active_users=Count('user', distinct=True)
+        ).order_by()
+    ]
+    # Distinct users are not additive across types, so each day also gets an overall row
+    rows.extend(
+        DailyActivityRollup(activity_type=ALL_ACTIVITY, **row)
+        for row in activities.values('day').annotate(
+            event_count=Count('id'), active_users=Count('user', distinct=True)
+        ).order_by()
+    )
+    return rows
+
+
+def _usage_rows(date_from, date_to, start, end):
+    rows = defaultdict(dict)
+
+    submissions = CodeSubmission.objects.filter(created_at__gte=start, created_at__lt=end).annotate(
+        day=local_day('created_at', date_from, date_to)
+    ).values('day', 'language').annotate(
+        submissions=Count('id'),
+        submission_bytes=Coalesce(Sum('file_size'), Value(0)),
+        submission_lines=Coalesce(Sum('line_count'), Value(0)),
+    ).order_by()
+    for row in submissions:
+        rows[(row.pop('day'), row.pop('language'))].update(row)
+
+    comparisons = ComparisonRequest.objects.filter(created_at__gte=start, created_at__lt=end).annotate(
+        day=local_day('created_at', date_from, date_to), language=F('source_submission__language')
+    ).values('day', 'language').annotate(
+        comparisons=Count('id'),
+        failed_comparisons=Count('id', filter=Q(status='failed')),
+    ).order_by()
+    for row in comparisons:
+        rows[(row.pop('day'), row.pop('language'))].update(row)
+
+    return [DailyUsageRollup(day=day, language=language, **values) for (day, language), values in rows.items()]
+
+
+def _refresh_window(date_from, date_to):
+    start, end = day_bounds(date_from, date_to)
+    similarity = _similarity_rows(date_from, date_to, start, end)
+    activity = _activity_rows(date_from, date_to, start, end)
+    usage = _usage_rows(date_from, date_to, start, end)
+
+    with transaction.atomic():
+        for model in (DailySimilarityRollup, DailyActivityRollup, DailyUsageRollup):
+            model.objects.filter(day__gte=date_from, day__lte=date_to).delete()
+        DailySimilarityRollup.objects.bulk_create(similarity)
+        DailyActivityRollup.objects.bulk_create(activity)
+        DailyUsageRollup.objects.bulk_create(usage)
+
+    return len(similarity) + len(activity) + len(usage)
+
+
+def refresh_rollups(date_from, date_to):
+    """Recompute the rollups for every day in date_from..date_to (inclusive)"""
+    written = 0
+    window_start = date_from
+    while window_start <= date_to:
+        window_end = min(date_to, window_start + timedelta(days=MAX_DAYS_PER_PASS - 1))
+        written += _refresh_window(window_start, window_end)
+        window_start = window_end + timedelta(days=1)
+    return written
+
+
+def refresh_recent(days=2):
+    """Recompute today and the previous days-1 days (the periodic job)"""
+    today = timezone.localdate()
+    return refresh_rollups(today - timedelta(days=max(days, 1) - 1), today)
+
+
+def missing_days(date_from, date_to):
+    """Days in date_from..date_to (inclusive) that no refresh has covered yet"""
+    covered = set()
+    for model in (DailySimilarityRollup, DailyActivityRollup, DailyUsageRollup):
+        covered.update(model.objects.filter(day__range=(date_from, date_to)).values_list('day', flat=True).distinct())
+    days = (date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1))
+    return [day for day in days if day not in covered]
+
+
+def backfill_rollups(date_from, date_to):
+    """Refresh the days in date_from..date_to that have no rollup rows; returns rows written"""
+    # Days before any activity or after today have nothing to roll up
+    earliest = earliest_activity_date()
+    if earliest is None:
+        return 0
+    date_from, date_to = max(date_from, earliest), min(date_to, timezone.localdate())
+    if date_from > date_to:
+        return 0
+
+    written = 0
+    run = []
+    for day in missing_days(date_from, date_to) + [None]:
+        if run and (day is None or day != run[-1] + timedelta(days=1)):
+            written += refresh_rollups(run[0], run[-1])
+            run = []
+        if day is not None:
+            run.append(day)
+    return written
+
+
+def earliest_activity_date():
+    """First day with any raw data, or None for an empty database"""
+    firsts = [
+        model.objects.order_by(field).values_list(field, flat=True).first()
+        for model, field in (
+            (SimilarityResult, 'created_at'),
+            (UserActivity, 'timestamp'),
+            (CodeSubmission, 'created_at'),
+            (ComparisonRequest, 'created_at'),
+        )
+    ]
+    firsts = [timezone.localtime(value).date() for value in firsts if value is not None]
+    return min(firsts) if firsts else None
@@ -0,0 +1,178 @@
+"""
+Background rendering of similarity reports.
+
+Report rows are created immediately in the 'pending' state and rendered
+off the request: a small thread pool does the database work and waits on
+the renderer, while CPU-heavy formats (see HEAVY_FORMATS) are rendered in
+separate processes so web workers never block on reportlab.
+
+The queue lives in memory, so a restart or a crashed worker loses the
+reports waiting in it. A report still unfinished REPORT_RENDER_TIMEOUT
+seconds after it was requested counts as lost: the report cache renders
+it again on the next request, and recover_interrupted_reports() (run when
+the server starts) fails the rest so their pages stop waiting.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import SimilarityReport
+from .report_generator import HEAVY_FORMATS, build_report_data, render_report_file
+
+_executor_lock = threading.Lock()
+_dispatcher = None
+_renderer = None
+
+
+def get_dispatcher():
+    """Thread pool that runs report jobs (database work and waiting)"""
+    global _dispatcher
+    with _executor_lock:
+        if _dispatcher is None:
+            _dispatcher = ThreadPoolExecutor(
+                max_workers=settings.REPORT_WORKERS, thread_name_prefix='report-dispatch'
+            )
+        return _dispatcher
+
+
+def get_renderer():
+    """Process pool that renders heavy report formats"""
+    global _renderer
+    with _executor_lock:
+        if _renderer is None or getattr(_renderer, '_broken', False):
+            # spawn keeps the children free of the parent's threads and DB sockets
+            _renderer = ProcessPoolExecutor(
+                max_workers=settings.REPORT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                # referenced from django itself so unpickling it needs no app imports
+                initializer=django.setup,
+            )
+        return _renderer
+
+
+UNFINISHED = ('pending', 'processing')
+INTERRUPTED_MESSAGE = 'Rendering was interrupted; request the report again.'
+
+
+def _update(report_pk, **fields):
+    SimilarityReport.objects.filter(pk=report_pk).update(**fields)
+
+
+def render_deadline():
+    """Reports requested before this and still unfinished were lost"""
+    return timezone.now() - timedelta(seconds=settings.REPORT_RENDER_TIMEOUT)
+
+
+def is_lost(report):
+    """Whether a (batch) report is unfinished past REPORT_RENDER_TIMEOUT"""
+    return report.status in UNFINISHED and report.generated_at < render_deadline()
+
+
+def recover_interrupted_reports():
+    """Fail the reports and batch reports lost with a previous run's queue; returns how many"""
+    from .models import BatchReport
+
+    deadline = render_deadline()
+    failed = 0
+    for model in (SimilarityReport, BatchReport):
+        failed += model.objects.filter(status__in=UNFINISHED, generated_at__lt=deadline).update(
+            status='failed', error_message=INTERRUPTED_MESSAGE
+        )
+    return failed
+
+
+def report_storage_name(report):
+    """Storage name (relative to MEDIA_ROOT) a report is rendered to"""
+    key = report.cache_key or report.report_id.hex
+    return f'reports/{key[:2]}/{key}.{report.report_format}'
+
+
+def render_report(report_pk, use_processes=True):
+    """Render one pending report and record its outcome on the row"""
+    from .report_cache import ReportCache
+
+    try:
+        report = SimilarityReport.objects.select_related(
+            'comparison__user', 'comparison__source_submission', 'comparison__target_submission', 'result'
+        ).defer(
+            'comparison__source_submission__inline_text', 'comparison__target_submission__inline_text'
+        ).get(pk=report_pk)
+        _update(report_pk, status='processing', progress=10)
+
+        data = build_report_data(report.comparison, report.result)
+        _update(report_pk, progress=30)
+
+        file_name = report_storage_name(report)
+        file_path = os.path.join(settings.MEDIA_ROOT, file_name)
+        tmp_path = f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        args = (
+            data, report.report_format,
+            report.include_visualizations, report.include_code_segments, report.include_metrics,
+            tmp_path,
+        )
+        try:
+            if use_processes and report.report_format in HEAVY_FORMATS:
+                get_renderer().submit(render_report_file, *args).result()
+            else:
+                render_report_file(*args)
+            _update(report_pk, progress=90)
+            os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        _update(
+            report_pk,
+            status='completed',
+            progress=100,
+            file_path=file_name,
+            file_size=os.path.getsize(file_path),
+            error_message=None,
+        )
+        ReportCache().evict(keep=report)
+    except Exception as e:
+        _update(report_pk, status='failed', error_message=str(e))
+
+
+def _run_in_background(report_pk):
+    try:
+        render_report(report_pk)
+    finally:
+        # Worker threads hold their own DB connections; don't leak them
+        connections.close_all()
+
+
+def submit_report(report_pk):
+    """Queue a report for background rendering once the current transaction commits"""
+    transaction.on_commit(lambda: get_dispatcher().submit(_run_in_background, report_pk))
+
+
+def render_batch_report(batch_report_pk, use_processes=True):
+    """Render a pending batch report"""
+    from .batch_report import BatchReportBuilder
+    from .models import BatchReport
+
+    batch_report = BatchReport.objects.get(pk=batch_report_pk)
+    BatchReportBuilder(batch_report, executor=get_renderer() if use_processes else None).build()
+
+
+def _run_batch_in_background(batch_report_pk):
+    try:
+        render_batch_report(batch_report_pk)
+    finally:
+        connections.close_all()
+
+
+def submit_batch_report(batch_report_pk):
+    """Queue a batch report for background rendering once the current transaction commits"""
+    transaction.on_commit(lambda: get_dispatcher().submit(_run_batch_in_background, batch_report_pk))
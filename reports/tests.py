@@ -1,3 +1,480 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from openpyxl import load_workbook
+from PyPDF2 import PdfReader
+
+from accounts.models import CustomUser, UserActivity
+from users.models import CodeSubmission, ComparisonRequest, SimilarityResult
+from users.tests import QueryBudgetMixin
+from .aggregate import (
+    generate_aggregate_report, plagiarism_incidents, similarity_trends, system_usage, user_activity,
+)
+from .batch_report import BatchReportBuilder
+from .exporters import export_headers, iter_result_rows, stream_csv, stream_jsonl, write_xlsx
+from .models import (
+    BatchReport, DailyActivityRollup, DailySimilarityRollup, DailyUsageRollup, SimilarityReport,
+)
+from .report_cache import ReportCache
+from .rollups import missing_days, refresh_rollups
+from .tasks import recover_interrupted_reports, render_report
+
+
+def make_results(user, scores):
+    """A completed file_vs_file comparison and its result per score, oldest first"""
+    submission = CodeSubmission.objects.create(
+        user=user, title='a.py', language='python', code_file='submissions/a.py', code_text='x = 1\n'
+    )
+    results = []
+    for score in scores:
+        comparison = ComparisonRequest.objects.create(
+            user=user, comparison_type='file_vs_file', source_submission=submission,
+            target_submission=submission, status='completed',
+        )
+        results.append(SimilarityResult.objects.create(comparison=comparison, overall_similarity_score=score))
+    return results
+
+
+class ReportsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    from reports import urls as urlconf
+
+    budgets = {
+        'generate_report': 6,
+        'download_report': 7,
+        'report_status': 6,
+        'my_reports': 6,
+        'batch_report': 6,
+        'batch_report_status': 6,
+        'download_batch_report': 6,
+    }
+
+    def url_kwargs(self, name, kwarg_names):
+        values = {
+            'request_id': self.comparison.request_id,
+            'report_id': self.batch_report.report_id if name.startswith(('batch_', 'download_batch')) else self.report.report_id,
+        }
+        return {kwarg: values[kwarg] for kwarg in kwarg_names}
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user('root', 'root@example.com', 'pw-root-123', is_superuser=True)
+        cls.results = make_results(cls.admin, [10.0, 20.0, 30.0, 40.0, 50.0])
+        # Two days: the first three results on 2024-01-01, the rest on 2024-01-02
+        for result, day in zip(cls.results, (1, 1, 1, 2, 2)):
+            SimilarityResult.objects.filter(pk=result.pk).update(
+                created_at=datetime(2024, 1, day, 12, tzinfo=dt_timezone.utc)
+            )
+
+    def scores(self, rows):
+        index = export_headers().index('overall_similarity')
+        return [row[index] for row in rows]
+
+    def test_rows_are_read_in_batches(self):
+        for chunk_size, queries in ((2, 3), (5, 2), (10, 1)):
+            with self.subTest(chunk_size=chunk_size):
+                with CaptureQueriesContext(connection) as captured:
+                    rows = list(iter_result_rows(chunk_size=chunk_size))
+                # One query per batch, plus an empty one when the last batch is full
+                self.assertEqual(len(captured), queries)
+                self.assertEqual(self.scores(rows), [10.0, 20.0, 30.0, 40.0, 50.0])
+        filtered = SimilarityResult.objects.filter(overall_similarity_score__gt=25)
+        self.assertEqual(self.scores(iter_result_rows(filtered, chunk_size=2)), [30.0, 40.0, 50.0])
+
+    def test_formats(self):
+        lines = list(csv.reader(io.StringIO(''.join(stream_csv(iter_result_rows())))))
+        self.assertEqual(lines[0], export_headers())
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[1][0], str(self.results[0].result_id))
+
+        records = [json.loads(line) for line in stream_jsonl(iter_result_rows())]
+        self.assertEqual([record['overall_similarity'] for record in records], [10.0, 20.0, 30.0, 40.0, 50.0])
+        self.assertEqual(records[0]['user'], 'root')
+
+        spreadsheet = write_xlsx(iter_result_rows(), io.BytesIO())
+        sheet = load_workbook(spreadsheet, read_only=True).active
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(list(rows[0]), export_headers())
+        self.assertEqual(self.scores(rows[1:]), [10.0, 20.0, 30.0, 40.0, 50.0])
+
+    def test_xlsx_rows_spill_over_to_new_sheets(self):
+        with mock.patch('reports.exporters.XLSX_MAX_DATA_ROWS', 2):
+            spreadsheet = write_xlsx(iter_result_rows(), io.BytesIO())
+        workbook = load_workbook(spreadsheet, read_only=True)
+        self.assertEqual(
+            workbook.sheetnames, ['Similarity Results', 'Similarity Results (2)', 'Similarity Results (3)']
+        )
+        sheets = [list(sheet.iter_rows(values_only=True)) for sheet in workbook.worksheets]
+        self.assertTrue(all(list(rows[0]) == export_headers() for rows in sheets))
+        self.assertEqual([self.scores(rows[1:]) for rows in sheets], [[10.0, 20.0], [30.0, 40.0], [50.0]])
+
+    def export(self, export_format='jsonl', **params):
+        self.client.force_login(self.admin)
+        return self.client.get(
+            reverse('admins:export_results', args=[export_format]), params, HTTP_HOST='localhost'
+        )
+
+    def test_view_filters(self):
+        response = self.export(date_from='2024-01-02')
+        records = [json.loads(line) for line in b''.join(response).decode().splitlines()]
+        self.assertEqual([record['overall_similarity'] for record in records], [40.0, 50.0])
+
+        response = self.export(date_to='2024-01-01', min_score='15')
+        records = [json.loads(line) for line in b''.join(response).decode().splitlines()]
+        self.assertEqual([record['overall_similarity'] for record in records], [20.0, 30.0])
+
+        response = self.export('xlsx', min_score='45')
+        self.assertEqual(response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        rows = list(load_workbook(io.BytesIO(b''.join(response)), read_only=True).active.iter_rows(values_only=True))
+        self.assertEqual(self.scores(rows[1:]), [50.0])
+
+    def test_view_rejects_bad_filters(self):
+        for params in ({'date_from': 'notadate'}, {'date_to': '2024-02-30'}, {'min_score': 'high'}):
+            with self.subTest(**params):
+                self.assertEqual(self.export(**params).status_code, 400)
+        self.assertEqual(self.export('pdf').status_code, 404)
+
+
+class TemporaryMediaMixin:
+    """MEDIA_ROOT in a directory removed after the test"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp(prefix='report_media_')
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+
+class ReportCacheTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('rita', 'rita@example.com', 'pw-rita-123')
+        self.results = make_results(self.user, [80.0, 60.0, 40.0])
+
+    def report(self, result=None, report_format='json', include_code=True, cache=None, background=False):
+        result = result or self.results[0]
+        return (cache or ReportCache()).get_or_create(
+            self.user, result.comparison, result, report_format, True, include_code, True, background=background
+        )
+
+    def test_hits_and_misses(self):
+        report, created = self.report()
+        self.assertTrue(created)
+        self.assertEqual(report.status, 'completed')
+        self.assertTrue(os.path.exists(report.file_path.path))
+        self.assertEqual(self.report(), (report, False))
+        # Other options, formats and results are other renderings
+        self.assertTrue(self.report(include_code=False)[1])
+        self.assertTrue(self.report(report_format='html')[1])
+        self.assertTrue(self.report(self.results[1])[1])
+        # A report whose file is gone is rendered again, in the same row
+        os.remove(report.file_path.path)
+        again, created = self.report()
+        self.assertTrue(created)
+        self.assertEqual(again.pk, report.pk)
+        self.assertTrue(os.path.exists(again.file_path.path))
+
+    def test_new_template_version_invalidates(self):
+        report, _ = self.report()
+        with mock.patch('reports.report_cache.REPORT_TEMPLATE_VERSION', 2):
+            newer, created = self.report()
+        self.assertTrue(created)
+        self.assertNotEqual(newer.cache_key, report.cache_key)
+
+    def test_failed_and_lost_reports_are_rendered_again(self):
+        with self.captureOnCommitCallbacks():
+            pending, created = self.report(background=True)
+        self.assertEqual((pending.status, created), ('pending', True))
+        # Still rendering: requests share it
+        self.assertEqual(self.report(background=True), (pending, False))
+
+        # Requested longer ago than the render timeout: its job was lost
+        SimilarityReport.objects.filter(pk=pending.pk).update(
+            status='processing', generated_at=timezone.now() - timedelta(hours=1)
+        )
+        report, created = self.report()
+        self.assertEqual((report.pk, report.status, created), (pending.pk, 'completed', True))
+
+        SimilarityReport.objects.filter(pk=report.pk).update(status='failed')
+        self.assertEqual(self.report(), (report, True))
+        self.assertEqual(SimilarityReport.objects.count(), 1)
+
+    def test_evict_keeps_the_recently_used_reports_within_budget(self):
+        reports = [self.report(result)[0] for result in self.results]
+        now = timezone.now()
+        for age, report in zip((3, 1, 2), reports):
+            SimilarityReport.objects.filter(pk=report.pk).update(last_accessed=now - timedelta(minutes=age))
+        sizes = [report.file_size for report in reports]
+
+        self.assertEqual(ReportCache(max_bytes=sum(sizes)).evict(), 0)
+        # Room for two: the least recently used one loses its file but keeps its row
+        self.assertEqual(ReportCache(max_bytes=sum(sizes) - 1).evict(), 1)
+        self.assertFalse(os.path.exists(reports[0].file_path.path))
+        evicted = SimilarityReport.objects.get(pk=reports[0].pk)
+        self.assertEqual((evicted.status, evicted.file_path.name, evicted.file_size), ('completed', '', 0))
+        # keep is never evicted, even when it is the oldest
+        self.assertEqual(ReportCache(max_bytes=0).evict(keep=reports[2]), 1)
+        self.assertEqual(
+            set(SimilarityReport.objects.exclude(file_path='').values_list('pk', flat=True)), {reports[2].pk}
+        )
+        self.assertEqual(SimilarityReport.objects.count(), 3)
+
+        # The next request renders the evicted report again
+        again, created = self.report(self.results[0])
+        self.assertEqual((again.pk, again.status, created), (reports[0].pk, 'completed', True))
+        self.assertTrue(os.path.exists(again.file_path.path))
+
+    def test_downloading_an_evicted_report_renders_it_again(self):
+        report, _ = self.report()
+        ReportCache(max_bytes=0).evict()
+        self.client.force_login(self.user)
+        url = reverse('reports:download_report', args=[report.report_id])
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.get(url, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(callbacks), 1)
+        report.refresh_from_db()
+        self.assertEqual(report.status, 'pending')
+
+        render_report(report.pk, use_processes=False)
+        response = self.client.get(url, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+
+class ReportRenderingTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('sam', 'sam@example.com', 'pw-sam-123')
+        self.result = make_results(self.user, [70.0])[0]
+
+    def pending(self, **fields):
+        return SimilarityReport.objects.create(
+            user=self.user, comparison=self.result.comparison, result=self.result, report_format='html', **fields
+        )
+
+    def test_pending_report_is_rendered(self):
+        report = self.pending()
+        render_report(report.pk, use_processes=False)
+        report.refresh_from_db()
+        self.assertEqual((report.status, report.progress, report.error_message), ('completed', 100, None))
+        self.assertEqual(report.file_size, os.path.getsize(report.file_path.path))
+
+    def test_rendering_errors_fail_the_report(self):
+        report = self.pending()
+        with mock.patch('reports.tasks.render_report_file', side_effect=RuntimeError('renderer crashed')):
+            render_report(report.pk, use_processes=False)
+        report.refresh_from_db()
+        self.assertEqual((report.status, report.error_message), ('failed', 'renderer crashed'))
+        # No temporary file is left behind
+        leftovers = [name for _, _, names in os.walk(self.media_root) for name in names if name.endswith('.tmp')]
+        self.assertEqual(leftovers, [])
+
+    def test_recover_fails_reports_lost_with_the_queue(self):
+        lost = self.pending(status='processing')
+        fresh = self.pending()
+        batch = BatchReport.objects.create(user=self.user, title='Batch')
+        long_ago = timezone.now() - timedelta(hours=1)
+        SimilarityReport.objects.filter(pk=lost.pk).update(generated_at=long_ago)
+        BatchReport.objects.filter(pk=batch.pk).update(generated_at=long_ago)
+
+        self.assertEqual(recover_interrupted_reports(), 2)
+        self.assertEqual(SimilarityReport.objects.get(pk=lost.pk).status, 'failed')
+        self.assertEqual(BatchReport.objects.get(pk=batch.pk).status, 'failed')
+        self.assertEqual(SimilarityReport.objects.get(pk=fresh.pk).status, 'pending')
+
+
+class RollupTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('uma', 'uma@example.com', 'pw-uma-123')
+
+    def at(self, obj, *local):
+        """Move a row (and its comparison) to a local time"""
+        moment = timezone.make_aware(datetime(*local))
+        field = 'timestamp' if isinstance(obj, UserActivity) else 'created_at'
+        type(obj).objects.filter(pk=obj.pk).update(**{field: moment})
+        if isinstance(obj, SimilarityResult):
+            ComparisonRequest.objects.filter(pk=obj.comparison_id).update(created_at=moment)
+
+    @override_settings(TIME_ZONE='Asia/Kolkata')
+    def test_rows_roll_up_by_local_day(self):
+        late, noon, early, before = make_results(self.user, [90.0, 60.0, 80.0, 10.0])
+        # Above its own comparison's threshold, but not a high-similarity result
+        ComparisonRequest.objects.filter(pk=noon.comparison_id).update(similarity_threshold=0.5)
+        # 23:50 and 00:10 local are both 18:xx UTC on January 1st
+        self.at(late, 2026, 1, 1, 23, 50)
+        self.at(noon, 2026, 1, 1, 12, 0)
+        self.at(early, 2026, 1, 2, 0, 10)
+        self.at(before, 2025, 12, 31, 23, 59)
+        for activity_type in ('login', 'upload'):
+            self.at(UserActivity.objects.create(user=self.user, activity_type=activity_type, description=''),
+                    2026, 1, 2, 0, 5)
+
+        first, second = date(2026, 1, 1), date(2026, 1, 2)
+        written = refresh_rollups(first, second)
+        # Refreshing again replaces the same rows
+        self.assertEqual(refresh_rollups(first, second), written)
+
+        similarity = {row.day: row for row in DailySimilarityRollup.objects.all()}
+        self.assertEqual(set(similarity), {first, second})
+        self.assertEqual((similarity[first].result_count, similarity[first].high_similarity_count), (2, 1))
+        self.assertEqual((similarity[first].min_score, similarity[first].max_score), (60.0, 90.0))
+        self.assertEqual(similarity[first].score_histogram, [0, 0, 0, 0, 0, 0, 1, 0, 0, 1])
+        self.assertEqual((similarity[second].result_count, similarity[second].high_similarity_count), (1, 1))
+        self.assertEqual(
+            set(DailyActivityRollup.objects.values_list('day', 'activity_type', 'event_count', 'active_users')),
+            {(second, 'login', 1, 1), (second, 'upload', 1, 1), (second, 'all', 2, 1)},
+        )
+        self.assertEqual(dict(DailyUsageRollup.objects.values_list('day', 'comparisons')), {first: 2, second: 1})
+
+        # The aggregate reports read the rollups
+        self.assertEqual(similarity_trends(first, second)['high_similarity_results'], 2)
+        incidents = plagiarism_incidents(first, second)
+        self.assertEqual((incidents['total_results'], incidents['incidents']), (3, 2))
+        self.assertEqual(incidents['daily'], {'2026-01-01': 1, '2026-01-02': 1})
+        self.assertEqual(user_activity(first, second)['total_events'], 2)
+        self.assertEqual(system_usage(first, second)['comparisons'], 3)
+
+    @override_settings(TIME_ZONE='Europe/Berlin')
+    def test_days_follow_daylight_saving_time(self):
+        # March 29th 2026 has 23 hours in Berlin
+        last, next_day = make_results(self.user, [50.0, 50.0])
+        self.at(last, 2026, 3, 29, 23, 30)
+        self.at(next_day, 2026, 3, 30, 0, 30)
+        refresh_rollups(date(2026, 3, 29), date(2026, 3, 30))
+        self.assertEqual(
+            dict(DailySimilarityRollup.objects.values_list('day', 'result_count')),
+            {date(2026, 3, 29): 1, date(2026, 3, 30): 1},
+        )
+
+    def test_aggregate_reports_backfill_days_without_rollups(self):
+        first, refreshed = make_results(self.user, [90.0, 90.0])
+        self.at(first, 2026, 1, 1, 12, 0)
+        self.at(refreshed, 2026, 1, 3, 12, 0)
+        refresh_rollups(date(2026, 1, 3), date(2026, 1, 3))
+        # Rollups that exist are final and are not recomputed
+        SimilarityResult.objects.filter(pk=refreshed.pk).update(overall_similarity_score=10.0)
+
+        report = generate_aggregate_report('plagiarism_incidents', date(2026, 1, 1), date(2026, 1, 3))
+        self.assertEqual(report.data_summary['daily'], {'2026-01-01': 1, '2026-01-03': 1})
+        self.assertEqual(missing_days(date(2026, 1, 1), date(2026, 1, 3)), [date(2026, 1, 2)])
+
+
+class _LazyFuture:
+    """Future running its call when its result is asked for"""
+
+    def __init__(self, executor, fn, args):
+        self.executor, self.fn, self.args = executor, fn, args
+
+    def result(self):
+        self.executor.outstanding -= 1
+        return self.fn(*self.args)
+
+    def cancel(self):
+        self.executor.outstanding -= 1
+
+
+class _CountingExecutor:
+    """Executor recording how many submitted calls were outstanding at once"""
+
+    def __init__(self):
+        self.outstanding = self.peak = 0
+
+    def submit(self, fn, *args):
+        self.outstanding += 1
+        self.peak = max(self.peak, self.outstanding)
+        return _LazyFuture(self, fn, args)
+
+
+class BatchReportTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('val', 'val@example.com', 'pw-val-123')
+        self.results = make_results(self.user, [30.0, 90.0, 60.0, 75.0, 45.0])
+        self.batch = BatchReport.objects.create(user=self.user, title='Assignment 1')
+        self.batch.comparisons.set([result.comparison for result in self.results])
+
+    def build(self, **options):
+        BatchReportBuilder(self.batch, **options).build()
+        self.batch.refresh_from_db()
+        return self.batch
+
+    def test_parts_are_merged_in_order(self):
+        executor = _CountingExecutor()
+        with mock.patch('reports.batch_report.SUMMARY_ROWS_PER_PART', 2):
+            batch = self.build(executor=executor, section_size=2, max_in_flight=2)
+        self.assertEqual((batch.status, batch.progress, batch.comparison_count), ('completed', 100, 5))
+        self.assertEqual(batch.file_size, os.path.getsize(batch.file_path.path))
+        # Three summary parts and three sections, never more than two of them in flight
+        self.assertEqual(executor.peak, 2)
+
+        ranked = sorted(self.results, key=lambda result: -result.overall_similarity_score)
+        request_ids = [str(result.comparison.request_id) for result in ranked]
+        text = '\n'.join(page.extract_text() for page in PdfReader(batch.file_path.path).pages)
+        # Summary rows ranked across the parts, then one section per comparison in the same order
+        self.assertEqual(
+            re.findall(r'\n(\d+)\n([0-9a-f]{8})\n', text),
+            [(str(rank), request_id[:8]) for rank, request_id in enumerate(request_ids, 1)],
+        )
+        self.assertEqual(re.findall(r'Request ID:\n([0-9a-f-]{36})', text), request_ids)
+
+    def test_failures_are_recorded_and_clean_up(self):
+        work_dir = tempfile.mkdtemp(dir=self.media_root)
+        with mock.patch('reports.batch_report.tempfile.mkdtemp', return_value=work_dir), \
+                mock.patch('reports.batch_report.render_section', side_effect=RuntimeError('no fonts')):
+            batch = self.build()
+        self.assertEqual((batch.status, batch.error_message), ('failed', 'no fonts'))
+        self.assertFalse(os.path.exists(work_dir))
+
+    @override_settings(MAX_BATCH_REPORT_COMPARISONS=4)
+    def test_view_caps_the_comparisons_in_a_batch(self):
+        self.client.force_login(self.user)
+        selected = [str(result.comparison.request_id) for result in self.results]
+        with mock.patch('reports.views.submit_batch_report') as submit:
+            url = reverse('reports:batch_report')
+            response = self.client.post(url, {'comparisons': selected}, HTTP_HOST='localhost')
+            self.assertRedirects(response, url, fetch_redirect_response=False)
+            self.assertEqual(BatchReport.objects.count(), 1)
+
+            self.client.post(url, {'comparisons': selected[:4]}, HTTP_HOST='localhost')
+        self.assertEqual(BatchReport.objects.count(), 2)
+        submit.assert_called_once()
+
+    def test_view_rejects_malformed_request_ids(self):
+        self.client.force_login(self.user)
+        url = reverse('reports:batch_report')
+        with mock.patch('reports.views.submit_batch_report') as submit:
+            response = self.client.post(url, {'comparisons': ['not-a-uuid']}, HTTP_HOST='localhost')
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertEqual(BatchReport.objects.count(), 1)
+        submit.assert_not_called()
+
+    @override_settings(MAX_BATCH_REPORT_COMPARISONS=4)
+    def test_command_caps_the_comparisons_in_a_batch(self):
+        with mock.patch('reports.management.commands.generate_batch_report.render_batch_report') as render:
+            with self.assertRaisesMessage(CommandError, 'at most 4'):
+                call_command('generate_batch_report', owner='val', stdout=io.StringIO())
+        render.assert_not_called()
+        self.assertEqual(BatchReport.objects.count(), 1)
@@ -6,5 +6,9 @@ app_name = 'reports'
 urlpatterns = [
     path('generate/<uuid:request_id>/', views.generate_report_view, name='generate_report'),
     path('download/<uuid:report_id>/', views.download_report_view, name='download_report'),
+    path('status/<uuid:report_id>/', views.report_status_view, name='report_status'),
     path('my-reports/', views.my_reports_view, name='my_reports'),
+    path('batch/', views.batch_report_view, name='batch_report'),
+    path('batch/<uuid:report_id>/status/', views.batch_report_status_view, name='batch_report_status'),
+    path('batch/<uuid:report_id>/download/', views.download_batch_report_view, name='download_batch_report'),
 ]
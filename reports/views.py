@@ -1,10 +1,15 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import FileResponse, HttpResponse
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.urls import reverse
 from django.contrib import messages
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 from users.models import ComparisonRequest, SimilarityResult
-from .models import SimilarityReport
-from .report_generator import ReportGenerator
+from .models import BatchReport, SimilarityReport
+from .report_cache import ReportCache, file_missing
+from .tasks import submit_batch_report
 import os
 
 @login_required
@@ -14,7 +19,7 @@ def generate_report_view(request, request_id):
     
     if comparison.status != 'completed':
         messages.error(request, 'Cannot generate report for incomplete comparison.')
-        return redirect('users:comparison_detail', request_id=request_id)
+        return redirect('users:comparison_detail', comparison_id=request_id)
     
     if request.method == 'POST':
         report_format = request.POST.get('format', 'pdf')
@@ -22,9 +27,12 @@ def generate_report_view(request, request_id):
         include_code_segments = request.POST.get('include_code_segments') == 'on'
         include_metrics = request.POST.get('include_metrics') == 'on'
         
-        # Generate report
-        generator = ReportGenerator()
-        report_path = generator.generate_report(
+        if report_format not in dict(SimilarityReport.FORMAT_CHOICES):
+            messages.error(request, 'Unsupported report format.')
+            return redirect('users:comparison_detail', comparison_id=request_id)
+        
+        report, created = ReportCache().get_or_create(
+            request.user,
             comparison,
             comparison.result,
             report_format,
@@ -33,20 +41,10 @@ def generate_report_view(request, request_id):
             include_metrics
         )
         
-        # Save report record
-        report = SimilarityReport.objects.create(
-            user=request.user,
-            comparison=comparison,
-            result=comparison.result,
-            report_format=report_format,
-            file_path=report_path,
-            file_size=os.path.getsize(report_path),
-            include_visualizations=include_visualizations,
-            include_code_segments=include_code_segments,
-            include_metrics=include_metrics
-        )
-        
-        messages.success(request, 'Report generated successfully!')
+        if created:
+            messages.success(request, 'Report queued. It will be ready to download shortly.')
+        else:
+            messages.info(request, 'An identical report already exists; reusing it.')
         return redirect('reports:download_report', report_id=report.report_id)
     
     return render(request, 'reports/generate_report.html', {'comparison': comparison})
@@ -56,6 +54,19 @@ def generate_report_view(request, request_id):
 def download_report_view(request, report_id):
     """Download report"""
     report = get_object_or_404(SimilarityReport, report_id=report_id, user=request.user)
+    if report.cache_key and file_missing(report):
+        # Evicted from the report cache: render it again
+        report = ReportCache().rerender(report)
+    
+    if not report.is_ready:
+        # Still rendering (or failed): show progress instead of the file
+        return render(request, 'reports/report_status.html', {
+            'report': report,
+            'heading': 'Similarity Report',
+            'subtitle': f'{report.get_report_format_display()} report for comparison {report.comparison.request_id}',
+            'status_url': reverse('reports:report_status', args=[report.report_id]),
+            'download_url': reverse('reports:download_report', args=[report.report_id]),
+        }, status=202)
     
     report.download_count += 1
     report.last_downloaded = timezone.now()
@@ -77,8 +88,101 @@ def download_report_view(request, report_id):
 def my_reports_view(request):
     """View all user reports"""
     reports = SimilarityReport.objects.filter(user=request.user).select_related(
-        'comparison', 'result'
+        'comparison'
     ).order_by('-generated_at')
     
     context = {'reports': reports}
     return render(request, 'reports/my_reports.html', context)
+
+
+@login_required
+def report_status_view(request, report_id):
+    """Report rendering status and progress (polled while a report renders)"""
+    report = get_object_or_404(SimilarityReport, report_id=report_id, user=request.user)
+    
+    return JsonResponse({
+        'report_id': str(report.report_id),
+        'status': report.status,
+        'progress': report.progress,
+        'error_message': report.error_message,
+        'download_url': reverse('reports:download_report', args=[report.report_id]) if report.is_ready else None,
+    })
+
+
+@login_required
+def batch_report_view(request):
+    """Select comparisons and queue one combined PDF report for all of them"""
+    comparisons = ComparisonRequest.objects.filter(status='completed', result__isnull=False)
+    if not request.user.is_superuser:
+        comparisons = comparisons.filter(user=request.user)
+    
+    if request.method == 'POST':
+        try:
+            selected = comparisons.filter(request_id__in=request.POST.getlist('comparisons'))
+            count = selected.count()
+        except ValidationError:
+            # A malformed request id
+            count = 0
+        if not count:
+            messages.error(request, 'Select at least one completed comparison.')
+            return redirect('reports:batch_report')
+        if count > settings.MAX_BATCH_REPORT_COMPARISONS:
+            messages.error(
+                request, f'A batch report covers at most {settings.MAX_BATCH_REPORT_COMPARISONS} comparisons.'
+            )
+            return redirect('reports:batch_report')
+        
+        batch_report = BatchReport.objects.create(
+            user=request.user,
+            title=request.POST.get('title') or 'Batch Similarity Report',
+            include_code_segments=request.POST.get('include_code_segments') == 'on',
+            include_metrics=request.POST.get('include_metrics') == 'on',
+        )
+        batch_report.comparisons.set(selected)
+        submit_batch_report(batch_report.pk)
+        
+        messages.success(request, 'Batch report queued.')
+        return redirect('reports:download_batch_report', report_id=batch_report.report_id)
+    
+    comparisons = comparisons.select_related('user').with_submissions().with_result().order_by(
+        '-result__overall_similarity_score'
+    )
+    return render(request, 'reports/batch_report.html', {'comparisons': comparisons})
+
+
+@login_required
+def batch_report_status_view(request, report_id):
+    """Batch report rendering status and progress"""
+    report = get_object_or_404(BatchReport, report_id=report_id, user=request.user)
+    
+    return JsonResponse({
+        'report_id': str(report.report_id),
+        'status': report.status,
+        'progress': report.progress,
+        'error_message': report.error_message,
+        'download_url': reverse('reports:download_batch_report', args=[report.report_id]) if report.is_ready else None,
+    })
+
+
+@login_required
+def download_batch_report_view(request, report_id):
+    """Download a batch report once it has been rendered"""
+    report = get_object_or_404(BatchReport, report_id=report_id, user=request.user)
+    
+    if not report.is_ready:
+        return render(request, 'reports/report_status.html', {
+            'report': report,
+            'heading': report.title,
+            'subtitle': f'{report.comparison_count} comparisons',
+            'status_url': reverse('reports:batch_report_status', args=[report.report_id]),
+            'download_url': reverse('reports:download_batch_report', args=[report.report_id]),
+        }, status=202)
+    
+    file_path = report.file_path.path
+    if not os.path.exists(file_path):
+        messages.error(request, 'Report file not found.')
+        return redirect('reports:my_reports')
+    
+    response = FileResponse(open(file_path, 'rb'), content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="batch_report_{report.report_id}.pdf"'
+    return response
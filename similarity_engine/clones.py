@@ -0,0 +1,119 @@
+"""
+Corpus-wide clone detection: code fragments shared by many submissions.
+
+All of a language's token streams (read from the corpus store, see
+corpus.py) are joined into one stream and the repeated fragments are read off its suffix and LCP arrays (see
+suffix_array.py). Each fragment is reported with every occurrence as a
+submission and line range.
+"""
+
+import time
+
+import numpy as np
+from django.conf import settings
+
+from users.models import CodeSubmission
+from .corpus import load_streams
+from .suffix_array import lcp_array, maximal_repeats, suffix_array
+
+# Tokens of a fragment included in its preview, and occurrences listed per fragment
+PREVIEW_TOKENS = 40
+MAX_OCCURRENCES = 1000
+
+
+class CloneDetection:
+
+    def __init__(self, language, submissions, tokens, fragments, elapsed):
+        self.language = language
+        self.submissions = submissions
+        self.tokens = tokens
+        self.fragments = fragments
+        self.elapsed = elapsed
+
+    @property
+    def tokens_per_second(self):
+        return self.tokens / self.elapsed if self.elapsed else 0
+
+
+def _join(reader, rows):
+    """
+    (ids, lines, file starts) of the rows' streams joined like
+    suffix_array.TokenCorpus.stream(): each followed by its own separator
+    id, vocabulary size + file index, on line 0
+    """
+    lengths = reader.lengths[rows]
+    file_starts = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths + 1, out=file_starts[1:])
+    separators = file_starts[1:] - 1
+    ids = np.empty(int(file_starts[-1]), dtype=np.int64)
+    lines = np.zeros(len(ids), dtype=np.int32)
+    body = np.ones(len(ids), dtype=bool)
+    body[separators] = False
+    ids[body], lines[body] = reader.gather(rows)
+    ids[separators] = reader.vocabulary_size + np.arange(len(rows))
+    return ids, lines, file_starts
+
+
+def detect_clones(language, min_tokens=None, min_files=None):
+    """
+    Maximal fragments of at least min_tokens tokens found in at least
+    min_files of a language's submissions, most widespread first, as dicts
+    with their occurrences' submission and line coordinates
+    """
+    started = time.perf_counter()
+    min_tokens = min_tokens or settings.CLONE_MIN_TOKENS
+    min_files = min_files or settings.CLONE_MIN_FILES
+
+    submissions = CodeSubmission.objects.filter(language=language, is_temporary=False).order_by('pk')
+    reader, pks, rows = load_streams(submissions, 'code')
+    details = {
+        pk: (str(submission_id), title, username)
+        for pk, submission_id, title, username in submissions.values_list(
+            'pk', 'submission_id', 'title', 'user__username'
+        ).iterator(chunk_size=10_000)
+    }
+    # Leave out submissions deleted, or whose text changed, while the streams were loaded
+    keep = (rows >= 0) & np.isin(pks, np.fromiter(details, dtype=np.int64, count=len(details)))
+    pks, rows = pks[keep], rows[keep]
+    files = [details[pk] for pk in pks.tolist()]
+    ids, lines, file_starts = _join(reader, rows)
+
+    order, history = suffix_array(ids)
+    lcp = lcp_array(order, history)
+    del history
+    repeats = maximal_repeats(ids, order, lcp, min_tokens)
+
+    fragments = []
+    for repeat in repeats:
+        positions = np.sort(repeat.positions)
+        owners = np.searchsorted(file_starts, positions, side='right') - 1
+        if owners[0] == owners[-1] and min_files > 1:
+            continue
+        # Periodic code (the same line many times) repeats overlapping itself; keep an occurrence
+        # only if it starts after the previous one in the same file ends
+        overlapping = np.zeros(len(positions), dtype=bool)
+        overlapping[1:] = (owners[1:] == owners[:-1]) & (positions[1:] - positions[:-1] < repeat.length)
+        positions, owners = positions[~overlapping], owners[~overlapping]
+        file_count = len(np.unique(owners))
+        if file_count < min_files or len(positions) < 2:
+            continue
+        first = int(positions[0])
+        fragments.append({
+            'language': language,
+            'tokens': repeat.length,
+            'files': file_count,
+            'occurrence_count': len(positions),
+            'preview': ' '.join(reader.decode(ids[first:first + min(repeat.length, PREVIEW_TOKENS)])),
+            'occurrences': [
+                {
+                    'submission_id': files[owner][0],
+                    'title': files[owner][1],
+                    'user': files[owner][2],
+                    'start_line': int(lines[position]),
+                    'end_line': int(lines[position + repeat.length - 1]),
+                }
+                for owner, position in zip(owners[:MAX_OCCURRENCES].tolist(), positions[:MAX_OCCURRENCES].tolist())
+            ],
+        })
+    fragments.sort(key=lambda fragment: (-fragment['files'], -fragment['tokens'], -fragment['occurrence_count']))
+    return CloneDetection(language, len(files), len(ids) - len(files), fragments, time.perf_counter() - started)
@@ -0,0 +1,221 @@
+"""
+Plagiarism clusters over the corpus similarity graph.
+
+Submissions are nodes; an edge joins two submissions whose score is at
+least the threshold. Edges come from candidate pairs rather than an N x N
+matrix: the pairs of submissions sharing a sampled n-gram fingerprint
+(reference_index.fingerprints), scored by the share of the smaller file's
+fingerprints found in the other. Fingerprints held by more than
+max_postings submissions (boilerplate, starter code) make no pairs, which
+bounds the candidate count at O(fingerprints x max_postings).
+
+Connected components are found with a union-find structure. A component
+whose edge density is under min_density (a chain of pairwise matches
+rather than a ring sharing one solution) is split again with union-find
+over its stronger edges, a threshold step at a time, into dense clusters.
+
+Like feature_store, this module only depends on numpy.
+"""
+
+import numpy as np
+
+# Pair occurrences collected before they are merged into (pair, count) totals
+PAIR_CHUNK = 5_000_000
+# How much the threshold is raised each time a sparse component is split
+THRESHOLD_STEP = 0.05
+
+
+class UnionFind:
+    """Disjoint sets over 0..n-1 with union by size and path halving"""
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, node):
+        parent = self.parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return a
+
+    def union_many(self, sources, targets):
+        for a, b in zip(sources.tolist(), targets.tolist()):
+            self.union(a, b)
+
+    def labels(self):
+        """Root of every node's set, as an int64 array"""
+        return np.fromiter((self.find(node) for node in range(len(self.parent))), dtype=np.int64,
+                           count=len(self.parent))
+
+
+def _merge_counts(keys, counts):
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+def candidate_pairs(fingerprint_sets, threshold, max_postings=200):
+    """
+    (sources, targets, scores) of the node pairs whose share of shared
+    fingerprints (over the smaller set) is at least threshold; sources <
+    targets, scores 0-1. fingerprint_sets holds one sorted distinct uint64
+    array per node.
+    """
+    n = len(fingerprint_sets)
+    sizes = np.fromiter((len(grams) for grams in fingerprint_sets), dtype=np.int64, count=n)
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+    if n < 2 or not sizes.sum():
+        return empty
+
+    grams = np.concatenate(fingerprint_sets)
+    nodes = np.repeat(np.arange(n, dtype=np.int64), sizes)
+    order = np.argsort(grams, kind='stable')
+    grams, nodes = grams[order], nodes[order]
+    _, starts, lengths = np.unique(grams, return_index=True, return_counts=True)
+    usable = (lengths >= 2) & (lengths <= max_postings)
+    starts, lengths = starts[usable], lengths[usable]
+
+    keys, counts = np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+    pending, pending_size = [], 0
+
+    def flush():
+        nonlocal keys, counts, pending, pending_size
+        if pending:
+            batch = np.concatenate(pending)
+            keys, counts = _merge_counts(np.concatenate([keys, batch]),
+                                         np.concatenate([counts, np.ones(len(batch), dtype=np.int64)]))
+            pending, pending_size = [], 0
+
+    # Every posting list of one length is a (lists, length) array, so its pairs are one fancy index
+    for length in np.unique(lengths).tolist():
+        first, second = np.triu_indices(length, k=1)
+        group = starts[lengths == length]
+        rows = max(1, PAIR_CHUNK // len(first))
+        for batch in range(0, len(group), rows):
+            members = nodes[group[batch:batch + rows, None] + np.arange(length)]
+            # Node ids ascend within a posting list (stable sort), so a < b
+            pair_keys = (members[:, first] * n + members[:, second]).ravel().astype(np.uint64)
+            pending.append(pair_keys)
+            pending_size += len(pair_keys)
+            if pending_size >= PAIR_CHUNK:
+                flush()
+    flush()
+
+    sources = (keys // np.uint64(n)).astype(np.int64)
+    targets = (keys % np.uint64(n)).astype(np.int64)
+    scores = counts / np.minimum(sizes[sources], sizes[targets])
+    keep = scores >= threshold
+    return sources[keep], targets[keep], scores[keep].astype(np.float32)
+
+
+class Cluster:
+    """A dense set of nodes and the edges among them"""
+
+    def __init__(self, nodes, sources, targets, scores, component, threshold):
+        self.nodes = nodes
+        self.sources = sources
+        self.targets = targets
+        self.scores = scores
+        # Connected component (at the base threshold) the cluster was split from
+        self.component = component
+        # Edge threshold the cluster was formed at
+        self.threshold = threshold
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def edge_count(self):
+        return len(self.scores)
+
+    @property
+    def density(self):
+        possible = len(self.nodes) * (len(self.nodes) - 1) / 2
+        return self.edge_count / possible if possible else 0.0
+
+    def degrees(self):
+        """node -> (edges within the cluster, best score)"""
+        degree = {}
+        for a, b, score in zip(self.sources.tolist(), self.targets.tolist(), self.scores.tolist()):
+            for node in (a, b):
+                count, best = degree.get(node, (0, 0.0))
+                degree[node] = (count + 1, max(best, score))
+        return degree
+
+
+def _components(nodes, sources, targets, scores):
+    """Split an edge list into (nodes, sources, targets, scores) per connected component"""
+    local = {node: i for i, node in enumerate(nodes.tolist())}
+    to_local = np.vectorize(local.__getitem__, otypes=[np.int64])
+    local_sources, local_targets = to_local(sources), to_local(targets)
+    union_find = UnionFind(len(nodes))
+    union_find.union_many(local_sources, local_targets)
+    labels = union_find.labels()
+
+    # Every node has an edge, so grouping nodes and edges by root gives the same roots in the same order
+    node_order = np.argsort(labels, kind='stable')
+    node_labels = labels[node_order]
+    node_starts = np.flatnonzero(np.diff(node_labels, prepend=-1))
+    node_stops = np.append(node_starts[1:], len(node_labels))
+
+    edge_order = np.argsort(labels[local_sources], kind='stable')
+    edge_labels = labels[local_sources][edge_order]
+    sources, targets, scores = sources[edge_order], targets[edge_order], scores[edge_order]
+    edge_starts = np.flatnonzero(np.diff(edge_labels, prepend=-1))
+    edge_stops = np.append(edge_starts[1:], len(edge_labels))
+
+    for node_start, node_stop, edge_start, edge_stop in zip(
+        node_starts.tolist(), node_stops.tolist(), edge_starts.tolist(), edge_stops.tolist()
+    ):
+        yield (
+            nodes[node_order[node_start:node_stop]],
+            sources[edge_start:edge_stop],
+            targets[edge_start:edge_stop],
+            scores[edge_start:edge_stop],
+        )
+
+
+def find_clusters(sources, targets, scores, threshold, min_density=0.5, min_size=2):
+    """
+    Dense clusters of the graph with the given edges (sources, targets,
+    scores arrays; scores 0-1), largest first. Components under
+    min_density are split over edges at least THRESHOLD_STEP stronger
+    until each part is dense or smaller than min_size.
+    """
+    sources, targets, scores = np.asarray(sources), np.asarray(targets), np.asarray(scores)
+    keep = scores >= threshold
+    sources, targets, scores = sources[keep], targets[keep], scores[keep]
+    if not len(scores):
+        return []
+    nodes = np.unique(np.concatenate([sources, targets]))
+
+    clusters = []
+    work = [(component, edges, threshold) for component, edges in enumerate(_components(nodes, sources, targets, scores))]
+    while work:
+        component, (part, part_sources, part_targets, part_scores), part_threshold = work.pop()
+        if len(part) < min_size:
+            continue
+        cluster = Cluster(part, part_sources, part_targets, part_scores, component, part_threshold)
+        next_threshold = part_threshold + THRESHOLD_STEP
+        if cluster.density >= min_density or next_threshold > 1.0:
+            clusters.append(cluster)
+            continue
+        stronger = part_scores >= next_threshold
+        if stronger.any():
+            part_sources, part_targets, part_scores = part_sources[stronger], part_targets[stronger], part_scores[stronger]
+            part = np.unique(np.concatenate([part_sources, part_targets]))
+            work.extend((component, edges, next_threshold)
+                        for edges in _components(part, part_sources, part_targets, part_scores))
+
+    clusters.sort(key=lambda cluster: (-len(cluster), cluster.component, int(cluster.nodes[0])))
+    return clusters
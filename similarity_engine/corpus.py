@@ -0,0 +1,80 @@
+"""
+Submission token streams for corpus-wide batch jobs, kept in a
+corpus_store.CorpusStore under settings.CORPUS_STORE_PATH.
+
+Each stream kind is one tokenization of a submission's text:
+
+    words   lower-cased \\w+ words (reference_index fingerprints, plagiarism clusters)
+    code    suffix_array.tokenize() tokens and their lines (clone detection)
+
+load_streams() encodes whatever the store lacks (new submissions, and
+submissions whose text moved to another blob since) and returns a reader,
+so a job over the whole corpus reads memory-mapped streams instead of
+decompressing and tokenizing every text.
+"""
+
+import numpy as np
+from django.conf import settings
+
+from users.models import CodeSubmission
+from .corpus_store import CorpusStore
+from .pipeline import read_submission_text
+from .suffix_array import tokenize
+from .token_encoding import WORD_RE
+
+# Submissions loaded and encoded per batch when filling the store
+ENCODE_BATCH = 2000
+
+
+def _words(text, language):
+    return WORD_RE.findall(text.lower()), None
+
+
+STREAM_KINDS = {
+    # kind: (tokenizer(text, language) -> (tokens, lines or None), stores lines)
+    'words': (_words, False),
+    'code': (tokenize, True),
+}
+
+
+def get_corpus_store(kind):
+    """Corpus store of a stream kind rooted at settings.CORPUS_STORE_PATH"""
+    return CorpusStore(settings.CORPUS_STORE_PATH, kind, with_lines=STREAM_KINDS[kind][1])
+
+
+def _encode(submissions, kind):
+    tokenizer = STREAM_KINDS[kind][0]
+    for submission in submissions:
+        tokens, lines = tokenizer(read_submission_text(submission), submission.language)
+        yield submission.pk, submission.blob_id or 0, tokens, lines
+
+
+def load_streams(submissions, kind):
+    """
+    (reader, pks, rows) for a CodeSubmission queryset: its pks in the
+    queryset's order and the reader row of each one's stream, encoding
+    the submissions the store has no current stream for
+    """
+    store = get_corpus_store(kind)
+    pks, blobs = [], []
+    for pk, blob in submissions.values_list('pk', 'blob_id').iterator(chunk_size=10_000):
+        pks.append(pk)
+        blobs.append(blob or 0)
+    pks, blobs = np.asarray(pks, dtype=np.int64), np.asarray(blobs, dtype=np.int64)
+
+    reader = store.reader()
+    rows = reader.locate(pks, blobs)
+    missing = pks[rows < 0].tolist()
+    if missing:
+        for start in range(0, len(missing), ENCODE_BATCH):
+            batch = CodeSubmission.objects.filter(pk__in=missing[start:start + ENCODE_BATCH]).with_code()
+            store.append(_encode(batch, kind))
+        reader = store.reader()
+        rows = reader.locate(pks, blobs)
+    return reader, pks, rows
+
+
+def compact_corpus(kind):
+    """Drop the streams of deleted (or temporary) submissions; returns (bytes before, bytes after)"""
+    live = CodeSubmission.objects.filter(is_temporary=False).values_list('pk', flat=True)
+    return get_corpus_store(kind).compact(live.iterator(chunk_size=10_000))
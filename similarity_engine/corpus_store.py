@@ -0,0 +1,291 @@
+"""
+Append-only, memory-mapped store of every submission's encoded token stream.
+
+Batch jobs over the corpus read token streams from here instead of
+loading and re-tokenizing each submission's text. Each engine version and
+stream kind gets its own directory:
+
+    <root>/<engine_version>/<kind>/tokens.bin        uint32 (T,)   store token ids, all streams back to back
+    <root>/<engine_version>/<kind>/lines.bin         uint32 (T,)   line of each token (kinds with lines only)
+    <root>/<engine_version>/<kind>/index.bin         INDEX_DTYPE   one record per stream appended
+    <root>/<engine_version>/<kind>/vocabulary.bin    utf-8         the store's tokens, concatenated
+    <root>/<engine_version>/<kind>/vocabulary_offsets.bin  int64 (V+1,)
+    <root>/<engine_version>/<kind>/hashes.bin        uint64 (V,)   crc32 of each token
+    <root>/<engine_version>/<kind>/meta.json
+
+Token ids are the store's own (appended to its vocabulary as new tokens
+appear), so they mean the same thing in every process reading the store.
+An index record is written last, after its tokens and vocabulary, and
+records the totals it committed: a crashed append leaves only a tail that
+the next append truncates. The latest record for a submission wins;
+compact() rewrites the store without superseded streams and submissions
+that no longer exist, and swaps it in by rename (readers that still map
+the old files keep reading them).
+
+Like feature_store, this module doesn't depend on Django.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import threading
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+from .similarity_analyzer import ENGINE_VERSION
+
+FORMAT_VERSION = 1
+INDEX_DTYPE = np.dtype([
+    ('submission', '<i8'),
+    # Blob the stream was encoded from (0 for text stored inline): a changed blob means a stale stream
+    ('blob', '<i8'),
+    ('offset', '<i8'),
+    ('length', '<i8'),
+    # Vocabulary size once this record's tokens were added
+    ('vocabulary', '<i8'),
+])
+
+
+def _append(path, data, committed_bytes):
+    with open(path, 'ab') as f:
+        # Drop any partial tail left by an interrupted append
+        f.truncate(committed_bytes)
+        f.write(np.ascontiguousarray(data).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _span_index(offsets, lengths):
+    """Positions of the tokens of spans (offset, length), back to back"""
+    starts = np.zeros(len(lengths), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    return np.repeat(offsets - starts, lengths) + np.arange(int(lengths.sum()), dtype=np.int64), starts
+
+
+def _memmap(path, dtype, rows):
+    if rows == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(rows,))
+
+
+class CorpusStore:
+    """Token streams of one kind for one engine version"""
+
+    def __init__(self, root, kind, engine_version=ENGINE_VERSION, with_lines=False):
+        self.root = str(root)
+        self.kind = kind
+        self.engine_version = engine_version
+        self.with_lines = with_lines
+        self.path = os.path.join(self.root, engine_version, kind)
+
+    def _file(self, name, path=None):
+        return os.path.join(path or self.path, name)
+
+    @contextmanager
+    def _locked(self):
+        # The lock lives outside the store directory, which compact() replaces
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(os.path.dirname(self.path), f'.{self.kind}.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_meta(self, path=None):
+        meta_path = self._file('meta.json', path)
+        if os.path.exists(meta_path):
+            return
+        with open(meta_path, 'w') as f:
+            json.dump({
+                'format': FORMAT_VERSION,
+                'engine_version': self.engine_version,
+                'kind': self.kind,
+                'lines': self.with_lines,
+            }, f, indent=2)
+
+    def _records(self):
+        path = self._file('index.bin')
+        rows = os.path.getsize(path) // INDEX_DTYPE.itemsize if os.path.exists(path) else 0
+        return _memmap(path, INDEX_DTYPE, rows)
+
+    @staticmethod
+    def _totals(records):
+        """(tokens, vocabulary size) committed by the records"""
+        if not len(records):
+            return 0, 0
+        last = records[-1]
+        return int(last['offset'] + last['length']), int(last['vocabulary'])
+
+    def _load_vocabulary(self, size):
+        offsets = _memmap(self._file('vocabulary_offsets.bin'), np.int64, size + 1 if size else 0)
+        if not size:
+            return {}, np.zeros(1, dtype=np.int64)
+        with open(self._file('vocabulary.bin'), 'rb') as f:
+            data = f.read(int(offsets[-1]))
+        tokens = {data[start:stop].decode('utf-8'): token_id
+                  for token_id, (start, stop) in enumerate(zip(offsets[:-1].tolist(), offsets[1:].tolist()))}
+        return tokens, np.array(offsets)
+
+    # ------------------------------------------------------------------ writing
+
+    def append(self, streams):
+        """
+        Append streams: (submission id, blob id or 0, tokens (str list),
+        lines or None) tuples. Returns the number appended.
+        """
+        streams = list(streams)
+        if not streams:
+            return 0
+        with self._locked():
+            self._write_meta()
+            records = self._records()
+            token_total, vocabulary_size = self._totals(records)
+            vocabulary, vocabulary_offsets = self._load_vocabulary(vocabulary_size)
+            new_tokens = []
+
+            encoded, lines, index = [], [], np.zeros(len(streams), dtype=INDEX_DTYPE)
+            offset = token_total
+            for i, (submission, blob, tokens, token_lines) in enumerate(streams):
+                ids = np.empty(len(tokens), dtype=np.uint32)
+                for j, token in enumerate(tokens):
+                    token_id = vocabulary.get(token)
+                    if token_id is None:
+                        token_id = vocabulary[token] = len(vocabulary)
+                        new_tokens.append(token)
+                    ids[j] = token_id
+                encoded.append(ids)
+                if self.with_lines:
+                    lines.append(np.asarray(token_lines, dtype=np.uint32))
+                index[i] = (submission, blob or 0, offset, len(ids), len(vocabulary))
+                offset += len(ids)
+
+            data = [token.encode('utf-8') for token in new_tokens]
+            ends = vocabulary_offsets[-1] + np.cumsum([len(token) for token in data], dtype=np.int64)
+            _append(self._file('vocabulary.bin'), np.frombuffer(b''.join(data), dtype=np.uint8),
+                    int(vocabulary_offsets[-1]))
+            _append(self._file('vocabulary_offsets.bin'),
+                    ends if vocabulary_size else np.concatenate([[0], ends]).astype(np.int64),
+                    (vocabulary_size + 1) * 8 if vocabulary_size else 0)
+            _append(self._file('hashes.bin'),
+                    np.fromiter((zlib.crc32(token) for token in data), dtype=np.uint64, count=len(data)),
+                    vocabulary_size * 8)
+            _append(self._file('tokens.bin'), np.concatenate(encoded), token_total * 4)
+            if self.with_lines:
+                _append(self._file('lines.bin'), np.concatenate(lines), token_total * 4)
+            _append(self._file('index.bin'), index, len(records) * INDEX_DTYPE.itemsize)
+        return len(streams)
+
+    def compact(self, live_submissions):
+        """
+        Rewrite the store keeping only the latest stream of each submission
+        in live_submissions (ids); returns (bytes before, bytes after)
+        """
+        with self._locked():
+            before = self.size_on_disk()
+            reader = CorpusReader(self)
+            keep = np.isin(reader.submissions, np.asarray(list(live_submissions), dtype=np.int64))
+            submissions, blobs = reader.submissions[keep], reader.blobs[keep]
+            offsets, lengths = reader.offsets[keep], reader.lengths[keep]
+            # Keep the streams in their original order, so reading stays sequential
+            order = np.argsort(offsets, kind='stable')
+            submissions, blobs, offsets, lengths = submissions[order], blobs[order], offsets[order], lengths[order]
+
+            gather, starts = _span_index(offsets, lengths)
+            index = np.zeros(len(submissions), dtype=INDEX_DTYPE)
+            index['submission'], index['blob'], index['offset'], index['length'] = submissions, blobs, starts, lengths
+            index['vocabulary'] = reader.vocabulary_size
+
+            tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+            self._write_meta(tmp_path)
+            # The vocabulary is kept whole: ids stay valid and it is small next to the streams
+            for name in ('vocabulary.bin', 'vocabulary_offsets.bin', 'hashes.bin'):
+                if os.path.exists(self._file(name)):
+                    shutil.copyfile(self._file(name), self._file(name, tmp_path))
+            _append(self._file('tokens.bin', tmp_path), reader.tokens[gather], 0)
+            if self.with_lines:
+                _append(self._file('lines.bin', tmp_path), reader.lines[gather], 0)
+            _append(self._file('index.bin', tmp_path), index, 0)
+
+            old_path = f'{tmp_path}.old'
+            os.replace(self.path, old_path)
+            os.replace(tmp_path, self.path)
+            shutil.rmtree(old_path, ignore_errors=True)
+            return before, self.size_on_disk()
+
+    def size_on_disk(self):
+        if not os.path.isdir(self.path):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(self.path) if entry.is_file())
+
+    def reader(self):
+        return CorpusReader(self)
+
+
+class CorpusReader:
+    """Read-only, memory-mapped snapshot of a CorpusStore"""
+
+    def __init__(self, store):
+        self.store = store
+        records = np.array(store._records())
+        token_total, self.vocabulary_size = store._totals(records)
+        self.tokens = _memmap(store._file('tokens.bin'), np.uint32, token_total)
+        self.lines = _memmap(store._file('lines.bin'), np.uint32, token_total) if store.with_lines else None
+        self.hashes = _memmap(store._file('hashes.bin'), np.uint64, self.vocabulary_size)
+        self._vocabulary_offsets = _memmap(
+            store._file('vocabulary_offsets.bin'), np.int64, self.vocabulary_size + 1 if self.vocabulary_size else 0
+        )
+
+        # Streams appended since the last compaction, superseded ones included
+        self.record_count = len(records)
+        # Latest record per submission, sorted by submission id
+        latest = len(records) - 1 - np.unique(records['submission'][::-1], return_index=True)[1]
+        records = records[latest]
+        self.submissions = records['submission']
+        self.blobs = records['blob']
+        self.offsets = records['offset']
+        self.lengths = records['length']
+
+    def __len__(self):
+        return len(self.submissions)
+
+    def locate(self, submissions, blobs=None):
+        """
+        Row of each submission id in this reader, or -1 when it has no
+        stream (or, given blobs, one encoded from a different blob)
+        """
+        submissions = np.asarray(submissions, dtype=np.int64)
+        if not len(self.submissions):
+            return np.full(len(submissions), -1, dtype=np.int64)
+        rows = np.searchsorted(self.submissions, submissions)
+        rows[rows >= len(self.submissions)] = 0
+        found = self.submissions[rows] == submissions
+        if blobs is not None:
+            found &= self.blobs[rows] == np.asarray(blobs, dtype=np.int64)
+        return np.where(found, rows, -1)
+
+    def stream(self, row):
+        """Token ids of a row (a zero-copy slice of the mapped file)"""
+        start = int(self.offsets[row])
+        return self.tokens[start:start + int(self.lengths[row])]
+
+    def stream_lines(self, row):
+        start = int(self.offsets[row])
+        return self.lines[start:start + int(self.lengths[row])]
+
+    def gather(self, rows):
+        """(tokens, lines or None) of rows, concatenated in row order"""
+        positions = _span_index(self.offsets[rows], self.lengths[rows])[0]
+        return self.tokens[positions], self.lines[positions] if self.lines is not None else None
+
+    def decode(self, ids):
+        """Token strings of store ids"""
+        offsets = self._vocabulary_offsets
+        with open(self.store._file('vocabulary.bin'), 'rb') as f:
+            data = f.read(int(offsets[-1]) if len(offsets) else 0)
+        return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in np.asarray(ids).tolist()]
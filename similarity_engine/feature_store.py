@@ -0,0 +1,264 @@
+"""
+Append-only, columnar store of per-pair similarity features.
+
+Each engine version gets its own directory holding one flat binary file per
+column, so the trainer can memory-map the whole store without parsing:
+
+    <root>/<engine_version>/keys.bin      uint8  (n, 64)  sha256(source) + sha256(target)
+    <root>/<engine_version>/features.bin  float32 (n, 15) TRAINING_FEATURE_NAMES order
+    <root>/<engine_version>/scores.bin    float32 (n,)    overall similarity (0-1)
+    <root>/<engine_version>/meta.json     feature names and format version
+
+The features are the analyzer's signals for the pair (analyze_similarity,
+extract_training_features); the score is the label the model learns to
+predict, which is the score users see: pipeline.score_pair's overall
+score, as stored on the SimilarityResult that backfill_pair_features
+reads.
+
+Each pair is stored once. The store keeps an index of 64-bit key
+fingerprints in memory and extends it with the rows appended since it
+last looked (by any process), so checking a pair doesn't read the whole
+key file. Two distinct pairs sharing a fingerprint (odds about n^2 / 2^65)
+would only cost the second one its features.
+
+This module only depends on numpy so it can be imported by the standalone
+trainer as well as by the Django comparison pipeline.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from .similarity_analyzer import ENGINE_VERSION, TRAINING_FEATURE_NAMES
+
+FORMAT_VERSION = 1
+KEY_SIZE = 64
+# Odd multiplier mixing the source and target digests into a key fingerprint
+FINGERPRINT_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# Recent fingerprints kept in a set before they are merged into the sorted array
+INDEX_MERGE_SIZE = 4096
+
+
+def content_digest(text):
+    """SHA-256 digest (raw bytes) of a submission's source text"""
+    if isinstance(text, str):
+        text = text.encode('utf-8')
+    return hashlib.sha256(text or b'').digest()
+
+
+def pair_key(source_digest, target_digest):
+    """Fixed-width store key for an ordered (source, target) pair"""
+    return bytes(source_digest) + bytes(target_digest)
+
+
+def key_fingerprints(keys):
+    """64-bit fingerprints of (n, 64) uint8 pair keys (SHA-256 digests are uniform, so leading bytes do)"""
+    keys = np.ascontiguousarray(keys, dtype=np.uint8).reshape(-1, KEY_SIZE)
+    source = np.ascontiguousarray(keys[:, :8]).view('<u8').ravel()
+    target = np.ascontiguousarray(keys[:, 32:40]).view('<u8').ravel()
+    return source * FINGERPRINT_MULTIPLIER + target
+
+
+class _KeyIndex:
+    """Fingerprints of the stored keys: a sorted array plus the most recent ones in a set"""
+
+    def __init__(self):
+        self.rows = 0
+        self.sorted = np.empty(0, dtype=np.uint64)
+        self.recent = set()
+
+    def add(self, fingerprints):
+        self.recent.update(fingerprints.tolist())
+        if len(self.recent) >= INDEX_MERGE_SIZE:
+            self.sorted = np.union1d(self.sorted, np.fromiter(self.recent, dtype=np.uint64, count=len(self.recent)))
+            self.recent.clear()
+
+    def __contains__(self, fingerprint):
+        if fingerprint in self.recent:
+            return True
+        fingerprint = np.uint64(fingerprint)
+        index = np.searchsorted(self.sorted, fingerprint)
+        return bool(index < len(self.sorted) and self.sorted[index] == fingerprint)
+
+
+class PairFeatureStore:
+    """Append-only feature store for one engine version"""
+
+    def __init__(self, root, engine_version=ENGINE_VERSION, feature_names=None):
+        self.engine_version = engine_version
+        self.feature_names = list(feature_names or TRAINING_FEATURE_NAMES)
+        self.path = os.path.join(str(root), engine_version)
+        self.columns = {
+            'keys': (os.path.join(self.path, 'keys.bin'), np.uint8, KEY_SIZE),
+            'features': (os.path.join(self.path, 'features.bin'), np.float32, len(self.feature_names)),
+            'scores': (os.path.join(self.path, 'scores.bin'), np.float32, 1),
+        }
+        self._index = _KeyIndex()
+        self._thread_lock = threading.Lock()
+
+    # ------------------------------------------------------------------ writing
+
+    @contextmanager
+    def _locked(self):
+        # The thread lock guards the in-memory index; the file lock other processes' appends
+        os.makedirs(self.path, exist_ok=True)
+        with self._thread_lock, open(os.path.join(self.path, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _indexed(self):
+        """The key index, extended with the rows appended since it was last read (call under _locked)"""
+        rows = self._row_count()
+        if rows < self._index.rows:
+            # The store was replaced; start over
+            self._index = _KeyIndex()
+        if rows > self._index.rows:
+            path = self.columns['keys'][0]
+            with open(path, 'rb') as f:
+                f.seek(self._index.rows * KEY_SIZE)
+                data = f.read((rows - self._index.rows) * KEY_SIZE)
+            self._index.add(key_fingerprints(np.frombuffer(data, dtype=np.uint8)))
+            self._index.rows = rows
+        return self._index
+
+    def _write_meta(self):
+        meta_path = os.path.join(self.path, 'meta.json')
+        if os.path.exists(meta_path):
+            return
+        with open(meta_path, 'w') as f:
+            json.dump({
+                'format': FORMAT_VERSION,
+                'engine_version': self.engine_version,
+                'feature_names': self.feature_names,
+            }, f, indent=2)
+
+    def _row_count(self):
+        """Number of fully written rows (a crashed append may leave a partial tail)"""
+        counts = []
+        for path, dtype, width in self.columns.values():
+            row_bytes = np.dtype(dtype).itemsize * width
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            counts.append(size // row_bytes)
+        return min(counts)
+
+    def append(self, keys, features, scores):
+        """Append rows; keys are 64-byte pair keys, features are (n, 15) floats"""
+        keys = np.frombuffer(b''.join(keys), dtype=np.uint8).reshape(-1, KEY_SIZE)
+        features = np.asarray(features, dtype=np.float32).reshape(len(keys), len(self.feature_names))
+        scores = np.asarray(scores, dtype=np.float32).reshape(len(keys))
+        if not len(keys):
+            return 0
+
+        with self._locked():
+            self._append_locked(keys, features, scores)
+        return len(keys)
+
+    def _append_locked(self, keys, features, scores):
+        self._write_meta()
+        committed = self._row_count()
+        for name, data in (('features', features), ('scores', scores), ('keys', keys)):
+            path, dtype, width = self.columns[name]
+            with open(path, 'ab') as f:
+                # Drop any partial tail left by an interrupted append so
+                # that every column stays row-aligned.
+                f.truncate(committed * np.dtype(dtype).itemsize * width)
+                f.write(np.ascontiguousarray(data).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+    def add(self, source_digest, target_digest, features, score):
+        """Append a single pair unless it is already stored"""
+        key = pair_key(source_digest, target_digest)
+        fingerprint = int(key_fingerprints(np.frombuffer(key, dtype=np.uint8))[0])
+        with self._locked():
+            # Checked under the lock, so concurrent writers can't both append the pair
+            if fingerprint in self._indexed():
+                return False
+            self._append_locked(
+                np.frombuffer(key, dtype=np.uint8).reshape(1, KEY_SIZE),
+                np.asarray(features, dtype=np.float32).reshape(1, len(self.feature_names)),
+                np.asarray([score], dtype=np.float32),
+            )
+        return True
+
+    # ------------------------------------------------------------------ reading
+
+    def _memmap(self, name, rows):
+        path, dtype, width = self.columns[name]
+        shape = (rows, width) if width > 1 else (rows,)
+        if rows == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+    def __len__(self):
+        return self._row_count()
+
+    def load(self):
+        """Memory-map the store; returns (keys, features, scores) read-only arrays"""
+        rows = self._row_count()
+        return self._memmap('keys', rows), self._memmap('features', rows), self._memmap('scores', rows)
+
+    def contains(self, key):
+        """Whether a pair key is stored (by its fingerprint)"""
+        fingerprint = int(key_fingerprints(np.frombuffer(key, dtype=np.uint8))[0])
+        with self._locked():
+            return fingerprint in self._indexed()
+
+    def unique_indices(self):
+        """Row indices of the first occurrence of every distinct pair key"""
+        keys, _, _ = self.load()
+        if not len(keys):
+            return np.empty(0, dtype=np.int64)
+        _, first = np.unique(keys.view(np.dtype((np.void, KEY_SIZE))).ravel(), return_index=True)
+        return np.sort(first)
+
+    def training_matrix(self, threshold=0.75, deduplicate=True):
+        """Feature matrix and binary labels (score >= threshold) for the trainer"""
+        _, features, scores = self.load()
+        if deduplicate:
+            rows = self.unique_indices()
+            return features[rows], (scores[rows] >= threshold).astype(np.int64)
+        return features, (scores >= threshold).astype(np.int64)
+
+
+_stores_lock = threading.Lock()
+_stores = {}
+
+
+def get_feature_store(engine_version=ENGINE_VERSION):
+    """Feature store rooted at settings.FEATURE_STORE_PATH, one per process (it keeps its key index)"""
+    from django.conf import settings
+
+    key = (str(settings.FEATURE_STORE_PATH), engine_version)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = PairFeatureStore(settings.FEATURE_STORE_PATH, engine_version=engine_version)
+        return _stores[key]
+
+
+def record_pair_features(source_text, target_text, language, score):
+    """
+    Compute and persist features for a compared pair (no-op if already
+    stored); score is its pipeline.score_pair overall score (see above)
+    """
+    from .similarity_analyzer import get_analyzer, get_predictor
+
+    store = get_feature_store()
+    source_digest = content_digest(source_text)
+    target_digest = content_digest(target_text)
+    if store.contains(pair_key(source_digest, target_digest)):
+        return False
+
+    basic_similarities = get_analyzer().analyze_similarity(source_text, target_text, language)
+    features = get_predictor().extract_training_features(
+        source_text, target_text, basic_similarities, language
+    )
+    return store.add(source_digest, target_digest, features, score)
@@ -0,0 +1,312 @@
+"""
+Background comparison jobs.
+
+A multiple_vs_multiple comparison scores every file of one submission set
+against every file of another, which is too slow for the request: the view
+creates the pending ComparisonRequest and the job runs on a small thread
+pool once the transaction commits. The kept matches (see matrix.top_k_matches)
+are written with bulk inserts, plus one summary SimilarityResult. The job
+reports its progress on the ComparisonRequest row as it goes (see
+progress.py for the clients waiting on it).
+
+The pool takes turns between users (FairScheduler): one user's pile of
+batch jobs queues behind everyone else's first job instead of holding
+every worker, and a batch job pauses between blocks while interactive
+file_vs_file comparisons, which run in the request, use this process.
+
+The queue lives in memory, so a restart loses the jobs in it. The
+scheduler refreshes heartbeat_at on its queued and running jobs every
+COMPARISON_HEARTBEAT_INTERVAL seconds; a comparison pending or processing
+whose heartbeat is older than COMPARISON_ORPHAN_AFTER was lost. Lost
+comparisons don't count as queued or active (live_comparisons()), and
+fail_orphaned_comparisons(), run when the server starts, fails them.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from users.models import CodeSubmission, ComparisonRequest, SimilarityMatch, SimilarityResult
+from .matrix import ranked_rows, top_k_matches
+from .pipeline import read_submission_text
+
+logger = logging.getLogger('similarity_engine.jobs')
+
+# Share of the progress bar for loading the texts, and for scoring them
+LOAD_PROGRESS = 10
+SCORE_PROGRESS = 85
+UNFINISHED = ('pending', 'processing')
+ORPHANED_MESSAGE = 'The comparison was interrupted by a server restart; run it again.'
+QUEUE_FIELDS = ('pk', 'user_id', 'status')
+
+
+def fair_order(queued, running):
+    """
+    The order queued jobs run in: queued is [(comparison_pk, user_id)],
+    oldest first, and running {user_id: jobs running}. A job's turn is the
+    number of its user's jobs running or queued before it; lower turns run
+    first and the oldest wins a tie, so users alternate however many jobs
+    each of them queued.
+    """
+    turns = Counter(running)
+    keyed = []
+    for index, (comparison_pk, user_id) in enumerate(queued):
+        keyed.append((turns[user_id], index, comparison_pk, user_id))
+        turns[user_id] += 1
+    keyed.sort()
+    return [(comparison_pk, user_id) for _, _, comparison_pk, user_id in keyed]
+
+
+def heartbeat_deadline():
+    """Unfinished comparisons whose heartbeat is older than this were lost with their process"""
+    return timezone.now() - timedelta(seconds=settings.COMPARISON_ORPHAN_AFTER)
+
+
+def live_comparisons():
+    """Comparisons pending or processing in a running process"""
+    return ComparisonRequest.objects.filter(status__in=UNFINISHED, heartbeat_at__gte=heartbeat_deadline())
+
+
+def fail_orphaned_comparisons():
+    """Fail the comparisons lost with a previous run's queue; returns how many"""
+    return ComparisonRequest.objects.filter(status__in=UNFINISHED, heartbeat_at__lt=heartbeat_deadline()).update(
+        status='failed', error_message=ORPHANED_MESSAGE
+    )
+
+
+def queued_jobs():
+    """values(*QUEUE_FIELDS) of the batch jobs pending or processing, for queue_positions()"""
+    return live_comparisons().filter(comparison_type='multiple_vs_multiple').order_by().values(*QUEUE_FIELDS)
+
+
+def queue_positions(rows):
+    """{comparison_pk: place in the queue, from 1} of the pending jobs among queued_jobs() rows"""
+    running = Counter(row['user_id'] for row in rows if row['status'] == 'processing')
+    queued = sorted((row['pk'], row['user_id']) for row in rows if row['status'] == 'pending')
+    return {comparison_pk: place for place, (comparison_pk, _) in enumerate(fair_order(queued, running), 1)}
+
+
+class FairScheduler:
+    """
+    Runs comparison jobs on a fixed set of worker threads. The next job is
+    the first in fair_order() whose user has fewer than per_user jobs
+    running. This process's view of the queue is the same as
+    queue_positions() over the database as long as one process runs the
+    jobs; with several, each one takes turns over its own jobs. Another
+    thread beats the heartbeat of the jobs every heartbeat_interval seconds.
+    """
+
+    def __init__(self, workers, per_user, heartbeat_interval=60):
+        self.workers = workers
+        self.per_user = per_user
+        self.heartbeat_interval = heartbeat_interval
+        self._condition = threading.Condition()
+        # [(comparison_pk, user_id, job)], oldest first
+        self._queue = []
+        self._running = Counter()
+        self._running_pks = set()
+        self._interactive = 0
+        self._threads = []
+
+    def submit(self, comparison_pk, user_id, job):
+        """Queue job(comparison_pk)"""
+        with self._condition:
+            if not self._threads:
+                self._threads = [
+                    threading.Thread(target=self._work, name=f'comparison-job-{i}', daemon=True)
+                    for i in range(self.workers)
+                ]
+                self._threads.append(threading.Thread(target=self._heartbeat, name='comparison-heartbeat', daemon=True))
+                for thread in self._threads:
+                    thread.start()
+            self._queue.append((comparison_pk, user_id, job))
+            self._condition.notify_all()
+
+    def _take(self):
+        order = fair_order([(comparison_pk, user_id) for comparison_pk, user_id, _ in self._queue], self._running)
+        for comparison_pk, user_id in order:
+            if self._running[user_id] < self.per_user:
+                index = next(i for i, entry in enumerate(self._queue) if entry[0] == comparison_pk)
+                self._running[user_id] += 1
+                self._running_pks.add(comparison_pk)
+                return self._queue.pop(index)
+        return None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                entry = self._take()
+                while entry is None:
+                    self._condition.wait()
+                    entry = self._take()
+            comparison_pk, user_id, job = entry
+            try:
+                job(comparison_pk)
+            except Exception:
+                logger.exception('Comparison job %s failed', comparison_pk)
+            finally:
+                with self._condition:
+                    self._running[user_id] -= 1
+                    if not self._running[user_id]:
+                        del self._running[user_id]
+                    self._running_pks.discard(comparison_pk)
+                    self._condition.notify_all()
+
+    def beat(self):
+        """Refresh heartbeat_at of the jobs queued or running here"""
+        with self._condition:
+            pks = [comparison_pk for comparison_pk, _, _ in self._queue] + list(self._running_pks)
+        if pks:
+            ComparisonRequest.objects.filter(pk__in=pks, status__in=UNFINISHED).update(heartbeat_at=timezone.now())
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                self.beat()
+            except Exception:
+                logger.exception('Could not refresh the comparison job heartbeats')
+                # Reconnect on the next beat
+                connections.close_all()
+
+    @contextmanager
+    def interactive(self):
+        """Mark an interactive comparison running in this process (batch jobs pause for it)"""
+        with self._condition:
+            self._interactive += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._interactive -= 1
+                self._condition.notify_all()
+
+    def pause_for_interactive(self, timeout=None):
+        """Wait while interactive comparisons run, at most timeout seconds (INTERACTIVE_PAUSE_SECONDS)"""
+        timeout = settings.INTERACTIVE_PAUSE_SECONDS if timeout is None else timeout
+        with self._condition:
+            self._condition.wait_for(lambda: not self._interactive, timeout)
+
+
+_scheduler_lock = threading.Lock()
+_scheduler = None
+
+
+def get_scheduler():
+    """The process's FairScheduler of comparison jobs"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FairScheduler(
+                settings.COMPARISON_WORKERS,
+                settings.MAX_RUNNING_JOBS_PER_USER,
+                heartbeat_interval=settings.COMPARISON_HEARTBEAT_INTERVAL,
+            )
+        return _scheduler
+
+
+def _progress_reporter(comparison_pk, pause=None):
+    """progress(done, total) callback saving the scoring progress, once per percent, and calling pause()"""
+    last = [None]
+
+    def report(done, total):
+        if pause is not None:
+            pause()
+        percent = LOAD_PROGRESS + int(SCORE_PROGRESS * done / total)
+        if percent != last[0]:
+            last[0] = percent
+            ComparisonRequest.objects.filter(pk=comparison_pk).update(progress=percent)
+    return report
+
+
+def run_set_comparison(comparison_pk, top_k=None, pause=None):
+    """
+    Score a pending multiple_vs_multiple comparison and record its outcome
+    on the row; pause() is called between blocks (see FairScheduler)
+    """
+    comparison = ComparisonRequest.objects.get(pk=comparison_pk)
+    try:
+        comparison.status = 'processing'
+        comparison.progress = 0
+        comparison.save(update_fields=['status', 'progress'])
+        started = time.perf_counter()
+
+        top_k = top_k or settings.SET_COMPARISON_TOP_K
+        sources = list(comparison.source_set.with_code().order_by('pk'))
+        targets = list(comparison.target_set.with_code().order_by('pk'))
+        source_texts = [read_submission_text(s) for s in sources]
+        target_texts = [read_submission_text(t) for t in targets]
+        ComparisonRequest.objects.filter(pk=comparison_pk).update(progress=LOAD_PROGRESS)
+        matrix = top_k_matches(
+            source_texts,
+            target_texts,
+            top_k=top_k,
+            threshold=comparison.similarity_threshold,
+            source_keys=[s.pk for s in sources],
+            target_keys=[t.pk for t in targets],
+            progress=_progress_reporter(comparison_pk, pause),
+        )
+
+        matches = [
+            SimilarityMatch(
+                comparison=comparison,
+                source_submission_id=sources[row].pk,
+                target_submission_id=targets[column].pk,
+                score=score * 100,
+                rank=rank,
+            )
+            for row, ranked in ranked_rows(matrix)
+            for rank, (column, score) in enumerate(ranked, 1)
+        ]
+        best = max((match.score for match in matches), default=0.0)
+        elapsed = time.perf_counter() - started
+        pairs = len(sources) * len(targets)
+
+        with transaction.atomic():
+            SimilarityMatch.objects.bulk_create(matches, batch_size=1000)
+            SimilarityResult.objects.create(
+                comparison=comparison,
+                overall_similarity_score=best,
+                token_similarity=best,
+                identical_segments=[],
+                near_identical_segments=[],
+                code_metrics={},
+                visualization_data={
+                    'sources': len(sources),
+                    'targets': len(targets),
+                    'pairs_scored': pairs,
+                    'matches_kept': len(matches),
+                    'top_k': top_k,
+                    'seconds': round(elapsed, 3),
+                    'pairs_per_second': round(pairs / elapsed) if elapsed else None,
+                },
+            )
+            CodeSubmission.objects.filter(pk__in=[s.pk for s in sources + targets]).update(status='completed')
+            comparison.status = 'completed'
+            comparison.progress = 100
+            comparison.completed_at = timezone.now()
+            comparison.save(update_fields=['status', 'progress', 'completed_at'])
+    except Exception as e:
+        comparison.status = 'failed'
+        comparison.error_message = str(e)
+        comparison.save(update_fields=['status', 'error_message'])
+
+
+def _run_in_background(comparison_pk):
+    try:
+        run_set_comparison(comparison_pk, pause=get_scheduler().pause_for_interactive)
+    finally:
+        # Worker threads hold their own DB connections; don't leak them
+        connections.close_all()
+
+
+def submit_set_comparison(comparison_pk, user_id):
+    """Queue a user's multiple_vs_multiple comparison once the current transaction commits"""
+    transaction.on_commit(lambda: get_scheduler().submit(comparison_pk, user_id, _run_in_background))
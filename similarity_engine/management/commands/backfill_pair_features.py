@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from users.models import ComparisonRequest
+from similarity_engine.similarity_analyzer import get_analyzer, get_predictor
+from similarity_engine.feature_store import KEY_SIZE, content_digest, get_feature_store, pair_key
+from similarity_engine.pipeline import read_submission_text
+
+class Command(BaseCommand):
+    help = 'Backfill the pair feature store from completed file-vs-file comparisons'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows appended per write')
+    
+    def handle(self, *args, **options):
+        store = get_feature_store()
+        analyzer = get_analyzer()
+        predictor = get_predictor()
+        
+        stored_keys, _, _ = store.load()
+        seen = {bytes(row) for row in stored_keys.reshape(-1, KEY_SIZE)}
+        pending = ([], [], [])
+        written = 0
+        
+        comparisons = ComparisonRequest.objects.filter(
+            comparison_type='file_vs_file',
+            status='completed',
+            target_submission__isnull=False,
+        ).select_related('source_submission', 'target_submission').with_result()
+        
+        for comparison in comparisons.iterator(chunk_size=options['batch_size']):
+            source = comparison.source_submission
+            target = comparison.target_submission
+            if source.language != target.language:
+                continue
+            
+            src_text = read_submission_text(source)
+            tgt_text = read_submission_text(target)
+            key = pair_key(content_digest(src_text), content_digest(tgt_text))
+            if key in seen:
+                continue
+            seen.add(key)
+            
+            basic_similarities = analyzer.analyze_similarity(src_text, tgt_text, source.language)
+            pending[0].append(key)
+            pending[1].append(predictor.extract_training_features(src_text, tgt_text, basic_similarities, source.language))
+            pending[2].append(comparison.result.overall_similarity_score / 100)
+            
+            if len(pending[0]) >= options['batch_size']:
+                written += store.append(*pending)
+                pending = ([], [], [])
+                self.stdout.write(f"  {written} pairs written...")
+        
+        written += store.append(*pending)
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {written} pairs into {store.path} ({len(store)} rows total)"
+        ))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from users.models import CodeSubmission
+from similarity_engine.corpus import STREAM_KINDS, compact_corpus, get_corpus_store, load_streams
+
+
+class Command(BaseCommand):
+    help = 'Encode the token streams the corpus store is missing, and optionally compact it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kinds', nargs='*', help=f"Stream kinds: {', '.join(STREAM_KINDS)} (default: all)")
+        parser.add_argument('--compact', action='store_true',
+                            help='Afterwards drop the streams of deleted and superseded submissions')
+
+    def handle(self, *args, **options):
+        unknown = set(options['kinds']) - set(STREAM_KINDS)
+        if unknown:
+            raise CommandError(f"Unknown stream kind {', '.join(sorted(unknown))}")
+
+        submissions = CodeSubmission.objects.filter(is_temporary=False).order_by('pk')
+        for kind in options['kinds'] or STREAM_KINDS:
+            started = time.perf_counter()
+            before = get_corpus_store(kind).reader().record_count
+            reader, pks, _ = load_streams(submissions, kind)
+            self.stdout.write(
+                f'{kind:<8} {len(pks):>8,} submissions  {reader.record_count - before:>8,} encoded  '
+                f'{len(reader.tokens):>12,} tokens  {time.perf_counter() - started:6.1f}s'
+            )
+            if options['compact']:
+                size_before, size_after = compact_corpus(kind)
+                self.stdout.write(self.style.SUCCESS(
+                    f'{kind:<8} compacted {filesizeformat(size_before)} to {filesizeformat(size_after)}'
+                ))
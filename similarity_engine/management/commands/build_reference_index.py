@@ -0,0 +1,46 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from admins.models import CodeDataset
+from similarity_engine.references import process_reference_dataset
+
+
+class Command(BaseCommand):
+    help = 'Index reference datasets (CodeDataset with dataset_type=reference) for reference search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('datasets', nargs='*', help='Dataset names (default: every unprocessed active reference dataset)')
+        parser.add_argument('--rebuild', action='store_true', help='Also rebuild datasets that are already processed')
+
+    def handle(self, *args, **options):
+        datasets = CodeDataset.objects.filter(dataset_type='reference', is_active=True)
+        if options['datasets']:
+            datasets = datasets.filter(name__in=options['datasets'])
+            missing = set(options['datasets']) - set(datasets.values_list('name', flat=True))
+            if missing:
+                raise CommandError(f"No active reference dataset named {', '.join(sorted(missing))}")
+        elif not options['rebuild']:
+            datasets = datasets.filter(is_processed=False)
+
+        for dataset in datasets:
+            self.stdout.write(f'Indexing {dataset.name}')
+            started = time.perf_counter()
+
+            def progress(files, elapsed):
+                self.stdout.write(f'  {files:>12,} files  {elapsed:8.1f}s  {files / elapsed:>10,.0f} files/s')
+
+            try:
+                index = process_reference_dataset(dataset, progress=progress)
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f'  failed: {e}'))
+                continue
+            elapsed = time.perf_counter() - started
+            index_bytes = sum(entry.stat().st_size for entry in os.scandir(index.path))
+            self.stdout.write(self.style.SUCCESS(
+                f'  {dataset.file_count:,} files ({filesizeformat(dataset.total_size)}) in {elapsed:.1f}s: '
+                f"{index.meta['grams']:,} fingerprints, {index.meta['postings']:,} postings, "
+                f'{filesizeformat(index_bytes)} on disk'
+            ))
@@ -0,0 +1,42 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError, OutputWrapper
+
+from users.models import CodeSubmission
+from similarity_engine.clones import detect_clones
+
+
+class Command(BaseCommand):
+    help = 'Find code fragments shared by several submissions (JSON lines, one fragment per line)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('languages', nargs='*', help='Languages to scan (default: all)')
+        parser.add_argument('--min-tokens', type=int, help='Shortest fragment reported (default: CLONE_MIN_TOKENS)')
+        parser.add_argument('--min-files', type=int, help='Fewest submissions a fragment must appear in (default: CLONE_MIN_FILES)')
+        parser.add_argument('--limit', type=int, help='Fragments written per language, most widespread first')
+        parser.add_argument('--output', help='File to write the fragments to (default: standard output)')
+
+    def handle(self, *args, **options):
+        known = [code for code, _ in CodeSubmission.LANGUAGE_CHOICES]
+        unknown = set(options['languages']) - set(known)
+        if unknown:
+            raise CommandError(f"Unknown language {', '.join(sorted(unknown))}")
+
+        output = open(options['output'], 'w', encoding='utf-8') if options['output'] else sys.stdout
+        # Keep the summary out of the fragments when they go to standard output
+        log = self.stdout if options['output'] else OutputWrapper(sys.stderr)
+        try:
+            for language in options['languages'] or known:
+                detection = detect_clones(language, options['min_tokens'], options['min_files'])
+                fragments = detection.fragments[:options['limit']] if options['limit'] else detection.fragments
+                for fragment in fragments:
+                    output.write(json.dumps(fragment) + '\n')
+                log.write(
+                    f'{language:<12} {detection.submissions:>8,} submissions  {detection.tokens:>12,} tokens  '
+                    f'{len(detection.fragments):>7,} fragments  {detection.elapsed:6.1f}s  '
+                    f'({detection.tokens_per_second:,.0f} tokens/s)'
+                )
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import CodeSubmission
+from similarity_engine.plagiarism import cluster_corpus
+
+
+class Command(BaseCommand):
+    help = 'Find clusters of mutually similar submissions across the corpus (replaces the stored clusters)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('languages', nargs='*', help='Languages to cluster (default: all)')
+        parser.add_argument('--threshold', type=float, help='Edge score, 0-1 (default: PLAGIARISM_CLUSTER_THRESHOLD)')
+        parser.add_argument('--min-density', type=float, help='Split components sparser than this (0-1)')
+        parser.add_argument('--max-postings', type=int, help='Skip fingerprints shared by more submissions than this')
+
+    def handle(self, *args, **options):
+        known = {code for code, _ in CodeSubmission.LANGUAGE_CHOICES}
+        unknown = set(options['languages']) - known
+        if unknown:
+            raise CommandError(f"Unknown language {', '.join(sorted(unknown))}")
+
+        for run in cluster_corpus(
+            options['languages'],
+            threshold=options['threshold'],
+            min_density=options['min_density'],
+            max_postings=options['max_postings'],
+        ):
+            largest = max((cluster.size for cluster in run.clusters), default=0)
+            self.stdout.write(
+                f'{run.language:<12} {run.submissions:>8,} submissions  {run.candidate_edges:>9,} candidate edges  '
+                f'{run.known_edges:>7,} scored edges  {len(run.clusters):>6,} clusters '
+                f'({run.clustered_submissions:,} submissions, largest {largest})  {run.elapsed:6.1f}s'
+            )
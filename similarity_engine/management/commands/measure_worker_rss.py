@@ -0,0 +1,118 @@
+import gc
+import json
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.template.defaultfilters import filesizeformat
+
+SAMPLE = '''
+def mean(values):
+    total = 0
+    for value in values:
+        total += value
+    return total / len(values)
+
+
+class Account:
+    def __init__(self, owner, balance=0):
+        self.owner = owner
+        self.balance = balance
+
+    def deposit(self, amount):
+        if amount <= 0:
+            raise ValueError("amount must be positive")
+        self.balance += amount
+        return self.balance
+'''
+
+
+def _memory():
+    """(unique, proportional) bytes of this process, from /proc/self/smaps_rollup"""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[name] = int(value.split()[0]) * 1024
+    return fields['Private_Clean'] + fields['Private_Dirty'], fields['Pss']
+
+
+def _workload(rounds):
+    """What a worker does on its first comparisons: score pairs, extract features, search references"""
+    from similarity_engine.pipeline import score_pair
+    from similarity_engine.references import search_references
+    from similarity_engine.similarity_analyzer import get_analyzer, get_predictor
+
+    for i in range(rounds):
+        target = SAMPLE.replace('total', f'total{i}')
+        score_pair(SAMPLE, target, 'python', 'python')
+        similarities = get_analyzer().analyze_similarity(SAMPLE, target, 'python')
+        get_predictor().extract_training_features(SAMPLE, target, similarities, 'python')
+        search_references(target)
+    # A long-running worker's collections visit every object in the generations they scan
+    gc.collect()
+
+
+def _fork_workers(workers, rounds):
+    """Fork workers that each run the workload and report their memory; returns [(unique, pss)]"""
+    # Forked children must not share the parent's database connections
+    connections.close_all()
+    children = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = 0
+            try:
+                _workload(rounds)
+                with os.fdopen(write_fd, 'w') as pipe:
+                    json.dump(_memory(), pipe)
+            except BaseException as e:
+                print(f'worker failed: {e}', file=sys.stderr)
+                status = 1
+            finally:
+                os._exit(status)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    results = []
+    for pid, read_fd in children:
+        with os.fdopen(read_fd) as pipe:
+            data = pipe.read()
+        os.waitpid(pid, 0)
+        if not data:
+            raise CommandError('A worker failed; see the output above')
+        results.append(tuple(json.loads(data)))
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Measure the unique memory of forked workers, without and then with the pre-fork warmup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Workers forked per measurement')
+        parser.add_argument('--rounds', type=int, default=3, help='Comparisons each worker runs before measuring')
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/smaps_rollup'):
+            raise CommandError('Needs Linux (/proc/self/smaps_rollup)')
+        # Workers forked before the warmup load everything themselves; the warmup then runs in
+        # this process, as it would in a pre-forking server's master
+        from similarity_engine.warmup import warm_up
+
+        for mode in ('lazy', 'preloaded'):
+            if mode == 'preloaded':
+                timings = warm_up()
+                self.stdout.write(f"warmup {sum(timings.values()):.2f}s ({', '.join(timings)})")
+            results = _fork_workers(options['workers'], options['rounds'])
+            unique = sum(result[0] for result in results)
+            pss = sum(result[1] for result in results)
+            self.stdout.write(
+                f'{mode:<10} {len(results):>3} workers  '
+                f'{filesizeformat(unique / len(results)):>10} unique/worker  '
+                f'{filesizeformat(pss / len(results)):>10} PSS/worker  '
+                f'{filesizeformat(unique):>10} unique in total'
+            )
@@ -0,0 +1,97 @@
+"""
+Vectorized set-vs-set similarity for multiple_vs_multiple comparisons.
+
+Every file becomes an L2-normalised TF-IDF vector of its token 1-3-grams
+(weighted from its integer token stream, see token_encoding), so the
+cross-similarity of m sources and n targets is one sparse matrix product
+(cosine similarity). The product is evaluated a block of source
+rows at a time, bounded to BLOCK_CELLS dense cells, and only each source
+row's best matches are kept: the result is a sparse m x n matrix whatever
+the size of the two sets.
+
+Like feature_store, this module doesn't depend on Django.
+"""
+
+import numpy as np
+from scipy import sparse
+
+from .token_encoding import encode_words, scratch_vocabulary, tfidf_matrix
+
+# Dense cells (float32) per block of the product: 4M cells = 16 MB
+BLOCK_CELLS = 4_000_000
+# Upper bound on kept matches per source file, however many pass the threshold
+MAX_MATCHES_PER_FILE = 50
+
+
+def vectorize(source_texts, target_texts):
+    """TF-IDF matrices (CSR, rows L2-normalised) of both sets over a shared vocabulary"""
+    vocabulary = scratch_vocabulary()
+    streams = [encode_words(text, vocabulary) for text in list(source_texts) + list(target_texts)]
+    matrix = tfidf_matrix(streams, len(vocabulary), ngram_range=(1, 3), sublinear_tf=True)
+    return matrix[:len(source_texts)], matrix[len(source_texts):]
+
+
+def top_k_matches(source_texts, target_texts, top_k=5, threshold=None, source_keys=None, target_keys=None,
+                  max_per_file=MAX_MATCHES_PER_FILE, progress=None):
+    """
+    Sparse (m, n) float32 CSR matrix of cosine similarities (0-1) keeping,
+    for each source, its top_k targets plus every target scoring at least
+    threshold, at most max_per_file per source and never zero scores.
+    Pairs with equal keys (the same submission in both sets) are skipped.
+    progress(rows done, m) is called after each block.
+    """
+    m, n = len(source_texts), len(target_texts)
+    if not m or not n:
+        return sparse.csr_matrix((m, n), dtype=np.float32)
+
+    sources, targets = vectorize(source_texts, target_texts)
+    targets_t = targets.T.tocsr()
+    if source_keys is not None and target_keys is not None:
+        source_keys, target_keys = np.asarray(source_keys), np.asarray(target_keys)
+    else:
+        source_keys = target_keys = None
+
+    width = min(max_per_file, n)
+    ranks = np.arange(width)
+    block_rows = max(1, BLOCK_CELLS // n)
+    rows, cols, data = [], [], []
+
+    for start in range(0, m, block_rows):
+        stop = min(start + block_rows, m)
+        block = (sources[start:stop] @ targets_t).toarray()
+        if source_keys is not None:
+            block[source_keys[start:stop, None] == target_keys[None, :]] = -1
+
+        # Best `width` columns per row (unordered), then ordered by score
+        if width < n:
+            candidates = np.argpartition(-block, width - 1, axis=1)[:, :width]
+        else:
+            candidates = np.broadcast_to(np.arange(n), block.shape)
+        scores = np.take_along_axis(block, candidates, axis=1)
+        order = np.argsort(-scores, axis=1, kind='stable')
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+
+        keep = ranks < top_k
+        if threshold is not None:
+            keep = keep | (scores >= threshold)
+        keep = keep & (scores > 0)
+        block_row, position = np.nonzero(keep)
+        rows.append(block_row + start)
+        cols.append(candidates[block_row, position])
+        data.append(scores[block_row, position])
+        if progress is not None:
+            progress(stop, m)
+
+    return sparse.csr_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(m, n), dtype=np.float32
+    )
+
+
+def ranked_rows(matrix):
+    """Yield (row, [(column, score), ...] best first) for each row of a top_k_matches() matrix"""
+    for row in range(matrix.shape[0]):
+        start, stop = matrix.indptr[row], matrix.indptr[row + 1]
+        columns, scores = matrix.indices[start:stop], matrix.data[start:stop]
+        order = np.argsort(-scores, kind='stable')
+        yield row, [(int(columns[i]), float(scores[i])) for i in order]
@@ -0,0 +1,153 @@
+"""
+Comparison pipeline: scores a ComparisonRequest and persists its result.
+
+The pair's training features (feature_store) cost about twice the scoring
+itself, so they are recorded on a background thread once the result is
+committed rather than in the request.
+"""
+
+import ast as _ast
+import difflib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import SimilarityResult
+from users.uploads import ingest_upload
+from .feature_store import record_pair_features
+from .token_encoding import encode_words, scratch_vocabulary
+
+logger = logging.getLogger('similarity_engine.pipeline')
+
+_recorder_lock = threading.Lock()
+_recorder = None
+
+
+def get_feature_recorder():
+    """Single background thread recording pair features (appends to the store are serialized anyway)"""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pair-features')
+        return _recorder
+
+
+def _record_in_background(src_text, tgt_text, language, score):
+    # Keep the pair's features for retraining; never fail anything over it
+    try:
+        record_pair_features(src_text, tgt_text, language, score)
+    except Exception:
+        logger.exception('Could not record pair features')
+
+
+def read_submission_text(submission):
+    """Source text of a submission, falling back to the uploaded file"""
+    text = submission.code_text or ''
+    try:
+        if not text and submission.code_file:
+            text = ingest_upload(submission.code_file).text
+    except Exception:
+        text = text or ''
+    return text
+
+
+def _normalize_whitespace(s):
+    return re.sub(r"\s+", ' ', s).strip()
+
+
+def _token_sequence(s, vocabulary):
+    """Lower-cased word ids (uint32, see token_encoding)"""
+    return encode_words(s, vocabulary)
+
+
+def _seq_ratio(a, b):
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+def score_pair(src_text, tgt_text, source_language, target_language):
+    """Token, structural and AST similarity (fractions) plus the weighted overall score"""
+    # Token similarity (sequence matcher on tokens)
+    try:
+        vocabulary = scratch_vocabulary()
+        toks_src = _token_sequence(src_text, vocabulary)
+        toks_tgt = _token_sequence(tgt_text, vocabulary)
+        # Aligned token by token over the ids rather than character by character over joined text
+        token_sim = _seq_ratio(toks_src.tolist(), toks_tgt.tolist()) if len(toks_src) or len(toks_tgt) else 0.0
+    except Exception:
+        token_sim = 0.0
+
+    # Structural similarity (line-based)
+    try:
+        lines_src = [_normalize_whitespace(l) for l in src_text.splitlines() if l.strip()]
+        lines_tgt = [_normalize_whitespace(l) for l in tgt_text.splitlines() if l.strip()]
+        struct_sim = _seq_ratio('\n'.join(lines_src), '\n'.join(lines_tgt)) if lines_src or lines_tgt else 0.0
+    except Exception:
+        struct_sim = 0.0
+
+    # AST similarity for python files
+    ast_sim = 0.0
+    if source_language == 'python' and target_language == 'python':
+        try:
+            def flatten_ast(node):
+                return ' '.join(type(n).__name__ for n in _ast.walk(node))
+
+            ast_sim = _seq_ratio(flatten_ast(_ast.parse(src_text)), flatten_ast(_ast.parse(tgt_text)))
+        except Exception:
+            ast_sim = 0.0
+
+    # Aggregate overall score (weights)
+    overall = (0.5 * token_sim) + (0.3 * struct_sim) + (0.2 * ast_sim)
+
+    return {
+        'overall_similarity': overall,
+        'token_similarity': token_sim,
+        'structural_similarity': struct_sim,
+        'ast_similarity': ast_sim,
+    }
+
+
+def run_file_comparison(comparison):
+    """Score a file_vs_file comparison, store its SimilarityResult and mark it completed"""
+    source = comparison.source_submission
+    target = comparison.target_submission
+
+    src_text = read_submission_text(source)
+    tgt_text = read_submission_text(target)
+    scores = score_pair(src_text, tgt_text, source.language, target.language)
+
+    # Persist result (store percentages for display consistency)
+    result = SimilarityResult.objects.create(
+        comparison=comparison,
+        overall_similarity_score=scores['overall_similarity'] * 100,
+        structural_similarity=scores['structural_similarity'] * 100,
+        token_similarity=scores['token_similarity'] * 100,
+        ast_similarity=scores['ast_similarity'] * 100,
+        identical_segments=[],
+        near_identical_segments=[],
+        code_metrics={},
+        visualization_data={}
+    )
+
+    # Mark comparison and related submissions as completed
+    comparison.status = 'completed'
+    comparison.progress = 100
+    comparison.completed_at = timezone.now()
+    comparison.save()
+
+    for submission in (source, target):
+        try:
+            submission.status = 'completed'
+            submission.save()
+        except Exception:
+            pass
+
+    if source.language == target.language:
+        transaction.on_commit(lambda: get_feature_recorder().submit(
+            _record_in_background, src_text, tgt_text, source.language, scores['overall_similarity']
+        ))
+
+    return result
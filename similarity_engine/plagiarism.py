@@ -0,0 +1,133 @@
+"""
+Corpus-wide plagiarism clusters (see clusters.py), one language at a time.
+
+Each submission is reduced to the reference_index fingerprints of its
+'words' stream in the corpus store (see corpus.py); candidate pairs come
+from shared fingerprints, plus the pairs already scored above the
+threshold by file_vs_file comparisons and multiple_vs_multiple matches.
+A run replaces the language's PlagiarismCluster rows.
+"""
+
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from users.models import (
+    CodeSubmission, PlagiarismCluster, PlagiarismClusterMember, SimilarityMatch, SimilarityResult,
+)
+from .clusters import candidate_pairs, find_clusters
+from .corpus import load_streams
+from .reference_index import hash_fingerprints
+
+
+class ClusteringRun:
+
+    def __init__(self, language, submissions, candidate_edges, known_edges, clusters, elapsed):
+        self.language = language
+        self.submissions = submissions
+        self.candidate_edges = candidate_edges
+        self.known_edges = known_edges
+        self.clusters = clusters
+        self.elapsed = elapsed
+
+    @property
+    def clustered_submissions(self):
+        return sum(cluster.size for cluster in self.clusters)
+
+
+def _known_edges(language, threshold):
+    """(source pk, target pk, score 0-1) of pairs comparisons already scored at or above threshold"""
+    results = SimilarityResult.objects.filter(
+        overall_similarity_score__gte=threshold * 100,
+        comparison__source_submission__language=language,
+        comparison__target_submission__language=language,
+    ).values_list('comparison__source_submission_id', 'comparison__target_submission_id', 'overall_similarity_score')
+    matches = SimilarityMatch.objects.filter(
+        score__gte=threshold * 100,
+        source_submission__language=language,
+        target_submission__language=language,
+    ).values_list('source_submission_id', 'target_submission_id', 'score')
+    for source, target, score in results.iterator():
+        yield source, target, score / 100
+    for source, target, score in matches.iterator():
+        yield source, target, score / 100
+
+
+def cluster_language(language, threshold=None, min_density=None, max_postings=None):
+    """Find the plagiarism clusters among a language's submissions and replace its stored ones"""
+    started = time.perf_counter()
+    threshold = threshold if threshold is not None else settings.PLAGIARISM_CLUSTER_THRESHOLD
+    min_density = min_density if min_density is not None else settings.PLAGIARISM_CLUSTER_MIN_DENSITY
+    max_postings = max_postings or settings.PLAGIARISM_CLUSTER_MAX_POSTINGS
+
+    submissions = CodeSubmission.objects.filter(language=language, is_temporary=False).order_by('pk')
+    reader, pks, rows = load_streams(submissions, 'words')
+    pks = pks[rows >= 0].tolist()
+    fingerprint_sets = [hash_fingerprints(reader.hashes[reader.stream(row)]) for row in rows[rows >= 0].tolist()]
+
+    sources, targets, scores = candidate_pairs(fingerprint_sets, threshold, max_postings)
+    candidate_edges = len(scores)
+    del fingerprint_sets
+
+    # Keep the best score per pair across both edge sources
+    node_of = {pk: node for node, pk in enumerate(pks)}
+    n = len(pks)
+    best = dict(zip((sources * n + targets).tolist(), scores.tolist()))
+    known_edges = 0
+    for source, target, score in _known_edges(language, threshold):
+        a, b = node_of.get(source), node_of.get(target)
+        if a is None or b is None or a == b:
+            continue
+        key = min(a, b) * n + max(a, b)
+        best[key] = max(best.get(key, 0.0), score)
+        known_edges += 1
+    keys = np.fromiter(best.keys(), dtype=np.int64, count=len(best))
+    scores = np.fromiter(best.values(), dtype=np.float64, count=len(best))
+    clusters = find_clusters(keys // max(n, 1), keys % max(n, 1), scores, threshold, min_density)
+
+    rows, members = [], []
+    for cluster in clusters:
+        row = PlagiarismCluster(
+            language=language,
+            component=cluster.component,
+            size=len(cluster),
+            edge_count=cluster.edge_count,
+            density=round(cluster.density, 4),
+            average_score=float(cluster.scores.mean()) * 100,
+            max_score=float(cluster.scores.max()) * 100,
+            threshold=round(cluster.threshold * 100, 2),
+        )
+        rows.append(row)
+        members.append([
+            PlagiarismClusterMember(cluster=row, submission_id=pks[node], degree=degree, max_score=score * 100)
+            for node, (degree, score) in sorted(cluster.degrees().items())
+        ])
+
+    with transaction.atomic():
+        PlagiarismCluster.objects.filter(language=language).delete()
+        PlagiarismCluster.objects.bulk_create(rows, batch_size=500)
+        if rows and rows[0].pk is None:
+            # MySQL can't return the ids of bulk-inserted rows; read them back by the client-side UUIDs
+            _read_back_pks(rows)
+        PlagiarismClusterMember.objects.bulk_create(
+            [member for cluster_members in members for member in cluster_members], batch_size=1000
+        )
+
+    return ClusteringRun(language, n, candidate_edges, known_edges, rows, time.perf_counter() - started)
+
+
+def _read_back_pks(rows, batch_size=500):
+    by_uuid = {row.cluster_id: row for row in rows}
+    uuids = list(by_uuid)
+    for start in range(0, len(uuids), batch_size):
+        batch = PlagiarismCluster.objects.filter(cluster_id__in=uuids[start:start + batch_size])
+        for cluster_id, pk in batch.values_list('cluster_id', 'pk'):
+            by_uuid[cluster_id].pk = pk
+
+
+def cluster_corpus(languages=None, **options):
+    """cluster_language() for each language (default: every supported one); yields a ClusteringRun per language"""
+    for language in languages or [code for code, _ in CodeSubmission.LANGUAGE_CHOICES]:
+        yield cluster_language(language, **options)
@@ -0,0 +1,154 @@
+"""
+Comparison status for waiting clients.
+
+Any number of clients can wait on running comparisons (the Server-Sent
+Events endpoint in users.views) for the cost of one query per poll
+interval per event loop: a single poller task reads the status of every
+watched comparison with one query, and wakes only the waiters whose
+comparison changed. A waiter is a coroutine parked on an asyncio.Event,
+not a thread, so under ASGI a waiting client holds a few KB and a socket.
+
+The jobs write their progress to the ComparisonRequest row (see jobs.py),
+so the poller sees jobs running in any process. Pending comparisons also
+carry their place in the job queue, read with one more query.
+"""
+
+import asyncio
+import contextvars
+import weakref
+
+from django.conf import settings
+
+from users.models import ComparisonRequest
+from .jobs import queue_positions, queued_jobs
+
+STATUS_FIELDS = ('pk', 'status', 'progress', 'error_message', 'completed_at')
+FINISHED = ('completed', 'failed')
+# Comparisons read per poll query
+POLL_BATCH = 500
+
+
+def status_snapshot(row):
+    """JSON-ready status of a values(*STATUS_FIELDS) row"""
+    return {
+        'status': row['status'],
+        'progress': row['progress'],
+        'error_message': row['error_message'],
+        'completed_at': row['completed_at'].isoformat() if row['completed_at'] else None,
+        'queue_position': None,
+    }
+
+
+async def add_queue_positions(snapshots):
+    """Set the queue_position of the pending ones among {comparison_pk: snapshot}"""
+    pending = [pk for pk, snapshot in snapshots.items() if snapshot['status'] == 'pending']
+    if pending:
+        positions = queue_positions([row async for row in queued_jobs()])
+        for pk in pending:
+            snapshots[pk]['queue_position'] = positions.get(pk)
+
+
+class _Waiter:
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.changed = asyncio.Event()
+
+
+class _Poller:
+    """Polls the watched comparisons of one event loop"""
+
+    def __init__(self):
+        self.waiters = {}
+        self.task = None
+        self.polls = 0
+
+    def add(self, comparison_pk, snapshot):
+        waiter = _Waiter(snapshot)
+        self.waiters.setdefault(comparison_pk, set()).add(waiter)
+        if self.task is None:
+            # A fresh context: the task must not run its queries on (and outlive) the executor
+            # thread of the request that happened to start it
+            self.task = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+        return waiter
+
+    def remove(self, comparison_pk, waiter):
+        waiters = self.waiters.get(comparison_pk)
+        if waiters is not None:
+            waiters.discard(waiter)
+            if not waiters:
+                del self.waiters[comparison_pk]
+
+    async def _run(self):
+        try:
+            while self.waiters:
+                await asyncio.sleep(settings.COMPARISON_STATUS_POLL_INTERVAL)
+                pks = list(self.waiters)
+                rows = {}
+                for start in range(0, len(pks), POLL_BATCH):
+                    async for row in ComparisonRequest.objects.filter(
+                        pk__in=pks[start:start + POLL_BATCH]
+                    ).order_by().values(*STATUS_FIELDS):
+                        rows[row['pk']] = status_snapshot(row)
+                await add_queue_positions(rows)
+                self.polls += 1
+                for pk in pks:
+                    # A deleted comparison reads as failed, so its waiters stop
+                    snapshot = rows.get(pk, {
+                        'status': 'failed', 'progress': 0, 'error_message': 'Comparison deleted', 'completed_at': None,
+                        'queue_position': None,
+                    })
+                    for waiter in self.waiters.get(pk, ()):
+                        if waiter.snapshot != snapshot:
+                            waiter.snapshot = snapshot
+                            waiter.changed.set()
+        finally:
+            self.task = None
+
+
+_pollers = weakref.WeakKeyDictionary()
+
+
+def get_poller():
+    """The running event loop's poller"""
+    loop = asyncio.get_running_loop()
+    poller = _pollers.get(loop)
+    if poller is None:
+        poller = _pollers[loop] = _Poller()
+    return poller
+
+
+async def watch_comparison(comparison_pk, snapshot, heartbeat=None, timeout=None):
+    """
+    Yield the comparison's status (status_snapshot() dicts), starting with
+    snapshot, each time it changes until it finishes, and None every
+    heartbeat seconds without a change. Ends after timeout seconds even if
+    the comparison hasn't finished (the client reconnects).
+    """
+    heartbeat = heartbeat or settings.COMPARISON_EVENTS_HEARTBEAT
+    timeout = timeout or settings.COMPARISON_EVENTS_TIMEOUT
+    yield snapshot
+    if snapshot['status'] in FINISHED:
+        return
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    poller = get_poller()
+    waiter = poller.add(comparison_pk, snapshot)
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(waiter.changed.wait(), min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                if loop.time() < deadline:
+                    yield None
+                continue
+            waiter.changed.clear()
+            yield waiter.snapshot
+            if waiter.snapshot['status'] in FINISHED:
+                return
+    finally:
+        poller.remove(comparison_pk, waiter)
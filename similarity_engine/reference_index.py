@@ -0,0 +1,266 @@
+"""
+On-disk inverted index of token n-gram fingerprints for reference datasets.
+
+Each file is reduced to the distinct hashes of its token n-grams, keeping
+only hashes that are 0 mod SAMPLE_MOD (the same sample is taken from every
+file, so matching n-grams are always kept on both sides). The index is a
+CSR matrix from fingerprint to file ids stored as flat binary files:
+
+    <root>/<dataset>/grams.bin         uint64 (G,)    sorted distinct fingerprints
+    <root>/<dataset>/offsets.bin       int64  (G+1,)  postings of grams[i] are postings[offsets[i]:offsets[i+1]]
+    <root>/<dataset>/postings.bin      uint32 (P,)    file ids, ascending within each gram
+    <root>/<dataset>/file_grams.bin    uint32 (F,)    fingerprints per file
+    <root>/<dataset>/paths.bin         utf-8          file paths, concatenated
+    <root>/<dataset>/path_offsets.bin  int64  (F+1,)
+    <root>/<dataset>/meta.json         n-gram size, sampling and counts
+
+Readers memory-map the files read-only, so every process searching an
+index shares the same page-cache pages, and a search only touches the
+postings of the query's fingerprints.
+
+Like feature_store, this module doesn't depend on Django.
+"""
+
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from .token_encoding import encode_words, scratch_vocabulary
+
+FORMAT_VERSION = 1
+NGRAM = 5
+SAMPLE_MOD = 4
+# Files added before their fingerprints are merged into one array while building
+BUILD_BATCH = 10_000
+
+_PRIME = np.uint64(1099511628211)
+_MIX = np.uint64(0xFF51AFD7ED558CCD)
+_SHIFT = np.uint64(33)
+
+_EMPTY = np.empty(0, dtype=np.uint64)
+
+
+def fingerprints(text, ngram=NGRAM, sample_mod=SAMPLE_MOD):
+    """Sorted distinct sampled n-gram hashes (uint64) of a text's lower-cased tokens"""
+    vocabulary = scratch_vocabulary()
+    tokens = encode_words(text, vocabulary)
+    if len(tokens) < ngram:
+        return _EMPTY
+    # Token crc32s rather than the ids: ids (and str hashes) differ between processes
+    return hash_fingerprints(vocabulary.hashes(tokens), ngram, sample_mod)
+
+
+def hash_fingerprints(token_hashes, ngram=NGRAM, sample_mod=SAMPLE_MOD):
+    """fingerprints() of a stream of token crc32s (e.g. from a corpus_store reader)"""
+    count = len(token_hashes) - ngram + 1
+    if count <= 0:
+        return _EMPTY
+    with np.errstate(over='ignore'):
+        hashes = np.zeros(count, dtype=np.uint64)
+        for offset in range(ngram):
+            hashes = hashes * _PRIME + token_hashes[offset:offset + count]
+        # Mix the bits so that sampling on the low bits is uniform
+        hashes ^= hashes >> _SHIFT
+        hashes *= _MIX
+        hashes ^= hashes >> _SHIFT
+    if sample_mod > 1:
+        hashes = hashes[hashes % np.uint64(sample_mod) == 0]
+    return np.unique(hashes)
+
+
+def _write_array(path, array):
+    with open(path, 'wb') as f:
+        f.write(np.ascontiguousarray(array).tobytes())
+
+
+class ReferenceIndexBuilder:
+    """Collects files and writes a ReferenceIndex, replacing any previous one at path"""
+
+    def __init__(self, path, ngram=NGRAM, sample_mod=SAMPLE_MOD):
+        self.path = str(path)
+        self.ngram = ngram
+        self.sample_mod = sample_mod
+        self.paths = []
+        self.file_grams = []
+        self._grams = []
+        self._files = []
+        self._pending_grams = []
+        self._pending_files = []
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, name, text):
+        """Add one file; returns its file id"""
+        grams = fingerprints(text, self.ngram, self.sample_mod)
+        file_id = len(self.paths)
+        self.paths.append(name)
+        self.file_grams.append(len(grams))
+        self._pending_grams.append(grams)
+        self._pending_files.append(np.full(len(grams), file_id, dtype=np.uint32))
+        if len(self._pending_grams) >= BUILD_BATCH:
+            self._merge_pending()
+        return file_id
+
+    def _merge_pending(self):
+        if self._pending_grams:
+            self._grams.append(np.concatenate(self._pending_grams))
+            self._files.append(np.concatenate(self._pending_files))
+            self._pending_grams, self._pending_files = [], []
+
+    def write(self):
+        """Sort the postings, write the index next to path and swap it in"""
+        self._merge_pending()
+        grams = np.concatenate(self._grams) if self._grams else _EMPTY
+        files = np.concatenate(self._files) if self._files else np.empty(0, dtype=np.uint32)
+        # By gram, then file id (file ids were assigned in order, so a stable sort keeps them ascending)
+        order = np.argsort(grams, kind='stable')
+        grams, files = grams[order], files[order]
+        unique_grams, starts = np.unique(grams, return_index=True)
+        offsets = np.append(starts, len(grams)).astype(np.int64)
+
+        encoded = [name.encode('utf-8') for name in self.paths]
+        path_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=path_offsets[1:])
+
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        _write_array(os.path.join(tmp_path, 'grams.bin'), unique_grams)
+        _write_array(os.path.join(tmp_path, 'offsets.bin'), offsets)
+        _write_array(os.path.join(tmp_path, 'postings.bin'), files)
+        _write_array(os.path.join(tmp_path, 'file_grams.bin'), np.asarray(self.file_grams, dtype=np.uint32))
+        with open(os.path.join(tmp_path, 'paths.bin'), 'wb') as f:
+            f.write(b''.join(encoded))
+        _write_array(os.path.join(tmp_path, 'path_offsets.bin'), path_offsets)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({
+                'format': FORMAT_VERSION,
+                'ngram': self.ngram,
+                'sample_mod': self.sample_mod,
+                'files': len(self.paths),
+                'grams': len(unique_grams),
+                'postings': len(files),
+            }, f, indent=2)
+
+        # Readers that still map the old files keep reading them until they reopen
+        old_path = f'{tmp_path}.old'
+        if os.path.exists(self.path):
+            os.replace(self.path, old_path)
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        return ReferenceIndex(self.path)
+
+
+class ReferenceHit:
+    """A reference file sharing fingerprints with a query"""
+
+    def __init__(self, file_id, path, shared, containment, coverage):
+        self.file_id = file_id
+        self.path = path
+        self.shared = shared
+        # Share of the query's fingerprints found in the file, and of the file's found in the query
+        self.containment = containment
+        self.coverage = coverage
+
+
+class ReferenceIndex:
+    """Read-only, memory-mapped view of an index written by ReferenceIndexBuilder"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(os.path.join(self.path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.ngram = self.meta['ngram']
+        self.sample_mod = self.meta['sample_mod']
+        self.grams = self._memmap('grams.bin', np.uint64, self.meta['grams'])
+        self.offsets = self._memmap('offsets.bin', np.int64, self.meta['grams'] + 1)
+        self.postings = self._memmap('postings.bin', np.uint32, self.meta['postings'])
+        self.file_grams = self._memmap('file_grams.bin', np.uint32, self.meta['files'])
+        self.path_offsets = self._memmap('path_offsets.bin', np.int64, self.meta['files'] + 1)
+        self.paths = self._memmap('paths.bin', np.uint8, int(self.path_offsets[-1]))
+
+    def _memmap(self, name, dtype, rows):
+        if rows == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode='r', shape=(rows,))
+
+    def __len__(self):
+        return self.meta['files']
+
+    def file_path(self, file_id):
+        start, stop = self.path_offsets[file_id], self.path_offsets[file_id + 1]
+        return self.paths[start:stop].tobytes().decode('utf-8')
+
+    def search(self, text, limit=10, min_containment=0.0, max_postings=None):
+        """
+        Reference files sharing the most fingerprints with text, best first.
+        Fingerprints in more than max_postings files (boilerplate) are not
+        looked up, but still count towards the query's size.
+        """
+        query = fingerprints(text, self.ngram, self.sample_mod)
+        if not len(query) or not len(self.grams):
+            return []
+
+        positions = np.searchsorted(self.grams, query)
+        found = positions < len(self.grams)
+        found[found] = self.grams[positions[found]] == query[found]
+        positions = positions[found]
+        starts = self.offsets[positions]
+        lengths = self.offsets[positions + 1] - starts
+        if max_postings is not None:
+            starts, lengths = starts[lengths <= max_postings], lengths[lengths <= max_postings]
+        if not lengths.sum():
+            return []
+
+        # Gather every matched postings slice in one fancy index
+        ends = np.cumsum(lengths)
+        index = np.arange(ends[-1]) + np.repeat(starts - (ends - lengths), lengths)
+        file_ids, shared = np.unique(self.postings[index], return_counts=True)
+
+        containment = shared / len(query)
+        keep = containment >= min_containment
+        file_ids, shared, containment = file_ids[keep], shared[keep], containment[keep]
+        if len(file_ids) > limit:
+            top = np.argpartition(-shared, limit - 1)[:limit]
+            file_ids, shared, containment = file_ids[top], shared[top], containment[top]
+        order = np.lexsort((file_ids, -shared))
+
+        file_grams = self.file_grams[file_ids]
+        return [
+            ReferenceHit(
+                int(file_ids[i]),
+                self.file_path(int(file_ids[i])),
+                int(shared[i]),
+                float(containment[i]),
+                float(shared[i] / file_grams[i]) if file_grams[i] else 0.0,
+            )
+            for i in order
+        ]
+
+
+_open_lock = threading.Lock()
+_open_indexes = {}
+
+
+def open_index(path):
+    """
+    ReferenceIndex at path, mapped once per process and reopened when the
+    index is rebuilt (its meta.json changes)
+    """
+    path = str(path)
+    meta_path = os.path.join(path, 'meta.json')
+    try:
+        stat = os.stat(meta_path)
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+    except FileNotFoundError:
+        return None
+    with _open_lock:
+        cached = _open_indexes.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, ReferenceIndex(path))
+            _open_indexes[path] = cached
+        return cached[1]
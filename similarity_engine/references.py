@@ -0,0 +1,103 @@
+"""
+Reference-repository search.
+
+A CodeDataset with dataset_type='reference' is processed into a
+reference_index.ReferenceIndex under settings.REFERENCE_INDEX_PATH (one
+directory per dataset). search_references() checks a text against every
+active, processed reference dataset.
+"""
+
+import os
+import posixpath
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from admins.models import CodeDataset
+from users.archives import detect_language, is_hidden_path, iter_archive_files
+from users.uploads import ingest_upload
+from .reference_index import ReferenceIndexBuilder, open_index
+
+
+def reference_index_path(dataset):
+    return os.path.join(str(settings.REFERENCE_INDEX_PATH), dataset.dataset_id.hex)
+
+
+def dataset_directory(dataset):
+    """Directory a dataset without an uploaded archive is read from"""
+    return os.path.join(str(settings.DATASET_PATH), dataset.name)
+
+
+def iter_dataset_files(dataset):
+    """(path, data) for each file in a dataset's archive (file_path) or in DATASET_PATH/<name>/"""
+    if dataset.file_path:
+        with dataset.file_path.open('rb') as archive:
+            yield from iter_archive_files(archive, settings.MAX_UPLOAD_SIZE)
+        return
+
+    root = dataset_directory(dataset)
+    if not os.path.isdir(root):
+        raise ValueError(f'Dataset {dataset.name} has no archive and no directory at {root}')
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            full_path = os.path.join(directory, filename)
+            path = os.path.relpath(full_path, root).replace(os.sep, '/')
+            if os.path.getsize(full_path) > settings.MAX_UPLOAD_SIZE:
+                yield path, None
+                continue
+            with open(full_path, 'rb') as f:
+                yield path, f.read()
+
+
+def process_reference_dataset(dataset, progress=None):
+    """
+    Index a reference dataset's source files (those in the dataset's language,
+    or any language for 'multi') and record is_processed, file_count and
+    total_size. Returns the new ReferenceIndex.
+    """
+    started = time.perf_counter()
+    builder = ReferenceIndexBuilder(reference_index_path(dataset))
+    total_size = 0
+    for path, data in iter_dataset_files(dataset):
+        if data is None or is_hidden_path(path):
+            continue
+        language = detect_language(path)
+        if language is None or dataset.language not in ('multi', language):
+            continue
+        builder.add(path, ingest_upload(ContentFile(data, name=posixpath.basename(path))).text)
+        total_size += len(data)
+        if progress is not None and len(builder) % 10_000 == 0:
+            progress(len(builder), time.perf_counter() - started)
+    index = builder.write()
+
+    dataset.is_processed = True
+    dataset.file_count = len(builder)
+    dataset.total_size = total_size
+    dataset.save(update_fields=['is_processed', 'file_count', 'total_size', 'updated_at'])
+    return index
+
+
+def reference_datasets():
+    return CodeDataset.objects.filter(dataset_type='reference', is_active=True, is_processed=True)
+
+
+def search_references(text, limit=None):
+    """Reference files sharing the most n-grams with text across all reference datasets, best first"""
+    limit = limit or settings.REFERENCE_SEARCH_LIMIT
+    hits = []
+    for dataset in reference_datasets().only('id', 'dataset_id', 'name'):
+        index = open_index(reference_index_path(dataset))
+        if index is None:
+            continue
+        for hit in index.search(
+            text,
+            limit=limit,
+            min_containment=settings.REFERENCE_MIN_CONTAINMENT,
+            max_postings=settings.REFERENCE_MAX_POSTINGS,
+        ):
+            hit.dataset = dataset
+            hits.append(hit)
+    hits.sort(key=lambda hit: (-hit.containment, -hit.shared))
+    return hits[:limit]
@@ -1,15 +1,18 @@
 import ast
 import difflib
+import os
 import re
+import threading
 from collections import Counter
 from radon.complexity import cc_visit
 from radon.metrics import mi_visit, h_visit
 from radon.raw import analyze
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import lizard
 
+from .token_encoding import scratch_vocabulary, tfidf_matrix
+
 try:
     from tree_sitter import Language, Parser
     TREE_SITTER_AVAILABLE = True
@@ -18,6 +21,32 @@ except ImportError:
     print("Warning: tree-sitter not available. AST analysis will be limited.")
 
 
+# Bump whenever scoring or feature extraction changes so persisted pair
+# features from an older engine are never mixed with new ones.
+# 1.1: token similarity aligns integer token streams (see token_encoding)
+ENGINE_VERSION = '1.1'
+
+# Column order of the full training feature vector (matches the trainer in
+# ml_models/train_advanced_model); the first seven are the ML features.
+TRAINING_FEATURE_NAMES = [
+    'token_similarity',
+    'structural_similarity',
+    'ast_similarity',
+    'identical_segments_count',
+    'near_identical_segments_count',
+    'complexity_difference',
+    'loc_difference',
+    'function_count_ratio',
+    'class_count_ratio',
+    'comment_ratio_difference',
+    'blank_lines_ratio',
+    'avg_line_length_difference',
+    'unique_token_ratio',
+    'operator_count_ratio',
+    'operand_count_ratio',
+]
+
+
 class MultiLanguageCodeAnalyzer:
     """Multi-language code analyzer with tree-sitter support"""
     
@@ -96,12 +125,10 @@ class MultiLanguageCodeAnalyzer:
 
 class CodeSimilarityAnalyzer:
     
+    # Terms kept (most frequent first) when TF-IDF weighting a pair
+    MAX_TFIDF_FEATURES = 1000
+    
     def __init__(self):
-        self.vectorizer = TfidfVectorizer(
-            token_pattern=r'\b\w+\b',
-            lowercase=True,
-            max_features=1000
-        )
         self.language_analyzer = MultiLanguageCodeAnalyzer()
     
     def analyze_similarity(self, source_code, target_code, language='python'):
@@ -154,17 +181,21 @@ class CodeSimilarityAnalyzer:
         """Calculate token-based similarity using TF-IDF (language-agnostic)"""
         try:
             # Tokenize code with language-specific cleanup
-            tokens1 = self._tokenize_code(code1, language)
-            tokens2 = self._tokenize_code(code2, language)
+            vocabulary = scratch_vocabulary(language)
+            tokens1 = self._encode_code(code1, vocabulary, language)
+            tokens2 = self._encode_code(code2, vocabulary, language)
             
-            if not tokens1 or not tokens2:
+            if not len(tokens1) or not len(tokens2):
                 return 0.0
             
-            # Calculate TF-IDF vectors
-            tfidf_matrix = self.vectorizer.fit_transform([tokens1, tokens2])
+            # Calculate TF-IDF vectors (case-insensitive)
+            matrix = tfidf_matrix(
+                [vocabulary.fold(tokens1), vocabulary.fold(tokens2)], len(vocabulary),
+                max_features=self.MAX_TFIDF_FEATURES,
+            )
             
             # Calculate cosine similarity
-            similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
+            similarity = cosine_similarity(matrix[0:1], matrix[1:2])[0][0]
             
             return float(similarity)
         except Exception as e:
@@ -302,8 +333,8 @@ class CodeSimilarityAnalyzer:
         
         return identical, near_identical
     
-    def _tokenize_code(self, code, language):
-        """Tokenize code into meaningful tokens (language-specific)"""
+    def _encode_code(self, code, vocabulary, language):
+        """Token ids (uint32, in vocabulary) of the code's words, without comments and strings"""
         config = self.language_analyzer.get_language_config(language)
         
         # Remove comments
@@ -315,8 +346,7 @@ class CodeSimilarityAnalyzer:
             code = re.sub(pattern, '', code)
         
         # Extract tokens
-        tokens = re.findall(r'\b\w+\b', code)
-        return ' '.join(tokens)
+        return vocabulary.encode(re.findall(r'\b\w+\b', code))
     
     def _extract_structural_features(self, code, language):
         """Extract structural features based on language"""
@@ -454,3 +484,71 @@ class MLSimilarityPredictor:
             basic_similarities['code_metrics']['loc_diff'],
         ]
         return features
+    
+    def extract_training_features(self, code1, code2, basic_similarities, language='python'):
+        """Extract the full training feature vector (see TRAINING_FEATURE_NAMES)"""
+        analyzer = get_analyzer()
+        structure1 = analyzer._extract_structural_features(code1, language)
+        structure2 = analyzer._extract_structural_features(code2, language)
+        metrics = basic_similarities['code_metrics']
+        source_metrics = metrics.get('source_metrics', {})
+        target_metrics = metrics.get('target_metrics', {})
+        
+        def count_ratio(a, b):
+            if a == 0 and b == 0:
+                return 1.0
+            return min(a, b) / max(a, b)
+        
+        def per_line(value, loc):
+            return value / loc if loc else 0.0
+        
+        def avg_line_length(code):
+            lines = [line for line in code.splitlines() if line.strip()]
+            return np.mean([len(line) for line in lines]) if lines else 0.0
+        
+        vocabulary = scratch_vocabulary(language)
+        tokens1 = analyzer._encode_code(code1, vocabulary, language)
+        tokens2 = analyzer._encode_code(code2, vocabulary, language)
+        operator_pattern = r'[+\-*/%=<>!&|^~]+'
+        
+        features = self.extract_ml_features(code1, code2, basic_similarities)
+        features.extend([
+            count_ratio(structure1['functions'], structure2['functions']),
+            count_ratio(structure1['classes'], structure2['classes']),
+            abs(per_line(source_metrics.get('comments', 0), source_metrics.get('loc', 0)) -
+                per_line(target_metrics.get('comments', 0), target_metrics.get('loc', 0))),
+            count_ratio(source_metrics.get('blank', 0), target_metrics.get('blank', 0)),
+            abs(avg_line_length(code1) - avg_line_length(code2)),
+            count_ratio(len(np.unique(tokens1)), len(np.unique(tokens2))),
+            count_ratio(len(re.findall(operator_pattern, code1)), len(re.findall(operator_pattern, code2))),
+            count_ratio(len(tokens1), len(tokens2)),
+        ])
+        return [float(value) for value in features]
+
+
+# Saved by ml_models/train_advanced_model under settings.ML_MODEL_PATH
+DEFAULT_MODEL_FILE = 'default_model.pkl'
+
+_shared_lock = threading.Lock()
+_shared_analyzer = None
+_shared_predictor = None
+
+
+def get_analyzer():
+    """The process's shared CodeSimilarityAnalyzer (it holds no per-comparison state)"""
+    global _shared_analyzer
+    with _shared_lock:
+        if _shared_analyzer is None:
+            _shared_analyzer = CodeSimilarityAnalyzer()
+        return _shared_analyzer
+
+
+def get_predictor():
+    """The process's shared MLSimilarityPredictor, with the default model if one has been trained"""
+    global _shared_predictor
+    from django.conf import settings
+    with _shared_lock:
+        if _shared_predictor is None:
+            model_path = os.path.join(str(settings.ML_MODEL_PATH), DEFAULT_MODEL_FILE)
+            _shared_predictor = MLSimilarityPredictor(model_path if os.path.exists(model_path) else None)
+        return _shared_predictor
@@ -0,0 +1,214 @@
+"""
+Suffix array and LCP array over a corpus of token streams, and the
+maximal repeated fragments they expose.
+
+Files are tokenized (comments and whitespace dropped, string and number
+literals normalized), their token ids concatenated with a distinct
+separator after each file, so no repeat runs across a file boundary. The
+suffix array is built by prefix doubling: each round sorts the suffixes
+by (rank of the first k tokens, rank of the next k), and rounds stop once
+every rank is unique, after log2 of the longest repeat. The first sort is
+over all n tokens (O(n log n)); later rounds only sort the suffixes that
+still share a rank, which is mostly the repeated code. The rank array of each round is kept, so the LCP of adjacent
+suffixes is found by binary lifting over them, vectorized over all n.
+
+A fragment is a maximal repeat: an LCP interval (a run of adjacent
+suffixes sharing their first `length` tokens) whose occurrences can't all
+be extended one token to the left either.
+
+Like feature_store, this module doesn't depend on Django.
+"""
+
+import re
+
+import numpy as np
+
+from .token_encoding import get_vocabulary
+
+# Comments, literals, identifiers and single-character operators; whitespace is skipped
+_C_COMMENT = r'//[^\n]*|/\*.*?\*/'
+_TOKEN_PATTERNS = {
+    'python': re.compile(
+        r'(?P<comment>#[^\n]*)'
+        r'|(?P<string>[rbuRBU]{0,2}(?:"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'))'
+        r'|(?P<number>\d[\w.]*)'
+        r'|(?P<word>\w+)'
+        r'|(?P<op>\S)',
+        re.DOTALL,
+    ),
+    'default': re.compile(
+        rf'(?P<comment>{_C_COMMENT})'
+        r'|(?P<string>"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`[^`]*`)'
+        r'|(?P<number>\d[\w.]*)'
+        r'|(?P<word>\w+)'
+        r'|(?P<op>\S)',
+        re.DOTALL,
+    ),
+}
+STRING_TOKEN = '<str>'
+NUMBER_TOKEN = '<num>'
+
+
+def tokenize(text, language=None):
+    """Normalized tokens of a source text and the (1-based) line each starts on"""
+    pattern = _TOKEN_PATTERNS.get(language, _TOKEN_PATTERNS['default'])
+    tokens, offsets = [], []
+    for match in pattern.finditer(text):
+        kind = match.lastgroup
+        if kind == 'comment':
+            continue
+        tokens.append(STRING_TOKEN if kind == 'string' else NUMBER_TOKEN if kind == 'number' else match.group())
+        offsets.append(match.start())
+    newlines = np.flatnonzero(np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32) == ord('\n'))
+    lines = np.searchsorted(newlines, np.asarray(offsets, dtype=np.int64)) + 1
+    return tokens, lines.astype(np.int32)
+
+
+class TokenCorpus:
+    """
+    Token ids of many files concatenated into one stream, with each file
+    followed by its own separator id (above every token id)
+    """
+
+    def __init__(self, language=None):
+        self.vocabulary = get_vocabulary(language)
+        self._ids = []
+        self._lines = []
+        self.file_starts = [0]
+
+    def __len__(self):
+        return len(self.file_starts) - 1
+
+    def add(self, tokens, lines):
+        """Add one file's tokens; returns its file index"""
+        ids = self.vocabulary.encode(tokens)
+        self._ids.append(ids)
+        self._lines.append(np.asarray(lines, dtype=np.int32))
+        self.file_starts.append(self.file_starts[-1] + len(ids) + 1)
+        return len(self) - 1
+
+    def stream(self):
+        """(ids, lines) of the whole corpus (int64); separators are len(vocabulary) + file index, line 0"""
+        parts, lines = [], []
+        separator = len(self.vocabulary)
+        for index, (ids, file_lines) in enumerate(zip(self._ids, self._lines)):
+            parts.extend([ids.astype(np.int64), np.array([separator + index], dtype=np.int64)])
+            lines.extend([file_lines, np.zeros(1, dtype=np.int32)])
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        return np.concatenate(parts), np.concatenate(lines)
+
+
+def _head_ranks(sorted_keys, slots):
+    """
+    Rank of each of a group's sorted keys: the slot (index in the suffix
+    array) of the first key equal to it
+    """
+    heads = np.empty(len(sorted_keys), dtype=bool)
+    heads[0] = True
+    heads[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    return slots[np.flatnonzero(heads)][np.cumsum(heads) - 1]
+
+
+def suffix_array(ids):
+    """
+    Suffix array of an int sequence, and the rank arrays of every doubling
+    round: ranks[r][i] orders the first 2**r values of suffix i, and equal
+    prefixes share a rank
+    """
+    n = len(ids)
+    if not n:
+        return np.empty(0, dtype=np.int64), []
+    order = np.argsort(ids, kind='stable')
+    slots = np.arange(n)
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = _head_ranks(ids[order], slots)
+    history = [rank.astype(np.int32)]
+
+    k = 1
+    while True:
+        # Only suffixes sharing their rank with another (an unsettled group) are sorted again
+        sorted_ranks = rank[order]
+        unsettled = np.zeros(n, dtype=bool)
+        unsettled[1:] = sorted_ranks[1:] == sorted_ranks[:-1]
+        unsettled[:-1] |= unsettled[1:]
+        if not unsettled.any():
+            break
+        slots = np.flatnonzero(unsettled)
+        suffixes = order[slots]
+        # Rank of the next k values; 0 past the end, so everything else is shifted up by one
+        following = np.zeros(len(suffixes), dtype=np.int64)
+        inside = suffixes + k < n
+        following[inside] = rank[suffixes[inside] + k] + 1
+        keys = rank[suffixes] * (n + 1) + following
+        # Groups occupy contiguous slots, so sorting the keys keeps every group in its slots
+        resort = np.argsort(keys, kind='stable')
+        order[slots] = suffixes[resort]
+        rank[suffixes[resort]] = _head_ranks(keys[resort], slots)
+        history.append(rank.astype(np.int32))
+        k *= 2
+    return order, history
+
+
+def lcp_array(order, history):
+    """lcp[i]: tokens shared by the suffixes at order[i - 1] and order[i] (lcp[0] = 0)"""
+    n = len(order)
+    lcp = np.zeros(n, dtype=np.int64)
+    if n < 2:
+        return lcp
+    left, right = order[:-1].copy(), order[1:].copy()
+    shared = np.zeros(n - 1, dtype=np.int64)
+    for power in range(len(history) - 1, -1, -1):
+        ranks = history[power]
+        step = 1 << power
+        a, b = left + shared, right + shared
+        inside = (a < n) & (b < n)
+        equal = np.zeros(n - 1, dtype=bool)
+        equal[inside] = ranks[a[inside]] == ranks[b[inside]]
+        shared += equal * step
+    lcp[1:] = shared
+    return lcp
+
+
+class Fragment:
+    """A token sequence occurring at several corpus positions"""
+
+    def __init__(self, length, positions):
+        self.length = length
+        self.positions = positions
+
+
+def maximal_repeats(ids, order, lcp, min_length):
+    """
+    Fragments of at least min_length tokens that are maximal repeats in
+    ids, from one stack pass over the LCP intervals
+    """
+    n = len(ids)
+    fragments = []
+    candidates = np.flatnonzero(lcp >= min_length)
+    if not len(candidates):
+        return fragments
+
+    # The token before each suffix (separators are unique, so file starts always differ);
+    # the occurrences order[lb:rb + 1] extend left together iff before[lb:rb + 1] is constant
+    before = np.full(n, -1, dtype=np.int64)
+    before[order > 0] = ids[order[order > 0] - 1]
+    changes = np.zeros(n, dtype=np.int64)
+    np.cumsum(before[1:] != before[:-1], out=changes[1:])
+
+    # Runs of adjacent suffixes all sharing at least min_length tokens; each is a separate tree of intervals
+    breaks = np.flatnonzero(np.diff(candidates) != 1) + 1
+    for run in np.split(candidates, breaks):
+        first, last = int(run[0]) - 1, int(run[-1])
+        values = lcp[first + 1:last + 1].tolist() + [0]
+        stack = []
+        for offset, value in enumerate(values):
+            i = first + 1 + offset
+            bound = i - 1
+            while stack and stack[-1][0] > value:
+                length, bound = stack.pop()
+                if changes[i - 1] != changes[bound]:
+                    fragments.append(Fragment(length, order[bound:i]))
+            if value and (not stack or stack[-1][0] < value):
+                stack.append((value, bound))
+    return fragments
@@ -1,3 +1,706 @@
-from django.test import TestCase
+import io
+import queue
+import shutil
+import tempfile
+import threading
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from sklearn.feature_extraction.text import TfidfVectorizer
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from admins.models import CodeDataset
+from code_similarity_system.startup import on_load
+from reports.aggregate import plagiarism_incidents
+from users.models import CodeSubmission, ComparisonRequest, PlagiarismCluster, SimilarityMatch
+from .clones import detect_clones
+from .clusters import UnionFind, candidate_pairs, find_clusters
+from .corpus import compact_corpus, get_corpus_store, load_streams
+from .corpus_store import CorpusStore
+from .feature_store import PairFeatureStore, content_digest, get_feature_store, pair_key
+from .jobs import (
+    ORPHANED_MESSAGE, FairScheduler, fail_orphaned_comparisons, fair_order, queue_positions, queued_jobs,
+    run_set_comparison,
+)
+from .matrix import ranked_rows, top_k_matches
+from .pipeline import get_feature_recorder
+from .plagiarism import cluster_language
+from .reference_index import ReferenceIndexBuilder, fingerprints, open_index
+from .references import process_reference_dataset
+from .similarity_analyzer import get_analyzer, get_predictor
+from .suffix_array import TokenCorpus, lcp_array, maximal_repeats, suffix_array, tokenize
+from .token_encoding import ScratchVocabulary, Vocabulary, encode_words, get_vocabulary, tfidf_matrix
+from .warmup import WARMUP_STEPS, warm_up
+
+ADD = 'def add(a, b):\n    total = a + b\n    return total\n'
+MUL = 'def mul(a, b):\n    product = a * b\n    return product\n'
+LOOP = 'for i in range(10):\n    print(i, i * i)\n'
+
+
+def use_temporary_corpus_store(test):
+    """Point CORPUS_STORE_PATH at a directory removed after the test"""
+    root = tempfile.mkdtemp(prefix='corpus_store_')
+    test.addCleanup(shutil.rmtree, root, ignore_errors=True)
+    store_override = override_settings(CORPUS_STORE_PATH=root)
+    store_override.enable()
+    test.addCleanup(store_override.disable)
+
+
+class TopKMatchesTests(SimpleTestCase):
+
+    def test_keeps_top_k_per_source_best_first(self):
+        sources = [ADD, LOOP]
+        targets = [MUL, ADD + '\n', LOOP, 'x = 1\n']
+        matrix = top_k_matches(sources, targets, top_k=2)
+        self.assertEqual(matrix.shape, (2, 4))
+        rows = dict(ranked_rows(matrix))
+        self.assertEqual([column for column, _ in rows[0]], [1, 0])
+        self.assertAlmostEqual(rows[0][0][1], 1.0, places=5)
+        self.assertEqual(rows[1][0][0], 2)
+        self.assertLessEqual(matrix.getnnz(axis=1).max(), 2)
+
+    def test_threshold_keys_and_blocks(self):
+        texts = [ADD, MUL, LOOP] * 4
+        keys = list(range(len(texts)))
+        # top_k=0: only matches above the threshold; one-row blocks exercise the chunking
+        with mock.patch('similarity_engine.matrix.BLOCK_CELLS', len(texts)):
+            matrix = top_k_matches(texts, texts, top_k=0, threshold=0.99, source_keys=keys, target_keys=keys)
+        for row, ranked in ranked_rows(matrix):
+            # The three other copies of the same text, never the file itself
+            self.assertEqual(sorted(column for column, _ in ranked), [c for c in range(row % 3, 12, 3) if c != row])
+
+    def test_empty_inputs(self):
+        self.assertEqual(top_k_matches([], [ADD]).shape, (0, 1))
+        self.assertEqual(top_k_matches(['', ''], ['']).nnz, 0)
+
+
+class SetComparisonTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('grace', 'grace@example.com', 'pw-grace-123')
+        self.client.force_login(self.user)
+
+    def submit(self, title, text):
+        return CodeSubmission.objects.create(
+            user=self.user, title=title, language='python', code_file=f'submissions/{title}', code_text=text
+        )
+
+    def test_view_queues_job_that_persists_matches(self):
+        sources = [self.submit('a1.py', ADD), self.submit('a2.py', LOOP)]
+        targets = [self.submit('b1.py', MUL), self.submit('b2.py', ADD), sources[1]]
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('users:compare_code'), {
+                'comparison_type': 'multiple_vs_multiple',
+                'source_submissions': [s.submission_id for s in sources],
+                'target_submissions': [t.submission_id for t in targets],
+                'similarity_threshold': '0.9',
+            }, HTTP_HOST='localhost')
+        comparison = ComparisonRequest.objects.get(comparison_type='multiple_vs_multiple')
+        self.assertRedirects(
+            response, reverse('users:comparison_detail', args=[comparison.request_id]), fetch_redirect_response=False
+        )
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(comparison.status, 'pending')
+
+        run_set_comparison(comparison.pk, top_k=1)
+        comparison.refresh_from_db()
+        self.assertEqual(comparison.status, 'completed')
+        best = {
+            (m.source_submission.title, m.rank): m
+            for m in SimilarityMatch.objects.filter(comparison=comparison).with_submissions()
+        }
+        self.assertEqual(best[('a1.py', 1)].target_submission.title, 'b2.py')
+        self.assertAlmostEqual(best[('a1.py', 1)].score, 100, places=3)
+        # a2.py is in both sets, so it is never matched with itself
+        self.assertFalse(comparison.matches.filter(target_submission=sources[1], source_submission=sources[1]).exists())
+        self.assertAlmostEqual(comparison.result.overall_similarity_score, 100, places=3)
+        self.assertEqual(comparison.result.visualization_data['pairs_scored'], 6)
+        self.assertEqual(CustomUser.objects.get(pk=self.user.pk).completed_comparisons, 1)
+
+        response = self.client.get(reverse('users:comparison_detail', args=[comparison.request_id]), HTTP_HOST='localhost')
+        self.assertContains(response, 'b2.py')
+
+    def test_rejects_other_users_submissions(self):
+        other = CustomUser.objects.create_user('heidi', 'heidi@example.com', 'pw-heidi-123')
+        theirs = CodeSubmission.objects.create(
+            user=other, title='x.py', language='python', code_file='submissions/x.py', code_text=ADD
+        )
+        mine = self.submit('a.py', ADD)
+        self.client.post(reverse('users:compare_code'), {
+            'comparison_type': 'multiple_vs_multiple',
+            'source_submissions': [mine.submission_id],
+            'target_submissions': [theirs.submission_id],
+        }, HTTP_HOST='localhost')
+        self.assertFalse(ComparisonRequest.objects.exists())
+
+    def test_file_comparison_records_pair_features_after_commit(self):
+        root = tempfile.mkdtemp(prefix='feature_store_')
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        source, target = self.submit('a.py', ADD), self.submit('b.py', MUL)
+        with override_settings(FEATURE_STORE_PATH=root):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.client.post(reverse('users:compare_code'), {
+                    'source_submission': source.submission_id, 'target_submission': target.submission_id,
+                }, HTTP_HOST='localhost')
+            self.assertEqual(len(callbacks), 1)
+            # One recorder thread: once this no-op has run, the pair has been recorded
+            get_feature_recorder().submit(lambda: None).result(timeout=60)
+            self.assertTrue(get_feature_store().contains(pair_key(content_digest(ADD), content_digest(MUL))))
+
+
+
+class FairSchedulerTests(SimpleTestCase):
+
+    def test_users_take_turns(self):
+        queued = [(1, 'a'), (2, 'a'), (3, 'a'), (4, 'b'), (5, 'c')]
+        self.assertEqual([pk for pk, _ in fair_order(queued, {})], [1, 4, 5, 2, 3])
+        # Running jobs count as turns taken
+        self.assertEqual([pk for pk, _ in fair_order(queued, {'b': 1})], [1, 5, 2, 4, 3])
+        rows = [
+            {'pk': 1, 'user_id': 1, 'status': 'processing'},
+            {'pk': 2, 'user_id': 1, 'status': 'pending'},
+            {'pk': 3, 'user_id': 2, 'status': 'pending'},
+        ]
+        self.assertEqual(queue_positions(rows), {3: 1, 2: 2})
+
+    def test_scheduler_limits_jobs_per_user(self):
+        scheduler = FairScheduler(workers=2, per_user=1)
+        started = queue.Queue()
+        release = {pk: threading.Event() for pk in (1, 2, 3, 4)}
+
+        def job(pk):
+            started.put(pk)
+            release[pk].wait(5)
+
+        for pk, user in ((1, 'a'), (2, 'a'), (3, 'a'), (4, 'b')):
+            scheduler.submit(pk, user, job)
+        # Two workers, but user a only gets one of them
+        self.assertEqual({started.get(timeout=5), started.get(timeout=5)}, {1, 4})
+        with self.assertRaises(queue.Empty):
+            started.get(timeout=0.05)
+        release[1].set()
+        self.assertEqual(started.get(timeout=5), 2)
+        for event in release.values():
+            event.set()
+        self.assertEqual(started.get(timeout=5), 3)
+
+    def test_batch_jobs_pause_for_interactive_comparisons(self):
+        scheduler = FairScheduler(workers=1, per_user=1)
+        with scheduler.interactive():
+            paused = threading.Thread(target=scheduler.pause_for_interactive, args=(5,))
+            paused.start()
+            paused.join(0.05)
+            self.assertTrue(paused.is_alive())
+        paused.join(5)
+        self.assertFalse(paused.is_alive())
+
+
+class OrphanedComparisonTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('hana', 'hana@example.com', 'pw-hana-123')
+        self.submission = CodeSubmission.objects.create(
+            user=self.user, title='a.py', language='python', code_file='submissions/a.py', code_text=ADD
+        )
+
+    def comparison(self, status='pending', heartbeat_age=0):
+        comparison = ComparisonRequest.objects.create(
+            user=self.user, comparison_type='multiple_vs_multiple', source_submission=self.submission, status=status
+        )
+        ComparisonRequest.objects.filter(pk=comparison.pk).update(
+            heartbeat_at=timezone.now() - timedelta(seconds=heartbeat_age)
+        )
+        return comparison
+
+    @override_settings(COMPARISON_ORPHAN_AFTER=300)
+    def test_comparisons_without_a_heartbeat_are_orphaned(self):
+        live = self.comparison('processing', heartbeat_age=60)
+        lost = [self.comparison('pending', heartbeat_age=600), self.comparison('processing', heartbeat_age=600)]
+        done = self.comparison('completed', heartbeat_age=600)
+        self.assertEqual([row['pk'] for row in queued_jobs()], [live.pk])
+
+        self.assertEqual(fail_orphaned_comparisons(), 2)
+        for comparison in lost:
+            comparison.refresh_from_db()
+            self.assertEqual((comparison.status, comparison.error_message), ('failed', ORPHANED_MESSAGE))
+        self.assertEqual(ComparisonRequest.objects.get(pk=live.pk).status, 'processing')
+        self.assertEqual(ComparisonRequest.objects.get(pk=done.pk).status, 'completed')
+
+    def test_scheduler_beats_for_queued_and_running_jobs(self):
+        running, queued, elsewhere = (self.comparison(heartbeat_age=600) for _ in range(3))
+        scheduler = FairScheduler(workers=1, per_user=1, heartbeat_interval=3600)
+        started, release = threading.Event(), threading.Event()
+
+        def job(pk):
+            started.set()
+            release.wait(5)
+
+        scheduler.submit(running.pk, self.user.pk, job)
+        self.assertTrue(started.wait(5))
+        scheduler.submit(queued.pk, self.user.pk, job)
+        try:
+            scheduler.beat()
+        finally:
+            release.set()
+        recent = timezone.now() - timedelta(seconds=60)
+        beats = dict(ComparisonRequest.objects.values_list('pk', 'heartbeat_at'))
+        self.assertGreater(beats[running.pk], recent)
+        self.assertGreater(beats[queued.pk], recent)
+        self.assertLess(beats[elsewhere.pk], recent)
+
+
+def sample_program(seed, lines=40):
+    return ''.join(f'def f{seed}_{i}(x{i}):\n    return x{i} * {seed + i} + {i}\n' for i in range(lines))
+
+
+class ReferenceIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='reference_index_')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def build(self, files, path='index', **options):
+        builder = ReferenceIndexBuilder(f'{self.root}/{path}', **options)
+        for name, text in files.items():
+            builder.add(name, text)
+        return builder.write()
+
+    def test_fingerprints_are_stable_and_sampled(self):
+        text = sample_program(1)
+        self.assertTrue((fingerprints(text) == fingerprints(text)).all())
+        self.assertLess(len(fingerprints(text)), len(fingerprints(text, sample_mod=1)))
+        self.assertEqual(len(fingerprints('a b c')), 0)
+
+    def test_search_ranks_files_by_shared_fingerprints(self):
+        index = self.build({f'repo/p{i}.py': sample_program(i) for i in range(50)})
+        self.assertEqual(len(index), 50)
+
+        # Half of p7 pasted into new code
+        query = sample_program(7, lines=20) + sample_program(99, lines=20)
+        hits = index.search(query, limit=3)
+        self.assertEqual(hits[0].path, 'repo/p7.py')
+        self.assertGreater(hits[0].containment, 0.3)
+        self.assertAlmostEqual(hits[0].coverage, 0.5, delta=0.15)
+        self.assertEqual(index.search(query, limit=3, min_containment=0.9), [])
+
+        # Fingerprints shared by every file are skipped as boilerplate
+        common = 'import os\nimport sys\nimport json\nimport re\n'
+        index = self.build({f'p{i}.py': common + sample_program(i) for i in range(5)}, sample_mod=1)
+        self.assertEqual(len(index.search(common, max_postings=4)), 0)
+        self.assertEqual(len(index.search(common)), 5)
+
+    def test_rebuild_is_picked_up_by_open_index(self):
+        self.build({'a.py': sample_program(1)})
+        first = open_index(f'{self.root}/index')
+        self.assertIs(open_index(f'{self.root}/index'), first)
+        self.build({'a.py': sample_program(1), 'b.py': sample_program(2)})
+        self.assertEqual(len(open_index(f'{self.root}/index')), 2)
+        self.assertIsNone(open_index(f'{self.root}/missing'))
+
+
+class ReferenceSearchTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='reference_media_')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.root, REFERENCE_INDEX_PATH=f'{self.root}/index')
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.user = CustomUser.objects.create_user('ivan', 'ivan@example.com', 'pw-ivan-123')
+
+    def test_dataset_is_indexed_and_searched_from_a_submission(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for i in range(10):
+                archive.writestr(f'solutions/p{i}.py', sample_program(i))
+            archive.writestr('solutions/Main.java', 'class Main {}')
+            archive.writestr('README.md', '# solutions')
+        dataset = CodeDataset(name='solutions', description='', dataset_type='reference', language='python')
+        dataset.file_path.save('solutions.zip', ContentFile(buffer.getvalue()))
+
+        process_reference_dataset(dataset)
+        dataset.refresh_from_db()
+        self.assertTrue(dataset.is_processed)
+        self.assertEqual(dataset.file_count, 10)
+        self.assertEqual(dataset.total_size, sum(len(sample_program(i)) for i in range(10)))
+
+        submission = CodeSubmission.objects.create(
+            user=self.user, title='mine.py', language='python', code_file='submissions/mine.py',
+            code_text=sample_program(4) + sample_program(50, lines=5),
+        )
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('users:submission_references', args=[submission.submission_id]), HTTP_HOST='localhost'
+        )
+        self.assertEqual(response.context['hits'][0].path, 'solutions/p4.py')
+        self.assertContains(response, 'solutions/p4.py')
+
+
+class ClusterTests(SimpleTestCase):
+
+    def test_union_find(self):
+        union_find = UnionFind(6)
+        union_find.union_many(np.array([0, 1, 4]), np.array([1, 2, 5]))
+        labels = union_find.labels()
+        self.assertEqual(len({labels[0], labels[1], labels[2]}), 1)
+        self.assertNotEqual(labels[0], labels[3])
+        self.assertEqual(labels[4], labels[5])
+
+    def test_candidate_pairs_share_of_smaller_set(self):
+        grams = [np.arange(10, dtype=np.uint64), np.arange(5, dtype=np.uint64), np.arange(20, 30, dtype=np.uint64)]
+        sources, targets, scores = candidate_pairs(grams, threshold=0.5)
+        self.assertEqual(list(zip(sources.tolist(), targets.tolist())), [(0, 1)])
+        self.assertAlmostEqual(float(scores[0]), 1.0)
+        # Fingerprints in more than max_postings sets make no pairs
+        self.assertEqual(len(candidate_pairs(grams, threshold=0.5, max_postings=1)[0]), 0)
+
+    def test_sparse_component_is_split_into_dense_clusters(self):
+        # Two triangles (0-1-2 and 3-4-5) joined by one weaker edge 2-3
+        edges = [(0, 1, 0.95), (0, 2, 0.95), (1, 2, 0.95), (3, 4, 0.9), (3, 5, 0.9), (4, 5, 0.9), (2, 3, 0.8)]
+        sources, targets, scores = (np.array(column) for column in zip(*edges))
+        clusters = find_clusters(sources, targets, scores, threshold=0.75, min_density=0.6)
+        self.assertEqual(sorted(sorted(c.nodes.tolist()) for c in clusters), [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual({c.component for c in clusters}, {0})
+        self.assertTrue(all(c.density == 1.0 for c in clusters))
+        # Without the density requirement the whole component is one cluster
+        self.assertEqual([len(c) for c in find_clusters(sources, targets, scores, threshold=0.75, min_density=0)], [6])
+
+
+class PlagiarismClusterTests(TestCase):
+
+    def setUp(self):
+        use_temporary_corpus_store(self)
+        self.user = CustomUser.objects.create_user('judy', 'judy@example.com', 'pw-judy-123')
+
+    def submit(self, title, text, language='python'):
+        return CodeSubmission.objects.create(
+            user=self.user, title=title, language=language, code_file=f'submissions/{title}', code_text=text
+        )
+
+    def test_ring_is_clustered_and_reported(self):
+        ring = [self.submit(f'ring{i}.py', sample_program(7) + f'# {i}\n') for i in range(3)]
+        loners = [self.submit(f'solo{i}.py', sample_program(100 + i)) for i in range(3)]
+        self.submit('Ring.java', sample_program(7), language='java')
+
+        run = cluster_language('python', threshold=0.75)
+        self.assertEqual(run.submissions, 6)
+        cluster = PlagiarismCluster.objects.get()
+        self.assertEqual(cluster.size, 3)
+        self.assertEqual(cluster.density, 1.0)
+        self.assertEqual(
+            set(cluster.members.values_list('submission_id', flat=True)), {submission.pk for submission in ring}
+        )
+        self.assertFalse(loners[0].cluster_memberships.exists())
+
+        # A rerun replaces the language's clusters
+        cluster_language('python', threshold=0.75)
+        cluster = PlagiarismCluster.objects.get()
+
+        today = ring[0].created_at.date()
+        summary = plagiarism_incidents(today, today)['clusters']
+        self.assertEqual(summary['clusters'], 1)
+        self.assertEqual(summary['clustered_submissions'], 3)
+        self.assertEqual({member['title'] for member in summary['top'][0]['members']}, {'ring0.py', 'ring1.py', 'ring2.py'})
+
+        admin = CustomUser.objects.create_superuser('root2', 'root2@example.com', 'pw-root-123')
+        comparison = ComparisonRequest.objects.create(
+            user=self.user, comparison_type='file_vs_file', source_submission=ring[0], target_submission=ring[1]
+        )
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admins:comparisons'), HTTP_HOST='localhost')
+        self.assertContains(response, 'Plagiarism Clusters')
+        self.assertContains(response, f'#{cluster.pk} (3)')
+        self.assertTrue(next(c for c in response.context['comparisons'] if c.pk == comparison.pk).shares_cluster)
+
+    def test_clusters_are_stored_without_bulk_insert_returning_ids(self):
+        # As on MySQL, where bulk_create can't set auto-increment ids
+        ring = [self.submit(f'ring{i}.py', sample_program(7) + f'# {i}\n') for i in range(3)]
+        self.submit('solo.py', sample_program(100))
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            run = cluster_language('python', threshold=0.75)
+        cluster = PlagiarismCluster.objects.get()
+        self.assertEqual(run.clusters[0].pk, cluster.pk)
+        self.assertEqual(set(cluster.members.values_list('submission_id', flat=True)), {s.pk for s in ring})
+
+
+class SuffixArrayTests(SimpleTestCase):
+
+    def test_suffix_and_lcp_arrays_match_brute_force(self):
+        rng = np.random.default_rng(7)
+        for _ in range(50):
+            ids = rng.integers(0, 3, rng.integers(1, 60))
+            order, history = suffix_array(ids)
+            self.assertEqual(order.tolist(), sorted(range(len(ids)), key=lambda i: ids[i:].tolist()))
+            lcp = lcp_array(order, history)
+            for i in range(1, len(order)):
+                a, b = ids[order[i - 1]:], ids[order[i]:]
+                shared = next((k for k, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+                self.assertEqual(lcp[i], shared)
+
+    def test_tokenize_normalizes_literals_and_keeps_lines(self):
+        tokens, lines = tokenize('x = "a"  # note\n\ny = 42\n', 'python')
+        self.assertEqual(tokens, ['x', '=', '<str>', 'y', '=', '<num>'])
+        self.assertEqual(lines.tolist(), [1, 1, 1, 3, 3, 3])
+
+    def test_maximal_repeats_stay_within_files(self):
+        corpus = TokenCorpus()
+        corpus.add(list('abcdxy'), [1] * 6)
+        corpus.add(list('zabcdw'), [1] * 6)
+        corpus.add(list('abcd'), [1] * 4)
+        ids, _ = corpus.stream()
+        order, history = suffix_array(ids)
+        repeats = maximal_repeats(ids, order, lcp_array(order, history), min_length=3)
+        self.assertEqual([(r.length, sorted(r.positions.tolist())) for r in repeats], [(4, [0, 8, 14])])
+
+
+class CloneDetectionTests(TestCase):
+
+    def setUp(self):
+        use_temporary_corpus_store(self)
+
+    def test_shared_fragment_is_reported_with_line_ranges(self):
+        user = CustomUser.objects.create_user('ken', 'ken@example.com', 'pw-ken-123')
+        leaked = sample_program(3, lines=10)
+        texts = {
+            'a.py': leaked,
+            'b.py': '# copied\nimport os\n\n' + leaked.replace('x0 * 3 ', 'x0 * 99 '),
+            'c.py': sample_program(200, lines=10),
+        }
+        for title, text in texts.items():
+            CodeSubmission.objects.create(
+                user=user, title=title, language='python', code_file=f'submissions/{title}', code_text=text
+            )
+        detection = detect_clones('python', min_tokens=20, min_files=2)
+        self.assertEqual(detection.submissions, 3)
+        fragment = detection.fragments[0]
+        self.assertEqual(fragment['files'], 2)
+        # Number literals are normalized, so the edited constant doesn't break the fragment
+        self.assertEqual(
+            {(o['title'], o['start_line'], o['end_line']) for o in fragment['occurrences']},
+            {('a.py', 1, 20), ('b.py', 4, 23)},
+        )
+        self.assertTrue(fragment['preview'].startswith('def f3_0 ( x0 ) : return x0 * <num>'))
+
+
+class CorpusStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='corpus_store_')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.store = CorpusStore(self.root, 'code', with_lines=True)
+
+    def test_streams_are_read_back_as_mapped_slices(self):
+        self.store.append([(1, 10, ['a', 'b', 'a'], [1, 1, 2]), (2, 0, [], []), (3, 11, ['c', 'a'], [4, 5])])
+        self.store.append([(5, 12, ['b', 'd'], [1, 1])])
+        reader = self.store.reader()
+        self.assertEqual(reader.submissions.tolist(), [1, 2, 3, 5])
+        self.assertEqual(reader.locate([3, 4, 5, 1], blobs=[11, 0, 12, 99]).tolist(), [2, -1, 3, -1])
+        stream = reader.stream(2)
+        self.assertIsInstance(stream.base, np.memmap)
+        self.assertEqual(reader.decode(stream), ['c', 'a'])
+        self.assertEqual(reader.stream_lines(2).tolist(), [4, 5])
+        self.assertEqual(reader.decode(reader.stream(3)), ['b', 'd'])
+        tokens, lines = reader.gather(np.array([3, 0]))
+        self.assertEqual(reader.decode(tokens), ['b', 'd', 'a', 'b', 'a'])
+        self.assertEqual(lines.tolist(), [1, 1, 1, 1, 2])
+        vocabulary = get_vocabulary()
+        self.assertEqual(reader.hashes[tokens].tolist(), vocabulary.hashes(vocabulary.encode(['b', 'd', 'a', 'b', 'a'])).tolist())
+
+    def test_latest_stream_wins_and_compaction_reclaims_space(self):
+        self.store.append([(submission, submission, ['x'] * 1000, [1] * 1000) for submission in range(1, 6)])
+        self.store.append([(2, 20, ['y', 'x'], [1, 2])])
+        before, after = self.store.compact([2, 3])
+        self.assertLess(after, before / 2)
+        reader = self.store.reader()
+        self.assertEqual(reader.submissions.tolist(), [2, 3])
+        self.assertEqual(reader.blobs.tolist(), [20, 3])
+        self.assertEqual(reader.decode(reader.stream(0)), ['y', 'x'])
+        self.assertEqual(len(reader.stream(1)), 1000)
+        # Ids survive compaction, so later appends keep sharing the vocabulary
+        self.store.append([(7, 7, ['x', 'z'], [1, 1])])
+        reader = self.store.reader()
+        self.assertEqual(reader.stream(2).tolist(), [0, 2])
+
+    def test_interrupted_append_is_truncated(self):
+        self.store.append([(1, 1, ['a', 'b'], [1, 1])])
+        with open(f'{self.store.path}/tokens.bin', 'ab') as f:
+            f.write(b'\x07' * 10)
+        self.assertEqual(len(self.store.reader().tokens), 2)
+        self.store.append([(2, 2, ['b'], [3])])
+        reader = self.store.reader()
+        self.assertEqual(reader.decode(reader.stream(1)), ['b'])
+        self.assertEqual(reader.stream_lines(1).tolist(), [3])
+
+
+class CorpusStreamTests(TestCase):
+
+    def setUp(self):
+        use_temporary_corpus_store(self)
+        self.user = CustomUser.objects.create_user('lena', 'lena@example.com', 'pw-lena-123')
+
+    def test_missing_and_changed_streams_are_encoded(self):
+        first = CodeSubmission.objects.create(
+            user=self.user, title='a.py', language='python', code_file='submissions/a.py', code_text=ADD
+        )
+        second = CodeSubmission.objects.create(
+            user=self.user, title='b.py', language='python', code_file='submissions/b.py', code_text=MUL
+        )
+        submissions = CodeSubmission.objects.order_by('pk')
+        reader, pks, rows = load_streams(submissions, 'words')
+        self.assertEqual(pks.tolist(), [first.pk, second.pk])
+        self.assertEqual(reader.decode(reader.stream(rows[1]))[:3], ['def', 'mul', 'a'])
+
+        with mock.patch('similarity_engine.corpus.read_submission_text') as read:
+            load_streams(submissions, 'words')
+        read.assert_not_called()
+
+        second.code_text = LOOP
+        second.save()
+        reader, _, rows = load_streams(submissions, 'words')
+        self.assertEqual(reader.decode(reader.stream(rows[1]))[:2], ['for', 'i'])
+
+        first.delete()
+        size = get_corpus_store('words').size_on_disk()
+        compact_corpus('words')
+        self.assertLess(get_corpus_store('words').size_on_disk(), size)
+        self.assertEqual(get_corpus_store('words').reader().submissions.tolist(), [second.pk])
+
+
+class TokenEncodingTests(SimpleTestCase):
+
+    def test_vocabulary_round_trip_fold_and_hashes(self):
+        vocabulary = Vocabulary()
+        ids = vocabulary.encode(['Total', 'total', 'x', 'Total'])
+        self.assertEqual(ids.dtype, np.uint32)
+        self.assertEqual(vocabulary.decode(ids), ['Total', 'total', 'x', 'Total'])
+        self.assertEqual(ids[0], ids[3])
+        self.assertEqual(vocabulary.decode(vocabulary.fold(ids)), ['total', 'total', 'x', 'total'])
+        # Hashes don't depend on the order tokens were interned in
+        other = Vocabulary()
+        other.encode(['x'])
+        self.assertEqual(other.hashes(other.encode(['Total'])).tolist(), vocabulary.hashes(ids[:1]).tolist())
+
+    def test_tfidf_matches_sklearn_vectorizer(self):
+        texts = [ADD, MUL, LOOP, ADD.upper(), '']
+        expected = TfidfVectorizer(
+            token_pattern=r'\b\w+\b', ngram_range=(1, 3), sublinear_tf=True, dtype=np.float32
+        ).fit_transform(texts)
+        vocabulary = Vocabulary()
+        streams = [encode_words(text, vocabulary) for text in texts]
+        matrix = tfidf_matrix(streams, len(vocabulary), (1, 3), sublinear_tf=True)
+        np.testing.assert_allclose((matrix @ matrix.T).toarray(), (expected @ expected.T).toarray(), atol=1e-6)
+
+    def test_scratch_vocabulary_leaves_the_shared_one_alone(self):
+        shared = Vocabulary()
+        known = shared.encode(['total', 'Total'])
+        scratch = ScratchVocabulary(shared)
+        ids = scratch.encode(['Total', 'Fresh', 'total', 'fresh', 'Fresh'])
+        # Known tokens keep their shared ids; new ones are numbered after them, here only
+        self.assertEqual(ids[[0, 2]].tolist(), known[::-1].tolist())
+        self.assertEqual(ids[1], ids[4])
+        self.assertTrue(all(i >= len(shared) for i in ids[[1, 3]].tolist()))
+        self.assertEqual((len(shared), len(scratch)), (2, 4))
+        self.assertEqual(scratch.decode(ids), ['Total', 'Fresh', 'total', 'fresh', 'Fresh'])
+        self.assertEqual(scratch.decode(scratch.fold(ids)), ['total', 'fresh', 'total', 'fresh', 'fresh'])
+        plain = Vocabulary()
+        self.assertEqual(scratch.hashes(ids).tolist(), plain.hashes(plain.encode(scratch.decode(ids))).tolist())
+
+    def test_comparisons_do_not_grow_the_shared_vocabulary(self):
+        texts = ['def scratchonly_a(q): return q', 'def scratchonly_b(q): return q * 2']
+        size = len(get_vocabulary())
+        top_k_matches(texts[:1], texts[1:])
+        get_analyzer().analyze_similarity(texts[0], texts[1], 'python')
+        fingerprints(texts[0] * 3)
+        self.assertEqual(len(get_vocabulary()), size)
+
+
+
+class PairFeatureStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='feature_store_')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.names = ['a', 'b', 'c']
+        self.store = PairFeatureStore(self.root, engine_version='test', feature_names=self.names)
+
+    def digests(self, i):
+        return content_digest(f'source {i}'), content_digest(f'target {i}')
+
+    def test_add_reads_back_and_skips_stored_pairs(self):
+        self.assertTrue(self.store.add(*self.digests(1), [1, 2, 3], 0.9))
+        self.assertTrue(self.store.add(*self.digests(2), [4, 5, 6], 0.2))
+        self.assertFalse(self.store.add(*self.digests(1), [7, 8, 9], 0.5))
+        # The reverse pair is a different pair
+        source, target = self.digests(1)
+        self.assertTrue(self.store.add(target, source, [0, 0, 0], 0.9))
+
+        keys, features, scores = self.store.load()
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(bytes(keys[0]), pair_key(*self.digests(1)))
+        np.testing.assert_array_equal(features[1], [4, 5, 6])
+        np.testing.assert_allclose(scores, [0.9, 0.2, 0.9])
+        matrix, labels = self.store.training_matrix(threshold=0.75)
+        self.assertEqual(labels.tolist(), [1, 0, 1])
+
+    def test_sees_pairs_appended_by_other_writers(self):
+        # Another process's store: this one's index picks its rows up on the next check
+        other = PairFeatureStore(self.root, engine_version='test', feature_names=self.names)
+        self.assertFalse(self.store.contains(pair_key(*self.digests(1))))
+        other.append([pair_key(*self.digests(i)) for i in range(5000)], np.zeros((5000, 3)), np.zeros(5000))
+        self.assertTrue(self.store.contains(pair_key(*self.digests(4999))))
+        self.assertFalse(self.store.add(*self.digests(10), [1, 1, 1], 1.0))
+        self.assertTrue(self.store.add(*self.digests(6000), [1, 1, 1], 1.0))
+        self.assertEqual(len(self.store), 5001)
+
+    def test_concurrent_writers_store_a_pair_once(self):
+        stores = [PairFeatureStore(self.root, engine_version='test', feature_names=self.names) for _ in range(4)]
+        added = []
+        threads = [
+            threading.Thread(target=lambda store=store: added.append(store.add(*self.digests(1), [1, 2, 3], 0.5)))
+            for store in stores * 2
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(added), [False] * 7 + [True])
+        self.assertEqual(len(self.store), 1)
+
+    def test_partial_tail_is_dropped(self):
+        self.store.add(*self.digests(1), [1, 2, 3], 0.9)
+        # An append interrupted after its features were written
+        with open(self.store.columns['features'][0], 'ab') as f:
+            f.write(b'\0' * 8)
+        self.assertEqual(len(self.store), 1)
+        self.assertTrue(self.store.add(*self.digests(2), [4, 5, 6], 0.2))
+        _, features, _ = self.store.load()
+        np.testing.assert_array_equal(features, [[1, 2, 3], [4, 5, 6]])
+
+
+class WarmupTests(TestCase):
+
+    def setUp(self):
+        use_temporary_corpus_store(self)
+
+    def test_warm_up_loads_shared_state(self):
+        get_corpus_store('words').append([(1, 0, ['warmupseedtoken'], None)])
+        vocabulary = get_vocabulary()
+        size = len(vocabulary)
+        timings = warm_up(freeze=False)
+        self.assertEqual(list(timings), [name for name, _ in WARMUP_STEPS])
+        self.assertIn('warmupseedtoken', vocabulary.decode(range(size, len(vocabulary))))
+        self.assertIs(get_analyzer(), get_analyzer())
+        self.assertIs(get_predictor(), get_predictor())
+
+    def test_on_load_closes_the_connections_it_opened(self):
+        with mock.patch('similarity_engine.warmup.warm_up_on_load'), \
+                mock.patch('code_similarity_system.startup.connections') as connections:
+            on_load()
+        connections.close_all.assert_called_once_with()
@@ -0,0 +1,236 @@
+"""
+Integer token encoding.
+
+A Vocabulary interns token strings to dense integer ids, once per process
+and language, and a token stream is a uint32 numpy array of those ids
+(4 bytes a token, where a list of str costs a pointer plus a str object
+per token). Similarities consume the arrays directly:
+
+    tfidf_matrix()      TF-IDF rows for n-grams of id streams (scipy CSR)
+    Vocabulary.hashes   crc32 per id, for fingerprints that must be the same in every process
+    Vocabulary.fold     id -> id of the lower-cased token
+
+Ids are only meaningful within the process that assigned them; anything
+persisted (indexes, features) is built from token hashes or scores.
+
+The shared vocabularies (get_vocabulary()) never evict, so only the warmup
+and offline corpus jobs intern into them. Comparisons encode through a
+scratch_vocabulary(): tokens the shared vocabulary knows keep their ids,
+and the rest get ids of their own that are dropped with the comparison,
+so user uploads don't grow a worker's memory.
+
+Like feature_store, this module only depends on numpy (and scipy/sklearn
+for the TF-IDF weighting).
+"""
+
+import re
+import threading
+import zlib
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfTransformer
+
+WORD_RE = re.compile(r'\b\w+\b')
+DEFAULT_LANGUAGE = 'default'
+
+_EMPTY = np.empty(0, dtype=np.uint32)
+
+
+class Vocabulary:
+    """Token string <-> uint32 id, shared by the threads of a process"""
+
+    def __init__(self):
+        self._ids = {}
+        self._tokens = []
+        self._hashes = []
+        self._folded = []
+        self._lock = threading.Lock()
+        self._hash_array = np.empty(0, dtype=np.uint64)
+        self._fold_array = _EMPTY
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def _known(self, token):
+        return self._ids.get(token)
+
+    def _lookup(self, tokens):
+        """int64 ids of tokens, -1 for the ones not interned yet"""
+        ids = self._ids
+        return np.fromiter((ids.get(token, -1) for token in tokens), dtype=np.int64, count=len(tokens))
+
+    def _intern(self, token):
+        # Callers hold the lock
+        token_id = self._known(token)
+        if token_id is None:
+            lower = token.lower()
+            # The lower-cased token first, so both lists stay aligned with the ids
+            folded = None if lower == token else self._intern(lower)
+            token_id = len(self)
+            self._ids[token] = token_id
+            self._tokens.append(token)
+            self._hashes.append(zlib.crc32(token.encode('utf-8')))
+            self._folded.append(token_id if folded is None else folded)
+        return token_id
+
+    def encode(self, tokens):
+        """uint32 ids of a sequence of token strings, interning new ones"""
+        encoded = self._lookup(tokens)
+        missing = np.flatnonzero(encoded < 0)
+        if len(missing):
+            with self._lock:
+                for i in missing.tolist():
+                    encoded[i] = self._intern(tokens[i])
+        return encoded.astype(np.uint32)
+
+    def decode(self, ids):
+        tokens = self._tokens
+        return [tokens[i] for i in np.asarray(ids).tolist()]
+
+    def _refresh(self):
+        with self._lock:
+            if len(self._hash_array) != len(self._tokens):
+                self._hash_array = np.asarray(self._hashes, dtype=np.uint64)
+                self._fold_array = np.asarray(self._folded, dtype=np.uint32)
+
+    def hashes(self, ids):
+        """crc32 (as uint64) of each id's token: stable across processes, unlike the ids"""
+        if len(ids) and int(ids.max()) >= len(self._hash_array):
+            self._refresh()
+        return self._hash_array[ids]
+
+    def fold(self, ids):
+        """Ids of the lower-cased tokens"""
+        if len(ids) and int(ids.max()) >= len(self._fold_array):
+            self._refresh()
+        return self._fold_array[ids]
+
+
+_vocabularies_lock = threading.Lock()
+_vocabularies = {}
+
+
+class ScratchVocabulary(Vocabulary):
+    """
+    Vocabulary of one computation over a shared one: the tokens the shared
+    vocabulary had when this one was made keep their ids, new tokens get
+    ids from there up, kept only here
+    """
+
+    def __init__(self, base):
+        super().__init__()
+        self.base = base
+        self.offset = len(base)
+
+    def __len__(self):
+        return self.offset + len(self._tokens)
+
+    def _known(self, token):
+        token_id = self.base._ids.get(token)
+        if token_id is not None and token_id < self.offset:
+            return token_id
+        return self._ids.get(token)
+
+    def _lookup(self, tokens):
+        encoded = self.base._lookup(tokens)
+        # Tokens the base interned since this was made are new here too
+        encoded[encoded >= self.offset] = -1
+        if self._ids:
+            ids = self._ids
+            for i in np.flatnonzero(encoded < 0).tolist():
+                encoded[i] = ids.get(tokens[i], -1)
+        return encoded
+
+    def decode(self, ids):
+        base_tokens, tokens, offset = self.base._tokens, self._tokens, self.offset
+        return [base_tokens[i] if i < offset else tokens[i - offset] for i in np.asarray(ids).tolist()]
+
+    def _split(self, ids, base_lookup, own_lookup, dtype):
+        ids = np.asarray(ids)
+        own = ids >= self.offset
+        values = np.empty(len(ids), dtype=dtype)
+        values[~own] = base_lookup(ids[~own])
+        values[own] = own_lookup(ids[own] - self.offset)
+        return values
+
+    def hashes(self, ids):
+        return self._split(ids, self.base.hashes, super().hashes, np.uint64)
+
+    def fold(self, ids):
+        return self._split(ids, self.base.fold, super().fold, np.uint32)
+
+
+def get_vocabulary(language=None):
+    """The process's shared Vocabulary for a language (one common vocabulary when language is None)"""
+    language = language or DEFAULT_LANGUAGE
+    with _vocabularies_lock:
+        vocabulary = _vocabularies.get(language)
+        if vocabulary is None:
+            vocabulary = _vocabularies[language] = Vocabulary()
+        return vocabulary
+
+
+def scratch_vocabulary(language=None):
+    """A ScratchVocabulary over the shared one, for encoding the texts of one comparison"""
+    return ScratchVocabulary(get_vocabulary(language))
+
+
+def encode_words(text, vocabulary, lowercase=True):
+    """Token stream of a text's \\w+ words, lower-cased like the TF-IDF vectorizers used to"""
+    if lowercase:
+        text = text.lower()
+    return vocabulary.encode(WORD_RE.findall(text))
+
+
+def _ngram_ids(streams, n, vocabulary_size):
+    """Per-stream arrays of dense n-gram ids (shared across the streams), and how many ids there are"""
+    keys = [stream.astype(np.int64) for stream in streams]
+    for offset in range(1, n):
+        # (previous (offset)-gram id, next token): at most distinct n-grams x vocabulary_size keys
+        keys = [
+            key[:len(stream) - offset] * vocabulary_size + stream[offset:].astype(np.int64)
+            for key, stream in zip(keys, streams)
+        ]
+        keys = _densify(keys)[0]
+    return _densify(keys)
+
+
+def _densify(keys):
+    flat = np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+    unique, inverse = np.unique(flat, return_inverse=True)
+    bounds = np.cumsum([0] + [len(key) for key in keys])
+    return [inverse[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])], len(unique)
+
+
+def term_counts(streams, vocabulary_size, ngram_range=(1, 1)):
+    """Sparse (documents, terms) count matrix of the n-grams of id streams; only terms that occur get a column"""
+    low, high = ngram_range
+    rows, cols, width = [], [], 0
+    for n in range(low, high + 1):
+        ids, size = _ngram_ids(streams, n, vocabulary_size)
+        for row, gram_ids in enumerate(ids):
+            rows.append(np.full(len(gram_ids), row, dtype=np.int64))
+            cols.append(gram_ids + width)
+        width += size
+    if not width:
+        return sparse.csr_matrix((len(streams), 1), dtype=np.float32)
+    counts = sparse.csr_matrix(
+        (np.ones(sum(len(r) for r in rows), dtype=np.float32), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(streams), width), dtype=np.float32,
+    )
+    counts.sum_duplicates()
+    return counts
+
+
+def tfidf_matrix(streams, vocabulary_size, ngram_range=(1, 1), sublinear_tf=False, max_features=None):
+    """
+    L2-normalised TF-IDF rows (float32 CSR) of id streams, weighted like
+    sklearn's TfidfVectorizer with the same options
+    """
+    counts = term_counts(streams, vocabulary_size, ngram_range)
+    if max_features is not None and counts.shape[1] > max_features:
+        totals = np.asarray(counts.sum(axis=0)).ravel()
+        keep = np.sort(np.argsort(-totals, kind='stable')[:max_features])
+        counts = counts[:, keep]
+    return TfidfTransformer(sublinear_tf=sublinear_tf).fit_transform(counts).astype(np.float32)
@@ -0,0 +1,131 @@
+"""
+Pre-fork warmup.
+
+A pre-forking server (gunicorn --preload, uwsgi without lazy-apps)
+imports the WSGI/ASGI module once in the master and forks the workers
+from it. warm_up() runs there and loads everything the workers only read:
+
+    modules      scikit-learn, scipy, radon, lizard, joblib
+    analyzer     the shared CodeSimilarityAnalyzer (language configs, tree-sitter parsers)
+    model        the shared MLSimilarityPredictor and its trained model bundle
+    vocabulary   the shared word Vocabulary, seeded with the corpus store's tokens
+    indexes      every processed reference index, opened, and its files and the corpus
+                 store's read ahead into the page cache
+
+and then freezes the garbage collector: the loaded objects move to a
+generation collections never scan, so a worker's collections don't write
+to (and copy) every page of the inherited heap. Reference counting still
+copies the pages of the objects a worker actually uses.
+measure_worker_rss compares each worker's unique memory with and without
+the warmup.
+"""
+
+import gc
+import importlib
+import logging
+import os
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger('similarity_engine.warmup')
+
+PRELOAD_MODULES = (
+    'sklearn.feature_extraction.text',
+    'sklearn.metrics.pairwise',
+    'scipy.sparse',
+    'radon.complexity',
+    'radon.metrics',
+    'lizard',
+    'joblib',
+)
+# The stream kind whose vocabulary is the shared word Vocabulary's (see corpus.STREAM_KINDS)
+WORDS_KIND = 'words'
+
+
+def _load_modules():
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+
+
+def _load_analyzer():
+    from .similarity_analyzer import get_analyzer
+    get_analyzer()
+
+
+def _load_model():
+    from .similarity_analyzer import get_predictor
+    get_predictor()
+
+
+def _load_vocabulary():
+    from .corpus import get_corpus_store
+    from .token_encoding import get_vocabulary
+
+    reader = get_corpus_store(WORDS_KIND).reader()
+    if reader.vocabulary_size:
+        get_vocabulary().encode(reader.decode(range(reader.vocabulary_size)))
+
+
+def _read_ahead(directory):
+    """Ask the kernel to page in a directory's files (page cache pages are shared by every process)"""
+    if not os.path.isdir(directory):
+        return
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith('.bin'):
+            fd = os.open(entry.path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+
+
+def _load_indexes():
+    from .corpus import STREAM_KINDS, get_corpus_store
+    from .references import reference_datasets, reference_index_path
+    from .reference_index import open_index
+
+    # open_index() keeps the opened index for the process, so the workers inherit it
+    for dataset in reference_datasets().only('dataset_id'):
+        if open_index(reference_index_path(dataset)) is not None:
+            _read_ahead(reference_index_path(dataset))
+    for kind in STREAM_KINDS:
+        _read_ahead(get_corpus_store(kind).path)
+
+
+WARMUP_STEPS = (
+    ('modules', _load_modules),
+    ('analyzer', _load_analyzer),
+    ('model', _load_model),
+    ('vocabulary', _load_vocabulary),
+    ('indexes', _load_indexes),
+)
+
+
+def warm_up(freeze=True):
+    """
+    Load the shared read-only state (see the module docstring); returns
+    {step: seconds}. A step that fails is logged and skipped, so the
+    workers still start and load it lazily.
+    """
+    timings = {}
+    for name, step in WARMUP_STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception('Warmup step %s failed', name)
+            continue
+        timings[name] = time.perf_counter() - started
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    logger.info('Warmed up in %.2fs (%s)', sum(timings.values()),
+                ', '.join(f'{name} {seconds:.2f}s' for name, seconds in timings.items()))
+    return timings
+
+
+def warm_up_on_load():
+    """warm_up() from the WSGI/ASGI module, when settings.PREFORK_WARMUP is on"""
+    if settings.PREFORK_WARMUP:
+        warm_up()
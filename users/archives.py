@@ -0,0 +1,233 @@
+"""
+Bulk ingest of zip/tar archive uploads, one submission per source file.
+
+The archive is read as a stream, one member at a time. Each member's
+per-file artifacts (decoded text, hashes, line count, compressed blob and
+content-addressed file) are computed in a shared thread pool; zlib, hashlib
+and file writes release the GIL, so this runs in parallel without copying
+members to other processes. The submissions and their SourceBlobs are then
+written with bulk inserts inside one transaction.
+"""
+
+import hashlib
+import posixpath
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+
+from .counters import bump
+from .models import CodeSubmission, SourceBlob
+from .storage import source_name
+from .uploads import ingest_upload
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+_pool_lock = threading.Lock()
+_pool = None
+
+
+def get_ingest_pool():
+    """Thread pool that computes per-file artifacts for archive uploads"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.INGEST_WORKERS, thread_name_prefix='archive-ingest')
+        return _pool
+
+
+@lru_cache(maxsize=None)
+def language_extensions():
+    """Extension -> language, from MultiLanguageCodeAnalyzer.language_configs (first language wins, e.g. .h is C++)"""
+    from similarity_engine.similarity_analyzer import MultiLanguageCodeAnalyzer
+
+    extensions = {}
+    for language, config in MultiLanguageCodeAnalyzer().language_configs.items():
+        for extension in config['extensions']:
+            extensions.setdefault(extension, language)
+    return extensions
+
+
+def detect_language(path, default=None):
+    """Language of a file from its extension, else default"""
+    return language_extensions().get(posixpath.splitext(path)[1].lower(), default)
+
+
+def is_archive(name):
+    return (name or '').lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def is_hidden_path(path):
+    """Dot files and macOS metadata that archives pick up alongside the sources"""
+    return any(part.startswith('.') or part == '__MACOSX' for part in path.split('/'))
+
+
+def iter_archive_files(archive, max_member_size):
+    """
+    Yield (path, data) for each regular file in a zip or tar, streaming member
+    by member; data is None for members over max_member_size. Raises
+    ValidationError when the archive can't be read.
+    """
+    archive.seek(0)
+    try:
+        if (archive.name or '').lower().endswith('.zip') or zipfile.is_zipfile(archive):
+            archive.seek(0)
+            with zipfile.ZipFile(archive) as zip_file:
+                for info in zip_file.infolist():
+                    if info.is_dir():
+                        continue
+                    # Read one byte past the limit rather than trusting the header's size
+                    with zip_file.open(info) as member:
+                        data = member.read(max_member_size + 1)
+                    yield info.filename, data if len(data) <= max_member_size else None
+        else:
+            archive.seek(0)
+            # 'r|*': a forward-only stream in any compression, so members are never seeked back to
+            with tarfile.open(fileobj=archive, mode='r|*') as tar_file:
+                for info in tar_file:
+                    if not info.isfile():
+                        continue
+                    if info.size > max_member_size:
+                        yield info.name, None
+                        continue
+                    yield info.name, tar_file.extractfile(info).read()
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as exc:
+        raise ValidationError(f'Could not read the archive: {exc}', code='archive_invalid')
+
+
+def iter_archive_members(archive):
+    """
+    iter_archive_files() within the upload limits: MAX_UPLOAD_SIZE per file,
+    MAX_ARCHIVE_FILES and MAX_ARCHIVE_UNCOMPRESSED_SIZE per archive
+    (ValidationError past them).
+    """
+    members = total = 0
+    for path, data in iter_archive_files(archive, settings.MAX_UPLOAD_SIZE):
+        members += 1
+        if members > settings.MAX_ARCHIVE_FILES:
+            raise ValidationError(
+                f'The archive has more than {settings.MAX_ARCHIVE_FILES} files.', code='archive_too_many_files'
+            )
+        total += len(data or b'')
+        if total > settings.MAX_ARCHIVE_UNCOMPRESSED_SIZE:
+            raise ValidationError(
+                f'The archive expands to more than {filesizeformat(settings.MAX_ARCHIVE_UNCOMPRESSED_SIZE)}.',
+                code='archive_too_large',
+            )
+        yield path, data
+
+
+class ArchiveMember:
+    """Per-file artifacts of one archive member, computed in the ingest pool"""
+
+    def __init__(self, path, language, raw):
+        self.path = path
+        self.language = language
+        ingested = ingest_upload(ContentFile(raw, name=posixpath.basename(path)))
+        self.size = ingested.size
+        self.line_count = ingested.line_count
+        self.content_hash = ingested.content_hash
+        self.encoding = ingested.encoding
+        # Only the compressed text is kept until the rows are written
+        text = ingested.text.encode('utf-8')
+        self.blob_hash = hashlib.sha256(text).hexdigest()
+        self.blob_size = len(text)
+        self.blob_data = zlib.compress(text, SourceBlob.COMPRESSION_LEVEL)
+        # Only the name; the blob holds the text (see users.storage)
+        self.file_name = source_name(self.content_hash, path)
+
+
+class ArchiveIngestResult:
+
+    def __init__(self, submissions, skipped, size, elapsed):
+        self.submissions = submissions
+        self.skipped = skipped
+        self.size = size
+        self.elapsed = elapsed
+
+    @property
+    def files_per_second(self):
+        return len(self.submissions) / self.elapsed if self.elapsed else 0
+
+    @property
+    def bytes_per_second(self):
+        return self.size / self.elapsed if self.elapsed else 0
+
+    def summary(self):
+        return (
+            f'Imported {len(self.submissions)} files ({filesizeformat(self.size)}) in {self.elapsed:.2f}s: '
+            f'{self.files_per_second:,.0f} files/s, {filesizeformat(self.bytes_per_second)}/s'
+        )
+
+
+def ingest_archive(archive, user, default_language=None, description=''):
+    """
+    Create one CodeSubmission per source file in a zip/tar upload, in one
+    transaction. Files whose language can't be told from their extension
+    use default_language, or are skipped without one.
+    """
+    started = time.perf_counter()
+    pool = get_ingest_pool()
+    max_in_flight = settings.INGEST_WORKERS * 4
+    futures = []
+    in_flight = deque()
+    skipped = []
+
+    for path, raw in iter_archive_members(archive):
+        if is_hidden_path(path):
+            continue
+        language = detect_language(path, default_language)
+        if language is None:
+            skipped.append((path, 'unsupported file type'))
+            continue
+        if raw is None:
+            skipped.append((path, f'larger than {filesizeformat(settings.MAX_UPLOAD_SIZE)}'))
+            continue
+        future = pool.submit(ArchiveMember, path, language, raw)
+        futures.append(future)
+        in_flight.append(future)
+        # Bound the raw bytes held: wait for the oldest member before reading more
+        while len(in_flight) >= max_in_flight:
+            in_flight.popleft().result()
+
+    members = [future.result() for future in futures]
+    if not members:
+        raise ValidationError('The archive contains no supported source files.', code='archive_empty')
+
+    blobs = {}
+    for member in members:
+        _, _, count = blobs.get(member.blob_hash, (None, None, 0))
+        blobs[member.blob_hash] = (member.blob_data, member.blob_size, count + 1)
+
+    with transaction.atomic():
+        blob_ids = SourceBlob.objects.acquire_many(blobs)
+        submissions = CodeSubmission.objects.bulk_create([
+            CodeSubmission(
+                user=user,
+                title=member.path[:200],
+                description=description,
+                language=member.language,
+                code_file=member.file_name,
+                blob_id=blob_ids[member.blob_hash],
+                file_size=member.size,
+                line_count=member.line_count,
+                content_hash=member.content_hash,
+                encoding=member.encoding,
+            )
+            for member in members
+        ], batch_size=500)
+        # bulk_create sends no post_save, so update the counter here
+        bump(user.pk, total_submissions=len(submissions))
+
+    size = sum(member.size for member in members)
+    return ArchiveIngestResult(submissions, skipped, size, time.perf_counter() - started)
@@ -0,0 +1,68 @@
+"""
+Per-user counter caches stored on CustomUser.
+
+The counters are kept current by users.signals with atomic F() updates, so
+dashboards read a single row instead of counting submissions, comparisons
+and results. reconcile() recomputes them from the source tables to repair
+any drift (e.g. after bulk operations that bypass signals).
+"""
+
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from accounts.models import CustomUser
+from .models import CodeSubmission, ComparisonRequest, SimilarityResult
+
+# Results at or above this overall score (percent) count as high-similarity hits
+HIGH_SIMILARITY_SCORE = 75
+
+
+def bump(user_id, **deltas):
+    """Atomically add deltas to a user's counters"""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if user_id is None or not deltas:
+        return
+    CustomUser.objects.filter(pk=user_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def _count_subquery(queryset, user_field):
+    counts = queryset.filter(**{user_field: OuterRef('pk')}).order_by().values(user_field).annotate(
+        n=Count('pk')
+    ).values('n')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def expected_counters():
+    """Users annotated with their counters recomputed from the source tables"""
+    return CustomUser.objects.annotate(
+        expected_total_submissions=_count_subquery(CodeSubmission.objects.all(), 'user'),
+        expected_total_comparisons=_count_subquery(ComparisonRequest.objects.all(), 'user'),
+        expected_completed_comparisons=_count_subquery(ComparisonRequest.objects.filter(status='completed'), 'user'),
+        expected_high_similarity_count=_count_subquery(
+            SimilarityResult.objects.filter(overall_similarity_score__gte=HIGH_SIMILARITY_SCORE), 'user'
+        ),
+    )
+
+
+def reconcile(dry_run=False):
+    """Repair drifted counters; returns a list of (username, {field: (stored, expected)})"""
+    drift = Q()
+    for field in CustomUser.COUNTER_FIELDS:
+        drift |= ~Q(**{field: F(f'expected_{field}')})
+
+    repaired = []
+    values = ['pk', 'username'] + [f for field in CustomUser.COUNTER_FIELDS for f in (field, f'expected_{field}')]
+    for row in expected_counters().filter(drift).values(*values).iterator():
+        changes = {
+            field: (row[field], row[f'expected_{field}'])
+            for field in CustomUser.COUNTER_FIELDS
+            if row[field] != row[f'expected_{field}']
+        }
+        if not dry_run:
+            CustomUser.objects.filter(pk=row['pk']).update(
+                **{field: expected for field, (_, expected) in changes.items()}
+            )
+        repaired.append((row['username'], changes))
+    return repaired
@@ -1,5 +1,8 @@
 from django import forms
+from django.conf import settings
 from .models import CodeSubmission, ComparisonRequest
+from .archives import ARCHIVE_EXTENSIONS, is_archive
+from .uploads import OversizedUpload, ingest_upload, too_large_error
 
 class CodeSubmissionForm(forms.ModelForm):
     class Meta:
@@ -18,6 +21,19 @@ class CodeSubmissionForm(forms.ModelForm):
             'language': forms.Select(attrs={'class': 'form-control'}),
             'code_file': forms.FileInput(attrs={'class': 'form-control'}),
         }
+    
+    def clean_code_file(self):
+        code_file = self.cleaned_data.get('code_file')
+        if code_file and hasattr(code_file, 'chunks'):
+            # Single streaming pass; rejects the file as soon as it passes MAX_UPLOAD_SIZE
+            self.ingested = ingest_upload(code_file, max_size=settings.MAX_UPLOAD_SIZE)
+        return code_file
+    
+    def save(self, commit=True):
+        ingested = getattr(self, 'ingested', None)
+        if ingested is not None:
+            ingested.apply_to(self.instance)
+        return super().save(commit=commit)
 
 
 class TextSubmissionForm(forms.ModelForm):
@@ -44,6 +60,39 @@ class TextSubmissionForm(forms.ModelForm):
             }),
             'language': forms.Select(attrs={'class': 'form-control'}),
         }
+    
+    def save(self, commit=True):
+        # code_text is a property (stored in a SourceBlob), so ModelForm doesn't assign it
+        self.instance.code_text = self.cleaned_data['code_text']
+        return super().save(commit=commit)
+
+
+class ArchiveUploadForm(forms.Form):
+    archive = forms.FileField(
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': ','.join(ARCHIVE_EXTENSIONS)})
+    )
+    language = forms.ChoiceField(
+        choices=(('', 'Detect from file extension'),) + CodeSubmission.LANGUAGE_CHOICES,
+        required=False,
+        help_text='Used for files whose extension does not identify a language',
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    description = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={
+            'class': 'form-control',
+            'rows': 3,
+            'placeholder': 'Description for every file (optional)'
+        })
+    )
+    
+    def clean_archive(self):
+        archive = self.cleaned_data['archive']
+        if isinstance(archive, OversizedUpload) or archive.size > settings.MAX_ARCHIVE_UPLOAD_SIZE:
+            raise too_large_error(archive.size, settings.MAX_ARCHIVE_UPLOAD_SIZE)
+        if not is_archive(archive.name):
+            raise forms.ValidationError('Upload a .zip or .tar (optionally compressed) archive.')
+        return archive
 
 
 class ComparisonRequestForm(forms.ModelForm):
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from users.models import CodeSubmission, ComparisonRequest, SimilarityResult
+
+class Command(BaseCommand):
+    help = 'Compare bytes transferred per listing page with and without the deferred heavy columns'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=25)
+    
+    def _bytes_read(self, queryset):
+        """Rows and approximate payload bytes the database sends back for a queryset"""
+        sql, params = queryset.query.sql_with_params()
+        rows = total = 0
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for row in cursor.fetchall():
+                rows += 1
+                for value in row:
+                    if value is None:
+                        continue
+                    if isinstance(value, str):
+                        total += len(value.encode('utf-8'))
+                    elif isinstance(value, (bytes, bytearray, memoryview)):
+                        total += len(value)
+                    else:
+                        total += 8
+        return rows, total
+    
+    def handle(self, *args, **options):
+        n = options['page_size']
+        pages = [
+            (
+                'Submission listing',
+                CodeSubmission.objects.with_code(),
+                CodeSubmission.objects.all(),
+            ),
+            (
+                'Comparison listing (with submissions and result)',
+                ComparisonRequest.objects.select_related('source_submission', 'target_submission', 'result'),
+                ComparisonRequest.objects.with_submissions().with_result(),
+            ),
+            (
+                'Result listing (with comparison)',
+                SimilarityResult.objects.with_payload().select_related(
+                    'comparison__source_submission', 'comparison__target_submission'
+                ),
+                SimilarityResult.objects.with_comparison(),
+            ),
+        ]
+        
+        self.stdout.write(f"{'Page':<52}{'Rows':>6}{'Full bytes':>14}{'Deferred bytes':>16}{'Saved':>8}")
+        for label, full, deferred in pages:
+            rows, full_bytes = self._bytes_read(full.order_by('-created_at', '-id')[:n])
+            _, deferred_bytes = self._bytes_read(deferred.order_by('-created_at', '-id')[:n])
+            saved = 100 * (1 - deferred_bytes / full_bytes) if full_bytes else 0
+            self.stdout.write(f"{label:<52}{rows:>6}{full_bytes:>14,}{deferred_bytes:>16,}{saved:>7.1f}%")
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import Length
+
+from users.models import CodeSubmission, SourceBlob
+
+
+def _mb(value):
+    return f'{(value or 0) / (1024 * 1024):,.1f} MB'
+
+
+def _saved(before, after):
+    return f'{100 * (1 - after / before):.1f}%' if before else '-'
+
+
+class Command(BaseCommand):
+    help = 'Report how much source text and file storage the content-addressed blobs save'
+
+    def table_sizes(self, tables):
+        """On-disk bytes per table where the backend can tell (MySQL, SQLite with dbstat)"""
+        placeholders = ', '.join(['%s'] * len(tables))
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'mysql':
+                    cursor.execute(
+                        'SELECT table_name, data_length + index_length FROM information_schema.tables '
+                        f'WHERE table_schema = DATABASE() AND table_name IN ({placeholders})', tables
+                    )
+                elif connection.vendor == 'sqlite':
+                    cursor.execute(f'SELECT name, SUM(pgsize) FROM dbstat WHERE name IN ({placeholders}) GROUP BY name', tables)
+                else:
+                    return {}
+                return dict(cursor.fetchall())
+        except DatabaseError:
+            return {}
+
+    def handle(self, *args, **options):
+        submissions = CodeSubmission.objects.aggregate(
+            total=Count('id'),
+            in_blobs=Count('id', filter=Q(blob__isnull=False)),
+            logical_blob_bytes=Sum('blob__size'),
+            inline_bytes=Sum(Length('inline_text')),
+            file_bytes=Sum('file_size'),
+        )
+        blobs = SourceBlob.objects.aggregate(
+            count=Count('id'), text_bytes=Sum('size'), stored_bytes=Sum(Length('data')), references=Sum('ref_count'),
+        )
+        # Only uploads without a blob keep their file; identical ones share it, so count each name once
+        stored_file_bytes = sum(
+            row['size'] or 0
+            for row in CodeSubmission.objects.filter(blob__isnull=True).values('code_file')
+            .annotate(size=Max('file_size')).order_by()
+        )
+
+        inline_bytes = submissions['inline_bytes'] or 0
+        logical = (submissions['logical_blob_bytes'] or 0) + inline_bytes
+        distinct = (blobs['text_bytes'] or 0) + inline_bytes
+        stored = (blobs['stored_bytes'] or 0) + inline_bytes
+        inline = submissions['total'] - submissions['in_blobs']
+
+        self.stdout.write('Source text')
+        self.stdout.write(f"  Submissions              {submissions['total']:>14,}  ({submissions['in_blobs']:,} in blobs, {inline:,} inline)")
+        self.stdout.write(f"  Distinct blobs           {blobs['count']:>14,}  ({blobs['references'] or 0:,} references)")
+        self.stdout.write(f'  One copy per submission  {_mb(logical):>14}')
+        self.stdout.write(f'  Distinct texts           {_mb(distinct):>14}  ({_saved(logical, distinct)} saved by deduplication)')
+        self.stdout.write(f'  Stored (compressed)      {_mb(stored):>14}  ({_saved(logical, stored)} saved)')
+
+        self.stdout.write('Uploaded files')
+        self.stdout.write(f"  One file per submission  {_mb(submissions['file_bytes']):>14}")
+        self.stdout.write(
+            f"  Stored files             {_mb(stored_file_bytes):>14}  ({_saved(submissions['file_bytes'], stored_file_bytes)} saved)"
+        )
+
+        sizes = self.table_sizes([CodeSubmission._meta.db_table, SourceBlob._meta.db_table])
+        if sizes:
+            self.stdout.write('Tables on disk')
+            for table, size in sorted(sizes.items()):
+                self.stdout.write(f'  {table:<24} {_mb(size):>14}')
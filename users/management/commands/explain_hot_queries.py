@@ -0,0 +1,147 @@
+import json
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import CustomUser, UserActivity
+from users.counters import HIGH_SIMILARITY_SCORE
+from users.models import CodeSubmission, ComparisonRequest, SimilarityResult
+from users.seeding import seed_volume
+
+SQLITE_SCAN = re.compile(r'\bSCAN (\w+)( USING (?:COVERING )?INDEX \w+)?\s*$')
+POSTGRES_TABLE_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot listing and filter queries and fail if any of them does a full table scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed this many rows per table for a throwaway user first (rolled back afterwards)')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Refresh the planner statistics (ANALYZE) before explaining')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not just the failures')
+
+    def hot_queries(self, user):
+        """(label, queryset) for the query shapes the listing pages, dashboards and rollups run"""
+        now = timezone.now()
+        day_ago = now - timedelta(days=1)
+        return [
+            ('Submissions by user, newest first',
+             CodeSubmission.objects.filter(user=user).order_by('-created_at', '-id')[:26]),
+            ('All submissions, newest first',
+             CodeSubmission.objects.order_by('-created_at', '-id')[:51]),
+            ('Comparisons by user, newest first',
+             ComparisonRequest.objects.filter(user=user).with_submissions().with_result()
+             .order_by('-created_at', '-id')[:26]),
+            ('All comparisons, newest first',
+             ComparisonRequest.objects.with_submissions().with_result().order_by('-created_at', '-id')[:51]),
+            ('Completed comparisons by user',
+             ComparisonRequest.objects.filter(user=user, status='completed', result__isnull=False)
+             .order_by('-created_at')),
+            ('High-similarity results by user, newest first',
+             SimilarityResult.objects.filter(user=user, overall_similarity_score__gte=HIGH_SIMILARITY_SCORE)
+             .with_comparison().order_by('-created_at')[:5]),
+            ('Results above a score, highest first',
+             SimilarityResult.objects.filter(overall_similarity_score__gte=90)
+             .order_by('-overall_similarity_score')[:50]),
+            ('Results created in a day',
+             SimilarityResult.objects.filter(created_at__gte=day_ago, created_at__lt=now)
+             .values('overall_similarity_score')),
+            ('Recent activity by user',
+             UserActivity.objects.filter(user=user).order_by('-timestamp')[:10]),
+            ('Activity in a day',
+             UserActivity.objects.filter(timestamp__gte=day_ago, timestamp__lt=now).values('activity_type')),
+            ('Users, newest first',
+             CustomUser.objects.order_by('-date_joined', '-id')[:51]),
+        ]
+
+    def full_scans(self, queryset):
+        """
+        (plan text, tables read in full) for a queryset. Walking a whole index
+        in order only counts as a scan when the query has no LIMIT, since a
+        sliced query stops after the first rows (the listing pages).
+        """
+        vendor = connection.vendor
+        sliced = queryset.query.is_sliced
+        if vendor == 'mysql':
+            plan = queryset.explain(format='json')
+            scans = []
+
+            def walk(node):
+                if isinstance(node, dict):
+                    access = node.get('access_type')
+                    if access == 'ALL' or (access == 'index' and not sliced):
+                        scans.append(node.get('table_name', '?'))
+                    for value in node.values():
+                        walk(value)
+                elif isinstance(node, list):
+                    for value in node:
+                        walk(value)
+
+            walk(json.loads(plan))
+            return plan, scans
+
+        plan = queryset.explain()
+        if vendor == 'sqlite':
+            scans = [
+                match.group(1) for line in plan.splitlines()
+                if (match := SQLITE_SCAN.search(line)) and not (match.group(2) and sliced)
+            ]
+        else:
+            scans = POSTGRES_TABLE_SCAN.findall(plan)
+        return plan, scans
+
+    def analyze(self):
+        tables = [model._meta.db_table for model in
+                  (CustomUser, UserActivity, CodeSubmission, ComparisonRequest, SimilarityResult)]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(f"ANALYZE TABLE {', '.join(tables)}")
+                cursor.fetchall()
+            elif connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+            else:
+                for table in tables:
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(table)}')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                user = CustomUser.objects.create_user('explain-hot-queries', 'explain@example.com')
+                seed_volume(user, options['seed'])
+                UserActivity.objects.bulk_create([
+                    UserActivity(user=user, activity_type='similarity_check', description='seeded')
+                    for _ in range(options['seed'])
+                ])
+            else:
+                user = CustomUser.objects.order_by('-total_submissions').first()
+                if user is None:
+                    raise CommandError('No users to explain against; seed some data or pass --seed')
+
+            if options['analyze']:
+                if options['seed'] and connection.vendor == 'mysql':
+                    # ANALYZE TABLE commits implicitly, which would keep the seeded rows
+                    self.stderr.write('Skipping ANALYZE: not possible inside the seeded transaction on MySQL')
+                else:
+                    self.analyze()
+
+            failures = []
+            for label, queryset in self.hot_queries(user):
+                plan, scans = self.full_scans(queryset)
+                if scans:
+                    failures.append(label)
+                    self.stdout.write(self.style.ERROR(f"FULL SCAN  {label}: {', '.join(scans)}"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'indexed    {label}'))
+                if scans or options['verbose_plans']:
+                    self.stdout.write('\n'.join(f'    {line}' for line in plan.splitlines()))
+
+            if options['seed']:
+                transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f'{len(failures)} hot quer{"y" if len(failures) == 1 else "ies"} fell back to a full table scan')
@@ -0,0 +1,188 @@
+import asyncio
+import io
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from accounts.models import CustomUser
+from users.models import CodeSubmission, ComparisonRequest
+
+
+def _rss_bytes():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+class _Run:
+    """What a load test observed"""
+
+    def __init__(self):
+        self.connected = 0
+        self.done = 0
+        self.connect_seconds = None
+        self.notify_seconds = None
+        self.threads = 0
+        self.rss = 0
+
+
+class Command(BaseCommand):
+    help = (
+        'Hold many clients on the comparison events (SSE) endpoint of a running comparison, served through '
+        "Django's ASGI and then its WSGI handler, and report how many wait at once and what they cost"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--waiters', type=int, default=1000, help='Concurrent clients')
+        parser.add_argument('--wsgi-threads', type=int, default=32,
+                            help='Request threads of the WSGI server (e.g. gunicorn --threads)')
+        parser.add_argument('--hold', type=float, default=3.0,
+                            help='Seconds the comparison keeps running once the clients have connected')
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.create_user('load-test-waiters', 'load-test-waiters@example.com', None)
+        try:
+            submission = CodeSubmission.objects.create(
+                user=user, title='load_test.py', language='python', code_file='submissions/load_test.py',
+                code_text='x = 1\n',
+            )
+            comparison = ComparisonRequest.objects.create(
+                user=user, comparison_type='file_vs_file', source_submission=submission, status='processing'
+            )
+            client = Client()
+            client.force_login(user)
+            self.cookie = f"sessionid={client.cookies['sessionid'].value}"
+            self.path = reverse('users:comparison_events', args=[comparison.request_id])
+            self.comparison_pk = comparison.pk
+            # A short poll interval so the notification latency shows the server, not the interval;
+            # no per-request session saves, which SQLite (one writer at a time) fails under this load
+            with override_settings(COMPARISON_STATUS_POLL_INTERVAL=0.1, SESSION_SAVE_EVERY_REQUEST=False):
+                for server, run in (
+                    ('asgi', lambda: asyncio.run(self._asgi(options['waiters'], options['hold']))),
+                    ('wsgi', lambda: self._wsgi(options['waiters'], options['wsgi_threads'], options['hold'])),
+                ):
+                    ComparisonRequest.objects.filter(pk=comparison.pk).update(status='processing', progress=0)
+                    connections.close_all()
+                    self._report(server, options['waiters'], run())
+        finally:
+            user.delete()
+
+    def _report(self, server, waiters, run):
+        connect = f'{run.connect_seconds:.2f}s' if run.connect_seconds is not None else 'n/a'
+        notify = f'{run.notify_seconds:.2f}s' if run.notify_seconds is not None else 'n/a'
+        self.stdout.write(
+            f'{server}  {run.connected:>6,}/{waiters:,} waiting at once (in {connect})  '
+            f'{run.done:>6,} notified ({notify} after completion)  '
+            f'{run.threads:>5} threads  +{run.rss / 2 ** 20:,.0f} MB RSS'
+        )
+
+    def _complete(self):
+        ComparisonRequest.objects.filter(pk=self.comparison_pk).update(status='completed', progress=100)
+
+    async def _asgi(self, waiters, hold):
+        application = ASGIHandler()
+        run = _Run()
+        rss, threads = _rss_bytes(), threading.active_count()
+        all_connected, all_done, finished = asyncio.Event(), asyncio.Event(), asyncio.Event()
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': self.path, 'raw_path': self.path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'cookie', self.cookie.encode())],
+            'client': ('127.0.0.1', 40000), 'server': ('localhost', 80),
+        }
+
+        async def waiter():
+            requested = False
+            connected = False
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await finished.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                nonlocal connected
+                body = message.get('body', b'')
+                if not connected and b'event: status' in body:
+                    connected = True
+                    run.connected += 1
+                    if run.connected == waiters:
+                        all_connected.set()
+                if b'event: done' in body:
+                    run.done += 1
+                    if run.done == waiters:
+                        all_done.set()
+
+            await application(dict(scope), receive, send)
+
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(waiter()) for _ in range(waiters)]
+        try:
+            await asyncio.wait_for(all_connected.wait(), timeout=60)
+            run.connect_seconds = time.perf_counter() - started
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.sleep(hold)
+        run.threads = threading.active_count() - threads
+        run.rss = _rss_bytes() - rss
+
+        completed = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(None, self._complete)
+        try:
+            await asyncio.wait_for(all_done.wait(), timeout=60)
+            run.notify_seconds = time.perf_counter() - completed
+        except asyncio.TimeoutError:
+            pass
+        finished.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return run
+
+    def _wsgi(self, waiters, threads, hold):
+        application = WSGIHandler()
+        run = _Run()
+        lock = threading.Lock()
+        rss, baseline_threads = _rss_bytes(), threading.active_count()
+
+        def waiter():
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': self.path, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+                'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'HTTP_COOKIE': self.cookie,
+                'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr,
+            }
+            try:
+                for chunk in application(environ, lambda status, headers, exc_info=None: None):
+                    if b'event: done' in chunk:
+                        with lock:
+                            run.done += 1
+            finally:
+                connections.close_all()
+
+        pool = ThreadPoolExecutor(max_workers=threads)
+        started = time.perf_counter()
+        futures = [pool.submit(waiter) for _ in range(waiters)]
+        time.sleep(hold)
+        # A WSGI server thread serves one request at a time: the busy ones are the clients waiting now
+        run.connected = sum(1 for future in futures if future.running())
+        run.connect_seconds = time.perf_counter() - started
+        run.threads = threading.active_count() - baseline_threads
+        run.rss = _rss_bytes() - rss
+
+        completed = time.perf_counter()
+        self._complete()
+        pool.shutdown(wait=True)
+        if run.done:
+            run.notify_seconds = time.perf_counter() - completed
+        return run
@@ -0,0 +1,42 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.models import CodeSubmission, SourceBlob
+
+
+class Command(BaseCommand):
+    help = 'Move source text still stored inline on submissions into shared, compressed SourceBlobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the submissions left to move')
+
+    def handle(self, *args, **options):
+        pending = CodeSubmission.objects.filter(blob__isnull=True, inline_text__isnull=False)
+        if options['dry_run']:
+            self.stdout.write(f'{pending.count():,} submissions still store their text inline')
+            return
+
+        moved = 0
+        last_pk = 0
+        while True:
+            rows = list(
+                pending.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'inline_text')[:options['batch_size']]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+
+            by_text = defaultdict(list)
+            for pk, text in rows:
+                by_text[text].append(pk)
+            with transaction.atomic():
+                for text, pks in by_text.items():
+                    blob = SourceBlob.objects.acquire(text, count=len(pks))
+                    CodeSubmission.objects.filter(pk__in=pks).update(blob=blob, inline_text=None)
+            moved += len(rows)
+            self.stdout.write(f'  {moved:,} moved')
+
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved:,} submissions into source blobs'))
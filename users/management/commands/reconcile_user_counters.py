@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from users.counters import reconcile
+
+class Command(BaseCommand):
+    help = 'Recompute the per-user submission/comparison counters and repair any drift'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+    
+    def handle(self, *args, **options):
+        repaired = reconcile(dry_run=options['dry_run'])
+        for username, changes in repaired:
+            details = ', '.join(f"{field}: {stored} -> {expected}" for field, (stored, expected) in changes.items())
+            self.stdout.write(f"{username}: {details}")
+        
+        verb = 'drifted' if options['dry_run'] else 'repaired'
+        self.stdout.write(self.style.SUCCESS(f"{len(repaired)} users {verb}"))
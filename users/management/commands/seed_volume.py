@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from reports.rollups import earliest_activity_date, refresh_rollups
+from users.seeding import SEED_PASSWORD, VolumeSeeder
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with production-scale synthetic users, submissions, comparisons, results, reports and activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000, help='Approximate total rows to create (default: 100000)')
+        parser.add_argument('--users', type=int, help='Number of users to create (overrides --rows)')
+        parser.add_argument('--submissions-per-user', type=int, default=20, help='Mean submissions per user (default: 20)')
+        parser.add_argument('--days', type=int, default=180, help='Spread timestamps over the last N days (default: 180)')
+        parser.add_argument('--unique-fraction', type=float, default=0.3,
+                            help='Share of submissions with distinct source; the rest reuse template code (default: 0.3)')
+        parser.add_argument('--chunk-users', type=int, default=200, help='Users generated per transaction (default: 200)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per INSERT statement (default: 2000)')
+        parser.add_argument('--random-seed', type=int, help='Seed for reproducible data')
+        parser.add_argument('--refresh-rollups', action='store_true', help='Rebuild the daily rollups afterwards')
+
+    def handle(self, *args, **options):
+        per_user = options['submissions_per_user']
+        if per_user < 1 or options['days'] < 1 or options['chunk_users'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--submissions-per-user, --days, --chunk-users and --batch-size must be positive')
+
+        users = options['users']
+        if users is None:
+            users = max(1, round(options['rows'] / VolumeSeeder.estimated_rows_per_user(per_user)))
+        self.stdout.write(
+            f'Seeding {users:,} users (~{users * VolumeSeeder.estimated_rows_per_user(per_user):,.0f} rows) '
+            f'on {timezone.now():%Y-%m-%d %H:%M}'
+        )
+
+        seeder = VolumeSeeder(
+            submissions_per_user=per_user,
+            days=options['days'],
+            batch_size=options['batch_size'],
+            seed=options['random_seed'],
+            unique_fraction=options['unique_fraction'],
+        )
+
+        def progress(written, elapsed):
+            rate = written / elapsed if elapsed else 0
+            self.stdout.write(f'  {written:>12,} rows  {elapsed:8.1f}s  {rate:>10,.0f} rows/s')
+
+        seeder.seed(users, chunk_users=options['chunk_users'], progress=progress)
+
+        # From the database: the template pool's blobs are inserted outside the chunks
+        inserted = seeder.inserted_counts()
+        for label, count in inserted.items():
+            self.stdout.write(f'  {label:<28}{count:>12,}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {sum(inserted.values()):,} rows; seeded users log in with '{SEED_PASSWORD}'"
+        ))
+
+        if options['refresh_rollups']:
+            date_from = earliest_activity_date()
+            if date_from is not None:
+                rollups = refresh_rollups(date_from, timezone.localdate())
+                self.stdout.write(self.style.SUCCESS(f'Refreshed rollups from {date_from} ({rollups} rows)'))
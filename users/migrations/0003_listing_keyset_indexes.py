@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_savedcomparison_result'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='codesubmission',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='code_sub_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='codesubmission',
+            index=models.Index(fields=['created_at', 'id'], name='code_sub_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comparisonrequest',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='comp_req_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comparisonrequest',
+            index=models.Index(fields=['created_at', 'id'], name='comp_req_created_idx'),
+        ),
+    ]
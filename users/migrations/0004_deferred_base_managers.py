@@ -0,0 +1,21 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_listing_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='codesubmission',
+            options={'base_manager_name': 'objects', 'ordering': ['-created_at']},
+        ),
+        migrations.AlterModelOptions(
+            name='similarityresult',
+            options={'base_manager_name': 'objects', 'ordering': ['-created_at']},
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_result_users(apps, schema_editor):
+    ComparisonRequest = apps.get_model('users', 'ComparisonRequest')
+    SimilarityResult = apps.get_model('users', 'SimilarityResult')
+    SimilarityResult.objects.filter(user__isnull=True).update(
+        user=Subquery(ComparisonRequest.objects.filter(pk=OuterRef('comparison_id')).values('user_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_deferred_base_managers'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='similarityresult',
+            name='user',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='similarity_results', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_result_users, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comparisonrequest',
+            index=models.Index(fields=['user', 'status'], name='comp_req_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='similarityresult',
+            index=models.Index(fields=['overall_similarity_score'], name='sim_result_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='similarityresult',
+            index=models.Index(fields=['user', 'overall_similarity_score', 'created_at'], name='sim_result_user_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='similarityresult',
+            index=models.Index(fields=['created_at'], name='sim_result_created_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codesubmission',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='codesubmission',
+            name='encoding',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:22
+
+import django.core.validators
+import django.db.models.deletion
+import users.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_submission_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SourceBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('data', models.BinaryField()),
+                ('size', models.IntegerField(default=0)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'source_blobs',
+            },
+        ),
+        # code_text becomes inline_text on the same column: a state-only rename
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name='codesubmission',
+                    old_name='code_text',
+                    new_name='inline_text',
+                ),
+                migrations.AlterField(
+                    model_name='codesubmission',
+                    name='inline_text',
+                    field=models.TextField(blank=True, db_column='code_text', editable=False, null=True),
+                ),
+            ],
+        ),
+        # Only upload_to/storage change, which the database never sees
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='codesubmission',
+                    name='code_file',
+                    field=models.FileField(storage=users.storage.get_source_storage, upload_to=users.storage.source_upload_to, validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['py', 'java', 'js', 'cpp', 'c', 'txt'])]),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='codesubmission',
+            name='blob',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='submissions', to='users.sourceblob'),
+        ),
+    ]
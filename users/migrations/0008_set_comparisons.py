@@ -0,0 +1,40 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_source_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comparisonrequest',
+            name='source_set',
+            field=models.ManyToManyField(blank=True, related_name='source_set_comparisons', to='users.codesubmission'),
+        ),
+        migrations.AddField(
+            model_name='comparisonrequest',
+            name='target_set',
+            field=models.ManyToManyField(blank=True, related_name='target_set_comparisons', to='users.codesubmission'),
+        ),
+        migrations.CreateModel(
+            name='SimilarityMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('comparison', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='users.comparisonrequest')),
+                ('source_submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.codesubmission')),
+                ('target_submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.codesubmission')),
+            ],
+            options={
+                'db_table': 'similarity_matches',
+                'ordering': ['-score'],
+                'indexes': [models.Index(fields=['comparison', '-score'], name='sim_match_comp_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:43
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_set_comparisons'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlagiarismCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cluster_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('language', models.CharField(choices=[('python', 'Python'), ('java', 'Java'), ('javascript', 'JavaScript'), ('cpp', 'C++'), ('c', 'C')], max_length=20)),
+                ('component', models.PositiveIntegerField()),
+                ('size', models.PositiveIntegerField()),
+                ('edge_count', models.PositiveIntegerField()),
+                ('density', models.FloatField()),
+                ('average_score', models.FloatField()),
+                ('max_score', models.FloatField()),
+                ('threshold', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'plagiarism_clusters',
+                'ordering': ['-size', '-max_score'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PlagiarismClusterMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('degree', models.PositiveIntegerField()),
+                ('max_score', models.FloatField()),
+                ('cluster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='users.plagiarismcluster')),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cluster_memberships', to='users.codesubmission')),
+            ],
+            options={
+                'db_table': 'plagiarism_cluster_members',
+                'ordering': ['-degree', '-max_score'],
+                'unique_together': {('cluster', 'submission')},
+            },
+        ),
+    ]
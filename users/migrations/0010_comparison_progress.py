@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-19 03:34
+
+from django.db import migrations, models
+
+
+def complete_finished(apps, schema_editor):
+    ComparisonRequest = apps.get_model('users', 'ComparisonRequest')
+    ComparisonRequest.objects.filter(status='completed').update(progress=100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_plagiarism_clusters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comparisonrequest',
+            name='progress',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(complete_finished, migrations.RunPython.noop),
+    ]
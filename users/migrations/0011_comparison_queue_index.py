@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-19 03:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_comparison_progress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comparisonrequest',
+            index=models.Index(fields=['status', 'comparison_type'], name='comp_req_status_type_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_comparison_queue_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comparisonrequest',
+            name='heartbeat_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,7 +1,132 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.conf import settings
+from django.utils import timezone
 from django.core.validators import FileExtensionValidator
+import hashlib
 import uuid
+import zlib
+
+from .storage import get_source_storage, source_upload_to
+from .uploads import ingest_upload
+
+
+class SourceBlobManager(models.Manager):
+    
+    def acquire(self, text, count=1):
+        """The blob holding text (created if needed) with count more references"""
+        raw = text.encode('utf-8')
+        content_hash = hashlib.sha256(raw).hexdigest()
+        with transaction.atomic():
+            if not self.filter(content_hash=content_hash).update(ref_count=F('ref_count') + count):
+                try:
+                    # Savepoint: a concurrent upload of the same text may insert it first
+                    with transaction.atomic():
+                        blob = self.create(
+                            content_hash=content_hash,
+                            data=zlib.compress(raw, SourceBlob.COMPRESSION_LEVEL),
+                            size=len(raw),
+                            ref_count=count,
+                        )
+                        blob._text = text
+                        return blob
+                except IntegrityError:
+                    self.filter(content_hash=content_hash).update(ref_count=F('ref_count') + count)
+            blob = self.defer('data').get(content_hash=content_hash)
+        blob._text = text
+        return blob
+    
+    def acquire_many(self, blobs):
+        """
+        Bulk acquire() for already compressed texts: blobs maps content_hash
+        to (data, size, count). Returns content_hash -> blob id.
+        """
+        with transaction.atomic():
+            existing = set(self.filter(content_hash__in=blobs).values_list('content_hash', flat=True))
+            by_count = defaultdict(list)
+            for content_hash in existing:
+                by_count[blobs[content_hash][2]].append(content_hash)
+            for count, hashes in by_count.items():
+                self.filter(content_hash__in=hashes).update(ref_count=F('ref_count') + count)
+
+            missing = [content_hash for content_hash in blobs if content_hash not in existing]
+            try:
+                with transaction.atomic():
+                    self.bulk_create([
+                        SourceBlob(content_hash=content_hash, data=data, size=size, ref_count=count)
+                        for content_hash in missing
+                        for data, size, count in [blobs[content_hash]]
+                    ], batch_size=500)
+            except IntegrityError:
+                # A concurrent upload inserted some of them first
+                for content_hash in missing:
+                    data, size, count = blobs[content_hash]
+                    if not self.filter(content_hash=content_hash).update(ref_count=F('ref_count') + count):
+                        self.create(content_hash=content_hash, data=data, size=size, ref_count=count)
+
+            ids = dict(self.filter(content_hash__in=blobs).values_list('content_hash', 'pk'))
+            # Released to zero and deleted between the lookup and the update above
+            for content_hash in blobs.keys() - ids.keys():
+                data, size, count = blobs[content_hash]
+                ids[content_hash] = self.create(content_hash=content_hash, data=data, size=size, ref_count=count).pk
+        return ids
+    
+    def release(self, blob_id, count=1):
+        """Drop count references to a blob, deleting it when none are left"""
+        if blob_id is None:
+            return
+        with transaction.atomic():
+            self.filter(pk=blob_id).update(ref_count=F('ref_count') - count)
+            self.filter(pk=blob_id, ref_count__lte=0).delete()
+
+
+class SourceBlob(models.Model):
+    """
+    One distinct source text, stored once however many submissions share it.
+    Keyed by the SHA-256 of its UTF-8 text and kept zlib-compressed;
+    ref_count is the number of submissions pointing at it.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    data = models.BinaryField()
+    size = models.IntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    COMPRESSION_LEVEL = 6
+    
+    objects = SourceBlobManager()
+    
+    class Meta:
+        db_table = 'source_blobs'
+    
+    def __str__(self):
+        return f"Blob {self.content_hash[:12]} ({self.ref_count} refs)"
+    
+    _text = None
+    
+    @property
+    def text(self):
+        """Decompressed source text (decompressed once per instance)"""
+        if self._text is None:
+            self._text = zlib.decompress(bytes(self.data)).decode('utf-8')
+        return self._text
+
+
+class CodeSubmissionQuerySet(models.QuerySet):
+    
+    def with_code(self):
+        """Also load the source text (its blob, or the legacy inline column)"""
+        return self.defer(None).select_related('blob')
+
+
+class CodeSubmissionManager(models.Manager.from_queryset(CodeSubmissionQuerySet)):
+    """Defers the legacy inline text so listings and relation lookups transfer only metadata"""
+    
+    def get_queryset(self):
+        return super().get_queryset().defer(*CodeSubmission.HEAVY_FIELDS)
+
 
 class CodeSubmission(models.Model):
     LANGUAGE_CHOICES = (
@@ -25,66 +150,107 @@ class CodeSubmission(models.Model):
     description = models.TextField(blank=True, null=True)
     language = models.CharField(max_length=20, choices=LANGUAGE_CHOICES)
     code_file = models.FileField(
-        upload_to='submissions/%Y/%m/%d/',
+        upload_to=source_upload_to,
+        storage=get_source_storage,
         validators=[FileExtensionValidator(allowed_extensions=['py', 'java', 'js', 'cpp', 'c', 'txt'])]
     )
-    code_text = models.TextField(blank=True, null=True)
+    # Source text lives in a shared SourceBlob; rows from before blobs keep it inline
+    # (read both through code_text)
+    blob = models.ForeignKey(
+        SourceBlob,
+        on_delete=models.PROTECT,
+        related_name='submissions',
+        blank=True,
+        null=True,
+        editable=False
+    )
+    inline_text = models.TextField(blank=True, null=True, db_column='code_text', editable=False)
     file_size = models.IntegerField(default=0)
     line_count = models.IntegerField(default=0)
+    # SHA-256 of the uploaded bytes and the encoding they were decoded with (see users.uploads)
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    encoding = models.CharField(max_length=40, blank=True, default='')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     is_temporary = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    HEAVY_FIELDS = ('inline_text',)
+    
+    objects = CodeSubmissionManager()
+    
     class Meta:
         db_table = 'code_submissions'
         ordering = ['-created_at']
+        # Used for related lookups (comparison.source_submission) too
+        base_manager_name = 'objects'
+        # Keyset pagination on (created_at, id), per user and system-wide
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='code_sub_user_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='code_sub_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.user.username} ({self.language})"
     
+    # Text assigned through code_text and not yet moved into a blob by save()
+    _pending_text = None
+    
+    @property
+    def code_text(self):
+        """Source text, decompressed from the blob on first access"""
+        if self._pending_text is not None:
+            return self._pending_text
+        if self.blob_id is not None:
+            return self.blob.text
+        return self.inline_text
+    
+    @code_text.setter
+    def code_text(self, value):
+        self._pending_text = value
+    
     def save(self, *args, **kwargs):
-        if self.code_file and not self.code_text:
+        # Rows that already have their text (in a blob or inline) are not re-read
+        if (self._pending_text is None and self.blob_id is None and self.code_file
+                and 'inline_text' not in self.get_deferred_fields() and not self.inline_text):
             try:
-                # Ensure file pointer at start
-                try:
-                    self.code_file.seek(0)
-                except Exception:
-                    pass
-
-                content = self.code_file.read()
-
-                # UploadedFile.read() may return bytes or str
-                if isinstance(content, bytes):
-                    try:
-                        content_text = content.decode('utf-8')
-                    except Exception:
-                        content_text = content.decode('latin-1', errors='ignore')
-                else:
-                    content_text = str(content)
-
-                self.code_text = content_text
-
-                # Reset pointer so storage can read it again when saving
-                try:
-                    self.code_file.seek(0)
-                except Exception:
-                    pass
-
-                # Try to get file size
-                try:
-                    self.file_size = self.code_file.size
-                except Exception:
-                    try:
-                        self.file_size = self.code_file.file.size
-                    except Exception:
-                        self.file_size = len(content) if content is not None else 0
-
-                self.line_count = len(self.code_text.splitlines())
+                ingest_upload(self.code_file).apply_to(self)
             except Exception:
                 # If anything goes wrong reading the uploaded file, skip enriching fields
                 pass
-        super().save(*args, **kwargs)
+        
+        if self._pending_text is None:
+            super().save(*args, **kwargs)
+            return
+        
+        if self.code_file and not self.code_file._committed:
+            # The blob holds the text, so only the upload's content-addressed name is kept
+            self.code_file.name = source_upload_to(self, self.code_file.name)
+            self.code_file._committed = True
+        
+        with transaction.atomic():
+            previous_blob_id = self.blob_id
+            self.blob = SourceBlob.objects.acquire(self._pending_text)
+            self.inline_text = None
+            super().save(*args, **kwargs)
+            if previous_blob_id is not None:
+                SourceBlob.objects.release(previous_blob_id)
+        self._pending_text = None
+
+
+class ComparisonRequestQuerySet(models.QuerySet):
+    
+    def with_submissions(self):
+        """select_related the source/target submissions without their source text"""
+        return self.select_related('source_submission', 'target_submission').defer(
+            'source_submission__inline_text', 'target_submission__inline_text'
+        )
+    
+    def with_result(self):
+        """select_related the result's scores without its JSON payload"""
+        return self.select_related('result').defer(
+            *(f'result__{field}' for field in SimilarityResult.HEAVY_FIELDS)
+        )
 
 
 class ComparisonRequest(models.Model):
@@ -117,24 +283,82 @@ class ComparisonRequest(models.Model):
         blank=True,
         null=True
     )
+    # multiple_vs_multiple: the two sets (source_submission is the first of source_set)
+    source_set = models.ManyToManyField(CodeSubmission, related_name='source_set_comparisons', blank=True)
+    target_set = models.ManyToManyField(CodeSubmission, related_name='target_set_comparisons', blank=True)
     similarity_threshold = models.FloatField(default=0.75)
     use_ml_analysis = models.BooleanField(default=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Percent of the work done, reported by background jobs while they run
+    progress = models.IntegerField(default=0)
     error_message = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(blank=True, null=True)
+    # Last sign of life of the process running the comparison (similarity_engine.jobs)
+    heartbeat_at = models.DateTimeField(default=timezone.now)
+    
+    objects = ComparisonRequestQuerySet.as_manager()
     
     class Meta:
         db_table = 'comparison_requests'
         ordering = ['-created_at']
+        # Keyset pagination on (created_at, id), per user and system-wide
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='comp_req_user_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='comp_req_created_idx'),
+            # Per-user status filters (completed comparisons, batch report selection)
+            models.Index(fields=['user', 'status'], name='comp_req_user_status_idx'),
+            # The job queue: batch comparisons pending or processing (similarity_engine.jobs.queued_jobs)
+            models.Index(fields=['status', 'comparison_type'], name='comp_req_status_type_idx'),
+        ]
     
     def __str__(self):
         return f"Comparison {self.request_id} by {self.user.username}"
+    
+    # Status as last loaded from / saved to the database (used by the counter signals)
+    saved_status = None
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.saved_status = instance.__dict__.get('status')
+        return instance
+
+
+class SimilarityResultQuerySet(models.QuerySet):
+    
+    def with_payload(self):
+        """Also load the (deferred by default) segments, metrics and visualization JSON"""
+        return self.defer(None)
+    
+    def with_comparison(self):
+        """select_related the comparison and its submissions without their source text"""
+        return self.select_related(
+            'comparison__source_submission', 'comparison__target_submission'
+        ).defer(
+            'comparison__source_submission__inline_text', 'comparison__target_submission__inline_text'
+        )
+
+
+class SimilarityResultManager(models.Manager.from_queryset(SimilarityResultQuerySet)):
+    """Defers the JSON payload columns; listings only need the scores"""
+    
+    def get_queryset(self):
+        return super().get_queryset().defer(*SimilarityResult.HEAVY_FIELDS)
 
 
 class SimilarityResult(models.Model):
     result_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     comparison = models.OneToOneField(ComparisonRequest, on_delete=models.CASCADE, related_name='result')
+    # Copy of comparison.user so per-user score filters can use an index on this table
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='similarity_results',
+        blank=True,
+        null=True,
+        editable=False
+    )
     overall_similarity_score = models.FloatField()
     structural_similarity = models.FloatField(default=0.0)
     token_similarity = models.FloatField(default=0.0)
@@ -146,12 +370,104 @@ class SimilarityResult(models.Model):
     visualization_data = models.JSONField(default=dict)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    HEAVY_FIELDS = ('identical_segments', 'near_identical_segments', 'code_metrics', 'visualization_data')
+    
+    objects = SimilarityResultManager()
+    
     class Meta:
         db_table = 'similarity_results'
         ordering = ['-created_at']
+        # Used for comparison.result lookups too
+        base_manager_name = 'objects'
+        indexes = [
+            models.Index(fields=['overall_similarity_score'], name='sim_result_score_idx'),
+            models.Index(fields=['user', 'overall_similarity_score', 'created_at'], name='sim_result_user_score_idx'),
+            models.Index(fields=['created_at'], name='sim_result_created_idx'),
+        ]
     
     def __str__(self):
         return f"Result {self.result_id} - {self.overall_similarity_score:.2%}"
+    
+    def save(self, *args, **kwargs):
+        if self.user_id is None and self.comparison_id is not None:
+            self.user_id = self.comparison.user_id
+        super().save(*args, **kwargs)
+
+
+class SimilarityMatchQuerySet(models.QuerySet):
+    
+    def with_submissions(self):
+        """select_related both submissions without their source text"""
+        return self.select_related('source_submission', 'target_submission').defer(
+            'source_submission__inline_text', 'target_submission__inline_text'
+        )
+
+
+class SimilarityMatch(models.Model):
+    """
+    One kept cell of a multiple_vs_multiple comparison's similarity matrix:
+    the target that is the source's rank-th best match (see
+    similarity_engine.matrix). Scores are percentages like SimilarityResult's.
+    """
+    comparison = models.ForeignKey(ComparisonRequest, on_delete=models.CASCADE, related_name='matches')
+    source_submission = models.ForeignKey(CodeSubmission, on_delete=models.CASCADE, related_name='+')
+    target_submission = models.ForeignKey(CodeSubmission, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    
+    objects = SimilarityMatchQuerySet.as_manager()
+    
+    class Meta:
+        db_table = 'similarity_matches'
+        ordering = ['-score']
+        indexes = [
+            models.Index(fields=['comparison', '-score'], name='sim_match_comp_score_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Match #{self.rank} ({self.score:.2f}%) in {self.comparison_id}"
+
+
+class PlagiarismCluster(models.Model):
+    """
+    A dense group of submissions that all resemble each other, found by
+    similarity_engine.plagiarism over the whole corpus. Scores are percentages.
+    """
+    cluster_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    language = models.CharField(max_length=20, choices=CodeSubmission.LANGUAGE_CHOICES)
+    # Connected component the cluster belongs to (clusters split from one component share it)
+    component = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    edge_count = models.PositiveIntegerField()
+    density = models.FloatField()
+    average_score = models.FloatField()
+    max_score = models.FloatField()
+    # Edge score the cluster was formed at
+    threshold = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'plagiarism_clusters'
+        ordering = ['-size', '-max_score']
+    
+    def __str__(self):
+        return f"Cluster of {self.size} {self.language} submissions ({self.max_score:.2f}%)"
+
+
+class PlagiarismClusterMember(models.Model):
+    cluster = models.ForeignKey(PlagiarismCluster, on_delete=models.CASCADE, related_name='members')
+    submission = models.ForeignKey(CodeSubmission, on_delete=models.CASCADE, related_name='cluster_memberships')
+    # Edges to other members and the best of their scores
+    degree = models.PositiveIntegerField()
+    max_score = models.FloatField()
+    
+    class Meta:
+        db_table = 'plagiarism_cluster_members'
+        ordering = ['-degree', '-max_score']
+        unique_together = ['cluster', 'submission']
+    
+    def __str__(self):
+        return f"{self.submission_id} in cluster {self.cluster_id}"
 
 
 class SavedComparison(models.Model):
@@ -0,0 +1,134 @@
+"""
+Keyset (cursor) pagination for the listing pages.
+
+Pages are addressed by an opaque cursor holding the sort key of the row at
+the page edge, so every page is a single indexed range scan of per_page+1
+rows (page N costs the same as page 1, unlike OFFSET). Ordering must end
+in a unique column (e.g. ('-created_at', '-id')) to keep it stable.
+"""
+
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+CURSOR_PARAM = 'cursor'
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, next_cursor, previous_cursor, request=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.request = request
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def _url(self, cursor):
+        params = self.request.GET.copy() if self.request is not None else {}
+        params[CURSOR_PARAM] = cursor
+        return f'?{params.urlencode()}'
+
+    @property
+    def next_url(self):
+        return self._url(self.next_cursor) if self.has_next else None
+
+    @property
+    def previous_url(self):
+        return self._url(self.previous_cursor) if self.has_previous else None
+
+
+class KeysetPaginator:
+
+    def __init__(self, queryset, ordering=('-created_at', '-id'), per_page=25):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.descending = [name.startswith('-') for name in self.ordering]
+
+    # Cursor encoding
+
+    def _key(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def encode_cursor(self, direction, key):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in key]
+        raw = json.dumps([direction, values], separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """(direction, key) for a cursor, or None if it is malformed"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(raw)
+            if direction not in ('next', 'prev') or len(values) != len(self.fields):
+                return None
+            model = self.queryset.model
+            key = [model._meta.get_field(field).to_python(value) for field, value in zip(self.fields, values)]
+            if any(value is None for value in key):
+                return None
+            return direction, key
+        except (ValueError, TypeError, ValidationError):
+            return None
+
+    # Queries
+
+    def _after(self, key, reverse=False):
+        """Q for rows strictly after key in the ordering (or strictly before if reverse)"""
+        condition = Q()
+        equal = {}
+        for field, descending, value in zip(self.fields, self.descending, key):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        # Redundant bound on the leading column gives the planner an index range to scan
+        field, descending, value = self.fields[0], self.descending[0], key[0]
+        return Q(**{f"{field}__{'lte' if descending != reverse else 'gte'}": value}) & condition
+
+    def _reversed_ordering(self):
+        return [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+
+    def page(self, cursor=None, request=None):
+        decoded = self.decode_cursor(cursor) if cursor else None
+
+        if decoded is None:
+            rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_more, has_before = len(rows) > self.per_page, False
+            rows = rows[:self.per_page]
+        elif decoded[0] == 'next':
+            rows = list(self.queryset.filter(self._after(decoded[1])).order_by(*self.ordering)[:self.per_page + 1])
+            has_more, has_before = len(rows) > self.per_page, True
+            rows = rows[:self.per_page]
+        else:
+            rows = list(
+                self.queryset.filter(self._after(decoded[1], reverse=True))
+                .order_by(*self._reversed_ordering())[:self.per_page + 1]
+            )
+            has_before, has_more = len(rows) > self.per_page, True
+            rows = rows[:self.per_page][::-1]
+
+        next_cursor = self.encode_cursor('next', self._key(rows[-1])) if rows and has_more else None
+        previous_cursor = self.encode_cursor('prev', self._key(rows[0])) if rows and has_before else None
+        return KeysetPage(rows, next_cursor, previous_cursor, request)
+
+    def get_page(self, request):
+        """Page addressed by the request's ?cursor= parameter"""
+        return self.page(request.GET.get(CURSOR_PARAM), request)
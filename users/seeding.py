@@ -0,0 +1,550 @@
+"""
+Synthetic data for query-plan checks, the query budget tests and
+production-scale local databases (see the seed_volume management command).
+"""
+
+import hashlib
+import math
+import random
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from accounts.models import CustomUser, UserActivity
+from reports.models import SimilarityReport
+from .counters import HIGH_SIMILARITY_SCORE, reconcile
+from .models import CodeSubmission, ComparisonRequest, SimilarityResult, SourceBlob
+from .storage import SOURCE_PREFIX
+
+SAMPLE_CODE = '''def add(a, b):
+    return a + b
+
+
+class Calculator:
+    def multiply(self, a, b):
+        return a * b
+'''
+
+
+def seed_volume(user, count):
+    """Create count submissions, comparisons (with results) and reports for a user"""
+    start = CodeSubmission.objects.count()
+    blob = SourceBlob.objects.acquire(SAMPLE_CODE * 20, count=count)
+    submissions = CodeSubmission.objects.bulk_create([
+        CodeSubmission(
+            user=user,
+            title=f'sample_{start + i}.py',
+            language='python',
+            code_file=f'submissions/sample_{start + i}.py',
+            blob=blob,
+            file_size=len(SAMPLE_CODE) * 20,
+            line_count=SAMPLE_CODE.count('\n') * 20,
+            status='completed',
+        )
+        for i in range(count)
+    ])
+    # bulk_create doesn't return primary keys on every backend
+    submissions = list(CodeSubmission.objects.filter(user=user).order_by('-id')[:count])
+
+    comparisons = ComparisonRequest.objects.bulk_create([
+        ComparisonRequest(
+            user=user,
+            comparison_type='file_vs_file',
+            source_submission=submissions[i],
+            target_submission=submissions[(i + 1) % count],
+            status='completed',
+            progress=100,
+            completed_at=timezone.now(),
+        )
+        for i in range(count)
+    ])
+    comparisons = list(ComparisonRequest.objects.filter(user=user).order_by('-id')[:count])
+
+    segment = {'source_lines': '1-7', 'target_lines': '1-7', 'content': SAMPLE_CODE}
+    SimilarityResult.objects.bulk_create([
+        SimilarityResult(
+            comparison=comparison,
+            user=user,
+            overall_similarity_score=(i * 37) % 100,
+            token_similarity=(i * 13) % 100,
+            structural_similarity=(i * 17) % 100,
+            ast_similarity=(i * 19) % 100,
+            identical_segments=[segment] * 5,
+            near_identical_segments=[segment] * 5,
+            code_metrics={'loc_diff': 0, 'complexity_diff': 0.0},
+        )
+        for i, comparison in enumerate(comparisons)
+    ])
+    results = {r.comparison_id: r for r in SimilarityResult.objects.filter(comparison__in=comparisons)}
+
+    SimilarityReport.objects.bulk_create([
+        SimilarityReport(
+            user=user,
+            comparison=comparison,
+            result=results[comparison.pk],
+            report_format='pdf',
+            status='pending',
+        )
+        for comparison in comparisons
+    ])
+    reconcile()
+    return comparisons
+
+
+# Code bodies for the volume seeder: a few programs per language, expanded
+# into variants by renaming identifiers and repeating the body.
+CODE_TEMPLATES = {
+    'python': [
+        """def {name}(items):
+    total = 0
+    for item in items:
+        if item % {n} == 0:
+            total += item
+    return total
+
+
+class {cls}:
+    def __init__(self, values):
+        self.values = list(values)
+
+    def run(self):
+        return {name}(self.values)
+""",
+        """import json
+
+
+def load_{name}(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def summarize_{name}(records):
+    counts = {{}}
+    for record in records:
+        key = record.get('kind', 'unknown')
+        counts[key] = counts.get(key, 0) + {n}
+    return sorted(counts.items())
+""",
+    ],
+    'java': [
+        """public class {cls} {{
+    private final int[] values;
+
+    public {cls}(int[] values) {{
+        this.values = values;
+    }}
+
+    public int {name}() {{
+        int total = 0;
+        for (int value : values) {{
+            if (value % {n} == 0) {{
+                total += value;
+            }}
+        }}
+        return total;
+    }}
+}}
+""",
+    ],
+    'javascript': [
+        """function {name}(items) {{
+  return items
+    .filter((item) => item % {n} === 0)
+    .reduce((total, item) => total + item, 0);
+}}
+
+class {cls} {{
+  constructor(values) {{
+    this.values = values;
+  }}
+
+  run() {{
+    return {name}(this.values);
+  }}
+}}
+
+module.exports = {{ {name}, {cls} }};
+""",
+    ],
+    'cpp': [
+        """#include <vector>
+
+int {name}(const std::vector<int>& items) {{
+    int total = 0;
+    for (int item : items) {{
+        if (item % {n} == 0) {{
+            total += item;
+        }}
+    }}
+    return total;
+}}
+
+class {cls} {{
+public:
+    explicit {cls}(std::vector<int> values) : values_(values) {{}}
+    int run() const {{ return {name}(values_); }}
+private:
+    std::vector<int> values_;
+}};
+""",
+    ],
+    'c': [
+        """#include <stdio.h>
+
+int {name}(const int *items, int count) {{
+    int total = 0;
+    for (int i = 0; i < count; i++) {{
+        if (items[i] % {n} == 0) {{
+            total += items[i];
+        }}
+    }}
+    return total;
+}}
+
+int main(void) {{
+    int items[] = {{1, 2, 3, 4, 5, 6}};
+    printf("%d\\n", {name}(items, 6));
+    return 0;
+}}
+""",
+    ],
+}
+EXTENSIONS = {'python': 'py', 'java': 'java', 'javascript': 'js', 'cpp': 'cpp', 'c': 'c'}
+LANGUAGE_WEIGHTS = {'python': 50, 'java': 20, 'javascript': 15, 'cpp': 10, 'c': 5}
+COMPARISON_TYPE_WEIGHTS = {'file_vs_file': 85, 'text_vs_text': 10, 'single_vs_repo': 5}
+STATUS_WEIGHTS = {'completed': 90, 'failed': 5, 'pending': 3, 'processing': 2}
+REPORT_FORMAT_WEIGHTS = {'pdf': 70, 'html': 15, 'csv': 10, 'json': 5}
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_2) AppleWebKit/605.1.15 Version/17.2 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+]
+SEED_PASSWORD = 'seed-password'
+
+
+@contextmanager
+def bulk_load_session():
+    """Relax per-connection durability/constraint checks for the duration of a bulk load"""
+    vendor = connection.vendor
+    if vendor == 'sqlite' and connection.in_atomic_block:
+        # SQLite can't change its safety level inside a transaction; load at the current one
+        vendor = None
+    with connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute('PRAGMA synchronous = OFF')
+        elif vendor == 'mysql':
+            cursor.execute('SET SESSION unique_checks = 0, foreign_key_checks = 0')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            if vendor == 'sqlite':
+                cursor.execute('PRAGMA synchronous = FULL')
+            elif vendor == 'mysql':
+                cursor.execute('SET SESSION unique_checks = 1, foreign_key_checks = 1')
+
+
+class RowInserter:
+    """
+    Multi-row INSERTs of plain column dicts for one model.
+
+    This is what bulk_create does, minus the per-instance and per-field ORM
+    work (model __init__, pre_save, compiler value preparation) that caps
+    bulk_create at a few thousand rows a second. Values still go through
+    each field's get_db_prep_save, so datetimes, UUIDs and JSON are stored
+    exactly as the ORM would store them. Columns missing from a row get the
+    field default; auto_now/auto_now_add are not applied.
+    """
+
+    ADAPTED_TYPES = ('DateTimeField', 'UUIDField', 'JSONField')
+
+    def __init__(self, model):
+        self.model = model
+        fields = [field for field in model._meta.concrete_fields if not field.primary_key] + [model._meta.pk]
+        self.columns = [field.attname for field in fields]
+        self.defaults = []
+        for field in fields:
+            if field.has_default():
+                default = field.default if callable(field.default) else field.get_default
+                self.defaults.append(default)
+            else:
+                self.defaults.append(None)
+        self.adapters = [
+            field.get_db_prep_save if field.get_internal_type() in self.ADAPTED_TYPES else None for field in fields
+        ]
+        quote = connection.ops.quote_name
+        self.sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(model._meta.db_table),
+            ', '.join(quote(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+
+    def _values(self, row, db):
+        values = []
+        for column, default, adapt in zip(self.columns, self.defaults, self.adapters):
+            value = row[column] if column in row else (default() if default is not None else None)
+            values.append(adapt(value, db) if adapt is not None and value is not None else value)
+        return values
+
+    def insert(self, rows, batch_size):
+        # The connection itself rather than the thread-local proxy: adapters look it up once per value
+        db = connections[DEFAULT_DB_ALIAS]
+        with db.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(self.sql, [self._values(row, db) for row in rows[start:start + batch_size]])
+
+
+class VolumeSeeder:
+    """
+    Generates users with submissions, comparisons, results, reports and
+    activity in user chunks, one transaction per chunk.
+
+    Primary keys are assigned up front (bulk inserts can't return them on
+    MySQL), so each chunk is a handful of multi-row INSERTs with no reads.
+    Counter caches are computed while generating, so no reconcile pass is
+    needed afterwards. Per-user volume follows a log-normal distribution
+    (a few heavy users, a long tail of light ones) and timestamps spread
+    over the last `days` days. A unique_fraction of submissions get a
+    header comment that makes their source distinct; the rest share the
+    template pool's blobs, like a class uploading the same starter code.
+    """
+
+    MODELS = (
+        SourceBlob, CustomUser, CodeSubmission, ComparisonRequest, SimilarityResult, SimilarityReport, UserActivity,
+    )
+
+    def __init__(self, submissions_per_user=20, days=180, batch_size=2000, seed=None, unique_fraction=0.3):
+        self.submissions_per_user = submissions_per_user
+        self.unique_fraction = unique_fraction
+        self.days = days
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.now = timezone.now()
+        self.password = make_password(SEED_PASSWORD)
+        # Before the template pool's blobs are acquired, so inserted_counts() includes them
+        self.initial_counts = self._table_counts()
+        self.code_pool = self._build_code_pool()
+        self.shared_blob_ids = {body[1] for bodies in self.code_pool.values() for body in bodies}
+        self.inserters = {model: RowInserter(model) for model in self.MODELS}
+        self.next_ids = {
+            model: (model.objects.aggregate(top=Max('id'))['top'] or 0) + 1 for model in self.MODELS
+        }
+
+    def _table_counts(self):
+        return {model._meta.label: model.objects.count() for model in self.MODELS}
+
+    def inserted_counts(self):
+        """Rows per model added since this seeder was created, counted in the database"""
+        return {label: count - self.initial_counts[label] for label, count in self._table_counts().items()}
+
+    @staticmethod
+    def estimated_rows_per_user(submissions_per_user):
+        # submissions + ~1.5x comparisons + ~0.9x results + ~10% reports + activity for each + logins
+        comparisons = submissions_per_user * 1.5
+        results = comparisons * 0.9
+        reports = results * 0.1
+        activity = submissions_per_user + comparisons + reports + 8
+        return 1 + submissions_per_user + comparisons + results + reports + activity
+
+    def _build_code_pool(self, variants=8):
+        pool = {}
+        for language, templates in CODE_TEMPLATES.items():
+            bodies = []
+            for index, template in enumerate(templates):
+                for variant in range(variants):
+                    body = template.format(name=f'compute_{index}_{variant}', cls=f'Worker{index}{variant}', n=variant + 2)
+                    body = body * (1 + variant % 4)
+                    blob = SourceBlob.objects.acquire(body, count=0)
+                    bodies.append((body, blob.pk, blob.content_hash, len(body.encode('utf-8')), body.count('\n')))
+            pool[language] = bodies
+        return pool
+
+    def _pick(self, weights):
+        return self.rng.choices(list(weights), weights=list(weights.values()))[0]
+
+    def _take_id(self, model):
+        value = self.next_ids[model]
+        self.next_ids[model] += 1
+        return value
+
+    def _between(self, start, end):
+        return start + (end - start) * self.rng.random()
+
+    def _volume(self):
+        # Log-normal with the requested mean: most users submit a little, a few submit a lot
+        sigma = 1.0
+        mu = math.log(max(self.submissions_per_user, 1)) - sigma ** 2 / 2
+        return max(1, int(self.rng.lognormvariate(mu, sigma)))
+
+    def _score(self):
+        # Mostly unrelated code, with a tail of near-copies
+        if self.rng.random() < 0.04:
+            return self.rng.uniform(85, 100)
+        return self.rng.betavariate(1.6, 4.5) * 100
+
+    def _near(self, score, spread):
+        return min(100.0, max(0.0, score + self.rng.gauss(0, spread)))
+
+    def _segments(self, score, code):
+        if score < 50:
+            return []
+        span = max(1, int(code.count('\n') * score / 200))
+        return [{'source_lines': f'1-{span}', 'target_lines': f'1-{span}', 'content': code[:400]}]
+
+    def _unique_blob(self, rows, text, created):
+        raw = text.encode('utf-8')
+        blob_id = self._take_id(SourceBlob)
+        content_hash = hashlib.sha256(raw).hexdigest()
+        rows[SourceBlob].append({
+            'id': blob_id, 'content_hash': content_hash,
+            'data': zlib.compress(raw, SourceBlob.COMPRESSION_LEVEL), 'size': len(raw),
+            'ref_count': 1, 'created_at': created,
+        })
+        return blob_id, content_hash
+
+    def _activity(self, user_id, activity_type, when, description):
+        rng = self.rng
+        return {
+            'id': self._take_id(UserActivity), 'user_id': user_id, 'activity_type': activity_type,
+            'description': description, 'timestamp': when, 'user_agent': rng.choice(USER_AGENTS),
+            'ip_address': f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+        }
+
+    def _generate_user(self, rows):
+        """Append one user's rows to the per-model lists in rows"""
+        rng = self.rng
+        user_id = self._take_id(CustomUser)
+        joined = self.now - timedelta(days=self.days) * rng.random()
+        user = {
+            'id': user_id, 'username': f'seed{user_id}', 'email': f'seed{user_id}@example.com',
+            'password': self.password, 'first_name': 'Seed', 'last_name': str(user_id),
+            'date_joined': joined, 'created_at': joined, 'updated_at': joined,
+            'last_login': self._between(joined, self.now),
+            'total_submissions': 0, 'total_comparisons': 0, 'completed_comparisons': 0, 'high_similarity_count': 0,
+        }
+        rows[CustomUser].append(user)
+        activities = rows[UserActivity]
+
+        submissions = []
+        submission_texts = {}
+        for _ in range(self._volume()):
+            language = self._pick(LANGUAGE_WEIGHTS)
+            code, blob_id, content_hash, size, lines = rng.choice(self.code_pool[language])
+            created = self._between(joined, self.now)
+            submission_id = self._take_id(CodeSubmission)
+            title = f'solution_{submission_id}.{EXTENSIONS[language]}'
+            if rng.random() < self.unique_fraction:
+                comment = '#' if language == 'python' else '//'
+                code = f'{comment} {title} by seed{user_id}\n{code}'
+                blob_id, content_hash = self._unique_blob(rows, code, created)
+                size, lines = len(code.encode('utf-8')), lines + 1
+            submissions.append({
+                'id': submission_id, 'user_id': user_id, 'title': title, 'language': language,
+                # Content-addressed like real uploads (users.storage), so shared code shares a name
+                'code_file': f'{SOURCE_PREFIX}{content_hash[:2]}/{content_hash}.{EXTENSIONS[language]}',
+                'content_hash': content_hash, 'encoding': 'utf-8', 'blob_id': blob_id, 'file_size': size,
+                'line_count': lines, 'status': 'completed', 'created_at': created, 'updated_at': created,
+            })
+            submission_texts[submission_id] = code
+            activities.append(self._activity(user_id, 'upload', created, f'Uploaded {title}'))
+        rows[CodeSubmission].extend(submissions)
+        user['total_submissions'] = len(submissions)
+
+        for _ in range(int(len(submissions) * rng.uniform(0.5, 2.5))):
+            source = rng.choice(submissions)
+            comparison_type = self._pick(COMPARISON_TYPE_WEIGHTS)
+            target = None if comparison_type == 'single_vs_repo' else rng.choice(submissions)
+            latest = max(source['created_at'], target['created_at']) if target else source['created_at']
+            created = self._between(latest, self.now)
+            status = self._pick(STATUS_WEIGHTS)
+            completed_at = created + timedelta(seconds=rng.uniform(1, 90)) if status == 'completed' else None
+            comparison_id = self._take_id(ComparisonRequest)
+            rows[ComparisonRequest].append({
+                'id': comparison_id, 'user_id': user_id, 'comparison_type': comparison_type,
+                'source_submission_id': source['id'], 'target_submission_id': target['id'] if target else None,
+                'status': status, 'created_at': created, 'completed_at': completed_at,
+                'error_message': 'Analysis timed out' if status == 'failed' else None,
+            })
+            activities.append(self._activity(user_id, 'similarity_check', created, f"Compared {source['title']}"))
+            user['total_comparisons'] += 1
+            if status != 'completed':
+                continue
+            user['completed_comparisons'] += 1
+
+            score = self._score()
+            user['high_similarity_count'] += score >= HIGH_SIMILARITY_SCORE
+            result_id = self._take_id(SimilarityResult)
+            rows[SimilarityResult].append({
+                'id': result_id, 'comparison_id': comparison_id, 'user_id': user_id,
+                'overall_similarity_score': score,
+                'token_similarity': self._near(score, 8),
+                'structural_similarity': self._near(score, 12),
+                'ast_similarity': self._near(score, 10),
+                'ml_similarity': self._near(score, 6),
+                'identical_segments': self._segments(score, submission_texts[source['id']]),
+                'near_identical_segments': self._segments(score * 0.8, submission_texts[source['id']]),
+                'code_metrics': {
+                    'loc_diff': abs(source['line_count'] - (target or source)['line_count']), 'complexity_diff': 0.0,
+                },
+                'created_at': completed_at,
+            })
+
+            if rng.random() < 0.1:
+                report_format = self._pick(REPORT_FORMAT_WEIGHTS)
+                generated = min(completed_at + timedelta(minutes=rng.uniform(1, 600)), self.now)
+                rows[SimilarityReport].append({
+                    'id': self._take_id(SimilarityReport), 'user_id': user_id, 'comparison_id': comparison_id,
+                    'result_id': result_id, 'report_format': report_format, 'status': 'completed', 'progress': 100,
+                    'file_path': f'reports/seed/{comparison_id}.{report_format}',
+                    'file_size': rng.randrange(20_000, 400_000), 'generated_at': generated,
+                })
+                activities.append(self._activity(user_id, 'download_report', generated, 'Downloaded report'))
+
+        for _ in range(1 + int(rng.expovariate(1 / 7))):
+            activities.append(self._activity(user_id, 'login', self._between(joined, self.now), 'Logged in'))
+        if rng.random() < 0.2:
+            activities.append(self._activity(user_id, 'profile_update', self._between(joined, self.now), 'Updated profile'))
+
+    def seed_chunk(self, users):
+        """Generate and insert `users` users with all their rows in one transaction"""
+        rows = {model: [] for model in self.MODELS}
+        for _ in range(users):
+            self._generate_user(rows)
+        # Unique blobs are inserted with their one reference; the shared pool blobs are bumped per chunk
+        references = Counter(
+            row['blob_id'] for row in rows[CodeSubmission] if row['blob_id'] in self.shared_blob_ids
+        )
+        with transaction.atomic():
+            for model in self.MODELS:
+                self.inserters[model].insert(rows[model], self.batch_size)
+            for blob_id, count in references.items():
+                SourceBlob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') + count)
+        return sum(len(model_rows) for model_rows in rows.values())
+
+    def seed(self, users, chunk_users=200, progress=None):
+        """Seed `users` users in chunks; progress(rows_so_far, elapsed_seconds) is called per chunk"""
+        started = time.monotonic()
+        written = 0
+        with bulk_load_session():
+            remaining = users
+            while remaining > 0:
+                chunk = min(chunk_users, remaining)
+                written += self.seed_chunk(chunk)
+                remaining -= chunk
+                if progress:
+                    progress(written, time.monotonic() - started)
+        # Explicit ids leave PostgreSQL sequences behind (MySQL and SQLite track the max id themselves)
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), self.MODELS)
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
+        return written
@@ -0,0 +1,56 @@
+"""
+Signal handlers that maintain the per-user counter caches (see users.counters)
+and the source blob reference counts.
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .counters import HIGH_SIMILARITY_SCORE, bump
+from .models import CodeSubmission, ComparisonRequest, SimilarityResult, SourceBlob
+
+
+@receiver(post_save, sender=CodeSubmission)
+def submission_saved(sender, instance, created, **kwargs):
+    if created:
+        bump(instance.user_id, total_submissions=1)
+
+
+@receiver(post_delete, sender=CodeSubmission)
+def submission_deleted(sender, instance, **kwargs):
+    bump(instance.user_id, total_submissions=-1)
+    # Also runs for queryset and cascade deletes, unlike Model.delete()
+    SourceBlob.objects.release(instance.blob_id)
+
+
+@receiver(post_save, sender=ComparisonRequest)
+def comparison_saved(sender, instance, created, **kwargs):
+    completed = instance.status == 'completed'
+    if created:
+        bump(instance.user_id, total_comparisons=1, completed_comparisons=int(completed))
+    else:
+        was_completed = instance.saved_status == 'completed'
+        if completed != was_completed:
+            bump(instance.user_id, completed_comparisons=1 if completed else -1)
+    instance.saved_status = instance.status
+
+
+@receiver(post_delete, sender=ComparisonRequest)
+def comparison_deleted(sender, instance, **kwargs):
+    bump(
+        instance.user_id,
+        total_comparisons=-1,
+        completed_comparisons=-int(instance.saved_status == 'completed'),
+    )
+
+
+@receiver(post_save, sender=SimilarityResult)
+def result_saved(sender, instance, created, **kwargs):
+    if created and instance.overall_similarity_score >= HIGH_SIMILARITY_SCORE:
+        bump(instance.user_id, high_similarity_count=1)
+
+
+@receiver(post_delete, sender=SimilarityResult)
+def result_deleted(sender, instance, **kwargs):
+    if instance.overall_similarity_score >= HIGH_SIMILARITY_SCORE:
+        bump(instance.user_id, high_similarity_count=-1)
@@ -0,0 +1,55 @@
+"""
+Content-addressed storage for uploaded source files.
+
+Uploads are named after the SHA-256 of their bytes (computed while they
+are ingested, see users.uploads), so the same file uploaded by many users
+is written to disk once and every submission points at that one copy.
+
+Submissions whose text is kept in a SourceBlob only record that name; the
+file itself is written only for uploads that could not be decoded into a
+blob, since nothing would ever delete it when the blob is released.
+"""
+
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+SOURCE_PREFIX = 'sources/'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that reuses an existing file instead of renaming when its content-addressed name is taken"""
+
+    def get_available_name(self, name, max_length=None):
+        if name.startswith(SOURCE_PREFIX):
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if name.startswith(SOURCE_PREFIX) and self.exists(name):
+            # Same name means same bytes
+            return name
+        return super()._save(name, content)
+
+
+source_storage = ContentAddressedStorage()
+
+
+def get_source_storage():
+    return source_storage
+
+
+def source_name(content_hash, filename):
+    """Content-addressed storage name, sources/ab/abcdef....py"""
+    extension = os.path.splitext(filename)[1].lower()
+    return f'{SOURCE_PREFIX}{content_hash[:2]}/{content_hash}{extension}'
+
+
+def source_upload_to(instance, filename):
+    """source_name() when the content hash is known, else a dated path"""
+    if instance.content_hash:
+        return source_name(instance.content_hash, filename)
+    return timezone.now().strftime('submissions/%Y/%m/%d/') + filename
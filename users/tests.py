@@ -1,3 +1,680 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import re
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from base64 import urlsafe_b64encode
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.contrib.messages import get_messages
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from accounts.models import CustomUser, PasswordResetToken
+from reports.models import BatchReport, SimilarityReport
+from .counters import reconcile
+from .management.commands.explain_hot_queries import Command as ExplainHotQueries
+from .models import CodeSubmission, ComparisonRequest, SimilarityMatch, SimilarityResult, SourceBlob
+from .pagination import KeysetPaginator
+from .seeding import seed_volume
+from .storage import get_source_storage, source_name
+from .throttling import active_comparisons, take_token
+from .uploads import ingest_upload
+
+
+class QueryBudgetMixin:
+    """
+    Requests every URL of an app's urls.py as a seeded user and asserts its
+    query budget, and that the count doesn't grow when more data is seeded
+    (the signature of an N+1 query in a listing or template).
+
+    Subclasses set urlconf (the app's urls module) and budgets (URL name ->
+    maximum queries, which must cover every URL), and define
+    url_kwargs(name, kwarg_names) returning the kwargs to reverse a URL with.
+    """
+
+    urlconf = None
+    budgets = {}
+    as_superuser = False
+    initial_volume = 5
+    extra_volume = 20
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not callable(getattr(cls, 'url_kwargs', None)):
+            raise TypeError(f'{cls.__name__} must define url_kwargs(name, kwarg_names)')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('alice', 'alice@example.com', 'pw-alice-123', is_superuser=cls.as_superuser)
+        cls.other_user = CustomUser.objects.create_user('bob', 'bob@example.com', 'pw-bob-123')
+        cls.comparisons = seed_volume(cls.user, cls.initial_volume)
+        cls.comparison = cls.comparisons[0]
+        cls.submission = cls.comparison.source_submission
+        cls.report = SimilarityReport.objects.filter(comparison=cls.comparison).first()
+        cls.batch_report = BatchReport.objects.create(user=cls.user, title='Batch')
+        cls.batch_report.comparisons.set(cls.comparisons)
+        cls.reset_token = PasswordResetToken.objects.create(
+            user=cls.other_user, token='reset-token', expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp(prefix='query_budget_media_')
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def patterns(self):
+        return [p for p in self.urlconf.urlpatterns if isinstance(p, URLPattern)]
+
+    def url_for(self, pattern):
+        kwarg_names = list(pattern.pattern.converters)
+        kwargs = self.url_kwargs(pattern.name, kwarg_names) if kwarg_names else {}
+        return reverse(f'{self.urlconf.app_name}:{pattern.name}', kwargs=kwargs)
+
+    def count_queries(self, url):
+        # Fresh session per URL so e.g. logout can't affect the next request
+        self.client.force_login(self.user)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            if response.streaming:
+                # Iterating the response (not streaming_content) also drains async streams
+                b''.join(response)
+        self.assertLess(response.status_code, 500, f'{url} failed with {response.status_code}')
+        return len(queries), queries
+
+    def test_every_url_has_a_budget(self):
+        names = {pattern.name for pattern in self.patterns()}
+        self.assertEqual(names - set(self.budgets), set(), 'URLs without a query budget')
+
+    def test_query_budgets(self):
+        for pattern in self.patterns():
+            url = self.url_for(pattern)
+            with self.subTest(url=url):
+                count, queries = self.count_queries(url)
+                sql = '\n'.join(q['sql'] for q in queries)
+                self.assertLessEqual(count, self.budgets[pattern.name], f'{url} ran {count} queries:\n{sql}')
+
+    def test_queries_do_not_grow_with_volume(self):
+        urls = [self.url_for(pattern) for pattern in self.patterns()]
+        for url in urls:
+            # Warm-up: views with side effects (e.g. save_comparison) settle after one request
+            self.count_queries(url)
+        before = {url: self.count_queries(url)[0] for url in urls}
+        seed_volume(self.user, self.extra_volume)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url)[0], before[url])
+
+
+class UsersQueryBudgetTests(QueryBudgetMixin, TestCase):
+    from users import urls as urlconf
+
+    budgets = {
+        'login': 5,
+        'register': 5,
+        'logout': 4,
+        'password_reset_request': 5,
+        'password_reset_confirm': 6,
+        'dashboard': 8,
+        'profile': 5,
+        'change_password': 5,
+        'upload': 5,
+        'upload_code': 5,
+        'upload_archive': 5,
+        'submissions': 6,
+        'submission_detail': 6,
+        'submission_references': 7,
+        'delete_submission': 5,
+        'compare': 6,
+        'compare_code': 6,
+        'comparisons': 6,
+        'comparison_detail': 7,
+        'comparison_status': 6,
+        'comparison_events': 6,
+        'comparison_result': 7,
+        'save_comparison': 11,
+        'delete_comparison': 5,
+        'history': 6,
+    }
+
+    def url_kwargs(self, name, kwarg_names):
+        values = {
+            'submission_id': self.submission.submission_id,
+            'comparison_id': self.comparison.request_id,
+            'token': self.reset_token.token,
+        }
+        return {kwarg: values[kwarg] for kwarg in kwarg_names}
+
+
+class UserCounterTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('carol', 'carol@example.com', 'pw-carol-123')
+
+    def counters(self):
+        self.user.refresh_from_db()
+        return [getattr(self.user, field) for field in CustomUser.COUNTER_FIELDS]
+
+    def test_counters_follow_creates_status_changes_and_deletes(self):
+        submission = CodeSubmission.objects.create(
+            user=self.user, title='a.py', language='python', code_file='submissions/a.py', code_text='x = 1'
+        )
+        comparison = ComparisonRequest.objects.create(
+            user=self.user, comparison_type='file_vs_file', source_submission=submission, target_submission=submission
+        )
+        self.assertEqual(self.counters(), [1, 1, 0, 0])
+
+        comparison = ComparisonRequest.objects.get(pk=comparison.pk)
+        comparison.status = 'completed'
+        comparison.save()
+        SimilarityResult.objects.create(comparison=comparison, overall_similarity_score=90)
+        self.assertEqual(self.counters(), [1, 1, 1, 1])
+
+        # A stale full save of the user must not overwrite the counters
+        stale = CustomUser.objects.get(pk=self.user.pk)
+        stale.total_submissions = 0
+        stale.first_name = 'Carol'
+        stale.save()
+        self.assertEqual(self.counters(), [1, 1, 1, 1])
+
+        submission.delete()
+        self.assertEqual(self.counters(), [0, 0, 0, 0])
+
+    def test_reconcile_repairs_drift(self):
+        seed_volume(self.user, 3)
+        expected = self.counters()
+        CustomUser.objects.filter(pk=self.user.pk).update(total_comparisons=99)
+        self.assertEqual(len(reconcile()), 1)
+        self.assertEqual(self.counters(), expected)
+
+
+
+class SourceBlobTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('erin', 'erin@example.com', 'pw-erin-123')
+
+    def submit(self, text, title='a.py'):
+        return CodeSubmission.objects.create(
+            user=self.user, title=title, language='python', code_file=f'submissions/{title}', code_text=text
+        )
+
+    def test_identical_sources_share_one_compressed_blob(self):
+        text = 'def f(x):\n    return x * 2\n' * 200
+        first, second = self.submit(text), self.submit(text, 'b.py')
+        other = self.submit('print(1)\n', 'c.py')
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertNotEqual(first.blob_id, other.blob_id)
+        blob = SourceBlob.objects.get(pk=first.blob_id)
+        self.assertEqual(blob.ref_count, 2)
+        self.assertLess(len(bytes(blob.data)), len(text) // 10)
+        self.assertIsNone(CodeSubmission.objects.with_code().get(pk=first.pk).inline_text)
+
+        # Listings don't load the text; code_text decompresses it on access
+        listed = CodeSubmission.objects.get(pk=first.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(listed.code_text, text)
+
+    def test_deletes_release_references(self):
+        first, second = self.submit('x = 1\n'), self.submit('x = 1\n', 'b.py')
+        blob_id = first.blob_id
+        first.delete()
+        self.assertEqual(SourceBlob.objects.get(pk=blob_id).ref_count, 1)
+        CodeSubmission.objects.filter(pk=second.pk).delete()
+        self.assertFalse(SourceBlob.objects.filter(pk=blob_id).exists())
+
+    def test_editing_text_moves_the_reference(self):
+        submission = self.submit('x = 1\n')
+        old_blob = submission.blob_id
+        submission.code_text = 'x = 2\n'
+        submission.save()
+        self.assertNotEqual(submission.blob_id, old_blob)
+        self.assertFalse(SourceBlob.objects.filter(pk=old_blob).exists())
+        self.assertEqual(CodeSubmission.objects.get(pk=submission.pk).code_text, 'x = 2\n')
+
+class UploadIngestTests(TestCase):
+
+    def test_ingest_streams_chunks(self):
+        text = 'naïve = "café"\n' * 10000 + 'last_line = 1'
+        raw = text.encode('utf-8')
+        upload = ContentFile(raw, name='a.py')
+        # Small chunks split multi-byte characters across chunk boundaries
+        upload.DEFAULT_CHUNK_SIZE = 1000
+        ingested = ingest_upload(upload)
+        self.assertEqual(ingested.text, text)
+        self.assertEqual(ingested.encoding, 'utf-8')
+        self.assertEqual(ingested.size, len(raw))
+        self.assertEqual(ingested.line_count, len(text.splitlines()))
+        self.assertEqual(ingested.content_hash, hashlib.sha256(raw).hexdigest())
+
+    def test_non_utf8_falls_back_to_detection(self):
+        text = 'café = "déjà vu"\n' * 200
+        ingested = ingest_upload(ContentFile(text.encode('latin-1'), name='b.py'))
+        self.assertNotEqual(ingested.encoding, 'utf-8')
+        self.assertIn('caf', ingested.text)
+        self.assertEqual(ingested.line_count, 200)
+
+    def test_size_limit(self):
+        with self.assertRaises(ValidationError):
+            ingest_upload(ContentFile(b'x' * 2000, name='c.py'), max_size=1000)
+
+    def test_oversized_upload_is_rejected(self):
+        user = CustomUser.objects.create_user('dave', 'dave@example.com', 'pw-dave-123')
+        self.client.force_login(user)
+        with override_settings(MAX_UPLOAD_SIZE=1000):
+            response = self.client.post(reverse('users:upload_code'), {
+                'title': 'big.py', 'language': 'python',
+                'code_file': SimpleUploadedFile('big.py', b'x = 1\n' * 1000),
+            }, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(CodeSubmission.objects.filter(user=user).exists())
+
+    def test_blob_backed_uploads_write_no_file(self):
+        user = CustomUser.objects.create_user('dora', 'dora@example.com', 'pw-dora-123')
+        self.client.force_login(user)
+        raw = b'x = 1\n'
+        with tempfile.TemporaryDirectory(prefix='upload_media_') as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            self.client.post(reverse('users:upload_code'), {
+                'title': 'ok.py', 'language': 'python', 'code_file': SimpleUploadedFile('ok.py', raw),
+            }, HTTP_HOST='localhost')
+            submission = CodeSubmission.objects.get(user=user)
+            self.assertEqual(submission.code_file.name, source_name(hashlib.sha256(raw).hexdigest(), 'ok.py'))
+            self.assertFalse(get_source_storage().exists(submission.code_file.name))
+        self.assertEqual(submission.code_text, 'x = 1\n')
+
+
+class ArchiveUploadTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('frank', 'frank@example.com', 'pw-frank-123')
+        self.client.force_login(self.user)
+        self.media_root = tempfile.mkdtemp(prefix='archive_media_')
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+    def upload(self, name, data, **fields):
+        return self.client.post(reverse('users:upload_archive'), {
+            'archive': SimpleUploadedFile(name, data), **fields,
+        }, HTTP_HOST='localhost')
+
+    def zip_bytes(self, files):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, content in files.items():
+                archive.writestr(name, content)
+        return buffer.getvalue()
+
+    def test_zip_creates_one_submission_per_source_file(self):
+        data = self.zip_bytes({
+            'hw1/alice.py': 'def add(a, b):\n    return a + b\n',
+            'hw1/copy/alice.py': 'def add(a, b):\n    return a + b\n',
+            'hw1/Bob.java': 'class Bob {}\n',
+            'hw1/util.h': 'int add(int a, int b);\n',
+            'hw1/README.md': '# notes\n',
+            '__MACOSX/hw1/._alice.py': 'junk',
+        })
+        response = self.upload('hw1.zip', data)
+        self.assertRedirects(response, reverse('users:submissions'), fetch_redirect_response=False)
+
+        submissions = {s.title: s for s in CodeSubmission.objects.filter(user=self.user)}
+        self.assertEqual(set(submissions), {'hw1/alice.py', 'hw1/copy/alice.py', 'hw1/Bob.java', 'hw1/util.h'})
+        self.assertEqual(submissions['hw1/Bob.java'].language, 'java')
+        self.assertEqual(submissions['hw1/util.h'].language, 'cpp')
+        self.assertEqual(submissions['hw1/alice.py'].line_count, 2)
+
+        # Identical files share the blob and the content-addressed name; only the blob is stored
+        first, copy = submissions['hw1/alice.py'], submissions['hw1/copy/alice.py']
+        self.assertEqual(first.blob_id, copy.blob_id)
+        self.assertEqual(first.code_file.name, copy.code_file.name)
+        self.assertFalse(get_source_storage().exists(first.code_file.name))
+        self.assertEqual(SourceBlob.objects.get(pk=first.blob_id).ref_count, 2)
+        self.assertEqual(CodeSubmission.objects.with_code().get(pk=first.pk).code_text, 'def add(a, b):\n    return a + b\n')
+        self.assertEqual(reconcile(dry_run=True), [])
+
+        messages = [str(m) for m in response.wsgi_request._messages]
+        self.assertTrue(messages[0].startswith('Imported 4 files'))
+        self.assertIn('hw1/README.md', messages[1])
+
+    def test_tar_uses_the_chosen_language_for_unknown_extensions(self):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+            for name, content in (('lab/a.txt', b'print(1)\n'), ('lab/b.js', b'let b = 2;\n')):
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                archive.addfile(info, io.BytesIO(content))
+        self.upload('lab.tar.gz', buffer.getvalue(), language='python')
+        languages = dict(CodeSubmission.objects.filter(user=self.user).values_list('title', 'language'))
+        self.assertEqual(languages, {'lab/a.txt': 'python', 'lab/b.js': 'javascript'})
+
+    def test_invalid_archives_create_nothing(self):
+        self.upload('broken.zip', b'not a zip file')
+        self.upload('empty.zip', self.zip_bytes({'README.md': 'nothing here'}))
+        with override_settings(MAX_ARCHIVE_FILES=1):
+            self.upload('many.zip', self.zip_bytes({'a.py': 'a = 1', 'b.py': 'b = 2'}))
+        self.assertFalse(CodeSubmission.objects.filter(user=self.user).exists())
+        self.assertFalse(SourceBlob.objects.exists())
+
+
+@override_settings(COMPARISON_STATUS_POLL_INTERVAL=0.01, COMPARISON_EVENTS_HEARTBEAT=0.05)
+class ComparisonStatusTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('mia', 'mia@example.com', 'pw-mia-123')
+        self.submission = submission = CodeSubmission.objects.create(
+            user=self.user, title='a.py', language='python', code_file='submissions/a.py', code_text='x = 1\n'
+        )
+        self.comparison = ComparisonRequest.objects.create(
+            user=self.user, comparison_type='multiple_vs_multiple', source_submission=submission, status='processing'
+        )
+
+    async def test_events_stream_progress_until_done(self):
+        client = AsyncClient(headers={'host': 'localhost'})
+        await client.aforce_login(self.user)
+        response = await client.get(reverse('users:comparison_events', args=[self.comparison.request_id]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+
+        async def next_event():
+            while True:
+                chunk = (await anext(events)).decode()
+                if chunk.startswith('event:'):
+                    name, data = chunk.split('\n')[:2]
+                    return name.split(': ')[1], json.loads(data.split(': ', 1)[1])
+
+        self.assertEqual(await next_event(), ('status', {
+            'status': 'processing', 'progress': 0, 'error_message': None, 'completed_at': None, 'queue_position': None,
+        }))
+        comparisons = ComparisonRequest.objects.filter(pk=self.comparison.pk)
+        await comparisons.aupdate(progress=40)
+        self.assertEqual((await next_event())[1]['progress'], 40)
+
+        # Still running: the result isn't there yet
+        result_url = reverse('users:comparison_result', args=[self.comparison.request_id])
+        self.assertEqual((await client.get(result_url)).status_code, 202)
+
+        await SimilarityResult.objects.acreate(comparison=self.comparison, overall_similarity_score=91.0)
+        await SimilarityMatch.objects.acreate(
+            comparison=self.comparison, source_submission=self.submission, target_submission=self.submission, score=91.0, rank=1
+        )
+        await comparisons.aupdate(status='completed', progress=100)
+        name, data = await next_event()
+        self.assertEqual((name, data['status'], data['result_url']), ('done', 'completed', result_url))
+        with self.assertRaises(StopAsyncIteration):
+            await next_event()
+
+        response = await client.get(result_url)
+        self.assertEqual(response.json()['result']['overall_similarity_score'], 91.0)
+        self.assertEqual(response.json()['matches'][0]['source']['title'], 'a.py')
+        status = await client.get(reverse('users:comparison_status', args=[self.comparison.request_id]))
+        self.assertEqual(status.json()['progress'], 100)
+
+    def test_other_users_comparisons_are_not_found(self):
+        other = CustomUser.objects.create_user('ned', 'ned@example.com', 'pw-ned-123')
+        self.client.force_login(other)
+        for name in ('comparison_status', 'comparison_events', 'comparison_result'):
+            url = reverse(f'users:{name}', args=[self.comparison.request_id])
+            self.assertEqual(self.client.get(url, HTTP_HOST='localhost').status_code, 404)
+        self.client.logout()
+        response = self.client.get(reverse('users:comparison_status', args=[self.comparison.request_id]), HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 302)
+
+
+class DeferredFieldTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_superuser('max', 'max@example.com', 'pw-max-123')
+        self.client.force_login(self.user)
+        submission = CodeSubmission.objects.create(
+            user=self.user, title='a.py', language='python', code_file='submissions/a.py', code_text='x = 1\n'
+        )
+        self.comparison = ComparisonRequest.objects.create(
+            user=self.user, comparison_type='file_vs_file', source_submission=submission,
+            target_submission=submission, status='completed',
+        )
+        SimilarityResult.objects.create(
+            comparison=self.comparison, overall_similarity_score=90.0, visualization_data={'pairs': [1, 2]}
+        )
+        # Inline source text, as rows from before SourceBlob have
+        CodeSubmission.objects.filter(pk=submission.pk).update(blob=None, inline_text='legacy = 1\n')
+
+    def test_listings_leave_out_the_heavy_columns(self):
+        heavy = ('code_text', 'source_blobs', *SimilarityResult.HEAVY_FIELDS)
+        for name in ('users:submissions', 'users:comparisons', 'users:history',
+                     'admins:submissions', 'admins:comparisons'):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(reverse(name), HTTP_HOST='localhost').status_code, 200)
+            sql = ' '.join(query['sql'] for query in queries.captured_queries)
+            self.assertFalse([column for column in heavy if column in sql], name)
+
+    def test_relations_are_deferred_and_load_on_access(self):
+        comparison = ComparisonRequest.objects.get(pk=self.comparison.pk)
+        with self.assertNumQueries(1):
+            submission = comparison.source_submission
+        self.assertEqual(submission.get_deferred_fields(), {'inline_text'})
+        with self.assertNumQueries(1):
+            result = comparison.result
+        self.assertEqual(result.get_deferred_fields(), set(SimilarityResult.HEAVY_FIELDS))
+        # Deferred columns are still there when asked for
+        with self.assertNumQueries(1):
+            self.assertEqual(submission.code_text, 'legacy = 1\n')
+        with self.assertNumQueries(1):
+            self.assertEqual(result.visualization_data, {'pairs': [1, 2]})
+
+    def test_opting_back_in(self):
+        with self.assertNumQueries(1):
+            submission = CodeSubmission.objects.with_code().get(user=self.user)
+            self.assertEqual(submission.code_text, 'legacy = 1\n')
+        with self.assertNumQueries(1):
+            result = SimilarityResult.objects.with_payload().get(comparison=self.comparison)
+            self.assertEqual(result.visualization_data, {'pairs': [1, 2]})
+        with self.assertNumQueries(1):
+            comparison = ComparisonRequest.objects.with_submissions().with_result().get(pk=self.comparison.pk)
+            self.assertEqual(comparison.source_submission.get_deferred_fields(), {'inline_text'})
+            self.assertEqual(comparison.result.get_deferred_fields(), set(SimilarityResult.HEAVY_FIELDS))
+
+
+class KeysetPaginatorTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('kim', 'kim@example.com', 'pw-kim-123')
+        other = CustomUser.objects.create_user('lou', 'lou@example.com', 'pw-lou-123')
+        base = timezone.make_aware(datetime(2026, 1, 1, 12, 0))
+        # Seven submissions, created in pairs sharing a timestamp, plus someone else's
+        for i in range(7):
+            submission = self.submit(self.user, i)
+            CodeSubmission.objects.filter(pk=submission.pk).update(created_at=base + timedelta(minutes=i // 2))
+        self.submit(other, 7)
+        self.expected = list(
+            CodeSubmission.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('pk', flat=True)
+        )
+        self.paginator = KeysetPaginator(CodeSubmission.objects.filter(user=self.user), per_page=3)
+
+    def submit(self, user, i):
+        return CodeSubmission.objects.create(
+            user=user, title=f'{i}.py', language='python', code_file=f'submissions/{i}.py', code_text=f'x = {i}\n'
+        )
+
+    def pks(self, page):
+        return [submission.pk for submission in page]
+
+    def test_forward_and_backward_through_ties(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next:
+            with self.assertNumQueries(1):
+                pages.append(self.paginator.page(pages[-1].next_cursor))
+        expected = [self.expected[:3], self.expected[3:6], self.expected[6:]]
+        self.assertEqual([self.pks(page) for page in pages], expected)
+        self.assertFalse(pages[0].has_previous)
+
+        # Back from the last page, through the ties at the page edges
+        page = pages[-1]
+        back = []
+        while page.has_previous:
+            page = self.paginator.page(page.previous_cursor)
+            back.append(self.pks(page))
+        self.assertEqual(back, expected[-2::-1])
+        self.assertTrue(page.has_next)
+
+    def test_invalid_and_tampered_cursors(self):
+        first = self.pks(self.paginator.page())
+
+        def cursor(value):
+            return urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+        for bad in (
+            'not base64!', cursor('plain string'), cursor({'next': 1}), cursor(['sideways', ['2026-01-01', 1]]),
+            cursor(['next', ['2026-01-01T12:00:00']]), cursor(['next', ['yesterday', 1]]),
+            cursor(['next', [None, 1]]), cursor(['next', ['2026-01-01T12:00:00', 'one']]),
+        ):
+            self.assertIsNone(self.paginator.decode_cursor(bad), bad)
+            self.assertEqual(self.pks(self.paginator.page(bad)), first)
+
+        # A well-formed cursor only moves within the queryset: another user's rows stay out
+        anywhere = self.paginator.encode_cursor('next', ['2100-01-01T00:00:00+00:00', 10 ** 12])
+        self.assertEqual(self.pks(self.paginator.page(anywhere)), first)
+        before_everything = self.paginator.encode_cursor('next', ['2000-01-01T00:00:00+00:00', 0])
+        self.assertEqual(self.pks(self.paginator.page(before_everything)), [])
+
+
+class AdmissionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('olga', 'olga@example.com', 'pw-olga-123')
+        self.client.force_login(self.user)
+        self.submission = CodeSubmission.objects.create(
+            user=self.user, title='a.py', language='python', code_file='submissions/a.py', code_text='x = 1\n'
+        )
+
+    def queue(self, user, status='pending'):
+        return ComparisonRequest.objects.create(
+            user=user, comparison_type='multiple_vs_multiple', source_submission=self.submission, status=status
+        )
+
+    def test_token_bucket_allows_a_burst_then_one_per_interval(self):
+        with override_settings(COMPARE_RATE_PER_MINUTE=6, COMPARE_BURST=2):
+            self.assertEqual([take_token(1, 'compare', now=100.0) for _ in range(2)], [0, 0])
+            self.assertAlmostEqual(take_token(1, 'compare', now=100.0), 10.0)
+            # Other users and actions have their own buckets
+            self.assertEqual(take_token(2, 'compare', now=100.0), 0)
+            self.assertEqual(take_token(1, 'upload', now=100.0), 0)
+            self.assertAlmostEqual(take_token(1, 'compare', now=105.0), 5.0)
+            self.assertEqual(take_token(1, 'compare', now=110.0), 0)
+
+    @override_settings(COMPARE_RATE_PER_MINUTE=60, COMPARE_BURST=2)
+    def test_compare_is_rate_limited(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post(reverse('users:compare_code'), HTTP_HOST='localhost').status_code, 302)
+        response = self.client.post(reverse('users:compare_code'), HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertContains(response, 'Too many requests', status_code=429)
+
+    @override_settings(UPLOAD_RATE_PER_MINUTE=1, UPLOAD_BURST=1)
+    def test_uploads_are_rate_limited(self):
+        def upload():
+            return self.client.post(reverse('users:upload_code'), {
+                'title': 'b.py', 'language': 'python', 'code_file': SimpleUploadedFile('b.py', b'y = 2\n'),
+            }, HTTP_HOST='localhost')
+
+        with tempfile.TemporaryDirectory(prefix='admission_media_') as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            self.assertEqual(upload().status_code, 302)
+            self.assertEqual(upload().status_code, 429)
+        self.assertEqual(CodeSubmission.objects.filter(user=self.user).count(), 2)
+
+    @override_settings(MAX_ACTIVE_COMPARISONS_PER_USER=1)
+    def test_users_with_too_many_comparisons_running_are_refused(self):
+        self.queue(self.user, status='processing')
+        response = self.client.post(reverse('users:compare_code'), {
+            'source_submission': self.submission.submission_id, 'target_submission': self.submission.submission_id,
+        }, HTTP_HOST='localhost')
+        self.assertContains(response, '1 comparisons queued or running', status_code=429)
+        self.assertEqual(ComparisonRequest.objects.count(), 1)
+
+    def test_comparisons_lost_with_their_process_do_not_count(self):
+        lost = self.queue(self.user, status='processing')
+        self.queue(self.user)
+        self.assertEqual(active_comparisons(self.user), 2)
+        ComparisonRequest.objects.filter(pk=lost.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(active_comparisons(self.user), 1)
+
+    def test_queued_comparisons_report_their_place_in_the_queue(self):
+        other = CustomUser.objects.create_user('pia', 'pia@example.com', 'pw-pia-123')
+        self.queue(other)
+        self.queue(other)
+        # The job stays queued: its on_commit submission doesn't run in the test transaction
+        response = self.client.post(reverse('users:compare_code'), {
+            'comparison_type': 'multiple_vs_multiple',
+            'source_submissions': [self.submission.submission_id],
+            'target_submissions': [self.submission.submission_id],
+        }, HTTP_HOST='localhost')
+        # Ahead of the other user's second job: each user's first job goes first
+        self.assertIn('(position 2 in the queue)', [str(m) for m in get_messages(response.wsgi_request)][0])
+        comparison = ComparisonRequest.objects.filter(user=self.user).get()
+        status = self.client.get(reverse('users:comparison_status', args=[comparison.request_id]), HTTP_HOST='localhost')
+        self.assertEqual(status.json()['queue_position'], 2)
+
+
+class ExplainHotQueriesTests(TestCase):
+
+    def test_seeded_hot_queries_use_indexes_and_roll_back(self):
+        out = io.StringIO()
+        call_command('explain_hot_queries', seed=5, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len([line for line in lines if line.startswith('indexed')]), 11)
+        self.assertNotIn('FULL SCAN', out.getvalue())
+        self.assertFalse(CustomUser.objects.exists())
+
+    def test_full_scans_fail_the_command(self):
+        CustomUser.objects.create_user('nia', 'nia@example.com', 'pw-nia-123')
+        unindexed = [('Submissions by title', CodeSubmission.objects.filter(title='a.py'))]
+        out = io.StringIO()
+        with mock.patch.object(ExplainHotQueries, 'hot_queries', return_value=unindexed), \
+                self.assertRaisesMessage(CommandError, '1 hot query fell back to a full table scan'):
+            call_command('explain_hot_queries', stdout=out)
+        self.assertIn('FULL SCAN  Submissions by title: code_submissions', out.getvalue())
+
+    def test_needs_data_to_explain(self):
+        with self.assertRaisesMessage(CommandError, 'No users to explain against'):
+            call_command('explain_hot_queries', stdout=io.StringIO())
+
+
+class SeedVolumeCommandTests(TestCase):
+
+    def test_reports_the_rows_it_inserted(self):
+        before = {model: model.objects.count() for model in (SourceBlob, CustomUser, CodeSubmission, ComparisonRequest)}
+        out = io.StringIO()
+        call_command('seed_volume', users=3, submissions_per_user=4, random_seed=7, stdout=out)
+
+        reported = dict(re.findall(r'^  (\w+\.\w+) +([\d,]+)$', out.getvalue(), re.MULTILINE))
+        # SourceBlob includes the template pool's blobs, which are inserted before the first chunk
+        for model, count in before.items():
+            self.assertEqual(int(reported[model._meta.label].replace(',', '')), model.objects.count() - count)
+        total = sum(int(count.replace(',', '')) for count in reported.values())
+        self.assertIn(f'Created {total:,} rows', out.getvalue())
+        self.assertEqual(CustomUser.objects.count(), before[CustomUser] + 3)
@@ -0,0 +1,52 @@
+"""
+Per-user admission control for the views that start analysis work.
+
+take_token() is a token bucket per user and action kept in the cache: a
+user may make `burst` requests at once, then one every 60 / per_minute
+seconds. The bucket is stored as the time it is full again (the generic
+cell rate algorithm), so a take is one cache read and one write. The lock
+serializes takes within a process; with a shared cache (memcached, redis)
+two processes can race between the read and the write and let an extra
+request through, which a rate limit can live with.
+
+active_comparisons() counts what a user has queued or running, for the
+MAX_ACTIVE_COMPARISONS_PER_USER limit; comparisons lost with their process
+(see similarity_engine.jobs) don't count.
+"""
+
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from similarity_engine.jobs import live_comparisons
+
+RATE_LIMITS = {
+    # action: settings holding (requests per minute, burst)
+    'compare': ('COMPARE_RATE_PER_MINUTE', 'COMPARE_BURST'),
+    'upload': ('UPLOAD_RATE_PER_MINUTE', 'UPLOAD_BURST'),
+}
+
+_lock = threading.Lock()
+
+
+def take_token(user_id, action, now=None):
+    """Take one of the user's tokens for action; returns 0 if allowed, else the seconds until a token frees up"""
+    per_minute, burst = (getattr(settings, name) for name in RATE_LIMITS[action])
+    interval = 60 / per_minute
+    now = time.time() if now is None else now
+    key = f'throttling:{action}:{user_id}'
+    with _lock:
+        full_at = max(cache.get(key, now), now) + interval
+        wait = full_at - now - burst * interval
+        if wait > 0:
+            return wait
+        cache.set(key, full_at, timeout=math.ceil(full_at - now))
+    return 0
+
+
+def active_comparisons(user):
+    """The user's comparisons queued or running (one query)"""
+    return live_comparisons().filter(user=user).count()
@@ -0,0 +1,187 @@
+"""
+Streaming ingest of uploaded source files.
+
+An upload is read exactly once, chunk by chunk: each chunk updates the
+SHA-256 digest, byte size and line count and is decoded incrementally, so
+apart from the decoded text (which is stored in code_text) no more than
+one chunk of the file is held in memory. The encoding is detected from a
+prefix sample (strict UTF-8 first, then chardet). Uploads over
+their upload_limit() are cut off by UploadSizeLimitHandler while the request
+body is still being received, before they reach memory or a temp file.
+"""
+
+import codecs
+import hashlib
+
+import chardet
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.template.defaultfilters import filesizeformat
+
+ENCODING_SAMPLE_SIZE = 64 * 1024
+# Form field that takes zip/tar archives (see users.archives), which have their own size limit
+ARCHIVE_FIELD = 'archive'
+
+
+class IngestedFile:
+    """Metadata and decoded text of one ingested upload"""
+
+    def __init__(self, text, content_hash, size, line_count, encoding):
+        self.text = text
+        self.content_hash = content_hash
+        self.size = size
+        self.line_count = line_count
+        self.encoding = encoding
+
+    def apply_to(self, submission):
+        submission.code_text = self.text
+        submission.content_hash = self.content_hash
+        submission.file_size = self.size
+        submission.line_count = self.line_count
+        submission.encoding = self.encoding
+
+
+def detect_encoding(sample):
+    """Encoding of a prefix sample: UTF-8 when it decodes as such, else chardet's guess"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # final=False: the sample may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    guess = chardet.detect(sample).get('encoding')
+    try:
+        return codecs.lookup(guess).name if guess else 'latin-1'
+    except LookupError:
+        return 'latin-1'
+
+
+def upload_limit(field_name):
+    """Largest upload accepted for a form field"""
+    if field_name == ARCHIVE_FIELD:
+        return settings.MAX_ARCHIVE_UPLOAD_SIZE
+    return settings.MAX_UPLOAD_SIZE
+
+
+def too_large_error(size, max_size):
+    return ValidationError(
+        f'File is too large ({filesizeformat(size)}); the limit is {filesizeformat(max_size)}.',
+        code='file_too_large',
+    )
+
+
+def ingest_upload(file, max_size=None):
+    """
+    Read a File/UploadedFile once and return an IngestedFile. With max_size,
+    raises ValidationError as soon as more than max_size bytes have been read.
+    """
+    if max_size is not None and getattr(file, 'size', None) and file.size > max_size:
+        raise too_large_error(file.size, max_size)
+
+    digest = hashlib.sha256()
+    size = newlines = 0
+    decoder = encoding = None
+    sample = b''
+    parts = []
+    last_char = ''
+
+    def decode(data, final=False):
+        nonlocal newlines, last_char
+        text = decoder.decode(data, final=final)
+        if text:
+            newlines += text.count('\n')
+            last_char = text[-1]
+            parts.append(text)
+
+    try:
+        file.seek(0)
+    except Exception:
+        pass
+
+    for chunk in file.chunks():
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise too_large_error(size, max_size)
+        digest.update(chunk)
+
+        if decoder is None:
+            # Hold back only until the sample is big enough to detect the encoding
+            sample += chunk
+            if len(sample) < ENCODING_SAMPLE_SIZE:
+                continue
+            encoding = detect_encoding(sample)
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            decode(sample)
+            sample = b''
+        else:
+            decode(chunk)
+
+    if decoder is None:
+        encoding = detect_encoding(sample) if sample else 'utf-8'
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        decode(sample)
+    decode(b'', final=True)
+
+    try:
+        file.seek(0)
+    except Exception:
+        pass
+
+    # Same count as str.splitlines() for \n-terminated text: a final unterminated line counts too
+    line_count = newlines + (1 if last_char and last_char != '\n' else 0)
+    return IngestedFile(''.join(parts), digest.hexdigest(), size, line_count, encoding)
+
+
+class OversizedUpload(UploadedFile):
+    """Stand-in for a file that UploadSizeLimitHandler stopped receiving"""
+
+    def __init__(self, name, content_type, size, charset=None, content_type_extra=None):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+
+    def open(self, mode=None):
+        return self
+
+    def chunks(self, chunk_size=None):
+        return iter(())
+
+    def read(self, *args, **kwargs):
+        return b''
+
+    def seek(self, *args, **kwargs):
+        return 0
+
+    def close(self):
+        pass
+
+
+class UploadSizeLimitHandler(FileUploadHandler):
+    """
+    First upload handler: passes chunks through to the normal handlers until
+    a file exceeds its upload_limit(), then drops the rest of that file and
+    returns an OversizedUpload for it (which form validation rejects), so
+    an oversized file never fills memory or a temporary file.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.limit = upload_limit(self.field_name)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.limit:
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.received > self.limit:
+            return OversizedUpload(
+                self.file_name, self.content_type, self.received, self.charset, self.content_type_extra
+            )
+        return None
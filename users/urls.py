@@ -21,8 +21,10 @@ urlpatterns = [
     path('upload/', views.upload_code_view, name='upload'),
     # alias expected by templates
     path('upload/', views.upload_code_view, name='upload_code'),
+    path('upload/archive/', views.upload_archive_view, name='upload_archive'),
     path('submissions/', views.submissions_view, name='submissions'),
     path('submission/<uuid:submission_id>/', views.submission_detail_view, name='submission_detail'),
+    path('submission/<uuid:submission_id>/references/', views.submission_references_view, name='submission_references'),
     path('submission/<uuid:submission_id>/delete/', views.delete_submission_view, name='delete_submission'),
     
     # Code Comparison
@@ -31,6 +33,9 @@ urlpatterns = [
     path('compare/', views.compare_view, name='compare_code'),
     path('comparisons/', views.comparisons_view, name='comparisons'),
     path('comparison/<uuid:comparison_id>/', views.comparison_detail_view, name='comparison_detail'),
+    path('comparison/<uuid:comparison_id>/status/', views.comparison_status_view, name='comparison_status'),
+    path('comparison/<uuid:comparison_id>/events/', views.comparison_events_view, name='comparison_events'),
+    path('comparison/<uuid:comparison_id>/result/', views.comparison_result_view, name='comparison_result'),
     path('comparison/<uuid:comparison_id>/save/', views.save_comparison_view, name='save_comparison'),
     path('comparison/<uuid:comparison_id>/delete/', views.delete_comparison_view, name='delete_comparison'),
     
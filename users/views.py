@@ -1,16 +1,33 @@
+import json
+import math
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
 from django.contrib.auth.forms import AuthenticationForm, PasswordChangeForm
 from accounts.forms import UserRegistrationForm
 from django.contrib.auth import update_session_auth_hash
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.db import connections, transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from .models import CodeSubmission, ComparisonRequest, SimilarityResult, SavedComparison
-from .forms import CodeSubmissionForm
-import difflib
-import re
-import ast as _ast
-from django.utils import timezone
+from .forms import ArchiveUploadForm, CodeSubmissionForm
+from .counters import HIGH_SIMILARITY_SCORE
+from .archives import ingest_archive
+from .pagination import KeysetPaginator
+from .throttling import active_comparisons, take_token
+from similarity_engine.jobs import get_scheduler, queue_positions, queued_jobs, submit_set_comparison
+from similarity_engine.pipeline import read_submission_text, run_file_comparison
+from similarity_engine.progress import FINISHED, STATUS_FIELDS, add_queue_positions, status_snapshot, watch_comparison
+from similarity_engine.references import search_references
 
 
 def login_view(request):
@@ -93,31 +110,25 @@ def dashboard_view(request):
     # Get user's recent comparisons
     recent_comparisons = ComparisonRequest.objects.filter(
         user=request.user
-    ).order_by('-created_at')[:5]
+    ).with_submissions().with_result().order_by('-created_at')[:5]
     
-    # Statistics
-    total_submissions = CodeSubmission.objects.filter(user=request.user).count()
-    total_comparisons = ComparisonRequest.objects.filter(user=request.user).count()
-    completed_comparisons = ComparisonRequest.objects.filter(
-        user=request.user, 
-        status='completed'
-    ).count()
-
     # High similarity results for user's dashboard (show top recent)
     try:
         high_similarity = SimilarityResult.objects.filter(
-            comparison__user=request.user,
-            overall_similarity_score__gte=75
-        ).order_by('-created_at')[:5]
+            user=request.user,
+            overall_similarity_score__gte=HIGH_SIMILARITY_SCORE
+        ).with_comparison().order_by('-created_at')[:5]
     except Exception:
         high_similarity = []
     
+    # Statistics come from the user's counter caches (see users.counters)
     context = {
         'recent_submissions': recent_submissions,
         'recent_comparisons': recent_comparisons,
-        'total_submissions': total_submissions,
-        'total_comparisons': total_comparisons,
-        'completed_comparisons': completed_comparisons,
+        'total_submissions': request.user.total_submissions,
+        'total_comparisons': request.user.total_comparisons,
+        'completed_comparisons': request.user.completed_comparisons,
+        'high_similarity_count': request.user.high_similarity_count,
         'high_similarity': high_similarity,
     }
     
@@ -136,17 +147,7 @@ def profile_view(request):
         messages.success(request, 'Profile updated successfully!')
         return redirect('users:profile')
     
-    # Statistics
-    stats = {
-        'total_submissions': CodeSubmission.objects.filter(user=request.user).count(),
-        'total_comparisons': ComparisonRequest.objects.filter(user=request.user).count(),
-        'completed_comparisons': ComparisonRequest.objects.filter(
-            user=request.user, 
-            status='completed'
-        ).count(),
-    }
-    
-    return render(request, 'accounts/profile.html', {'stats': stats})
+    return render(request, 'accounts/profile.html')
 
 
 @login_required
@@ -168,10 +169,36 @@ def change_password_view(request):
     return render(request, 'accounts/change_password.html', {'form': form})
 
 
+def _refused(request, page, message, retry_after=None):
+    """page(request) with message, as a 429 (Too Many Requests) response"""
+    messages.error(request, message)
+    response = page(request)
+    response.status_code = 429
+    if retry_after:
+        response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+def _throttled(request, action, page):
+    """A _refused() response if the user is out of tokens for action (see users.throttling), else None"""
+    wait = take_token(request.user.pk, action)
+    if wait:
+        return _refused(request, page, f'Too many requests; try again in {math.ceil(wait)} seconds.', wait)
+    return None
+
+
+def _upload_page(request):
+    return render(request, 'users/upload_code.html', {'form': CodeSubmissionForm()})
+
+
 @login_required
 def upload_code_view(request):
     """Upload code submission"""
     if request.method == 'POST':
+        # Before the form reads request.FILES, so a refused upload isn't parsed
+        refused = _throttled(request, 'upload', _upload_page)
+        if refused:
+            return refused
         form = CodeSubmissionForm(request.POST, request.FILES)
         if form.is_valid():
             submission = form.save(commit=False)
@@ -179,18 +206,54 @@ def upload_code_view(request):
             submission.save()
             messages.success(request, 'Code uploaded successfully!')
             return redirect('users:submissions')
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
     else:
         form = CodeSubmissionForm()
     
     return render(request, 'users/upload_code.html', {'form': form})
 
 
+@login_required
+def upload_archive_view(request):
+    """Upload a zip/tar archive of code files as one submission per file"""
+    if request.method == 'POST':
+        refused = _throttled(request, 'upload', _upload_page)
+        if refused:
+            return refused
+        form = ArchiveUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                result = ingest_archive(
+                    form.cleaned_data['archive'],
+                    request.user,
+                    default_language=form.cleaned_data['language'] or None,
+                    description=form.cleaned_data['description'],
+                )
+            except ValidationError as error:
+                for message in error.messages:
+                    messages.error(request, message)
+            else:
+                messages.success(request, result.summary())
+                if result.skipped:
+                    names = ', '.join(path for path, _ in result.skipped[:5])
+                    more = f' and {len(result.skipped) - 5} more' if len(result.skipped) > 5 else ''
+                    messages.warning(request, f'Skipped {len(result.skipped)} files: {names}{more}')
+                return redirect('users:submissions')
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+    
+    return redirect('users:upload_code')
+
+
 @login_required
 def submissions_view(request):
     """List user's submissions"""
-    submissions = CodeSubmission.objects.filter(
-        user=request.user
-    ).order_by('-created_at')
+    submissions = KeysetPaginator(
+        CodeSubmission.objects.filter(user=request.user)
+    ).get_page(request)
     
     return render(request, 'users/submissions.html', {'submissions': submissions})
 
@@ -198,10 +261,26 @@ def submissions_view(request):
 @login_required
 def submission_detail_view(request, submission_id):
     """View submission details"""
-    submission = get_object_or_404(CodeSubmission, submission_id=submission_id, user=request.user)
+    submission = get_object_or_404(
+        CodeSubmission.objects.with_code(), submission_id=submission_id, user=request.user
+    )
     return render(request, 'users/submission_detail.html', {'submission': submission})
 
 
+@login_required
+def submission_references_view(request, submission_id):
+    """Search the reference datasets for files the submission shares code with"""
+    submission = get_object_or_404(
+        CodeSubmission.objects.with_code(), submission_id=submission_id, user=request.user
+    )
+    started = time.perf_counter()
+    hits = search_references(read_submission_text(submission))
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return render(request, 'users/reference_matches.html', {
+        'submission': submission, 'hits': hits, 'elapsed_ms': elapsed_ms,
+    })
+
+
 @login_required
 def delete_submission_view(request, submission_id):
     """Delete submission"""
@@ -213,10 +292,36 @@ def delete_submission_view(request, submission_id):
     return redirect('users:submissions')
 
 
+def _compare_page(request):
+    # Get user's submissions for dropdown
+    submissions = CodeSubmission.objects.filter(user=request.user).order_by('-created_at')
+    return render(request, 'users/compare_code.html', {'submissions': submissions})
+
+
+def _refuse_comparison(request):
+    """A 429 response if the user may not start another comparison now, else None"""
+    refused = _throttled(request, 'compare', _compare_page)
+    if refused:
+        return refused
+    active = active_comparisons(request.user)
+    if active >= settings.MAX_ACTIVE_COMPARISONS_PER_USER:
+        return _refused(
+            request, _compare_page,
+            f'You already have {active} comparisons queued or running; start more once they finish.',
+        )
+    return None
+
+
 @login_required
 def compare_view(request):
     """Compare code"""
     if request.method == 'POST':
+        refused = _refuse_comparison(request)
+        if refused:
+            return refused
+        if request.POST.get('comparison_type') == 'multiple_vs_multiple':
+            return _start_set_comparison(request)
+        
         source_id = request.POST.get('source_submission')
         target_id = request.POST.get('target_submission')
         
@@ -225,8 +330,8 @@ def compare_view(request):
             return redirect('users:compare_code')
         
         try:
-            source = CodeSubmission.objects.get(submission_id=source_id, user=request.user)
-            target = CodeSubmission.objects.get(submission_id=target_id, user=request.user)
+            source = CodeSubmission.objects.with_code().get(submission_id=source_id, user=request.user)
+            target = CodeSubmission.objects.with_code().get(submission_id=target_id, user=request.user)
         except CodeSubmission.DoesNotExist:
             messages.error(request, 'One or both submissions not found.')
             return redirect('users:compare_code')
@@ -240,130 +345,64 @@ def compare_view(request):
             status='processing'
         )
 
-        # Gather texts
-        src_text = source.code_text or ''
-        tgt_text = target.code_text or ''
-        try:
-            if not src_text and source.code_file:
-                src_text = source.code_file.read().decode('utf-8', errors='ignore')
-                try:
-                    source.code_file.seek(0)
-                except Exception:
-                    pass
-        except Exception:
-            src_text = src_text or ''
-        try:
-            if not tgt_text and target.code_file:
-                tgt_text = target.code_file.read().decode('utf-8', errors='ignore')
-                try:
-                    target.code_file.seek(0)
-                except Exception:
-                    pass
-        except Exception:
-            tgt_text = tgt_text or ''
-
-        # Normalization helpers
-        def normalize_whitespace(s):
-            return re.sub(r"\s+", ' ', s).strip()
-
-        def token_sequence(s):
-            return re.findall(r"\w+", s.lower())
-
-        def seq_ratio(a, b):
-            return difflib.SequenceMatcher(None, a, b).ratio()
-
-        # Token similarity (sequence matcher on tokens)
-        try:
-            toks_src = token_sequence(src_text)
-            toks_tgt = token_sequence(tgt_text)
-            token_sim = seq_ratio(' '.join(toks_src), ' '.join(toks_tgt)) if toks_src or toks_tgt else 0.0
-        except Exception:
-            token_sim = 0.0
-
-        # Structural similarity (line-based)
-        try:
-            lines_src = [normalize_whitespace(l) for l in src_text.splitlines() if l.strip()]
-            lines_tgt = [normalize_whitespace(l) for l in tgt_text.splitlines() if l.strip()]
-            struct_sim = seq_ratio('\n'.join(lines_src), '\n'.join(lines_tgt)) if lines_src or lines_tgt else 0.0
-        except Exception:
-            struct_sim = 0.0
-
-        # AST similarity for python files
-        ast_sim = 0.0
-        try:
-            if source.language == 'python' and target.language == 'python':
-                try:
-                    a_src = _ast.parse(src_text)
-                    a_tgt = _ast.parse(tgt_text)
-
-                    def flatten_ast(node):
-                        nodes = []
-                        for n in _ast.walk(node):
-                            nodes.append(type(n).__name__)
-                        return ' '.join(nodes)
-
-                    ast_seq_src = flatten_ast(a_src)
-                    ast_seq_tgt = flatten_ast(a_tgt)
-                    ast_sim = seq_ratio(ast_seq_src, ast_seq_tgt)
-                except Exception:
-                    ast_sim = 0.0
-        except Exception:
-            ast_sim = 0.0
-
-        # Aggregate overall score (weights) - keep as fraction, then convert to percentage for storage
-        overall = (0.5 * token_sim) + (0.3 * struct_sim) + (0.2 * ast_sim)
-
-        # Convert to percentage (0-100) for display consistency
-        overall_pct = overall * 100
-        token_pct = token_sim * 100
-        struct_pct = struct_sim * 100
-        ast_pct = ast_sim * 100
-
-        # Persist result (store percentages)
-        SimilarityResult.objects.create(
-            comparison=comparison,
-            overall_similarity_score=overall_pct,
-            structural_similarity=struct_pct,
-            token_similarity=token_pct,
-            ast_similarity=ast_pct,
-            identical_segments=[],
-            near_identical_segments=[],
-            code_metrics={},
-            visualization_data={}
-        )
-
-        # Mark comparison and related submissions as completed
-        comparison.status = 'completed'
-        comparison.completed_at = timezone.now()
-        comparison.save()
-
-        try:
-            source.status = 'completed'
-            source.save()
-        except Exception:
-            pass
-
-        try:
-            target.status = 'completed'
-            target.save()
-        except Exception:
-            pass
+        # Background batch jobs in this process pause while it runs
+        with get_scheduler().interactive():
+            run_file_comparison(comparison)
 
         messages.success(request, 'Comparison completed!')
         return redirect('users:comparison_detail', comparison_id=comparison.request_id)
     
-    # Get user's submissions for dropdown
-    submissions = CodeSubmission.objects.filter(user=request.user).order_by('-created_at')
+    return _compare_page(request)
+
+
+def _start_set_comparison(request):
+    """Queue a multiple_vs_multiple comparison of two submission sets"""
+    source_ids = request.POST.getlist('source_submissions')
+    target_ids = request.POST.getlist('target_submissions')
+    if not source_ids or not target_ids:
+        messages.error(request, 'Please select at least one source and one target submission.')
+        return redirect('users:compare_code')
     
-    return render(request, 'users/compare_code.html', {'submissions': submissions})
+    try:
+        threshold = min(max(float(request.POST.get('similarity_threshold', 0.75)), 0.0), 1.0)
+        mine = CodeSubmission.objects.filter(user=request.user).order_by('pk')
+        sources = list(mine.filter(submission_id__in=source_ids))
+        targets = list(mine.filter(submission_id__in=target_ids))
+    except (ValueError, ValidationError):
+        messages.error(request, 'Invalid comparison options.')
+        return redirect('users:compare_code')
+    if len(sources) != len(set(source_ids)) or len(targets) != len(set(target_ids)):
+        messages.error(request, 'One or more submissions not found.')
+        return redirect('users:compare_code')
+    if max(len(sources), len(targets)) > settings.MAX_SET_COMPARISON_FILES:
+        messages.error(request, f'Each set can hold at most {settings.MAX_SET_COMPARISON_FILES} submissions.')
+        return redirect('users:compare_code')
+    
+    with transaction.atomic():
+        comparison = ComparisonRequest.objects.create(
+            user=request.user,
+            source_submission=sources[0],
+            comparison_type='multiple_vs_multiple',
+            similarity_threshold=threshold,
+            status='pending'
+        )
+        comparison.source_set.set(sources)
+        comparison.target_set.set(targets)
+        submit_set_comparison(comparison.pk, request.user.pk)
+    
+    # None once a worker has already picked it up
+    position = queue_positions(list(queued_jobs())).get(comparison.pk)
+    queued = f' (position {position} in the queue)' if position else ''
+    messages.success(request, f'Comparing {len(sources)} x {len(targets)} submissions in the background{queued}.')
+    return redirect('users:comparison_detail', comparison_id=comparison.request_id)
 
 
 @login_required
 def comparisons_view(request):
     """List comparisons"""
-    comparisons = ComparisonRequest.objects.filter(
-        user=request.user
-    ).order_by('-created_at')
+    comparisons = KeysetPaginator(
+        ComparisonRequest.objects.filter(user=request.user).select_related('user')
+    ).get_page(request)
     
     return render(request, 'users/comparisons.html', {'comparisons': comparisons})
 
@@ -371,13 +410,124 @@ def comparisons_view(request):
 @login_required
 def comparison_detail_view(request, comparison_id):
     """View comparison details"""
-    comparison = get_object_or_404(ComparisonRequest, request_id=comparison_id, user=request.user)
-    result = None
-    try:
-        result = comparison.result
-    except SimilarityResult.DoesNotExist:
-        pass
-    return render(request, 'users/comparison_detail.html', {'comparison': comparison, 'result': result})
+    comparison = get_object_or_404(
+        ComparisonRequest.objects.with_submissions(), request_id=comparison_id, user=request.user
+    )
+    result = SimilarityResult.objects.with_payload().filter(comparison=comparison).first()
+    matches = None
+    if comparison.comparison_type == 'multiple_vs_multiple' and result is not None:
+        matches = comparison.matches.with_submissions()[:settings.SET_COMPARISON_DISPLAY_MATCHES]
+    return render(request, 'users/comparison_detail.html', {
+        'comparison': comparison, 'result': result, 'matches': matches,
+    })
+
+
+def async_login_required(view):
+    """login_required for async views (Django 5.0's only wraps sync ones)"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def _comparison_status(request, comparison_id):
+    row = await ComparisonRequest.objects.filter(
+        request_id=comparison_id, user=request.user
+    ).values(*STATUS_FIELDS).afirst()
+    if row is None:
+        raise Http404('No such comparison')
+    snapshot = status_snapshot(row)
+    await add_queue_positions({row['pk']: snapshot})
+    if snapshot['status'] == 'completed':
+        snapshot['result_url'] = reverse('users:comparison_result', args=[comparison_id])
+    return row['pk'], snapshot
+
+
+@async_login_required
+async def comparison_status_view(request, comparison_id):
+    """Comparison status and progress (polled while a comparison runs)"""
+    _, snapshot = await _comparison_status(request, comparison_id)
+    return JsonResponse({'comparison_id': str(comparison_id), **snapshot})
+
+
+async def _status_events(comparison_pk, snapshot, result_url):
+    # EventSource reconnects after this many milliseconds when the stream ends or drops
+    yield 'retry: 3000\n\n'
+    # The middleware is done with the database by now; don't hold the request thread's
+    # connection while waiting (the poller queries on its own)
+    await sync_to_async(connections.close_all)()
+    async for snapshot in watch_comparison(comparison_pk, snapshot):
+        if snapshot is None:
+            yield ': keep-alive\n\n'
+            continue
+        if snapshot['status'] == 'completed':
+            snapshot = {**snapshot, 'result_url': result_url}
+        event = 'done' if snapshot['status'] in FINISHED else 'status'
+        yield f'event: {event}\ndata: {json.dumps(snapshot)}\n\n'
+
+
+@async_login_required
+async def comparison_events_view(request, comparison_id):
+    """
+    Server-Sent Events stream of a comparison's status: a 'status' event
+    per change and a final 'done' one. Under ASGI a waiting client costs a
+    coroutine (and the idle thread Django keeps per request for the sync
+    middleware), but no database connection; under WSGI the stream is only sent once it ends, so it
+    holds a worker thread like a long poll (poll comparison_status there).
+    """
+    comparison_pk, snapshot = await _comparison_status(request, comparison_id)
+    result_url = reverse('users:comparison_result', args=[comparison_id])
+    response = StreamingHttpResponse(
+        _status_events(comparison_pk, snapshot, result_url), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Don't let a proxy (nginx) buffer the events
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@async_login_required
+async def comparison_result_view(request, comparison_id):
+    """A finished comparison's scores (and a set comparison's best matches); 202 while it runs"""
+    comparison = await ComparisonRequest.objects.filter(
+        request_id=comparison_id, user=request.user
+    ).only('pk', 'comparison_type', 'status', 'progress', 'error_message').afirst()
+    if comparison is None:
+        raise Http404('No such comparison')
+    data = {'comparison_id': str(comparison_id), 'status': comparison.status}
+    if comparison.status != 'completed':
+        data.update(progress=comparison.progress, error_message=comparison.error_message)
+        return JsonResponse(data, status=409 if comparison.status == 'failed' else 202)
+
+    result = await SimilarityResult.objects.filter(comparison_id=comparison.pk).afirst()
+    data['result'] = None if result is None else {
+        'overall_similarity_score': result.overall_similarity_score,
+        'structural_similarity': result.structural_similarity,
+        'token_similarity': result.token_similarity,
+        'ast_similarity': result.ast_similarity,
+        'ml_similarity': result.ml_similarity,
+    }
+    if comparison.comparison_type == 'multiple_vs_multiple':
+        matches = comparison.matches.values(
+            'source_submission__submission_id', 'source_submission__title',
+            'target_submission__submission_id', 'target_submission__title', 'score', 'rank',
+        )[:settings.SET_COMPARISON_DISPLAY_MATCHES]
+        data['matches'] = [
+            {
+                'source': {'submission_id': str(match['source_submission__submission_id']),
+                           'title': match['source_submission__title']},
+                'target': {'submission_id': str(match['target_submission__submission_id']),
+                           'title': match['target_submission__title']},
+                'score': match['score'],
+                'rank': match['rank'],
+            }
+            async for match in matches
+        ]
+    return JsonResponse(data)
 
 
 @login_required
@@ -421,8 +571,8 @@ def delete_comparison_view(request, comparison_id):
 @login_required
 def history_view(request):
     """View history"""
-    comparisons = ComparisonRequest.objects.filter(
-        user=request.user
-    ).order_by('-created_at')
+    comparisons = KeysetPaginator(
+        ComparisonRequest.objects.filter(user=request.user)
+    ).get_page(request)
     
     return render(request, 'users/history.html', {'comparisons': comparisons})